@@ -1,13 +1,14 @@
 import os
 from datetime import datetime
-import mysql.connector
+from db_pool import get_pooled_connection
 from dotenv import load_dotenv
 from difflib import get_close_matches
 
 load_dotenv()
 
 def get_db_connection():
-    return mysql.connector.connect(
+    return get_pooled_connection(
+        "main",
         host=os.environ.get("DB_HOST"),
         user=os.environ.get("DB_USER"),
         password=os.environ.get("DB_PASSWORD"),
@@ -1,10 +1,10 @@
 import os
-from openai import OpenAI
 from datetime import datetime
 from agent_core import find_next_appointment_for_name
 from db_utils import get_db_connection
+import llm_executor
+import llm_gateway
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 AGENT_MODEL = os.environ.get("AGENT_MODEL", "gpt-3.5-turbo")
 try:
     AGENT_TEMPERATURE = float(os.environ.get("AGENT_TEMPERATURE", "0.2"))
@@ -19,78 +19,88 @@ def load_knowledge():
     except Exception:
         return ""
 
-def agent_respond(user_message, channel="chat", user_email=None, agent_settings=None, contact_profile=None):
-    """
-    Liefert eine GPT-Antwort mit neckattack-Kontext und DB-Infos.
-    - user_message: Die Frage/Bitte des Nutzers (Mailtext, Chat, ...)
-    - channel: "chat", "email" etc.
-    - user_email: falls bekannt, für Kontext (z.B. bei E-Mail)
-    - agent_settings: dict mit role, instructions, faq_text, document_links (optional)
-    - contact_profile: dict mit Kundenprofil (name, email, summary, email_count)
+# Lazy import + kurzer Timeout für FAQ, um Hänger zu vermeiden
+# (geteilter FAQ-Pool: nach Ablauf wird nicht auf den Worker gewartet)
+def _faq_is_relevant_safe(text):
+    try:
+        def _call():
+            from faq_langchain import faq_is_relevant
+            return faq_is_relevant(text)
+        return llm_executor.FAQ.run(_call, timeout=2.5)
+    except Exception:
+        return False, None, 0.0
 
-    # WICHTIG: E-Mails IMMER klar gegliedert mit Absätzen, Listen und Themenblöcken formatieren – keine Fließtexte! (Regel: email_formatting)
-    """
-    import logging
-    # Lazy import + kurzer Timeout für FAQ, um Hänger zu vermeiden
-    def _faq_is_relevant_safe(text):
-        try:
-            from concurrent.futures import ThreadPoolExecutor, TimeoutError
-            def _call():
-                from faq_langchain import faq_is_relevant
-                return faq_is_relevant(text)
-            with ThreadPoolExecutor(max_workers=1) as ex:
-                fut = ex.submit(_call)
-                return fut.result(timeout=2.5)
-        except Exception:
-            return False, None, 0.0
-    def _faq_answer_safe(text):
-        try:
-            from concurrent.futures import ThreadPoolExecutor, TimeoutError
-            def _call():
-                from faq_langchain import faq_answer
-                return faq_answer(text)
-            with ThreadPoolExecutor(max_workers=1) as ex:
-                fut = ex.submit(_call)
-                return fut.result(timeout=3.0)
-        except Exception:
-            return None
-    from datetime import datetime
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    db_context = ""
-    knowledge = load_knowledge()
-    # Schlüsselwörter für DB-Fragen
-    db_keywords = [
-        "termin", "termine", "slot", "slots", "kunde", "kunden", "reservierung", "reservierungen",
-        "sql", "datenbank", "gebucht", "frei", "gebuchte zeiten", "freie zeiten", "einsatz", "einsätze"
+def _faq_answer_safe(text):
+    try:
+        def _call():
+            from faq_langchain import faq_answer
+            return faq_answer(text)
+        return llm_executor.FAQ.run(_call, timeout=3.0)
+    except Exception:
+        return None
+
+# Schlüsselwörter für DB-Fragen
+DB_KEYWORDS = [
+    "termin", "termine", "slot", "slots", "kunde", "kunden", "reservierung", "reservierungen",
+    "sql", "datenbank", "gebucht", "frei", "gebuchte zeiten", "freie zeiten", "einsatz", "einsätze"
+]
+
+# Einfache Off-Topic-Erkennung (z.B. Wetter, Smalltalk, allgemeine Fragen)
+def _is_offtopic(text: str) -> bool:
+    t = (text or "").lower()
+    offtopic_keywords = [
+        "wetter", "weather", "temperatur", "regen", "sonnig", "barcelona", "madrid", "berlin",
+        "witz", "joke", "nachrichten", "news", "aktien", "börse", "football", "fußball",
+        "wie gehts", "wie geht es", "smalltalk", "allgemein", "zeit", "uhrzeit"
     ]
-    # Einfache Off-Topic-Erkennung (z.B. Wetter, Smalltalk, allgemeine Fragen)
-    def is_offtopic(text: str) -> bool:
+    return any(k in t for k in offtopic_keywords)
+
+# Intent-Klassifizierung ohne LLM
+def _classify_intent(text: str) -> str:
+    try:
+        # 1) Datenbank-Keywords zuerst (verhindert, dass 'zeit' als Offtopic DB-Fragen überschreibt)
         t = (text or "").lower()
-        offtopic_keywords = [
-            "wetter", "weather", "temperatur", "regen", "sonnig", "barcelona", "madrid", "berlin",
-            "witz", "joke", "nachrichten", "news", "aktien", "börse", "football", "fußball",
-            "wie gehts", "wie geht es", "smalltalk", "allgemein", "zeit", "uhrzeit"
-        ]
-        return any(k in t for k in offtopic_keywords)
+        if any(k in t for k in DB_KEYWORDS):
+            return "db"
+        # 2) FAQ-Relevanz prüfen
+        is_rel, _doc, _score = _faq_is_relevant_safe(text)
+        if is_rel:
+            return "faq"
+        # 3) Offtopic zuletzt
+        if _is_offtopic(text):
+            return "offtopic"
+        return "general"
+    except Exception:
+        return "general"
 
-    # Intent-Klassifizierung ohne LLM
-    def classify_intent(text: str) -> str:
-        try:
-            # 1) Datenbank-Keywords zuerst (verhindert, dass 'zeit' als Offtopic DB-Fragen überschreibt)
-            t = (text or "").lower()
-            if any(k in t for k in db_keywords):
-                return "db"
-            # 2) FAQ-Relevanz prüfen
-            is_rel, _doc, _score = _faq_is_relevant_safe(text)
-            if is_rel:
-                return "faq"
-            # 3) Offtopic zuletzt
-            if is_offtopic(text):
-                return "offtopic"
-            return "general"
-        except Exception:
-            return "general"
+def _good_answer(text: str) -> bool:
+    if not text:
+        return False
+    t = text.strip()
+    if len(t) < 20:
+        return False
+    bad_tokens = ["nicht beantworten", "kann nicht helfen", "später erneut", "keine daten"]
+    return not any(b in t.lower() for b in bad_tokens)
+
+def _run_sql(query: str):
+    import logging
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        return rows
+    except Exception as e:
+        logging.error(f"[DB-Exception] Fehler bei DB-Abfrage: {e}")
+        return None
 
+def _build_system_prompt(channel, agent_settings=None, contact_profile=None):
+    """Systemprompt mit neckattack-Kontext, Agent-Einstellungen und Kundenprofil."""
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    db_context = ""
+    knowledge = load_knowledge()
     # Build system prompt with user-specific agent settings and contact profile
     agent_role = ""
     agent_instructions = ""
@@ -155,140 +165,194 @@ def agent_respond(user_message, channel="chat", user_email=None, agent_settings=
         f"(Kanal: {channel})\n"
         f"Datenbank-Kontext: {db_context}\n"
     )
+    return system_prompt
+
+def _max_tokens(channel):
+    # Dynamische Token-Grenze: E-Mail braucht oft mehr Platz
+    default_max = 900 if channel == "email" else 512
+    try:
+        return int(os.environ.get("AGENT_MAX_TOKENS", str(default_max)))
+    except Exception:
+        return default_max
+
+def _prepare(user_message, channel, agent_settings, contact_profile):
+    """Intent bestimmen und ggf. direkt per FAQ beantworten.
+    Liefert (intent, faq_antwort, messages); faq_antwort ist None, wenn das LLM gefragt werden muss."""
+    import logging
     # 0. Schritt: Intent bestimmen (nur Heuristik, kein LLM)
-    intent = classify_intent(user_message)
+    intent = _classify_intent(user_message)
     try:
         logging.info(f"[agent_respond] intent={intent} channel={channel}")
     except Exception:
         pass
-
-    # Hilfsfunktionen
-    def good_answer(text: str) -> bool:
-        if not text:
-            return False
-        t = text.strip()
-        if len(t) < 20:
-            return False
-        bad_tokens = ["nicht beantworten", "kann nicht helfen", "später erneut", "keine daten"]
-        return not any(b in t.lower() for b in bad_tokens)
-
-    def run_sql(query: str):
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            cursor.close()
-            conn.close()
-            return rows
-        except Exception as e:
-            import logging
-            logging.error(f"[DB-Exception] Fehler bei DB-Abfrage: {e}")
-            return None
-
     # 1. Schritt: FAQ-LangChain nutzen (nur wenn Intent 'faq')
     try:
         if intent == "faq":
             faq_resp = _faq_answer_safe(user_message)
             if faq_resp and len(faq_resp.strip()) > 10 and "nicht beantworten" not in faq_resp.lower():
-                return faq_resp.strip()
+                return intent, faq_resp.strip(), None
     except Exception as e:
         logging.error(f"[FAQ-LangChain-Exception] Fehler bei der FAQ-Antwort für Frage '{user_message}': {e}")
     # 2. Schritt: Fallback auf OpenAI/DB wie gehabt
+    messages = [
+        {"role": "system", "content": _build_system_prompt(channel, agent_settings, contact_profile)},
+        {"role": "user", "content": user_message}
+    ]
+    return intent, None, messages
+
+def _finalize_answer(antwort, user_message, channel, intent):
+    """Nachbearbeitung der LLM-Antwort: Formatierung, SQL-Ausführung, Qualitätscheck mit Fallbacks."""
     import re
-    import unicodedata
-    def normalize(text):
-        text = text.lower().strip()
-        text = unicodedata.normalize('NFKD', text)
-        text = re.sub(r'[\W_]+' , '', text)
-        return text
-    user_message_norm = normalize(user_message)
-    user_message_lower = user_message.lower().strip()
-    try:
-        # Dynamische Token-Grenze: E-Mail braucht oft mehr Platz
-        default_max = 900 if channel == "email" else 512
-        try:
-            env_max = int(os.environ.get("AGENT_MAX_TOKENS", str(default_max)))
-        except Exception:
-            env_max = default_max
-        response = client.chat.completions.create(
-            model=AGENT_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            max_tokens=env_max,
-            temperature=AGENT_TEMPERATURE
-        )
-        antwort = response.choices[0].message.content.strip()
-        # Eventuelle Code-Fences am Anfang/Ende entfernen
-        import re as _re
-        antwort = _re.sub(r'^```(?:html|\w+)?\s*', '', antwort)
-        antwort = _re.sub(r'```\s*$', '', antwort)
-        # Automatische Nachbearbeitung: E-Mail-Antworten schön formatieren
-        if channel == "email" and antwort:
-            import re
-            # Keine Absätze nach Punkt in URL
-            def absatz_sub(match):
-                s = match.group(0)
-                if 'http' in s or 'www.' in s:
-                    return s
-                return s[0] + '\n\n'
-            # Nach jedem Satzende (Punkt, Ausrufezeichen, Fragezeichen, außer bei URLs) einen Absatz erzwingen
-            antwort = re.sub(r'([.!?])\s+', absatz_sub, antwort)
-            # Schrittanweisungen als Listenpunkt erkennen
-            antwort = re.sub(r'(?i)\b(logge dich|klicke|scrolle|prüfe|beachte|falls|kontaktiere)\b', r'\n- \1', antwort)
-            # Listenpunkte ("1. ...") jeweils in eigene Zeile
-            antwort = re.sub(r'(\d+\. )', r'\n\1', antwort)
-            antwort = re.sub(r'\n{3,}', '\n\n', antwort)
-            # Immer mindestens zwei Absätze erzwingen
-            if antwort.count('\n\n') < 2:
-                antwort = antwort.replace('. ', '.\n\n')
-            antwort = antwort.strip()
+    antwort = (antwort or '').strip()
+    # Eventuelle Code-Fences am Anfang/Ende entfernen
+    import re as _re
+    antwort = _re.sub(r'^```(?:html|\w+)?\s*', '', antwort)
+    antwort = _re.sub(r'```\s*$', '', antwort)
+    # Automatische Nachbearbeitung: E-Mail-Antworten schön formatieren
+    if channel == "email" and antwort:
+        import re
+        # Keine Absätze nach Punkt in URL
+        def absatz_sub(match):
+            s = match.group(0)
+            if 'http' in s or 'www.' in s:
+                return s
+            return s[0] + '\n\n'
+        # Nach jedem Satzende (Punkt, Ausrufezeichen, Fragezeichen, außer bei URLs) einen Absatz erzwingen
+        antwort = re.sub(r'([.!?])\s+', absatz_sub, antwort)
+        # Schrittanweisungen als Listenpunkt erkennen
+        antwort = re.sub(r'(?i)\b(logge dich|klicke|scrolle|prüfe|beachte|falls|kontaktiere)\b', r'\n- \1', antwort)
+        # Listenpunkte ("1. ...") jeweils in eigene Zeile
+        antwort = re.sub(r'(\d+\. )', r'\n\1', antwort)
+        antwort = re.sub(r'\n{3,}', '\n\n', antwort)
+        # Immer mindestens zwei Absätze erzwingen
+        if antwort.count('\n\n') < 2:
+            antwort = antwort.replace('. ', '.\n\n')
+        antwort = antwort.strip()
 
 
-        # Wenn das LLM ein SQL-Statement zurückgibt, führe es aus (alle Kanäle) und formatiere die Ergebnisse
-        sql_pattern = re.compile(r'^(SELECT|SHOW|DESCRIBE|WITH) ', re.IGNORECASE)
-        if sql_pattern.match(antwort):
-            rows = run_sql(antwort)
-            if rows is None:
-                # DB-Fehler -> Fallback FAQ (Retry) -> General
-                try:
-                    faq_retry = faq_answer(user_message)
-                    if good_answer(faq_retry):
-                        return faq_retry.strip()
-                except Exception:
-                    pass
-                return "Entschuldigung, ich konnte dazu gerade keine Daten liefern. Wenn du magst, formuliere die Frage etwas anders oder gib mir mehr Kontext."
-            if not rows:
-                # Kein Ergebnis -> Fallback auf FAQ (Retry), dann General
-                try:
-                    faq_retry = faq_answer(user_message)
-                    if good_answer(faq_retry):
-                        return faq_retry.strip()
-                except Exception:
-                    pass
-                # General LLM zweite Runde (mit klarem Hinweis vermeiden wir Loop)
-                return "Es wurden keine passenden Daten gefunden. Vielleicht hilft dir Folgendes: \n\n- Prüfe das Datum oder die Schreibweise.\n- Stelle die Frage allgemeiner, z. B. ohne konkrete Namen."
-            # Ergebnisse formatieren
-            result_lines = []
-            for row in rows:
-                result_lines.append(", ".join(f"{k}: {v}" for k, v in row.items()))
-            result_text = "\n".join(result_lines)
-            return result_text
-        # Qualitätscheck und Fallback-Kaskade
-        if good_answer(antwort):
-            return antwort
-        # Wenn intent war 'db' aber Antwort nicht gut, probiere FAQ, dann General
-        if intent == "db":
+    # Wenn das LLM ein SQL-Statement zurückgibt, führe es aus (alle Kanäle) und formatiere die Ergebnisse
+    sql_pattern = re.compile(r'^(SELECT|SHOW|DESCRIBE|WITH) ', re.IGNORECASE)
+    if sql_pattern.match(antwort):
+        rows = _run_sql(antwort)
+        if rows is None:
+            # DB-Fehler -> Fallback FAQ (Retry) -> General
             try:
                 faq_retry = faq_answer(user_message)
-                if good_answer(faq_retry):
+                if _good_answer(faq_retry):
                     return faq_retry.strip()
             except Exception:
                 pass
-        # Generelle Antwort (zweite Runde vermeiden wir – wir geben hilfreichen Standardhinweis)
-        return "Entschuldigung, ich habe dazu gerade keine perfekte Antwort gefunden. Hier ein allgemeiner Hinweis: Prüfe bitte unsere Hilfe/FAQ oder stelle die Frage etwas konkreter."
+            return "Entschuldigung, ich konnte dazu gerade keine Daten liefern. Wenn du magst, formuliere die Frage etwas anders oder gib mir mehr Kontext."
+        if not rows:
+            # Kein Ergebnis -> Fallback auf FAQ (Retry), dann General
+            try:
+                faq_retry = faq_answer(user_message)
+                if _good_answer(faq_retry):
+                    return faq_retry.strip()
+            except Exception:
+                pass
+            # General LLM zweite Runde (mit klarem Hinweis vermeiden wir Loop)
+            return "Es wurden keine passenden Daten gefunden. Vielleicht hilft dir Folgendes: \n\n- Prüfe das Datum oder die Schreibweise.\n- Stelle die Frage allgemeiner, z. B. ohne konkrete Namen."
+        # Ergebnisse formatieren
+        result_lines = []
+        for row in rows:
+            result_lines.append(", ".join(f"{k}: {v}" for k, v in row.items()))
+        result_text = "\n".join(result_lines)
+        return result_text
+    # Qualitätscheck und Fallback-Kaskade
+    if _good_answer(antwort):
+        return antwort
+    # Wenn intent war 'db' aber Antwort nicht gut, probiere FAQ, dann General
+    if intent == "db":
+        try:
+            faq_retry = faq_answer(user_message)
+            if _good_answer(faq_retry):
+                return faq_retry.strip()
+        except Exception:
+            pass
+    # Generelle Antwort (zweite Runde vermeiden wir – wir geben hilfreichen Standardhinweis)
+    return "Entschuldigung, ich habe dazu gerade keine perfekte Antwort gefunden. Hier ein allgemeiner Hinweis: Prüfe bitte unsere Hilfe/FAQ oder stelle die Frage etwas konkreter."
+
+ERROR_ANSWER = "Entschuldigung, ich konnte deine Frage gerade nicht beantworten. Bitte versuche es später erneut oder kontaktiere den Support."
+
+def agent_respond(user_message, channel="chat", user_email=None, agent_settings=None, contact_profile=None, cache=True):
+    """
+    Liefert eine GPT-Antwort mit neckattack-Kontext und DB-Infos.
+    - user_message: Die Frage/Bitte des Nutzers (Mailtext, Chat, ...)
+    - channel: "chat", "email" etc.
+    - user_email: falls bekannt, für Kontext (z.B. bei E-Mail)
+    - agent_settings: dict mit role, instructions, faq_text, document_links (optional)
+    - contact_profile: dict mit Kundenprofil (name, email, summary, email_count)
+    - cache: False erzwingt eine neue LLM-Antwort statt eines Treffers im Antwort-Cache (llm_gateway)
+
+    # WICHTIG: E-Mails IMMER klar gegliedert mit Absätzen, Listen und Themenblöcken formatieren – keine Fließtexte! (Regel: email_formatting)
+    """
+    import logging
+    intent, faq_antwort, messages = _prepare(user_message, channel, agent_settings, contact_profile)
+    if faq_antwort:
+        return faq_antwort
+    try:
+        response = llm_gateway.chat(
+            model=AGENT_MODEL,
+            messages=messages,
+            max_tokens=_max_tokens(channel),
+            temperature=AGENT_TEMPERATURE,
+            priority=llm_gateway.INTERACTIVE,
+            cache=cache,
+        )
+        return _finalize_answer(response.choices[0].message.content, user_message, channel, intent)
+    except Exception as e:
+        logging.error(f"[FAQ/DB-Exception] Fehler bei der Antwort für Frage '{user_message}': {e}")
+        return ERROR_ANSWER
+
+def agent_respond_stream(user_message, channel="chat", user_email=None, agent_settings=None, contact_profile=None,
+                         cache=True, timeout_s=None):
+    """
+    Wie agent_respond, aber als Generator für Streaming (SSE):
+    - ("delta", text): Rohtext-Stück direkt aus dem LLM-Stream
+    - ("final", text): fertige, nachbearbeitete Antwort (identisch zu agent_respond)
+    - ("error", meldung): Abbruch (LLMBusy, Timeout, Provider-Fehler); anders als
+      agent_respond kommt hier keine Entschuldigung als Antwort, der Aufrufer
+      entscheidet selbst (z.B. Fallback statt gecachtem Fehlertext)
+
+    Beginnt die Antwort wie ein SQL-Statement, werden keine Deltas gesendet
+    (das Ergebnis der Abfrage kommt nur als "final"). ``timeout_s`` begrenzt
+    Warteschlange und Pausen zwischen zwei Stücken.
+    """
+    import logging
+    import re
+    intent, faq_antwort, messages = _prepare(user_message, channel, agent_settings, contact_profile)
+    if faq_antwort:
+        yield "final", faq_antwort
+        return
+    sql_pattern = re.compile(r'^\s*(?:```\w*\s*)?(SELECT|SHOW|DESCRIBE|WITH)\b', re.IGNORECASE)
+    parts = []
+    held = ""       # Anfang zurückhalten, bis klar ist, dass es kein SQL ist
+    streaming = False
+    try:
+        for chunk in llm_gateway.chat_stream(
+            model=AGENT_MODEL,
+            messages=messages,
+            max_tokens=_max_tokens(channel),
+            temperature=AGENT_TEMPERATURE,
+            priority=llm_gateway.INTERACTIVE,
+            cache=cache,
+            queue_timeout=timeout_s,
+            timeout=timeout_s,
+        ):
+            parts.append(chunk)
+            if streaming:
+                yield "delta", chunk
+            elif streaming is False:
+                held += chunk
+                if len(held.strip()) >= 12:
+                    # SQL (None): nur das Endergebnis liefern
+                    streaming = None if sql_pattern.match(held) else True
+                    if streaming:
+                        yield "delta", held
+        if streaming is False and held:
+            yield "delta", held
+        yield "final", _finalize_answer("".join(parts), user_message, channel, intent)
     except Exception as e:
         logging.error(f"[FAQ/DB-Exception] Fehler bei der Antwort für Frage '{user_message}': {e}")
-        return "Entschuldigung, ich konnte deine Frage gerade nicht beantworten. Bitte versuche es später erneut oder kontaktiere den Support."
+        yield "error", str(e)
@@ -1,20 +1,27 @@
 import os
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context
 import mysql.connector
 from dotenv import load_dotenv
 from datetime import datetime
-from openai import OpenAI
 from agent_core import find_next_appointment_for_name
-from agent_gpt import agent_respond
+from agent_gpt import agent_respond, agent_respond_stream, ERROR_ANSWER
 from encryption_utils import encrypt_password, decrypt_password
 from auth_utils import create_jwt_token, decode_jwt_token, verify_password, hash_password, require_auth, require_role
 import qdrant_store
+import email_sync
+import email_attachments
+import email_search
+import folder_stats
+import imap_pool
+import llm_executor
+import llm_gateway
+import embedding_cache
+import email_indexer
+import ttl_cache
+import sync_worker
 
 load_dotenv()
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-
 # Flask-App muss vor allen @app.route-Dekoratoren existieren
 app = Flask(__name__)
 
@@ -57,71 +64,42 @@ def api_build_info():
     short = build[:16]
     return jsonify({'build': short})
 
-# Einfache In-Memory-Caches (kurzer TTL) für Geschwindigkeit
-INBOX_CACHE = {"data": None, "ts": 0, "key": None}
-THREAD_CACHE = {}   # uid -> {data, ts}  (Mail-Thread-Inhalt)
-COMPOSE_CACHE = {}  # uid -> {html, to, subject, ts} (Antwort-Entwurf)
-EMAIL_DETAIL_CACHE = {}  # (user_email, email_id) -> {data, ts}
-
-# Per-Process TTL-Caches für BLUE-DB und Job-Abfragen (beschleunigt Preface)
-BLUE_USER_CACHE = {}  # email -> {data, ts}
-JOBS_CACHE = {}       # user_id -> {upcoming, past, ts}
-
-def _cache_get(store: dict, key: str, ttl: int):
-    import time as _t
-    e = store.get(key)
-    if not e:
-        return None
-    if _t.time() - e.get('ts', 0) > ttl:
-        try:
-            del store[key]
-        except Exception:
-            pass
-        return None
-    return e
+# Caches (LRU + TTL, siehe ttl_cache.py und /api/debug/caches). Kurzlebige bleiben
+# pro Prozess; teure (LLM-Entwurf, BLUE-DB) teilen sich mit CACHE_BACKEND=sqlite alle Worker.
+INBOX_CACHE = ttl_cache.cache('inbox', maxsize=200, ttl=15)                 # (user_email, host, user, mailbox, limit) -> items
+THREAD_CACHE = ttl_cache.cache('thread', maxsize=500, ttl=60)               # (user_email, uid) -> Mail-Thread-Inhalt
+COMPOSE_CACHE = ttl_cache.cache('compose', maxsize=500, ttl=300, shared=True)  # (user_email, email_id) -> Antwort-Entwurf
+EMAIL_DETAIL_CACHE = ttl_cache.cache('email_detail', maxsize=500, ttl=10)   # (user_email, email_id) -> payload
 
-def _cache_set(store: dict, key: str, value: dict):
-    import time as _t
-    value = dict(value or {})
-    value['ts'] = _t.time()
-    store[key] = value
-    return value
+# TTL-Caches für BLUE-DB und Job-Abfragen (beschleunigt Preface). Schlüssel ist
+# die nachgeschlagene Person, das Ergebnis hängt nicht vom anfragenden User ab.
+BLUE_USER_CACHE = ttl_cache.cache('blue_user', maxsize=2000, ttl=120, shared=True)  # email -> BLUE-User-Info
+JOBS_CACHE = ttl_cache.cache('jobs', maxsize=2000, ttl=120, shared=True)            # user_id -> (upcoming, past)
 
 # Agent-Aufruf mit Timeout, damit UI nicht hängt
-def _agent_respond_with_timeout(text: str, *, channel: str, user_email: str, timeout_s: int = 8, agent_settings: dict = None, contact_profile: dict = None):
-    from concurrent.futures import ThreadPoolExecutor, TimeoutError as _TO
+def _agent_respond_with_timeout(text: str, *, channel: str, user_email: str, timeout_s: int = 8, agent_settings: dict = None, contact_profile: dict = None, cache: bool = True):
+    """Liefert (antwort, timed_out). Läuft im geteilten LLM-Pool; nach ``timeout_s``
+    kehrt der Request zurück, ein noch laufender Aufruf wird verworfen (llm_executor)."""
     import time as _time
-    from flask import current_app as _cap
     def _call():
         try:
-            return agent_respond(text, channel=channel, user_email=user_email, agent_settings=agent_settings, contact_profile=contact_profile)
+            answer = agent_respond(text, channel=channel, user_email=user_email, agent_settings=agent_settings, contact_profile=contact_profile, cache=cache)
         except Exception as e:
-            try:
-                _cap.logger.error(f"[agent_respond] exception: {e}")
-            except Exception:
-                pass
+            app.logger.error(f"[agent_respond] exception: {e}")
             return ""
-    with ThreadPoolExecutor(max_workers=1) as ex:
-        fut = ex.submit(_call)
-        try:
-            t0 = _time.time()
-            res = fut.result(timeout=timeout_s)
-            dt = (_time.time() - t0)
-            try:
-                _cap.logger.info(f"[agent_respond] done in {dt:.2f}s (timeout_s={timeout_s}) len={len(res or '')}")
-            except Exception:
-                pass
-            return res or "", False
-        except _TO:
-            try:
-                fut.cancel()
-            except Exception:
-                pass
-            try:
-                _cap.logger.warning(f"[agent_respond] TIMEOUT after {timeout_s}s")
-            except Exception:
-                pass
-            return "", True
+        # Entschuldigung nach LLM-Fehler ist kein Entwurf -> wie leere Antwort behandeln (wird nicht gecacht)
+        return "" if answer == ERROR_ANSWER else answer
+    t0 = _time.time()
+    try:
+        res = llm_executor.LLM.run(_call, timeout=timeout_s)
+    except llm_executor.Overloaded as e:
+        app.logger.warning(f"[agent_respond] abgelehnt: {e}")
+        return "", True
+    except llm_executor.DeadlineExceeded:
+        app.logger.warning(f"[agent_respond] TIMEOUT after {timeout_s}s")
+        return "", True
+    app.logger.info(f"[agent_respond] done in {_time.time() - t0:.2f}s (timeout_s={timeout_s}) len={len(res or '')}")
+    return res or "", False
 
 # Plaintext -> einfaches, sauberes HTML (Absätze, Listen, Zeilenumbrüche)
 def _plaintext_to_html_email(s: str) -> str:
@@ -196,23 +174,14 @@ def _plaintext_to_html_email(s: str) -> str:
 def _get_user_info_cached(email_addr: str, ttl: int = 120):
     try:
         ck = (email_addr or '').strip().lower()
-        c = _cache_get(BLUE_USER_CACHE, ck, ttl)
-        if c is not None:
-            return c.get('data')
         from agent_blue import get_user_info_by_email
-        data = get_user_info_by_email(ck)
-        _cache_set(BLUE_USER_CACHE, ck, {'data': data})
-        return data
+        return BLUE_USER_CACHE.get_or_compute(ck, lambda: get_user_info_by_email(ck), ttl=ttl)
     except Exception:
         return None
 
 # Cached Jobs (TTL 120s)
 def _get_jobs_cached(user_id: int, ttl: int = 120):
-    try:
-        key = str(int(user_id))
-        c = _cache_get(JOBS_CACHE, key, ttl)
-        if c is not None:
-            return c.get('upcoming') or [], c.get('past') or []
+    def _load():
         from agent_debug_jobs import (
             get_upcoming_tasks_via_bids,
             get_upcoming_tasks_precise,
@@ -231,8 +200,10 @@ def _get_jobs_cached(user_id: int, ttl: int = 120):
             jobs_past = get_past_tasks_via_bids(user_id, limit=5) or []
         except Exception:
             jobs_past = []
-        _cache_set(JOBS_CACHE, key, {'upcoming': jobs or [], 'past': jobs_past or []})
         return jobs or [], jobs_past or []
+
+    try:
+        return JOBS_CACHE.get_or_compute(int(user_id), _load, ttl=ttl)
     except Exception:
         return [], []
 
@@ -245,8 +216,8 @@ def health_check():
     faq_frage = "Wie erkenne ich, ob meine Rechnung bezahlt wurde?"
     db_frage = "Welche Termine gibt es morgen?"
     try:
-        faq_antwort = agent_respond(faq_frage, channel="health")
-        db_antwort = agent_respond(db_frage, channel="health")
+        faq_antwort = agent_respond(faq_frage, channel="health", cache=False)
+        db_antwort = agent_respond(db_frage, channel="health", cache=False)
         return jsonify({
             "status": "ok",
             "faq_test": {
@@ -275,7 +246,7 @@ app.logger.info(f"mysql-connector-python Version: {mysql.connector.__version__}"
 # Prüfe und logge die wichtigsten DB-Umgebungsvariablen beim Start
 app.logger.info(f"[DB-UMGEBUNG] DB_HOST={os.environ.get('DB_HOST')}, DB_USER={os.environ.get('DB_USER')}, DB_NAME={os.environ.get('DB_NAME')}, DB_PORT={os.environ.get('DB_PORT')}")
 
-from db_utils import get_db_connection
+from db_utils import get_db_connection, get_settings_db_connection
 from flask import current_app
 from db_utils_blue import get_blue_db_connection
 
@@ -304,14 +275,33 @@ def debug_db_test():
     return jsonify(result)
 
 
+@app.route('/api/debug/caches', methods=['GET'])
+@require_auth
+@require_role(['superadmin'])
+def api_debug_caches(current_user):
+    """Größe, Trefferquote und Verdrängungen aller In-Process-Caches dieses Workers."""
+    return jsonify({'pid': os.getpid(), 'caches': ttl_cache.all_stats(), 'imap_pool': imap_pool.pool_status(),
+                    'embeddings': embedding_cache.status()}), 200
+
+
+@app.route('/api/debug/executors', methods=['GET'])
+@require_auth
+@require_role(['superadmin'])
+def api_debug_executors(current_user):
+    """Queue-Tiefe, laufende Aufgaben und Timeout-/Abbruch-Zähler der LLM/FAQ-Pools, des LLM-Gateways und des Mail-Indexers dieses Workers."""
+    return jsonify({'pid': os.getpid(), 'executors': llm_executor.all_status(), 'llm_gateway': llm_gateway.status(),
+                    'email_index': email_indexer.status()}), 200
+
+
 @app.route('/api/debug/qdrant-contact/<int:contact_id>', methods=['GET'])
 @require_auth
 def debug_qdrant_contact(current_user, contact_id):
     """Testet Qdrant mit echten E-Mails eines Kontakts.
 
     - Lädt die letzten N E-Mails dieses Kontakts aus der settings-DB
-    - indexiert sie in Qdrant (falls Collection noch nicht existiert, wird sie angelegt)
-    - führt eine Similarity-Suche mit einer echten Suchanfrage aus
+    - indexiert sie in Qdrant (falls Collection noch nicht existiert, wird sie angelegt);
+      bei aktivem email_indexer entfällt das, die Mails liegen dort bereits
+    - führt eine Similarity-Suche mit einer echten Suchanfrage aus (nur eigene Mails dieses Kontakts)
     """
     user_email = current_user.get('user_email')
     # Für Debug-Zwecke klein halten, um Embedding-Limits nicht zu sprengen
@@ -340,6 +330,7 @@ def debug_qdrant_contact(current_user, contact_id):
 
         texts = []
         meta = []
+        ids = []
         for r in rows:
             email_id = r['id']
             subject = r.get('subject') or ''
@@ -352,16 +343,21 @@ def debug_qdrant_contact(current_user, contact_id):
             # Sicherheit: Text für Embeddings hart begrenzen, um invalid_request_error zu vermeiden
             full_text = full_text[:1500]
             texts.append(full_text)
+            ids.append(qdrant_store.point_id(user_email, 'email', email_id, 'debug'))
             meta.append({
+                'source': 'email_debug',
+                'user_email': user_email,
                 'contact_id': contact_id,
                 'email_id': email_id,
                 'subject': subject,
                 'received_at': r.get('received_at').isoformat() if r.get('received_at') else None,
             })
 
-        # In Qdrant indexieren (IDs von Qdrant generieren lassen)
+        # In Qdrant indexieren: stabile IDs pro E-Mail, unveränderte Punkte werden übersprungen.
+        # Mit aktivem Hintergrund-Index nicht doppelt ablegen, sondern dessen Punkte durchsuchen.
+        source = 'email' if email_indexer.enabled() else 'email_debug'
         try:
-            indexed_count = qdrant_store.upsert_texts(texts, metadata=meta)
+            upserted_count = 0 if source == 'email' else qdrant_store.upsert_texts(texts, ids=ids, metadata=meta)
         except Exception as e:
             app.logger.error(f"[QDRANT DEBUG] Upsert-Fehler: {e}")
             return jsonify({'ok': False, 'error': f'Qdrant Upsert fehlgeschlagen: {e}'}), 500
@@ -371,14 +367,16 @@ def debug_qdrant_contact(current_user, contact_id):
             query_text = rows[0].get('subject') or 'E-Mail Kontext'
 
         try:
-            results = qdrant_store.similarity_search(query_text, limit=10)
+            results = email_indexer.search(user_email, query_text, limit=10, contact_id=contact_id, source=source)
         except Exception as e:
             app.logger.error(f"[QDRANT DEBUG] Search-Fehler: {e}")
             return jsonify({'ok': False, 'error': f'Qdrant Suche fehlgeschlagen: {e}'}), 500
 
         return jsonify({
             'ok': True,
-            'indexed_emails': indexed_count,
+            'indexed_emails': 0 if source == 'email' else len(texts),
+            'upserted': upserted_count,
+            'source': source,
             'contact_id': contact_id,
             'query': query_text,
             'results': results,
@@ -464,71 +462,62 @@ def api_emails_inbox(current_user):
         return jsonify({"error": "IMAP configuration incomplete. Please configure email settings."}), 400
     try:
         # Cache nutzen
-        cache_key = f"{host}:{port}:{user}:{mailbox}:{limit}"
-        import time as _t
-        if INBOX_CACHE["data"] is not None and INBOX_CACHE["key"] == cache_key and _t.time() - INBOX_CACHE["ts"] < 15:
-            return jsonify({'items': INBOX_CACHE['data']})
+        cache_key = (user_email, host, port, user, mailbox, limit)
+        cached_items = INBOX_CACHE.get(cache_key)
+        if cached_items is not None:
+            return jsonify({'items': cached_items})
         # Logge, welche Keys tatsächlich verwendet werden
         used_host_key = 'IMAP_HOST' if os.environ.get('IMAP_HOST') else ('IMAP_SERVER' if os.environ.get('IMAP_SERVER') else '—')
         used_user_key = 'IMAP_USER' if os.environ.get('IMAP_USER') else ('EMAIL_USER' if os.environ.get('EMAIL_USER') else '—')
         used_pass_key = 'IMAP_PASS' if os.environ.get('IMAP_PASS') else ('EMAIL_PASS' if os.environ.get('EMAIL_PASS') else '—')
         app.logger.info(f"[IMAP] Verbinde zu {host}:{port}, mailbox={mailbox}, user={(user or '')[:3]+'***'} | keys host={used_host_key}, user={used_user_key}, pass={used_pass_key}")
-        M = imaplib.IMAP4_SSL(host, port)
-        M.login(user, pw)
-        sel_typ, sel_data = M.select(mailbox)
-        if sel_typ != 'OK':
-            raise RuntimeError(f"IMAP select failed: {sel_typ} {sel_data}")
-        # UID-Suche ist robuster
-        typ, data = M.uid('search', None, 'ALL')
-        if typ != 'OK' or not data or data[0] is None:
-            raise RuntimeError(f'IMAP UID search failed: {typ} {data}')
-        ids = data[0].split()
-        app.logger.info(f"[IMAP] Treffer gesamt: {len(ids)}")
-        ids = ids[-limit:] if limit and len(ids) > limit else ids
-        items = []
-        for mid in reversed(ids):  # neueste zuerst
-            # Wichtig: BODY.PEEK[HEADER] verwenden, damit das reine Laden des
-            # Headers (für Subject/From/To usw.) nicht automatisch das
-            # IMAP-Flag \\Seen setzt. FLAGS holen wir weiterhin mit.
-            typ, msgdata = M.uid('fetch', mid, '(FLAGS BODY.PEEK[HEADER])')
-            if typ != 'OK' or not msgdata or not msgdata[0]:
-                continue
-            # msgdata kann ein Tupel oder Liste sein
-            tup = msgdata[0]
-            raw_bytes = tup[1] if isinstance(tup, tuple) else tup
-            # FLAGS extrahieren
-            flags_raw = (tup[0].decode() if isinstance(tup, tuple) and isinstance(tup[0], (bytes, bytearray)) else '')
-            seen = ('\\Seen' in flags_raw) if flags_raw else False
-            msg = email.message_from_bytes(raw_bytes)
-            # Betreff decodieren
-            raw_sub = msg.get('Subject', '')
-            dh = decode_header(raw_sub)
-            subject_parts = []
-            for s, enc in dh:
-                try:
-                    subject_parts.append(s.decode(enc or 'utf-8') if isinstance(s, bytes) else str(s))
-                except Exception:
-                    subject_parts.append(s.decode('utf-8', errors='ignore') if isinstance(s, bytes) else str(s))
-            subject = ''.join(subject_parts)
-            from_addr = msg.get('From', '')
-            date = msg.get('Date', '')
-            uid_str = mid.decode() if isinstance(mid, (bytes, bytearray)) else str(mid)
-            message_id = msg.get('Message-ID', '') or uid_str
-            items.append({
-                'subject': subject,
-                'from': from_addr,
-                'date': date,
-                'message_id': message_id,
-                'uid': uid_str,
-                'seen': seen
-            })
-        M.close()
-        M.logout()
-        INBOX_CACHE["data"] = items
-        # Zeitstempel für Inbox-Cache immer direkt neu setzen
-        import time as _t
-        INBOX_CACHE["ts"] = _t.time()
-        INBOX_CACHE["key"] = cache_key
+        # Session aus dem IMAP-Pool (Login/SELECT nur beim ersten Mal)
+        with imap_pool.session(imap_pool.user_key(user_email), settings, folder=mailbox) as M:
+            # UID-Suche ist robuster
+            typ, data = M.uid('search', None, 'ALL')
+            if typ != 'OK' or not data or data[0] is None:
+                raise RuntimeError(f'IMAP UID search failed: {typ} {data}')
+            ids = data[0].split()
+            app.logger.info(f"[IMAP] Treffer gesamt: {len(ids)}")
+            ids = ids[-limit:] if limit and len(ids) > limit else ids
+            items = []
+            for mid in reversed(ids):  # neueste zuerst
+                # Wichtig: BODY.PEEK[HEADER] verwenden, damit das reine Laden des
+                # Headers (für Subject/From/To usw.) nicht automatisch das
+                # IMAP-Flag \\Seen setzt. FLAGS holen wir weiterhin mit.
+                typ, msgdata = M.uid('fetch', mid, '(FLAGS BODY.PEEK[HEADER])')
+                if typ != 'OK' or not msgdata or not msgdata[0]:
+                    continue
+                # msgdata kann ein Tupel oder Liste sein
+                tup = msgdata[0]
+                raw_bytes = tup[1] if isinstance(tup, tuple) else tup
+                # FLAGS extrahieren
+                flags_raw = (tup[0].decode() if isinstance(tup, tuple) and isinstance(tup[0], (bytes, bytearray)) else '')
+                seen = ('\\Seen' in flags_raw) if flags_raw else False
+                msg = email.message_from_bytes(raw_bytes)
+                # Betreff decodieren
+                raw_sub = msg.get('Subject', '')
+                dh = decode_header(raw_sub)
+                subject_parts = []
+                for s, enc in dh:
+                    try:
+                        subject_parts.append(s.decode(enc or 'utf-8') if isinstance(s, bytes) else str(s))
+                    except Exception:
+                        subject_parts.append(s.decode('utf-8', errors='ignore') if isinstance(s, bytes) else str(s))
+                subject = ''.join(subject_parts)
+                from_addr = msg.get('From', '')
+                date = msg.get('Date', '')
+                uid_str = mid.decode() if isinstance(mid, (bytes, bytearray)) else str(mid)
+                message_id = msg.get('Message-ID', '') or uid_str
+                items.append({
+                    'subject': subject,
+                    'from': from_addr,
+                    'date': date,
+                    'message_id': message_id,
+                    'uid': uid_str,
+                    'seen': seen
+                })
+        INBOX_CACHE.set(cache_key, items)
         return jsonify({'items': items})
     except Exception as e:
         app.logger.error(f"[IMAP] Fehler beim Laden der Inbox: {e}")
@@ -541,69 +530,26 @@ def api_emails_search(current_user):
     """Volltextsuche über alle bereits synchronisierten E-Mails in der DB.
 
     Sucht innerhalb des aktuellen Ordners (oder 'sent'-Gruppe) nach einem Query
-    in From/To/Subject/Body. Nutzt dieselbe Struktur wie api_emails_list.
+    in From/To/Subject/Body über den FULLTEXT-Index (siehe email_search),
+    sortiert nach Relevanz. ``total`` ist bei sehr vielen Treffern gedeckelt
+    (``total_capped``). Nutzt dieselbe Struktur wie api_emails_list.
     """
     user_email = current_user.get('user_email')
     folder = request.args.get('folder', 'inbox')
     account_id = request.args.get('account_id', type=int)
     q = (request.args.get('q') or '').strip()
+    limit = min(max(request.args.get('limit', default=email_search.MAX_LIMIT, type=int) or 1, 1), email_search.MAX_LIMIT)
+    offset = max(request.args.get('offset', default=0, type=int) or 0, 0)
     if not account_id:
         return jsonify({'error': 'account_id erforderlich'}), 400
     if not q:
         return jsonify({'emails': [], 'total': 0}), 200
 
-    like = f"%{q}%"
-
     try:
         conn = get_settings_db_connection()
+        result = email_search.get_backend().search(conn, user_email, account_id, folder, q, limit=limit, offset=offset)
         cursor = conn.cursor(dictionary=True)
-
-        # Folder-Filter wie in api_emails_list, aber ohne Limit (oder hohes Limit)
-        base_where = ["e.user_email = %s", "e.account_id = %s"]
-        params = [user_email, account_id]
-
-        if folder == 'all':
-            pass
-        else:
-            if folder == 'sent':
-                folder_values = ('sent', 'inbox.sent', 'sent items')
-                base_where.append("e.folder IN (%s, %s, %s)")
-                params.extend(folder_values)
-            else:
-                base_where.append("e.folder = %s")
-                params.append(folder)
-
-        # Suchbedingungen
-        base_where.append(
-            "(e.from_addr LIKE %s OR e.from_name LIKE %s OR e.to_addrs LIKE %s OR e.subject LIKE %s OR e.body_text LIKE %s)"
-        )
-        params.extend([like, like, like, like, like])
-
-        where_sql = " AND ".join(base_where)
-
-        # Begrenze die Anzahl der zurückgegebenen Zeilen hart, damit die UI performant bleibt
-        cursor.execute(
-            f"""
-            SELECT e.id, e.message_id, e.from_addr, e.from_name, e.to_addrs, e.subject,
-                   e.body_text, e.body_html, e.received_at, e.folder, e.is_read, e.is_replied, e.starred,
-                   e.has_attachments, e.urgency_level, e.importance_level,
-                   c.name as contact_name, c.contact_email, c.email_count as contact_email_count
-            FROM emails e
-            LEFT JOIN contacts c ON e.contact_id = c.id
-            WHERE {where_sql}
-            ORDER BY e.received_at DESC
-            LIMIT 500
-            """,
-            params,
-        )
-        emails = cursor.fetchall()
-
-        # Gesamtanzahl der Treffer (ohne Limit) ermitteln
-        cursor.execute(
-            f"SELECT COUNT(*) AS total FROM emails e LEFT JOIN contacts c ON e.contact_id = c.id WHERE {where_sql}",
-            params,
-        )
-        total = cursor.fetchone()["total"]
+        emails = email_search.hydrate(cursor, result.ids, user_email, email_sync.PREVIEW_CHARS)
 
         cursor.close()
         conn.close()
@@ -617,7 +563,7 @@ def api_emails_search(current_user):
                 'from_addr': email_row['from_addr'],
                 'subject': email_row['subject'] or '(Kein Betreff)',
                 'date': email_row['received_at'].strftime('%d.%m.%Y %H:%M') if email_row['received_at'] else '',
-                'body_preview': (email_row['body_text'] or '')[:200],
+                'body_preview': email_row['preview'] or '',
                 'is_read': email_row['is_read'],
                 'is_replied': email_row.get('is_replied', 0),
                 'starred': email_row['starred'],
@@ -629,7 +575,12 @@ def api_emails_search(current_user):
                 'contact_email_count': email_row['contact_email_count'],
             })
 
-        return jsonify({'emails': formatted_emails, 'total': total}), 200
+        return jsonify({
+            'emails': formatted_emails,
+            'total': result.total,
+            'total_capped': result.capped,
+            'engine': result.engine,
+        }), 200
 
     except Exception as e:
         app.logger.error(f"[Search Emails] Error: {e}")
@@ -707,7 +658,7 @@ def api_contact_topic_detail(current_user, contact_id, topic_id):
                     f"Thema: {topic.get('topic_label')}\n\n"
                     "Relevante E-Mails (neueste zuerst):\n" + "\n".join(email_summaries)
                 )
-                resp = openai_client.chat.completions.create(
+                resp = llm_gateway.chat(
                     model="gpt-4.1-mini",
                     messages=[
                         {"role": "system", "content": "Du schreibst sehr knappe, stichpunktartige CRM-Zusammenfassungen."},
@@ -1252,7 +1203,7 @@ def api_reply_prep_category_draft(current_user):
             full_prompt = base_ctx + mode_instr
 
         try:
-            resp = openai_client.chat.completions.create(
+            resp = llm_gateway.chat(
                 model="gpt-4.1-mini",
                 messages=[
                     {"role": "system", "content": "Du formulierst prägnante, freundliche E-Mail-Antworten auf Deutsch."},
@@ -1260,6 +1211,7 @@ def api_reply_prep_category_draft(current_user):
                 ],
                 temperature=0.4,
                 max_tokens=260,
+                cache=False,  # erneuter Klick soll eine neue Formulierung liefern
             )
             snippet = resp.choices[0].message.content.strip() if resp.choices else ''
             if not snippet:
@@ -1284,9 +1236,35 @@ def api_reply_prep_category_draft(current_user):
 @require_auth
 def api_emails_agent_compose(current_user):
     """Erstellt einen Antwortvorschlag (HTML) für eine gegebene E-Mail-ID aus DB.
-    Request: { uid: email_id (int) }
+    Request: { uid: email_id (int), force?: bool, timeout_s?: int }
     Response: { html, to, subject }
     """
+    return _agent_compose(current_user, stream=False)
+
+
+@app.route('/api/emails/agent-compose/stream', methods=['POST'])
+@require_auth
+def api_emails_agent_compose_stream(current_user):
+    """Wie agent-compose, liefert den Entwurf aber per Server-Sent Events, während das LLM schreibt.
+
+    Request wie agent-compose (POST, daher im Browser per fetch + ReadableStream lesen).
+    Fehler vor dem Start (400/404) kommen weiterhin als JSON. Events:
+      - ``start``  { to, subject, html }: Gerüst mit Anrede (entfällt bei Cache-Treffer oder Jobs-Preface)
+      - ``delta``  { append, partial }: ``append`` = HTML neu abgeschlossener Absätze (anhängen),
+                    ``partial`` = HTML des laufenden Absatzes (ersetzt den vorherigen)
+      - ``done``   { html, to, subject, timed_out }: finaler Entwurf wie bei agent-compose
+      - ``error``  { error }: z.B. compose_empty / compose_timeout
+    ``timeout_s`` begrenzt hier die Wartezeit bis zum ersten Stück bzw. zwischen zwei Stücken.
+    """
+    return _agent_compose(current_user, stream=True)
+
+
+def _sse(event: str, payload: dict) -> str:
+    import json as _json
+    return f"event: {event}\ndata: {_json.dumps(payload)}\n\n"
+
+
+def _agent_compose(current_user, stream: bool = False):
     data = request.get_json(silent=True) or {}
     email_id = data.get('uid')  # uid ist jetzt email_id aus DB
     force = bool(data.get('force'))
@@ -1312,17 +1290,15 @@ def api_emails_agent_compose(current_user):
         # Compose-Cache Early-Return (TTL 300s) für schnelle Wiederholungen,
         # kann per force-Flag explizit umgangen werden (z.B. bei geänderten Reply-Preferences).
         if not force:
-            cc = COMPOSE_CACHE.get(str(email_id))
-            if cc:
-                import time as _t
-                if _t.time() - cc.get('ts', 0) < 300 and not cc.get('timed_out'):
-                    if cc.get('has_body') or cc.get('has_preface'):
-                        return jsonify({ 'html': cc['html'], 'to': cc['to'], 'subject': cc['subject'] })
-                    else:
-                        try:
-                            del COMPOSE_CACHE[str(email_id)]
-                        except Exception:
-                            pass
+            cc = COMPOSE_CACHE.get((user_email, email_id))
+            if cc and not cc.get('timed_out'):
+                if cc.get('has_body') or cc.get('has_preface'):
+                    payload = { 'html': cc['html'], 'to': cc['to'], 'subject': cc['subject'] }
+                    if stream:
+                        return Response(_sse('done', dict(payload, timed_out=False)), mimetype='text/event-stream',
+                                        headers={'Cache-Control': 'no-cache'})
+                    return jsonify(payload)
+                COMPOSE_CACHE.delete((user_email, email_id))
         
         # Load email from database
         conn = get_settings_db_connection()
@@ -2255,8 +2231,11 @@ def api_emails_agent_compose(current_user):
         except Exception as e:
             app.logger.warning(f"[Agent-Compose] Could not load contact profile: {e}")
         
-        # Agent-Antwort mit Timeout (UI soll nicht >8s warten)
-        antwort_body, timed_out = _agent_respond_with_timeout(source_text, channel="email", user_email=from_addr, timeout_s=timeout_s, agent_settings=agent_settings, contact_profile=contact_profile)
+        # Vorschlagsempfänger/Betreff
+        reply_to = from_addr
+        reply_subject = ("Re: " + subject) if subject and not subject.lower().startswith("re:") else (subject or "Antwort")
+        has_preface = bool(visible_preface_html)
+
         # Doppelte Grußformeln entfernen, falls LLM bereits mit "Hallo ..." startet
         def _strip_greeting_html(html: str) -> str:
             import re
@@ -2272,49 +2251,121 @@ def api_emails_agent_compose(current_user):
             # Plaintext-Variante (ohne <p>) am Anfang
             html = re.sub(rf'^\s*({greetings_pattern})[^\n<]*\n+', '', html, flags=re.IGNORECASE)
             return html
-        antwort_body = _strip_greeting_html(antwort_body)
-        # Body als "leer" behandeln, wenn nach HTML->Text kaum Inhalt vorhanden ist
-        _antwort_text = _html_to_text(antwort_body or '')
-        _has_meaningful_body = bool(_antwort_text and len(_antwort_text.strip()) >= 8)
-        # Antworten-HTML zusammensetzen:
-        # - Wenn Preface vorhanden ist, KEIN weiterer Body anhängen (ist bereits die gewünschte Antwortform)
-        has_preface = bool(visible_preface_html)
-        if visible_preface_html:
-            antwort_html = greeting_html + visible_preface_html + closing_html
-        else:
-            # Wenn der LLM-Body leer ist (auch ohne Timeout), liefern wir 504 statt eines leeren Drafts mit nur "Hallo,"
-            if not _has_meaningful_body:
-                return jsonify({'error': 'compose_empty'}), 504
-            body_html = _plaintext_to_html_email(antwort_body)
-            antwort_html = greeting_html + body_html + closing_html
-        has_body = _has_meaningful_body
-        # Draft ohne feste KI-Standardsignatur: nur der eigentliche Antworttext.
-        # Die persönliche Signatur des Users wird erst beim Versand im Endpoint
-        # /api/emails/send aus den Email-Einstellungen angehängt.
-        draft_html = (
-            "<!-- DRAFT-GENERATED -->\n"
-            '<div style="font-family:Arial,sans-serif;font-size:1.08em;line-height:1.5;">'
-            f"{antwort_html}"
-            '</div>'
-        )
-        # Vorschlagsempfänger/Betreff
-        reply_to = from_addr
-        reply_subject = ("Re: " + subject) if subject and not subject.lower().startswith("re:") else (subject or "Antwort")
-        # Bei Timeout ohne verwertbaren Body und ohne Preface -> 504 (zusätzlich oben schon für leere Bodies behandelt)
-        if (timed_out and not visible_preface_html and not (antwort_body and antwort_body.strip())):
-            return jsonify({'error': 'compose_timeout'}), 504
-        # In Compose-Cache legen (Timeout-Drafts nicht für Early-Return verwenden)
-        import time as _t
-        COMPOSE_CACHE[str(email_id)] = {
-            'html': draft_html,
-            'to': reply_to,
-            'subject': reply_subject,
-            'ts': _t.time(),
-            'timed_out': timed_out,
-            'has_body': has_body,
-            'has_preface': has_preface,
-        }
-        return jsonify({ 'html': draft_html, 'to': reply_to, 'subject': reply_subject })
+
+        def _wrap_draft(antwort_html: str) -> str:
+            # Draft ohne feste KI-Standardsignatur: nur der eigentliche Antworttext.
+            # Die persönliche Signatur des Users wird erst beim Versand im Endpoint
+            # /api/emails/send aus den Email-Einstellungen angehängt.
+            return (
+                "<!-- DRAFT-GENERATED -->\n"
+                '<div style="font-family:Arial,sans-serif;font-size:1.08em;line-height:1.5;">'
+                f"{antwort_html}"
+                '</div>'
+            )
+
+        def _finish_draft(antwort_body: str, timed_out: bool):
+            """Setzt den finalen Entwurf zusammen und legt ihn in den Compose-Cache.
+            Liefert (payload, None) oder (None, fehlercode)."""
+            antwort_body = _strip_greeting_html(antwort_body)
+            # Body als "leer" behandeln, wenn nach HTML->Text kaum Inhalt vorhanden ist
+            _antwort_text = _html_to_text(antwort_body or '')
+            _has_meaningful_body = bool(_antwort_text and len(_antwort_text.strip()) >= 8)
+            # Antworten-HTML zusammensetzen:
+            # - Wenn Preface vorhanden ist, KEIN weiterer Body anhängen (ist bereits die gewünschte Antwortform)
+            if visible_preface_html:
+                antwort_html = greeting_html + visible_preface_html + closing_html
+            else:
+                # Bei Timeout ohne verwertbaren Body -> compose_timeout
+                if timed_out and not (antwort_body and antwort_body.strip()):
+                    return None, 'compose_timeout'
+                # Wenn der LLM-Body leer ist (auch ohne Timeout), liefern wir 504 statt eines leeren Drafts mit nur "Hallo,"
+                if not _has_meaningful_body:
+                    return None, 'compose_empty'
+                body_html = _plaintext_to_html_email(antwort_body)
+                antwort_html = greeting_html + body_html + closing_html
+            draft_html = _wrap_draft(antwort_html)
+            # In Compose-Cache legen (Timeout-Drafts nicht für Early-Return verwenden)
+            COMPOSE_CACHE.set((user_email, email_id), {
+                'html': draft_html,
+                'to': reply_to,
+                'subject': reply_subject,
+                'timed_out': timed_out,
+                'has_body': _has_meaningful_body,
+                'has_preface': has_preface,
+            })
+            return { 'html': draft_html, 'to': reply_to, 'subject': reply_subject }, None
+
+        if stream:
+            def _compose_events():
+                import time as _t
+                t0 = _t.time()
+                if visible_preface_html:
+                    # Jobs-Preface ersetzt den LLM-Body -> kein LLM-Aufruf nötig
+                    payload, _ = _finish_draft('', False)
+                    yield _sse('done', dict(payload, timed_out=False))
+                    return
+                yield _sse('start', {'to': reply_to, 'subject': reply_subject, 'html': _wrap_draft(greeting_html)})
+                raw = ''
+                committed = 0     # Länge des Rohtexts, dessen Absätze schon gesendet wurden
+                greeting_checked = False
+                final_text = ''
+                ttft = None
+                for kind, text in agent_respond_stream(
+                    source_text, channel="email", user_email=from_addr, agent_settings=agent_settings,
+                    contact_profile=contact_profile, cache=not force, timeout_s=timeout_s,
+                ):
+                    if kind == 'error':
+                        # Wie Timeout im klassischen Endpoint: nichts cachen, Frontend fällt zurück
+                        app.logger.warning(f"[AGENT-COMPOSE] stream abgebrochen nach {_t.time() - t0:.2f}s: {text}")
+                        yield _sse('error', {'error': 'compose_timeout'})
+                        return
+                    if kind == 'final':
+                        final_text = text
+                        break
+                    if ttft is None:
+                        ttft = _t.time() - t0
+                    raw += text
+                    if not greeting_checked:
+                        # Grußzeile des LLM erst nach der ersten vollständigen Zeile entfernen
+                        if '\n' not in raw and len(raw) < 60:
+                            continue
+                        greeting_checked = True
+                        committed = len(raw) - len(_strip_greeting_html(raw).lstrip('\n'))
+                    # Abgeschlossene Absätze einmalig senden, den laufenden Absatz als Vorschau
+                    cut = raw.rfind('\n\n', committed)
+                    append_html = ''
+                    if cut >= 0:
+                        append_html = _plaintext_to_html_email(raw[committed:cut])
+                        committed = cut + 2
+                    yield _sse('delta', {'append': append_html,
+                                         'partial': _plaintext_to_html_email(raw[committed:])})
+                payload, error = _finish_draft(final_text, False)
+                app.logger.info(f"[AGENT-COMPOSE] stream done in {_t.time() - t0:.2f}s "
+                                f"(ttft={ttft if ttft is None else round(ttft, 2)}s) len={len(final_text or '')}")
+                if error:
+                    yield _sse('error', {'error': error})
+                else:
+                    yield _sse('done', dict(payload, timed_out=False))
+
+            def _guarded(events):
+                try:
+                    yield from events
+                except Exception as e:
+                    app.logger.error(f"[AGENT-COMPOSE] stream error: {e}")
+                    yield _sse('error', {'error': str(e)})
+
+            return Response(
+                stream_with_context(_guarded(_compose_events())),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+            )
+
+        # Agent-Antwort mit Timeout (UI soll nicht >8s warten)
+        antwort_body, timed_out = _agent_respond_with_timeout(source_text, channel="email", user_email=from_addr, timeout_s=timeout_s, agent_settings=agent_settings, contact_profile=contact_profile, cache=not force)
+        payload, error = _finish_draft(antwort_body, timed_out)
+        if error:
+            return jsonify({'error': error}), 504
+        return jsonify(payload)
     except Exception as e:
         app.logger.error(f"[AGENT-COMPOSE] error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -2630,7 +2681,6 @@ def api_emails_send(current_user):
                 conn_reply.close()
 
                 # 2) Best-Effort: IMAP-Flag \Answered anhand der Message-ID setzen
-                import imaplib
                 if row_orig and row_orig.get('message_id') and row_orig.get('account_id'):
                     orig_message_id = row_orig['message_id']
                     orig_account_id = row_orig['account_id']
@@ -2648,42 +2698,21 @@ def api_emails_send(current_user):
                         cur_acc.close()
                         conn_acc.close()
 
-                        if acc and acc.get('imap_host') and acc.get('imap_user'):
-                            from encryption_utils import decrypt_password
-
-                            host = acc['imap_host']
-                            port = int(acc.get('imap_port', 993))
-                            imap_user = acc['imap_user']
-                            pw = decrypt_password(acc['imap_pass_encrypted']) if acc['imap_pass_encrypted'] else ''
-
-                            if host and imap_user and pw:
-                                # Einfaches Folder-Mapping wie in api_emails_seen
-                                if folder_db == 'sent':
-                                    folder_imap = 'Sent'
-                                elif folder_db == 'archive':
-                                    folder_imap = 'Archive'
-                                else:
-                                    folder_imap = 'INBOX'
-
-                                M = imaplib.IMAP4_SSL(host, port, timeout=15)
-                                M.login(imap_user, pw)
-                                try:
-                                    try:
-                                        sel_typ, _ = M.select(f'"{folder_imap}"')
-                                    except imaplib.IMAP4.error:
-                                        sel_typ, _ = M.select(folder_imap)
-                                    if sel_typ == 'OK':
-                                        search_crit = f'(HEADER Message-ID "{orig_message_id}")'
-                                        typ, data = M.uid('search', None, search_crit)
-                                        if typ == 'OK' and data and data[0]:
-                                            for u in data[0].split():
-                                                M.uid('store', u, '+FLAGS.SILENT', '(\\Answered)')
-                                finally:
-                                    try:
-                                        M.close()
-                                    except Exception:
-                                        pass
-                                    M.logout()
+                        if acc and acc.get('imap_host') and acc.get('imap_user') and acc.get('imap_pass_encrypted'):
+                            # Einfaches Folder-Mapping wie in api_emails_seen
+                            if folder_db == 'sent':
+                                folder_imap = 'Sent'
+                            elif folder_db == 'archive':
+                                folder_imap = 'Archive'
+                            else:
+                                folder_imap = 'INBOX'
+
+                            with imap_pool.session(imap_pool.account_key(orig_account_id), acc, folder=folder_imap) as M:
+                                search_crit = f'(HEADER Message-ID "{orig_message_id}")'
+                                typ, data = M.uid('search', None, search_crit)
+                                if typ == 'OK' and data and data[0]:
+                                    for u in data[0].split():
+                                        M.uid('store', u, '+FLAGS.SILENT', '(\\Answered)')
                     except Exception as e_imap:
                         try:
                             app.logger.warning(f"[Send] Could not set IMAP \\Answered flag: {e_imap}")
@@ -2711,6 +2740,7 @@ def api_emails_send(current_user):
 
             conn_db = get_settings_db_connection()
             cur_db = conn_db.cursor()
+            folder_stats.ensure_schema(cur_db)
             # Minimal-Insert analog zum IMAP-Sync, aber ohne Kontakt-Verknüpfung
             cur_db.execute(
                 "INSERT INTO emails (message_id, in_reply_to, references_raw, thread_id, user_email, account_id, contact_id, "
@@ -2738,6 +2768,7 @@ def api_emails_send(current_user):
                     0,
                 ),
             )
+            folder_stats.bump(cur_db, account_id, 'sent', total=1)
             conn_db.commit()
             cur_db.close()
             conn_db.close()
@@ -2932,60 +2963,40 @@ def api_emails_smtp_test(current_user):
 @app.route('/api/emails/sync', methods=['POST'])
 @require_auth
 def api_emails_sync(current_user):
-    """Sync emails from IMAP to database.
+    """Sync emails from IMAP to database (als Hintergrund-Job).
 
     Body: { limit: 20, count_only: false, account_id, folder? }
-    - limit: Anzahl der neu zu ladenden E-Mails (neueste zuerst)
-    - count_only: wenn true, wird nur total_on_server gezählt
+    - limit: höchstens so viele Mails pro Lauf; erst neue (ab der letzten UID), mit dem Rest
+      ältere Mails nachladen (siehe email_sync.plan_uid_fetch)
+    - count_only: wenn true, wird nur total_on_server gezählt (synchron)
+    - flags_only: wenn true, werden nur is_read/is_replied abgeglichen
+      (CONDSTORE/CHANGEDSINCE oder ein FETCH FLAGS), synchron und günstig genug für Polling
     - account_id: E-Mail-Account in email_accounts
     - folder: optionaler IMAP-Ordner (Default 'INBOX')
+    - chunk_size: Nachrichten pro UID FETCH (Default EMAIL_SYNC_FETCH_CHUNK=50)
+
+    Der eigentliche Sync läuft im sync_worker: die Antwort ist 202 mit dem Job
+    (``job.id``, ``job.status``, ``job.progress``); Fortschritt und Ergebnis
+    liefert GET /api/emails/sync/jobs/<id>. Wartet für Account/Ordner bereits
+    ein Job, wird dieser zurückgegeben. Mit EMAIL_SYNC_WORKER=off wird der Job
+    direkt im Request ausgeführt (200, Ergebnis in ``job.result``).
     """
-    import imaplib, email
-    from email.header import decode_header
-    import re
-    
+    import imaplib
+
     data = request.get_json(silent=True) or {}
     limit = data.get('limit')  # None = all new, 20/50/100 = specific count
     count_only = data.get('count_only', False)  # Just count emails on server
+    flags_only = bool(data.get('flags_only', False))  # Nur Gelesen/Beantwortet abgleichen
     account_id = data.get('account_id')
     # IMAP-Folder vom Client und logischen DB-Folder bestimmen
-    raw_folder = (data.get('folder') or 'INBOX').strip() or 'INBOX'
-    folder_imap = 'INBOX'
-    folder_db_key = 'inbox'
-    if isinstance(raw_folder, str):
-        f = raw_folder.strip()
-        # Kaputte Präfixe wie '." INBOX.Sent' säubern
-        if f.startswith('."') or f.startswith('"'):
-            f = f.lstrip('.').lstrip('"').strip()
-        fu = f.upper()
-        # Gesendet-Varianten
-        if 'SENT' in fu:
-            folder_imap = f or 'INBOX.Sent'
-            folder_db_key = 'sent'
-        # Archiv-Varianten
-        elif 'ARCHIVE' in fu or 'ARCHIV' in fu:
-            folder_imap = f or 'Archive'
-            folder_db_key = 'archive'
-        # Inbox-Varianten (auch wenn zusätzlich INBOX.* drinsteht)
-        elif 'INBOX' in fu:
-            folder_imap = 'INBOX'
-            folder_db_key = 'inbox'
-        else:
-            # Fallback: letzten Pfadteil als Key verwenden
-            lower = f.lower()
-            last_part = lower.split('/')[-1].split('.')[-1]
-            folder_imap = f or 'INBOX'
-            folder_db_key = last_part or lower or 'inbox'
-    else:
-        folder_imap = 'INBOX'
-        folder_db_key = 'inbox'
-    
+    folder_imap, folder_db = email_sync.resolve_sync_folder((data.get('folder') or 'INBOX').strip() or 'INBOX')
+
     user_email = current_user.get('user_email')
     if not account_id:
         return jsonify({'error': 'account_id erforderlich'}), 400
-    
+
     try:
-        # Get IMAP settings from selected email account
+        # Get IMAP settings from selected email account (prüft zugleich, dass der Account dem User gehört)
         conn = get_settings_db_connection()
         cursor = conn.cursor(dictionary=True)
         cursor.execute(
@@ -2996,343 +3007,141 @@ def api_emails_sync(current_user):
         settings = cursor.fetchone()
         cursor.close()
         conn.close()
-        
+
         if not settings or not settings.get('imap_host'):
             return jsonify({'error': 'IMAP settings not configured'}), 400
-        
-        from encryption_utils import decrypt_password
-        host = settings['imap_host']
-        port = int(settings.get('imap_port', 993))
-        user = settings['imap_user']
-        pw = decrypt_password(settings['imap_pass_encrypted']) if settings['imap_pass_encrypted'] else ''
-        
-        # Connect to IMAP
-        M = imaplib.IMAP4_SSL(host, port, timeout=15)
-        M.login(user, pw)
-        # Ordner auswählen (Standard: INBOX)
-        # Folder-Namen (folder_imap) wurde oben bereits normalisiert
-        # Viele Server erwarten Foldernamen in Anführungszeichen, v.a. bei Leerzeichen
+
+        if not count_only and not flags_only:
+            job, created = sync_worker.enqueue_job(
+                user_email, int(account_id), folder_imap,
+                limit=int(limit) if limit else None,
+                chunk_size=int(data['chunk_size']) if data.get('chunk_size') else None,
+            )
+            if sync_worker.worker_mode() == 'off':
+                if created:
+                    job = sync_worker.run_inline(job['id'])
+            else:
+                sync_worker.ensure_started()
+            status_code = 202 if job['status'] in ('queued', 'running') else 200
+            return jsonify({'ok': True, 'job_id': job['id'], 'created': created, 'job': sync_worker.job_to_dict(job)}), status_code
+
+        # Frisches SELECT über eine Pool-Session: UIDVALIDITY/UIDNEXT/EXISTS kommen
+        # direkt aus den SELECT-Responses – kein Login, kein SEARCH ALL nötig
         try:
-            try:
-                sel_typ, _ = M.select(f'"{folder_imap}"')
-            except imaplib.IMAP4.error as e1:
-                # Fallback: ungequotete Variante versuchen
-                app.logger.warning(f"[Sync] IMAP SELECT with quotes failed for folder={folder_imap!r}: {e1}")
-                sel_typ, _ = M.select(folder_imap)
-        except imaplib.IMAP4.error as e2:
-            app.logger.error(f"[Sync] IMAP SELECT failed for folder={folder_imap!r}: {e2}")
-            M.close()
-            M.logout()
-            return jsonify({'error': f"IMAP SELECT failed for folder {folder_imap!r}: {e2}"}), 500
-        if sel_typ != 'OK':
-            app.logger.error(f"[Sync] IMAP SELECT returned {sel_typ} for folder={folder_imap!r}")
-            M.close()
-            M.logout()
-            return jsonify({'error': f"IMAP SELECT status {sel_typ} for folder {folder_imap!r}"}), 500
-        
-        # Search all emails
-        typ, data = M.search(None, 'ALL')
-        if typ != 'OK':
-            M.close()
-            M.logout()
-            return jsonify({'error': 'IMAP search failed'}), 500
-        
-        all_uids = data[0].split()
-        total_on_server = len(all_uids)
-        
-        # If just counting
-        if count_only:
-            M.close()
-            M.logout()
-            return jsonify({'total_on_server': total_on_server}), 200
-        
-        # Bereits synchronisierte Kombinationen aus message_id und Ordner laden,
-        # damit dieselbe Nachricht in verschiedenen Ordnern (z.B. INBOX vs. Gesendet)
-        # separat gespeichert werden kann.
-        conn_db = get_settings_db_connection()
-        cursor_db = conn_db.cursor()
-        cursor_db.execute(
-            "SELECT message_id, folder FROM emails WHERE user_email=%s AND account_id=%s",
-            (user_email, account_id)
-        )
-        synced_rows = [(row[0], (row[1] or '').lower()) for row in cursor_db.fetchall() if row[0]]
-        synced_ids = set(synced_rows)
-        
-        # Determine which emails to fetch
-        if limit:
-            # Vereinfachte Logik: immer die letzten "limit" UIDs holen.
-            # all_uids ist von alt nach neu sortiert, daher nehmen wir das
-            # Tail. Duplikate werden weiter unten über message_id+folder
-            # ignoriert.
-            total_uids = len(all_uids)
-            uids_to_fetch = all_uids[max(0, total_uids - int(limit)) : total_uids]
-        else:
-            # Fetch all (careful!)
-            uids_to_fetch = all_uids
-        
-        synced_count = 0
-        new_contacts_count = 0
+            with imap_pool.session(imap_pool.account_key(account_id), settings, folder=folder_imap, reselect=True) as M:
+                mbox_status = email_sync.mailbox_status(M, folder_imap)
+                total_on_server = mbox_status.get('exists') or 0
 
-        for uid in uids_to_fetch:
-            try:
-                # FLAGS gemeinsam mit der Nachricht laden, aber mit BODY.PEEK[],
-                # damit das reine Synchronisieren nicht das IMAP-Flag \Seen setzt.
-                typ, msg_data = M.fetch(uid, '(FLAGS BODY.PEEK[])')
-                if typ != 'OK':
-                    continue
+                # If just counting
+                if count_only:
+                    return jsonify({'total_on_server': total_on_server}), 200
 
-                # msg_data[0] ist i.d.R. ein Tupel: (b'1 (FLAGS (..) RFC822 {bytes}', raw_bytes)
-                tup = msg_data[0]
-                if isinstance(tup, tuple):
-                    meta_raw = tup[0].decode() if isinstance(tup[0], (bytes, bytearray)) else str(tup[0])
-                    raw_email = tup[1]
-                else:
-                    meta_raw = ''
-                    raw_email = tup
-
-                # Gelesen-Status und Beantwortet-Status aus FLAGS extrahieren.
-                # is_read spiegelt den aktuellen IMAP-Status (\\Seen) wider,
-                # damit alle Clients (Outlook, Handy, unsere App) konsistent sind.
-                is_read = 1 if ('\\Seen' in meta_raw) else 0
-                is_replied = 1 if ('\\Answered' in meta_raw) else 0
-                msg = email.message_from_bytes(raw_email)
-
-                # Extract message_id
-                message_id = msg.get('Message-ID', '').strip()
-                if not message_id:
-                    message_id = f"no-id-{uid.decode()}"
-
-                # Thread/Reply-Header auslesen
-                in_reply_to = (msg.get('In-Reply-To') or '').strip()
-                # References kann mehrfach vorkommen; alle kombinieren
+                conn_db = get_settings_db_connection()
+                cursor_db = conn_db.cursor()
                 try:
-                    refs_list = msg.get_all('References', []) or []
-                except Exception:
-                    refs_list = []
-                references_raw = ' '.join(refs_list).strip() if refs_list else ''
-
-                # Einfache thread_id bestimmen:
-                # 1) erste Message-ID aus References
-                # 2) sonst In-Reply-To
-                # 3) sonst eigene Message-ID
-                thread_id = ''
-                try:
-                    import re as _re_tid
-                    candidate = ''
-                    if references_raw:
-                        ids = _re_tid.findall(r'<([^>]+)>', references_raw)
-                        if ids:
-                            candidate = ids[0]
-                    if not candidate and in_reply_to:
-                        m = _re_tid.search(r'<([^>]+)>', in_reply_to)
-                        candidate = m.group(1) if m else in_reply_to
-                    if not candidate and message_id:
-                        m = _re_tid.search(r'<([^>]+)>', message_id)
-                        candidate = m.group(1) if m else message_id
-                    thread_id = candidate[:255] if candidate else ''
-                except Exception:
-                    thread_id = ''
+                    email_sync.ensure_sync_schema(cursor_db)
+                    sync_state = email_sync.get_sync_state(cursor_db, account_id, folder_imap)
+
+                    # Flag-Abgleich braucht gültige UIDs aus einem vorherigen Sync
+                    if not sync_state or sync_state['uidvalidity'] != mbox_status.get('uidvalidity'):
+                        return jsonify({'ok': True, 'flags': None, 'needs_full_sync': True}), 200
+                    flag_result = email_sync.sync_flags(M, cursor_db, user_email, account_id, folder_imap, folder_db, mbox_status, sync_state)
+                    conn_db.commit()
+                finally:
+                    cursor_db.close()
+                    conn_db.close()
+        except imaplib.IMAP4.error as e:
+            app.logger.error(f"[Sync] IMAP error for folder={folder_imap!r}: {e}")
+            return jsonify({'error': f"IMAP error for folder {folder_imap!r}: {e}"}), 500
+        return jsonify({'ok': True, 'flags': flag_result, 'total_on_server': total_on_server}), 200
 
-                # Skip- oder Update-Logik für bereits synchronisierte Nachrichten
-                key = (message_id, (folder_db_key or 'inbox').lower())
-                if key in synced_ids:
-                    # Flags (gelesen/beantwortet) in der bestehenden Zeile aktualisieren
-                    try:
-                        # Wichtig: Ein lokal gesetztes is_replied=1 (z.B. nach Versand einer Antwort)
-                        # darf durch fehlendes IMAP-Flag (\\Answered) nicht wieder auf 0 fallen.
-                        # Daher is_replied immer als Maximum aus bestehendem Wert und IMAP-Wert setzen.
-                        cursor_db.execute(
-                            "UPDATE emails SET is_read=%s, is_replied=GREATEST(is_replied, %s) WHERE user_email=%s AND account_id=%s AND message_id=%s AND folder=%s",
-                            (is_read, is_replied, user_email, account_id, message_id, folder_db_key)
-                        )
-                    except Exception as _upd_err:
-                        app.logger.warning(f"[Sync] Could not update flags for message_id={message_id}: {_upd_err}")
-                    continue
+    except Exception as e:
+        app.logger.error(f"[Sync] Error: {e}")
+        import traceback
+        return jsonify({'error': str(e), 'trace': traceback.format_exc()}), 500
 
-                # Extract headers
-                from_addr = msg.get('From', '')
-                to_addrs = msg.get('To', '')
-                subject = msg.get('Subject', '')
-                date_str = msg.get('Date', '')
 
-                # Decode headers
-                def decode_header_value(value):
-                    if not value:
-                        return ''
-                    parts = decode_header(value)
-                    decoded = []
-                    for content, encoding in parts:
-                        if isinstance(content, bytes):
-                            decoded.append(content.decode(encoding or 'utf-8', errors='ignore'))
-                        else:
-                            decoded.append(str(content))
-                    return ' '.join(decoded)
-
-                from_addr = decode_header_value(from_addr)
-                subject = decode_header_value(subject)
-
-                # Extract email address and name from "Name <email@example.com>"
-                from_email = from_addr
-                from_name = ''
-                email_match = re.search(r'<(.+?)>', from_addr)
-                if email_match:
-                    from_email = email_match.group(1)
-                    from_name = from_addr.split('<')[0].strip().strip('"')
-
-                # Parse date
-                from email.utils import parsedate_to_datetime
-                try:
-                    received_at = parsedate_to_datetime(date_str)
-                except Exception:
-                    received_at = datetime.now()
-
-                # Extract body
-                body_text = ''
-                body_html = ''
-                has_attachments = False
-                # Mapping von Content-ID -> data:-URL für kleine Inline-Bilder
-                inline_images = {}
-
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        ctype = part.get_content_type()
-                        disp = (part.get("Content-Disposition") or "").lower()
-                        cid = (part.get("Content-ID") or "").strip().strip("<>")
-
-                        if ctype == 'text/plain' and not body_text:
-                            try:
-                                payload = part.get_payload(decode=True)
-                                body_text = payload.decode(part.get_content_charset() or 'utf-8', errors='ignore')
-                            except Exception:
-                                pass
-                        elif ctype == 'text/html' and not body_html:
-                            try:
-                                payload = part.get_payload(decode=True)
-                                body_html = payload.decode(part.get_content_charset() or 'utf-8', errors='ignore')
-                            except Exception:
-                                pass
-                        # Kleine Inline-Bilder (cid) als data:-URL vorbereiten
-                        elif ctype.startswith('image/') and cid and ('attachment' not in disp):
-                            try:
-                                payload = part.get_payload(decode=True) or b''
-                                # Größen-Limit ~70 KB, damit die Base64-URL sicher in body_html[:100000] passt
-                                # (Base64 ca. 4/3 der Bytes -> ~93 KB Text)
-                                if len(payload) <= 70_000:
-                                    import base64
-                                    b64 = base64.b64encode(payload).decode('ascii')
-                                    # Nur ausgewählte Typen explizit zulassen
-                                    if ctype in ('image/png', 'image/jpeg', 'image/jpg', 'image/gif'):
-                                        inline_images[cid] = f"data:{ctype};base64,{b64}"
-                            except Exception:
-                                # Inline-Bild ist optional – Fehler hier sollen den Import nicht blockieren
-                                pass
-                        elif part.get_filename():
-                            has_attachments = True
-                else:
-                    try:
-                        payload = msg.get_payload(decode=True)
-                        if msg.get_content_type() == 'text/html':
-                            body_html = payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore')
-                        else:
-                            body_text = payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore')
-                    except Exception:
-                        pass
+@app.route('/api/emails/sync/jobs', methods=['GET'])
+@require_auth
+def api_emails_sync_jobs(current_user):
+    """Letzte Sync-Jobs des Users (optional ?account_id=, ?limit=20)."""
+    user_email = current_user.get('user_email')
+    account_id = request.args.get('account_id', type=int)
+    limit = request.args.get('limit', default=20, type=int)
+    try:
+        rows = sync_worker.list_jobs(user_email, account_id=account_id, limit=limit)
+        return jsonify({'ok': True, 'jobs': [sync_worker.job_to_dict(r) for r in rows]}), 200
+    except Exception as e:
+        app.logger.error(f"[SyncJobs] list error: {e}")
+        return jsonify({'error': str(e)}), 500
 
-                # Falls HTML vorhanden ist und wir Inline-Bilder haben, ersetze cid:-Verweise durch data:-URLs
-                if body_html and inline_images:
-                    try:
-                        import re as _re
-
-                        def _replace_cid(m):
-                            cid_val = (m.group(1) or '').strip()
-                            # src="cid:xyz" oder src='cid:xyz'
-                            cid_key = cid_val.split(':', 1)[1] if ':' in cid_val else cid_val
-                            cid_key = cid_key.strip().strip('<>')
-                            data_url = inline_images.get(cid_key)
-                            if not data_url:
-                                return m.group(0)
-                            return m.group(0).replace(m.group(1), data_url)
-
-                        # src="cid:..." / src='cid:...'
-                        body_html = _re.sub(r'src=("|\')(cid:[^"\']+)("|\')',
-                                             lambda m: f"src=\"{inline_images.get(m.group(2).split(':',1)[1].strip('<>'), m.group(2))}\"",
-                                             body_html)
-                    except Exception:
-                        # Wenn Ersetzung fehlschlägt, lieber Original-HTML behalten
-                        pass
 
-                # Get or create contact
-                cursor_db.execute(
-                    "SELECT id FROM contacts WHERE user_email=%s AND contact_email=%s",
-                    (user_email, from_email)
-                )
-                contact_row = cursor_db.fetchone()
-
-                if contact_row:
-                    contact_id = contact_row[0]
-                    # Update contact stats
-                    cursor_db.execute(
-                        "UPDATE contacts SET email_count=email_count+1, last_contact_at=%s, "
-                        "name=%s WHERE id=%s",
-                        (received_at, from_name or from_email, contact_id)
-                    )
-                else:
-                    # Create new contact
-                    cursor_db.execute(
-                        "INSERT INTO contacts (user_email, contact_email, name, first_name, "
-                        "email_count, first_contact_at, last_contact_at) "
-                        "VALUES (%s, %s, %s, %s, 1, %s, %s)",
-                        (user_email, from_email, from_name or from_email, from_name.split()[0] if from_name else '',
-                         received_at, received_at)
-                    )
-                    contact_id = cursor_db.lastrowid
-                    new_contacts_count += 1
-
-                # Insert email, Folder-Namen als logischen DB-Key speichern
-                folder_db = (folder_db_key or 'inbox').lower()
-                cursor_db.execute(
-                    "INSERT INTO emails (message_id, in_reply_to, references_raw, thread_id, user_email, account_id, contact_id, from_addr, from_name, "
-                    "to_addrs, subject, body_text, body_html, received_at, folder, has_attachments, is_read, is_replied) "
-                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                    (message_id, in_reply_to, references_raw, thread_id, user_email, account_id, contact_id, from_email, from_name, to_addrs,
-                     subject, body_text[:50000] if body_text else '', body_html[:100000] if body_html else '',
-                     received_at, folder_db, has_attachments, is_read, is_replied)
-                )
+@app.route('/api/emails/sync/jobs/<int:job_id>', methods=['GET'])
+@require_auth
+def api_emails_sync_job(current_user, job_id):
+    """Status/Fortschritt eines Sync-Jobs; bei status=done steht das Ergebnis in ``job.result``."""
+    user_email = current_user.get('user_email')
+    try:
+        row = sync_worker.get_job(job_id, user_email=user_email)
+        if not row:
+            return jsonify({'error': 'Job nicht gefunden'}), 404
+        return jsonify({'ok': True, 'job': sync_worker.job_to_dict(row)}), 200
+    except Exception as e:
+        app.logger.error(f"[SyncJobs] get error: {e}")
+        return jsonify({'error': str(e)}), 500
 
-                synced_count += 1
-                synced_ids.add(key)
 
-            except Exception as e:
-                app.logger.error(f"[Sync] Error processing email {uid}: {e}")
-                continue
+@app.route('/api/emails/events', methods=['GET'])
+@require_auth
+def api_emails_events(current_user):
+    """Server-Sent Events mit leichten Benachrichtigungen (z.B. neue Mails nach IDLE-Sync).
 
-        conn_db.commit()
-        cursor_db.close()
-        conn_db.close()
-        
-        M.close()
-        M.logout()
-        
-        # Gesamtanzahl der bereits in der DB vorhandenen Kombinationen
-        total_in_db = len(synced_ids)
-        # Anzahl der bereits in der DB vorhandenen Mails NUR für den aktuellen Ordner
-        current_folder_key = (folder_db_key or 'inbox').lower()
-        total_in_db_folder = sum(1 for _mid, f in synced_rows if f == current_folder_key)
+    Query: since=<letzte Event-ID> (ohne: nur Events ab jetzt).
+    Events: ``event: sync`` mit ``{id, account_id, folder, folder_db, synced, flags_updated}``.
+    Der Stream endet nach EMAIL_EVENTS_STREAM_SECONDS (Default 55), damit kein
+    Worker dauerhaft belegt wird; der Client verbindet sich mit ``since`` neu.
+    """
+    import json as _json
+    import time as _t
 
-        return jsonify({
-            'ok': True,
-            'synced': synced_count,
-            'total_on_server': total_on_server,
-            'total_in_db': total_in_db,
-            'total_in_db_folder': total_in_db_folder,
-            'new_contacts': new_contacts_count,
-            'already_synced': total_in_db - synced_count
-        }), 200
-        
+    user_email = current_user.get('user_email')
+    since = request.args.get('since', type=int)
+    try:
+        sync_worker.ensure_started()
+        if since is None:
+            since = sync_worker.latest_event_id(user_email)
     except Exception as e:
-        app.logger.error(f"[Sync] Error: {e}")
-        import traceback
-        return jsonify({'error': str(e), 'trace': traceback.format_exc()}), 500
+        app.logger.error(f"[Events] init error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    try:
+        max_seconds = int(os.environ.get('EMAIL_EVENTS_STREAM_SECONDS', '55'))
+    except Exception:
+        max_seconds = 55
+
+    def _stream(cursor_id):
+        started = _t.time()
+        last_ping = started
+        yield f"event: hello\ndata: {_json.dumps({'since': cursor_id})}\n\n"
+        while _t.time() - started < max_seconds:
+            try:
+                events = sync_worker.fetch_events(user_email, cursor_id)
+            except Exception as e:
+                app.logger.warning(f"[Events] fetch error: {e}")
+                events = []
+            for ev in events:
+                cursor_id = ev['id']
+                yield f"id: {ev['id']}\nevent: {ev['kind']}\ndata: {_json.dumps(ev)}\n\n"
+            if _t.time() - last_ping >= 15:
+                last_ping = _t.time()
+                yield ": ping\n\n"
+            _t.sleep(2)
+
+    return Response(
+        stream_with_context(_stream(since)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 
 @app.route('/api/email-folders', methods=['GET'])
@@ -3361,9 +3170,6 @@ def api_emails_folders(current_user):
       ]
     }
     """
-    import imaplib
-    from encryption_utils import decrypt_password
-
     user_email = current_user.get('user_email')
     account_id = request.args.get('account_id', type=int)
     if not account_id:
@@ -3384,16 +3190,9 @@ def api_emails_folders(current_user):
         if not settings or not settings.get('imap_host'):
             return jsonify({'error': 'IMAP settings not configured'}), 400
 
-        host = settings['imap_host']
-        port = int(settings.get('imap_port', 993))
-        user = settings['imap_user']
-        pw = decrypt_password(settings['imap_pass_encrypted']) if settings['imap_pass_encrypted'] else ''
-
-        M = imaplib.IMAP4_SSL(host, port, timeout=15)
-        M.login(user, pw)
-        typ, data = M.list()
+        with imap_pool.session(imap_pool.account_key(account_id), settings) as M:
+            typ, data = M.list()
         if typ != 'OK':
-            M.logout()
             return jsonify({'error': 'IMAP LIST failed'}), 500
 
         folders = []
@@ -3464,8 +3263,6 @@ def api_emails_folders(current_user):
                 'label': label,
             })
 
-        M.logout()
-
         # Deduplizieren: pro logischem Ordner nur einen Eintrag behalten
         unique_folders = []
         seen = set()
@@ -3500,6 +3297,26 @@ def api_emails_folders(current_user):
         return jsonify({'error': str(e), 'trace': traceback.format_exc()}), 500
 
 
+def _encode_list_cursor(received_at, email_id):
+    import base64 as _b64
+    raw = f"{received_at.isoformat() if received_at else ''}|{email_id}"
+    return _b64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_list_cursor(value):
+    """Liefert (received_at, id) aus dem Cursor von /api/emails/list oder None.
+
+    received_at ist None, wenn die letzte Zeile der Seite kein Datum hatte (NULL-Ende der Liste).
+    """
+    import base64 as _b64
+    try:
+        raw = _b64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        ts, email_id = raw.rsplit('|', 1)
+        return (datetime.fromisoformat(ts) if ts else None), int(email_id)
+    except Exception:
+        return None
+
+
 @app.route('/api/emails/list', methods=['GET'])
 @require_auth
 def api_emails_list(current_user):
@@ -3507,120 +3324,123 @@ def api_emails_list(current_user):
 
     Query params:
     - folder: Ordner in der emails-Tabelle (z.B. 'inbox', 'sent', 'archive') oder 'all' für alle Ordner
-    - limit, offset
+    - limit (max. 500)
+    - cursor: ``next_cursor`` der vorherigen Seite (Keyset auf received_at, id);
+      ``offset`` wird nur noch ohne cursor ausgewertet
     - account_id
+    - include: kommagetrennt ``total_all_folders``, ``can_sync_more`` – nur dann
+      werden die zusätzlichen Abfragen ausgeführt
+
+    Die Liste liest nur ``emails.preview`` (beim Sync befüllt), nie body_text/body_html.
     """
     user_email = current_user.get('user_email')
     folder = request.args.get('folder', 'inbox')
-    limit = int(request.args.get('limit', 50))
+    limit = min(max(int(request.args.get('limit', 50)), 1), 500)
     offset = int(request.args.get('offset', 0))
     account_id = request.args.get('account_id', type=int)
+    include = {p.strip() for p in (request.args.get('include') or '').split(',') if p.strip()}
     if not account_id:
         return jsonify({'error': 'account_id erforderlich'}), 400
-    
+
+    cursor_value = request.args.get('cursor')
+    after = None
+    if cursor_value:
+        after = _decode_list_cursor(cursor_value)
+        if after is None:
+            return jsonify({'error': 'Ungültiger cursor'}), 400
+
     try:
         conn = get_settings_db_connection()
         cursor = conn.cursor(dictionary=True)
-        
-        # Get emails with contact info
-        if folder == 'all':
-            cursor.execute(
-                """
-                SELECT e.id, e.message_id, e.from_addr, e.from_name, e.to_addrs, e.subject,
-                       e.body_text, e.body_html, e.received_at, e.folder, e.is_read, e.is_replied, e.starred,
-                       e.has_attachments, e.urgency_level, e.importance_level,
-                       c.name as contact_name, c.contact_email, c.email_count as contact_email_count
-                FROM emails e
-                LEFT JOIN contacts c ON e.contact_id = c.id
-                WHERE e.user_email = %s AND e.account_id = %s
-                ORDER BY e.received_at DESC
-                LIMIT %s OFFSET %s
-                """,
-                (user_email, account_id, limit, offset)
-            )
-        else:
-            # Für bestimmte Folder (z.B. 'sent') auch historische Varianten mit berücksichtigen
-            if folder == 'sent':
-                folder_values = ('sent', 'inbox.sent', 'sent items')
-                cursor.execute(
-                    """
-                    SELECT e.id, e.message_id, e.from_addr, e.from_name, e.to_addrs, e.subject,
-                           e.body_text, e.body_html, e.received_at, e.folder, e.is_read, e.is_replied, e.starred,
-                           e.has_attachments, e.urgency_level, e.importance_level,
-                           c.name as contact_name, c.contact_email, c.email_count as contact_email_count
-                    FROM emails e
-                    LEFT JOIN contacts c ON e.contact_id = c.id
-                    WHERE e.user_email = %s AND e.account_id = %s AND e.folder IN (%s, %s, %s)
-                    ORDER BY e.received_at DESC
-                    LIMIT %s OFFSET %s
-                    """,
-                    (user_email, account_id, *folder_values, limit, offset)
-                )
-            else:
-                cursor.execute(
-                    """
-                    SELECT e.id, e.message_id, e.from_addr, e.from_name, e.to_addrs, e.subject,
-                           e.body_text, e.body_html, e.received_at, e.folder, e.is_read, e.is_replied, e.starred,
-                           e.has_attachments, e.urgency_level, e.importance_level,
-                           c.name as contact_name, c.contact_email, c.email_count as contact_email_count
-                    FROM emails e
-                    LEFT JOIN contacts c ON e.contact_id = c.id
-                    WHERE e.user_email = %s AND e.account_id = %s AND e.folder = %s
-                    ORDER BY e.received_at DESC
-                    LIMIT %s OFFSET %s
-                    """,
-                    (user_email, account_id, folder, limit, offset)
-                )
-        emails = cursor.fetchall()
-        
-        # Get total count (abhängig von folder/all)
-        if folder == 'all':
-            cursor.execute(
-                "SELECT COUNT(*) as total FROM emails WHERE user_email=%s AND account_id=%s",
-                (user_email, account_id)
-            )
-        else:
-            if folder == 'sent':
-                folder_values = ('sent', 'inbox.sent', 'sent items')
-                cursor.execute(
-                    "SELECT COUNT(*) as total FROM emails WHERE user_email=%s AND account_id=%s AND folder IN (%s, %s, %s)",
-                    (user_email, account_id, *folder_values)
-                )
-            else:
-                cursor.execute(
-                    "SELECT COUNT(*) as total FROM emails WHERE user_email=%s AND account_id=%s AND folder=%s",
-                    (user_email, account_id, folder)
-                )
-        total = cursor.fetchone()['total']
-        
-        # Check if any emails exist at all (to know if sync is needed)
+
+        # Für bestimmte Folder (z.B. 'sent') auch historische Varianten mit berücksichtigen
+        folder_where, folder_params = email_search.folder_filter(folder)
+        where = ["e.user_email = %s", "e.account_id = %s"] + folder_where
+        params = [user_email, account_id] + folder_params
+        count_where_sql = " AND ".join(where)
+        count_params = list(params)
+        if after and after[0] is None:
+            # Schon im NULL-Ende (MySQL sortiert NULL bei DESC ans Ende): nur noch nach id
+            where.append("(e.received_at IS NULL AND e.id < %s)")
+            params.append(after[1])
+        elif after:
+            where.append("(e.received_at < %s OR (e.received_at = %s AND e.id < %s) OR e.received_at IS NULL)")
+            params.extend([after[0], after[0], after[1]])
+
+        # Eine Zeile mehr laden, um has_more ohne COUNT zu kennen
         cursor.execute(
-            "SELECT COUNT(*) as total FROM emails WHERE user_email=%s AND account_id=%s",
-            (user_email, account_id)
+            f"""
+            SELECT e.id, e.message_id, e.from_addr, e.from_name, e.to_addrs, e.subject,
+                   COALESCE(e.preview, LEFT(e.body_text, %s)) AS preview,
+                   e.received_at, e.folder, e.is_read, e.is_replied, e.starred,
+                   e.has_attachments, e.urgency_level, e.importance_level,
+                   c.name as contact_name, c.contact_email, c.email_count as contact_email_count
+            FROM emails e
+            LEFT JOIN contacts c ON e.contact_id = c.id
+            WHERE {" AND ".join(where)}
+            ORDER BY e.received_at DESC, e.id DESC
+            LIMIT %s{"" if after else " OFFSET %s"}
+            """,
+            [email_sync.PREVIEW_CHARS] + params + [limit + 1] + ([] if after else [offset])
         )
-        total_all_folders = cursor.fetchone()['total']
-        
-        # Check if user has email settings (to know if we can sync more)
+        emails = cursor.fetchall()
+        has_more = len(emails) > limit
+        emails = emails[:limit]
+        next_cursor = _encode_list_cursor(emails[-1]['received_at'], emails[-1]['id']) if has_more and emails else None
+
+        # Zähler aus folder_stats (gehört der Account dem User?); COUNT nur als Fallback
         cursor.execute(
-            "SELECT id FROM email_accounts WHERE user_email=%s AND id=%s AND is_active=1 AND imap_host IS NOT NULL",
+            "SELECT is_active, imap_host FROM email_accounts WHERE user_email=%s AND id=%s",
             (user_email, account_id)
         )
-        has_imap_settings = cursor.fetchone() is not None
-        
+        account_row = cursor.fetchone()
+        try:
+            folder_stats.ensure_schema(cursor)
+            stats = folder_stats.load(cursor, account_id) if account_row else {}
+            conn.commit()
+            total = folder_stats.counts_for(stats, folder)[0]
+            total_all = folder_stats.counts_for(stats, 'all')[0]
+        except Exception as e:
+            app.logger.warning(f"[List Emails] folder_stats nicht lesbar, zähle direkt: {e}")
+            conn.rollback()
+            cursor.execute(f"SELECT COUNT(*) as total FROM emails e WHERE {count_where_sql}", count_params)
+            total = cursor.fetchone()['total']
+            total_all = None
+
+        result = {
+            'emails': [],
+            'total': total,
+            'has_more': has_more,  # More in DB
+            'next_cursor': next_cursor,
+        }
+
+        if 'total_all_folders' in include:
+            # Check if any emails exist at all (to know if sync is needed)
+            if total_all is None:
+                cursor.execute(
+                    "SELECT COUNT(*) as total FROM emails WHERE user_email=%s AND account_id=%s",
+                    (user_email, account_id)
+                )
+                total_all = cursor.fetchone()['total']
+            result['total_all_folders'] = total_all
+
+        if 'can_sync_more' in include:
+            # Check if user has email settings (to know if we can sync more)
+            result['can_sync_more'] = bool(account_row and account_row['is_active'] and account_row['imap_host'] is not None)
+
         cursor.close()
         conn.close()
-        
+
         # Format emails for frontend
-        formatted_emails = []
         for email_row in emails:
-            formatted_emails.append({
+            result['emails'].append({
                 'id': email_row['id'],
                 'uid': str(email_row['id']),  # Use DB id as uid for compatibility
                 'from': email_row['from_name'] or email_row['from_addr'],
                 'from_addr': email_row['from_addr'],
                 'subject': email_row['subject'] or '(Kein Betreff)',
                 'date': email_row['received_at'].strftime('%d.%m.%Y %H:%M') if email_row['received_at'] else '',
-                'body_preview': (email_row['body_text'] or '')[:200],
+                'body_preview': email_row['preview'] or '',
                 'is_read': email_row['is_read'],
                 'is_replied': email_row.get('is_replied', 0),
                 'starred': email_row['starred'],
@@ -3631,14 +3451,8 @@ def api_emails_list(current_user):
                 'contact_email': email_row['contact_email'],
                 'contact_email_count': email_row['contact_email_count']
             })
-        
-        return jsonify({
-            'emails': formatted_emails,
-            'total': total,
-            'total_all_folders': total_all_folders,
-            'has_more': (offset + limit) < total,  # More in DB
-            'can_sync_more': has_imap_settings  # Can check server for more
-        }), 200
+
+        return jsonify(result), 200
         
     except Exception as e:
         app.logger.error(f"[List Emails] Error: {e}")
@@ -3659,25 +3473,62 @@ def api_emails_debug_folders():
     try:
         conn = get_settings_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            """
-            SELECT COALESCE(folder, '') AS folder, COUNT(*) AS cnt
-            FROM emails
-            WHERE user_email=%s AND account_id=%s
-            GROUP BY COALESCE(folder, '')
-            ORDER BY cnt DESC
-            """,
-            (user_email, account_id)
-        )
-        rows = cursor.fetchall()
+        cursor.execute("SELECT id FROM email_accounts WHERE user_email=%s AND id=%s", (user_email, account_id))
+        if cursor.fetchone() is None:
+            cursor.close()
+            conn.close()
+            return jsonify({'folders': []})
+        # Rohwerte aus folder_stats (ohne Gruppierung von 'sent'-Varianten)
+        folder_stats.ensure_schema(cursor)
+        stats = folder_stats.load(cursor, account_id)
+        conn.commit()
         cursor.close()
         conn.close()
+        rows = [{'folder': f, 'cnt': c['total'], 'unread': c['unread']} for f, c in stats.items()]
+        rows.sort(key=lambda r: r['cnt'], reverse=True)
         return jsonify({'folders': rows})
     except Exception as e:
         app.logger.error(f"[Emails Debug Folders] Error: {e}")
         return jsonify({'error': 'Error loading debug folders'}), 500
 
 
+@app.route('/api/emails/folder-stats', methods=['GET'])
+@require_auth
+def api_emails_folder_stats(current_user):
+    """Gesamt- und Ungelesen-Zähler aller Ordner eines Accounts (für Badges).
+
+    Query: account_id (required)
+
+    Response: {
+      "folders": {"inbox": {"total": 120, "unread": 3}, "sent": {...}, ...},
+      "all": {"total": 150, "unread": 3}
+    }
+    Liest nur die materialisierte Tabelle folder_stats (eine Zeile pro Ordner).
+    """
+    user_email = current_user.get('user_email')
+    account_id = request.args.get('account_id', type=int)
+    if not account_id:
+        return jsonify({'error': 'account_id erforderlich'}), 400
+
+    try:
+        conn = get_settings_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT id FROM email_accounts WHERE user_email=%s AND id=%s", (user_email, account_id))
+        if cursor.fetchone() is None:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Account nicht gefunden'}), 404
+        folder_stats.ensure_schema(cursor)
+        stats = folder_stats.load(cursor, account_id)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return jsonify(folder_stats.summarize(stats)), 200
+    except Exception as e:
+        app.logger.error(f"[Emails Folder Stats] Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/emails/get/<int:email_id>', methods=['GET'])
 @require_auth
 def api_emails_get(current_user, email_id):
@@ -3686,10 +3537,10 @@ def api_emails_get(current_user, email_id):
 
     try:
         # Kurzzeit-Cache (pro Prozess) prüfen, um wiederholte Aufrufe derselben Mail zu beschleunigen
-        cache_key = f"{user_email}:{email_id}"
-        cached = _cache_get(EMAIL_DETAIL_CACHE, cache_key, ttl=10)
+        cache_key = (user_email, email_id)
+        cached = EMAIL_DETAIL_CACHE.get(cache_key)
         if cached is not None:
-            return jsonify(cached.get('payload') or {}), 200
+            return jsonify(cached), 200
 
         conn = get_settings_db_connection()
         cursor = conn.cursor(dictionary=True)
@@ -3739,7 +3590,7 @@ def api_emails_get(current_user, email_id):
 
         # In-Memory-Cache aktualisieren (Best Effort)
         try:
-            _cache_set(EMAIL_DETAIL_CACHE, cache_key, {'payload': payload})
+            EMAIL_DETAIL_CACHE.set(cache_key, payload)
         except Exception:
             pass
 
@@ -3750,281 +3601,275 @@ def api_emails_get(current_user, email_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/emails/<int:email_id>/attachments', methods=['GET'])
-@require_auth
-def api_email_attachments_list(current_user, email_id):
-    """Listet Attachments einer E-Mail über IMAP auf.
-
-    Liefert eine schlanke Liste mit Index, Dateiname, Content-Type und Größe (Bytes),
-    basierend auf der Originalnachricht auf dem IMAP-Server.
-    """
-
-    import imaplib, email as _email_mod
-    from encryption_utils import decrypt_password
-
-    user_email = current_user.get('user_email')
-    M = None
-
+def _attachment_email_row(user_email, email_id):
+    """E-Mail samt IMAP-Zugangsdaten des Accounts für die Attachment-Endpunkte."""
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
     try:
-        conn = get_settings_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        email_attachments.ensure_attachments_schema(cursor)
         cursor.execute(
             """
-            SELECT e.id, e.message_id, e.folder, e.account_id, e.user_email,
-                   a.imap_host, a.imap_port, a.imap_user, a.imap_pass_encrypted, a.imap_security
+            SELECT e.*, a.imap_host, a.imap_port, a.imap_user, a.imap_pass_encrypted, a.imap_security
             FROM emails e
             JOIN email_accounts a ON e.account_id = a.id
             WHERE e.id = %s AND e.user_email = %s AND a.user_email = %s AND a.is_active = 1
             """,
             (email_id, user_email, user_email),
         )
-        row = cursor.fetchone()
+        return cursor.fetchone()
+    finally:
         cursor.close()
         conn.close()
 
-        if not row:
-            return jsonify({'error': 'Email oder Account nicht gefunden'}), 404
 
-        message_id = (row.get('message_id') or '').strip()
-        if not message_id:
-            return jsonify({'error': 'Message-ID fehlt; Attachments können nicht geladen werden'}), 400
+def _attachment_imap_folder(folder_db):
+    fu = (folder_db or '').upper()
+    if 'SENT' in fu:
+        return 'Sent'
+    if 'ARCHIVE' in fu or 'ARCHIV' in fu:
+        return 'Archive'
+    if 'SPAM' in fu or 'JUNK' in fu:
+        return 'Junk'
+    return 'INBOX' if folder_db in ('inbox', '', None) else folder_db
 
-        host = row.get('imap_host')
-        port = int(row.get('imap_port') or 993)
-        imap_user = row.get('imap_user')
-        imap_pass = decrypt_password(row.get('imap_pass_encrypted')) if row.get('imap_pass_encrypted') else ''
-        imap_security = (row.get('imap_security') or 'ssl').lower()
 
-        if not (host and imap_user and imap_pass):
-            return jsonify({'error': 'IMAP-Konfiguration unvollständig'}), 400
-
-        folder_db = (row.get('folder') or 'inbox').lower()
-        folder_imap = 'INBOX'
-        fu = folder_db.upper()
-        if 'SENT' in fu:
-            folder_imap = 'Sent'
-        elif 'ARCHIVE' in fu or 'ARCHIV' in fu:
-            folder_imap = 'Archive'
-        elif 'SPAM' in fu or 'JUNK' in fu:
-            folder_imap = 'Junk'
-        else:
-            folder_imap = 'INBOX' if folder_db in ('inbox', '', None) else folder_db
+def _attachment_uid(M, row, use_stored=True):
+    """UID der Nachricht: gespeicherte imap_uid, sonst (langsam) per SEARCH über die Message-ID."""
+    if use_stored and row.get('imap_uid'):
+        return row['imap_uid']
+    message_id = (row.get('message_id') or '').strip()
+    if not message_id:
+        return None
+    typ, data = M.uid('search', None, f'HEADER Message-ID "{message_id}"')
+    if typ != 'OK' or not data or not data[0]:
+        return None
+    return int(data[0].split()[0])
 
-        # Mit IMAP verbinden und Nachricht per Message-ID suchen
-        if imap_security == 'starttls':
-            M = imaplib.IMAP4_SSL(host, port, timeout=15)
-        else:
-            M = imaplib.IMAP4_SSL(host, port, timeout=15)
 
-        M.login(imap_user, imap_pass)
+def _load_email_attachments(row):
+    """Attachment-Metadaten aus der DB; fehlen sie (ältere Mails), einmalig per BODYSTRUCTURE nachladen.
 
+    Liefert (attachments, None) oder (None, (fehlermeldung, status)).
+    """
+    if row.get('attachments_indexed'):
+        conn = get_settings_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
-            try:
-                sel_typ, _ = M.select(f'"{folder_imap}"')
-            except imaplib.IMAP4.error:
-                sel_typ, _ = M.select(folder_imap)
-        except imaplib.IMAP4.error as e_sel:
-            M.close()
-            M.logout()
-            return jsonify({'error': f'IMAP SELECT fehlgeschlagen: {e_sel}'}), 500
-
-        if sel_typ != 'OK':
-            M.close()
-            M.logout()
-            return jsonify({'error': f'IMAP SELECT Status {sel_typ}'}), 500
-
-        # Suche nach exakter Message-ID im Header
-        search_crit = f'HEADER Message-ID "{message_id}"'
-        typ, data = M.search(None, search_crit)
-        if typ != 'OK' or not data or not data[0]:
-            M.close()
-            M.logout()
-            return jsonify({'error': 'Nachricht auf IMAP-Server nicht gefunden'}), 404
+            return email_attachments.load_attachments(cursor, row['id']), None
+        finally:
+            cursor.close()
+            conn.close()
 
-        uids = data[0].split()
-        uid = uids[0]
-        typ, msg_data = M.fetch(uid, '(BODY.PEEK[])')
-        if typ != 'OK' or not msg_data:
-            M.close()
-            M.logout()
-            return jsonify({'error': 'IMAP FETCH fehlgeschlagen'}), 500
-
-        tup = msg_data[0]
-        raw_email = tup[1] if isinstance(tup, tuple) else tup
-        msg = _email_mod.message_from_bytes(raw_email)
-
-        attachments = []
-        idx = 0
-        for part in msg.walk():
-            filename = part.get_filename()
-            if not filename:
-                continue
-            try:
-                payload = part.get_payload(decode=True) or b''
-                size_bytes = len(payload)
-            except Exception:
-                payload = b''
-                size_bytes = 0
-            attachments.append({
-                'idx': idx,
-                'filename': filename,
-                'content_type': part.get_content_type() or 'application/octet-stream',
-                'size': size_bytes,
-            })
-            idx += 1
+    if not (row.get('imap_host') and row.get('imap_user') and row.get('imap_pass_encrypted')):
+        return None, ('IMAP-Konfiguration unvollständig', 400)
 
-        M.close()
-        M.logout()
+    folder_imap = _attachment_imap_folder((row.get('folder') or 'inbox').lower())
+    with imap_pool.session(imap_pool.account_key(row['account_id']), row, folder=folder_imap) as M:
+        uid = _attachment_uid(M, row)
+        attachments = email_attachments.fetch_bodystructure(M, uid) if uid else None
+        if attachments is None and row.get('imap_uid'):
+            # Gespeicherte UID veraltet (z.B. verschoben) -> über Message-ID suchen
+            uid = _attachment_uid(M, row, use_stored=False)
+            attachments = email_attachments.fetch_bodystructure(M, uid) if uid else None
+    if attachments is None:
+        return None, ('Nachricht auf IMAP-Server nicht gefunden', 404)
+
+    try:
+        conn = get_settings_db_connection()
+        cursor = conn.cursor()
+        email_attachments.store_attachments(cursor, {row['id']: attachments}, replace=True)
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        app.logger.warning(f"[Attachments] Metadaten für email_id={row['id']} nicht gespeichert: {e}")
+    return [dict(a, sha256=None) for a in attachments], None
+
+
+@app.route('/api/emails/<int:email_id>/attachments', methods=['GET'])
+@require_auth
+def api_email_attachments_list(current_user, email_id):
+    """Listet Attachments einer E-Mail auf.
+
+    Liefert eine schlanke Liste mit Index, Dateiname, Content-Type und Größe (Bytes)
+    aus ``email_attachments`` (beim Sync befüllt); für ältere Mails wird einmalig
+    die BODYSTRUCTURE vom IMAP-Server geholt, ohne die Nachricht zu laden.
+    """
 
-        return jsonify({'__ok': True, 'attachments': attachments}), 200
+    import imaplib
+
+    user_email = current_user.get('user_email')
+
+    try:
+        row = _attachment_email_row(user_email, email_id)
+        if not row:
+            return jsonify({'error': 'Email oder Account nicht gefunden'}), 404
+
+        try:
+            attachments, error = _load_email_attachments(row)
+        except imaplib.IMAP4.error as e_imap:
+            return jsonify({'error': f'IMAP-Fehler: {e_imap}'}), 500
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        return jsonify({'__ok': True, 'attachments': [email_attachments.public_view(a) for a in attachments]}), 200
 
     except Exception as e:
-        if M is not None:
-            try:
-                M.close()
-                M.logout()
-            except Exception:
-                pass
         app.logger.error(f"[Attachments List] Error for email_id={email_id}: {e}")
         return jsonify({'error': 'Fehler beim Laden der Attachments'}), 500
 
 
+def _iter_attachment_from_imap(row, att):
+    """Generator über die dekodierten Chunks eines Anhangs direkt vom IMAP-Server.
+
+    Das erste ``next()`` prüft nur, ob die Nachricht gefunden wurde (None = nein,
+    b'' = ja). Jedes weitere Teilstück wird unter einer eigenen, kurzen
+    Pool-Ausleihe geholt: ein langsamer Client hält zwischen den Stücken keine
+    IMAP-Session fest und blockiert so keine anderen Endpunkte des Accounts.
+    """
+    folder_imap = _attachment_imap_folder((row.get('folder') or 'inbox').lower())
+    key = imap_pool.account_key(row['account_id'])
+    chunk_size = email_attachments.FETCH_CHUNK_BYTES
+    with imap_pool.session(key, row, folder=folder_imap) as M:
+        uid = _attachment_uid(M, row)
+        first = email_attachments.fetch_section_range(M, uid, att['section'], 0, chunk_size) if uid else None
+        if first is None and row.get('imap_uid'):
+            # Gespeicherte UID veraltet (z.B. verschoben) -> über Message-ID suchen
+            uid = _attachment_uid(M, row, use_stored=False)
+            first = email_attachments.fetch_section_range(M, uid, att['section'], 0, chunk_size) if uid else None
+    if first is None:
+        yield None
+        return
+    yield b''
+
+    def _fetch_range(offset, length):
+        with imap_pool.session(key, row, folder=folder_imap) as M:
+            return email_attachments.fetch_section_range(M, uid, att['section'], offset, length)
+
+    yield from email_attachments.iter_section(_fetch_range, att.get('encoding'), first, chunk_size)
+
+
+def _remember_attachment_blob(email_id, idx, writer):
+    """Blob in den Cache übernehmen und den Hash an der Attachment-Zeile merken; liefert den Hash."""
+    sha = None
+    try:
+        sha = writer.commit()
+        conn = get_settings_db_connection()
+        cursor = conn.cursor()
+        email_attachments.remember_blob(cursor, email_id, idx, sha, writer.size)
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        app.logger.warning(f"[Attachment Download] Blob-Cache für email_id={email_id}, idx={idx} nicht aktualisiert: {e}")
+    finally:
+        writer.abort()
+    return sha
+
+
 @app.route('/api/emails/<int:email_id>/attachments/<int:idx>/download', methods=['GET'])
 @require_auth
 def api_email_attachment_download(current_user, email_id, idx):
-    """Lädt einen konkreten Anhang einer E-Mail über IMAP herunter."""
+    """Lädt einen konkreten Anhang herunter (gestreamt, mit HTTP-Range-Support).
 
-    import imaplib, email as _email_mod
-    from flask import make_response
-    from encryption_utils import decrypt_password
+    Bereits geladene Anhänge kommen per ``send_file`` aus dem lokalen Blob-Cache
+    (Range/If-Range inklusive). Sonst wird nur die passende Section
+    (``BODY.PEEK[n.m]``) in Teilstücken vom IMAP-Server geholt, stückweise
+    dekodiert und gleichzeitig an den Client und in den Cache geschrieben.
+    Range-Requests für noch nicht gecachte Anhänge füllen zuerst den Cache.
+    """
+
+    import imaplib
+    from flask import send_file
 
     user_email = current_user.get('user_email')
-    M = None
 
     try:
-        conn = get_settings_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            """
-            SELECT e.id, e.message_id, e.folder, e.account_id, e.user_email,
-                   a.imap_host, a.imap_port, a.imap_user, a.imap_pass_encrypted, a.imap_security
-            FROM emails e
-            JOIN email_accounts a ON e.account_id = a.id
-            WHERE e.id = %s AND e.user_email = %s AND a.user_email = %s AND a.is_active = 1
-            """,
-            (email_id, user_email, user_email),
-        )
-        row = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
+        row = _attachment_email_row(user_email, email_id)
         if not row:
             return jsonify({'error': 'Email oder Account nicht gefunden'}), 404
 
-        message_id = (row.get('message_id') or '').strip()
-        if not message_id:
-            return jsonify({'error': 'Message-ID fehlt; Attachment kann nicht geladen werden'}), 400
+        try:
+            attachments, error = _load_email_attachments(row)
+        except imaplib.IMAP4.error as e_imap:
+            return jsonify({'error': f'IMAP-Fehler: {e_imap}'}), 500
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        att = next((a for a in attachments if a['idx'] == idx), None)
+        if att is None:
+            return jsonify({'error': 'Attachment-Index nicht gefunden'}), 404
 
-        host = row.get('imap_host')
-        port = int(row.get('imap_port') or 993)
-        imap_user = row.get('imap_user')
-        imap_pass = decrypt_password(row.get('imap_pass_encrypted')) if row.get('imap_pass_encrypted') else ''
-        imap_security = (row.get('imap_security') or 'ssl').lower()
+        content_type = att['content_type'] or 'application/octet-stream'
 
-        if not (host and imap_user and imap_pass):
-            return jsonify({'error': 'IMAP-Konfiguration unvollständig'}), 400
+        def _send_blob(path):
+            return send_file(path, mimetype=content_type, as_attachment=True,
+                             download_name=att['filename'], conditional=True)
 
-        folder_db = (row.get('folder') or 'inbox').lower()
-        folder_imap = 'INBOX'
-        fu = folder_db.upper()
-        if 'SENT' in fu:
-            folder_imap = 'Sent'
-        elif 'ARCHIVE' in fu or 'ARCHIV' in fu:
-            folder_imap = 'Archive'
-        elif 'SPAM' in fu or 'JUNK' in fu:
-            folder_imap = 'Junk'
-        else:
-            folder_imap = 'INBOX' if folder_db in ('inbox', '', None) else folder_db
-
-        if imap_security == 'starttls':
-            M = imaplib.IMAP4_SSL(host, port, timeout=15)
-        else:
-            M = imaplib.IMAP4_SSL(host, port, timeout=15)
+        blob_path = email_attachments.blob_store.get(att.get('sha256'))
+        if blob_path:
+            return _send_blob(blob_path)
 
-        M.login(imap_user, imap_pass)
+        if not (row.get('imap_host') and row.get('imap_user') and row.get('imap_pass_encrypted')):
+            return jsonify({'error': 'IMAP-Konfiguration unvollständig'}), 400
 
+        chunks = _iter_attachment_from_imap(row, att)
         try:
-            try:
-                sel_typ, _ = M.select(f'"{folder_imap}"')
-            except imaplib.IMAP4.error:
-                sel_typ, _ = M.select(folder_imap)
-        except imaplib.IMAP4.error as e_sel:
-            M.close()
-            M.logout()
-            return jsonify({'error': f'IMAP SELECT fehlgeschlagen: {e_sel}'}), 500
-
-        if sel_typ != 'OK':
-            M.close()
-            M.logout()
-            return jsonify({'error': f'IMAP SELECT Status {sel_typ}'}), 500
-
-        search_crit = f'HEADER Message-ID "{message_id}"'
-        typ, data = M.search(None, search_crit)
-        if typ != 'OK' or not data or not data[0]:
-            M.close()
-            M.logout()
+            found = next(chunks)
+        except imaplib.IMAP4.error as e_imap:
+            return jsonify({'error': f'IMAP-Fehler: {e_imap}'}), 500
+        if found is None:
+            chunks.close()
             return jsonify({'error': 'Nachricht auf IMAP-Server nicht gefunden'}), 404
 
-        uids = data[0].split()
-        uid = uids[0]
-        typ, msg_data = M.fetch(uid, '(BODY.PEEK[])')
-        if typ != 'OK' or not msg_data:
-            M.close()
-            M.logout()
-            return jsonify({'error': 'IMAP FETCH fehlgeschlagen'}), 500
-
-        tup = msg_data[0]
-        raw_email = tup[1] if isinstance(tup, tuple) else tup
-        msg = _email_mod.message_from_bytes(raw_email)
-
-        # Gewünschten Attachment-Part finden
-        current_idx = 0
-        target_part = None
-        target_filename = None
-        for part in msg.walk():
-            filename = part.get_filename()
-            if not filename:
-                continue
-            if current_idx == idx:
-                target_part = part
-                target_filename = filename
-                break
-            current_idx += 1
-
-        if target_part is None:
-            M.close()
-            M.logout()
-            return jsonify({'error': 'Attachment-Index nicht gefunden'}), 404
-
-        payload = target_part.get_payload(decode=True) or b''
-        content_type = target_part.get_content_type() or 'application/octet-stream'
+        writer = email_attachments.blob_store.writer()
 
-        M.close()
-        M.logout()
+        if request.headers.get('Range') and email_attachments.blob_store.enabled:
+            # Byte-Offsets im dekodierten Inhalt lassen sich nicht direkt auf die
+            # kodierte Section abbilden -> erst in den Cache streamen, dann ranged ausliefern
+            try:
+                for chunk in chunks:
+                    writer.write(chunk)
+            finally:
+                chunks.close()
+            blob_path = email_attachments.blob_store.get(_remember_attachment_blob(email_id, idx, writer))
+            if blob_path:
+                return _send_blob(blob_path)
+            # Anhang größer als der Cache: ohne Range ausliefern
+            chunks = _iter_attachment_from_imap(row, att)
+            if next(chunks) is None:
+                chunks.close()
+                return jsonify({'error': 'Nachricht auf IMAP-Server nicht gefunden'}), 404
+            writer = email_attachments.blob_store.writer()
+
+        def _stream():
+            completed = False
+            try:
+                for chunk in chunks:
+                    writer.write(chunk)
+                    yield chunk
+                completed = True
+            except Exception as e:
+                app.logger.error(f"[Attachment Download] Stream abgebrochen für email_id={email_id}, idx={idx}: {e}")
+                # Weiterreichen: der Server bricht die Antwort ab, statt sie als vollständigen 200 abzuschließen
+                raise
+            finally:
+                chunks.close()
+                if completed:
+                    _remember_attachment_blob(email_id, idx, writer)
+                else:
+                    writer.abort()
 
-        resp = make_response(payload)
-        resp.headers['Content-Type'] = content_type
+        resp = Response(_stream(), mimetype=content_type)
+        # Bricht der Client ab, bevor der Stream startet, den Generator trotzdem schließen
+        resp.call_on_close(chunks.close)
         # Content-Disposition mit einfachem Filename, Sonderzeichen werden vom Browser gehandhabt
-        resp.headers['Content-Disposition'] = f'attachment; filename="{target_filename}"'
+        resp.headers['Content-Disposition'] = f'attachment; filename="{att["filename"]}"'
+        if email_attachments.blob_store.enabled:
+            resp.headers['Accept-Ranges'] = 'bytes'
         return resp
 
     except Exception as e:
-        if M is not None:
-            try:
-                M.close()
-                M.logout()
-            except Exception:
-                pass
         app.logger.error(f"[Attachment Download] Error for email_id={email_id}, idx={idx}: {e}")
         return jsonify({'error': 'Fehler beim Herunterladen des Attachments'}), 500
 
@@ -4998,7 +4843,8 @@ Sei präzise, geschäftlich und hilfreich. Max 220 Wörter."""
         
         # Profil mit GPT erzeugen. Fehler (v.a. Kontext-Limit) in kurze Meldung kapseln.
         try:
-            response = openai_client.chat.completions.create(
+            response = llm_gateway.chat(
+                priority=llm_gateway.BACKGROUND,
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "Du bist ein CRM-Analyst, der Kundenprofile erstellt."},
@@ -5052,7 +4898,8 @@ Sei präzise, geschäftlich und hilfreich. Max 220 Wörter."""
             "Wenn du keine sinnvollen Themen findest, gib {\"topics\": []} zurück."
         )
 
-        topics_response = openai_client.chat.completions.create(
+        topics_response = llm_gateway.chat(
+            priority=llm_gateway.BACKGROUND,
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "Du extrahierst strukturierte Themenlisten als JSON für ein CRM."},
@@ -5511,7 +5358,7 @@ def api_contacts_generate_profile_full(current_user, contact_id):
         # dass das LLM-Kontextlimit nicht gesprengt wird
         cursor.execute(
             """
-            SELECT subject, body_text, body_html, received_at, from_addr, to_addrs
+            SELECT id, subject, body_text, body_html, received_at, from_addr, to_addrs
             FROM emails
             WHERE contact_id = %s AND user_email = %s
             ORDER BY received_at DESC
@@ -5549,46 +5396,52 @@ def api_contacts_generate_profile_full(current_user, contact_id):
         # Zusätzlichen Kontext aus Qdrant laden (falls konfiguriert), aber stark begrenzt
         qdrant_context = "(Keine zusätzlichen Qdrant-Kontexte verfügbar)"
         try:
-            # Wir indexieren für diesen Aufruf eine begrenzte Anzahl kürzerer Snippets,
-            # damit Qdrant eine semantische Übersicht über die Historie bekommt.
-            q_texts = []
-            q_meta = []
-            for e in emails[:40]:  # nur die neuesten 40 Mails für Qdrant verwenden
-                date_str = e['received_at'].strftime('%Y-%m-%d') if e['received_at'] else ''
-                subj = (e.get('subject') or '').strip()
-                body = (e.get('body_text') or e.get('body_html') or '')
-                snippet = body[:300]
-                q_texts.append(f"[{date_str}] {subj}\n{snippet}")
-                q_meta.append({
-                    'user_email': user_email,
-                    'contact_id': contact_id,
-                    'subject': subj,
-                    'received_at': e.get('received_at').isoformat() if e.get('received_at') else None,
-                })
-            if q_texts:
+            # Mit aktivem Hintergrund-Index liegen die Mails schon in Qdrant (email_indexer);
+            # sonst für diesen Aufruf eine begrenzte Anzahl kürzerer Snippets indexieren.
+            source = 'email'
+            if not email_indexer.enabled():
+                source = 'email_snippet'
+                q_texts = []
+                q_meta = []
+                q_ids = []
+                for e in emails[:40]:  # nur die neuesten 40 Mails für Qdrant verwenden
+                    date_str = e['received_at'].strftime('%Y-%m-%d') if e['received_at'] else ''
+                    subj = (e.get('subject') or '').strip()
+                    body = (e.get('body_text') or e.get('body_html') or '')
+                    snippet = body[:300]
+                    q_texts.append(f"[{date_str}] {subj}\n{snippet}")
+                    q_ids.append(qdrant_store.point_id(user_email, 'email', e['id'], 'snippet'))
+                    q_meta.append({
+                        'source': source,
+                        'user_email': user_email,
+                        'contact_id': contact_id,
+                        'subject': subj,
+                        'email_id': e['id'],
+                        'received_at': e.get('received_at').isoformat() if e.get('received_at') else None,
+                    })
                 try:
-                    # Indexierung; IDs werden intern generiert
-                    qdrant_store.upsert_texts(q_texts, metadata=q_meta)
+                    # Indexierung (idempotent: bereits gespeicherte, unveränderte Snippets werden übersprungen)
+                    qdrant_store.upsert_texts(q_texts, ids=q_ids, metadata=q_meta)
                 except Exception as e_q_up:
                     app.logger.warning(f"[QDRANT FullProfile] Upsert-Fehler (ignoriert): {e_q_up}")
 
-                # Generische Suchanfrage für den Kontaktverlauf
-                query_text = f"Wichtigste Themen, Entscheidungen und Probleme in der Kommunikation mit {contact['name'] or contact['contact_email']}"
-                try:
-                    # Nur wenige Top-Treffer verwenden, um Tokens klein zu halten
-                    results = qdrant_store.similarity_search(query_text, limit=10)
-                    lines = []
-                    for r in results:
-                        payload = r.get('payload') or {}
-                        subj = (payload.get('subject') or '').strip()
-                        rdate = payload.get('received_at') or ''
-                        text = (payload.get('text') or r.get('text') or '')
-                        text_short = text.replace('\n', ' ')[:180]
-                        lines.append(f"- ({rdate}) {subj}: {text_short}")
-                    if lines:
-                        qdrant_context = "\n".join(lines)
-                except Exception as e_q_s:
-                    app.logger.warning(f"[QDRANT FullProfile] Search-Fehler (ignoriert): {e_q_s}")
+            # Generische Suchanfrage für den Kontaktverlauf
+            query_text = f"Wichtigste Themen, Entscheidungen und Probleme in der Kommunikation mit {contact['name'] or contact['contact_email']}"
+            try:
+                # Nur wenige Top-Treffer verwenden, um Tokens klein zu halten; immer auf User und Kontakt gefiltert
+                results = email_indexer.search(user_email, query_text, limit=10, contact_id=contact_id, source=source)
+                lines = []
+                for r in results:
+                    payload = r.get('payload') or {}
+                    subj = (payload.get('subject') or '').strip()
+                    rdate = payload.get('received_at') or ''
+                    text = (payload.get('text') or r.get('text') or '')
+                    text_short = text.replace('\n', ' ')[:180]
+                    lines.append(f"- ({rdate}) {subj}: {text_short}")
+                if lines:
+                    qdrant_context = "\n".join(lines)
+            except Exception as e_q_s:
+                app.logger.warning(f"[QDRANT FullProfile] Search-Fehler (ignoriert): {e_q_s}")
         except Exception as e_q:
             try:
                 app.logger.warning(f"[QDRANT FullProfile] Allgemeiner Fehler (ignoriert): {e_q}")
@@ -5622,7 +5475,8 @@ Nutze eine sachliche, professionelle Sprache. Gliedere mit klaren Überschriften
 
         # Vollprofil mit GPT erzeugen und Kontextfehler sauber abfangen
         try:
-            response = openai_client.chat.completions.create(
+            response = llm_gateway.chat(
+                priority=llm_gateway.BACKGROUND,
                 model="gpt-4.1-mini",
                 messages=[
                     {"role": "system", "content": "Du erstellst ausführliche CRM-Gesamtprofile auf Basis von Notizen und E-Mail-Historien."},
@@ -6396,7 +6250,7 @@ def api_email_reply_prep(current_user, email_id):
                         "Gib 2-4 sehr kurze Stichworte (max. 6-8 Wörter) auf Deutsch zurück. "
                         "Kein Fließtext, nur Stichworte. Fokus: Kernanliegen und offene Punkte.\n\n" + body_for_summary
                     )
-                    resp_sum = openai_client.chat.completions.create(
+                    resp_sum = llm_gateway.chat(
                         model="gpt-4.1-mini",
                         messages=[
                             {"role": "system", "content": "Du schreibst sehr knappe, stichpunktartige Zusammenfassungen."},
@@ -6404,6 +6258,7 @@ def api_email_reply_prep(current_user, email_id):
                         ],
                         temperature=0.2,
                         max_tokens=220,
+                        cache=not force,
                     )
                     txt = resp_sum.choices[0].message.content if resp_sum.choices else ''
                     if txt:
@@ -6430,7 +6285,7 @@ def api_email_reply_prep(current_user, email_id):
                         "Fokussiere dich bei title und explanation auf die eigentlichen Sachverhalte und Aufgaben der Nachricht.\n\n"
                         + body_for_topics
                     )
-                    resp_topics = openai_client.chat.completions.create(
+                    resp_topics = llm_gateway.chat(
                         model="gpt-4.1-mini",
                         messages=[
                             {"role": "system", "content": "Du extrahierst Themen aus E-Mails und lieferst pro Thema passende Antwortoptionen als JSON-Liste."},
@@ -6438,6 +6293,7 @@ def api_email_reply_prep(current_user, email_id):
                         ],
                         temperature=0.2,
                         max_tokens=600,
+                        cache=not force,
                     )
                     t_txt = resp_topics.choices[0].message.content if resp_topics.choices else ''
                     raw_topics_llm = t_txt or ''
@@ -6744,7 +6600,7 @@ def api_reply_prep_manual_draft(current_user):
                 prompt += f"Kurze Beschreibung des Themas: {topic_expl}\n"
             prompt += f"Stichworte zur gewünschten Antwort: {note}"
 
-            resp = openai_client.chat.completions.create(
+            resp = llm_gateway.chat(
                 model="gpt-4.1-mini",
                 messages=[
                     {"role": "system", "content": "Du formulierst prägnante, freundliche E-Mail-Antworten auf Deutsch."},
@@ -6752,6 +6608,7 @@ def api_reply_prep_manual_draft(current_user):
                 ],
                 temperature=0.3,
                 max_tokens=220,
+                cache=False,  # erneuter Klick soll eine neue Formulierung liefern
             )
             snippet = resp.choices[0].message.content.strip() if resp.choices else ''
             if not snippet:
@@ -6846,6 +6703,9 @@ def api_emails_thread(current_user):
     
     # Get user-specific email settings
     user_email = current_user.get('user_email')
+    cached = THREAD_CACHE.get((user_email, uid))
+    if cached is not None:
+        return jsonify(cached)
     try:
         conn = get_settings_db_connection()
         cursor = conn.cursor(dictionary=True)
@@ -6874,17 +6734,15 @@ def api_emails_thread(current_user):
     if not (host and user and pw):
         return jsonify({'error': 'IMAP configuration incomplete'}), 400
     try:
-        M = imaplib.IMAP4_SSL(host, port)
-        M.login(user, pw)
-        M.select(mailbox)
-        # Wichtig: BODY.PEEK[] verwenden, damit das reine Lesen der Nachricht
-        # nicht automatisch das IMAP-Flag \\Seen setzt. Das Gelesen-Flag wird
-        # in unserer App ausschließlich über /api/emails/seen gesteuert.
-        typ, msgdata = M.uid('fetch', uid, '(BODY.PEEK[])')
-        if typ != 'OK' or not msgdata or not msgdata[0]:
-            raise RuntimeError('Fetch fehlgeschlagen')
-        raw = msgdata[0][1] if isinstance(msgdata[0], tuple) else msgdata[0]
-        msg = email.message_from_bytes(raw)
+        with imap_pool.session(imap_pool.user_key(user_email), settings, folder=mailbox) as M:
+            # Wichtig: BODY.PEEK[] verwenden, damit das reine Lesen der Nachricht
+            # nicht automatisch das IMAP-Flag \\Seen setzt. Das Gelesen-Flag wird
+            # in unserer App ausschließlich über /api/emails/seen gesteuert.
+            typ, msgdata = M.uid('fetch', uid, '(BODY.PEEK[])')
+            if typ != 'OK' or not msgdata or not msgdata[0]:
+                raise RuntimeError('Fetch fehlgeschlagen')
+            raw = msgdata[0][1] if isinstance(msgdata[0], tuple) else msgdata[0]
+            msg = email.message_from_bytes(raw)
         # Header
         def _decode(s):
             parts = []
@@ -6932,8 +6790,6 @@ def api_emails_thread(current_user):
                         text_body = payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore')
                     except Exception:
                         text_body = payload.decode('utf-8', errors='ignore')
-        M.close()
-        M.logout()
         result = {
             'uid': uid,
             'subject': subject,
@@ -6943,8 +6799,7 @@ def api_emails_thread(current_user):
             'html': html_body,
             'text': text_body
         }
-        import time as _t
-        THREAD_CACHE[uid] = {"data": result, "ts": _t.time()}
+        THREAD_CACHE.set((user_email, uid), result)
         return jsonify(result)
     except Exception as e:
         app.logger.error(f"[IMAP] thread error: {e}")
@@ -6960,8 +6815,6 @@ def api_emails_seen(current_user):
     - Aktualisiert immer emails.is_read in der DB.
     - Versucht zusätzlich, das IMAP-Flag \\Seen anhand der Message-ID zu setzen/zurückzusetzen.
     """
-    import imaplib
-
     data = request.get_json(silent=True) or {}
     email_id = data.get('uid') or data.get('id')
     seen = bool(data.get('seen', True))
@@ -6974,20 +6827,27 @@ def api_emails_seen(current_user):
     try:
         conn = get_settings_db_connection()
         cursor = conn.cursor(dictionary=True)
+        folder_stats.ensure_schema(cursor)
+        # Zeile sperren (wie api_emails_move): parallele seen/unseen-Requests und Moves
+        # sollen den Ungelesen-Zähler nicht doppelt bzw. im falschen Ordner ändern
         cursor.execute(
-            "SELECT id, message_id, account_id, folder FROM emails WHERE id=%s AND user_email=%s",
+            "SELECT id, message_id, account_id, folder, is_read FROM emails WHERE id=%s AND user_email=%s FOR UPDATE",
             (email_id, user_email),
         )
         row = cursor.fetchone()
         if not row:
+            conn.rollback()
             cursor.close()
             conn.close()
             return jsonify({'error': 'E-Mail nicht gefunden'}), 404
 
         cursor.execute(
-            "UPDATE emails SET is_read=%s WHERE id=%s AND user_email=%s",
-            (1 if seen else 0, email_id, user_email),
+            "UPDATE emails SET is_read=%s WHERE id=%s AND user_email=%s AND COALESCE(is_read, 0)<>%s",
+            (1 if seen else 0, email_id, user_email, 1 if seen else 0),
         )
+        # Ungelesen-Zähler des Ordners in derselben Transaktion nachziehen – nur bei echter Änderung
+        if cursor.rowcount:
+            folder_stats.bump(cursor, row.get('account_id'), row.get('folder'), unread=-1 if seen else 1)
         conn.commit()
         message_id = row.get('message_id')
         account_id = row.get('account_id')
@@ -7013,47 +6873,26 @@ def api_emails_seen(current_user):
             cursor.close()
             conn.close()
 
-            if settings and settings.get('imap_host') and settings.get('imap_user'):
-                from encryption_utils import decrypt_password
-
-                host = settings['imap_host']
-                port = int(settings.get('imap_port', 993))
-                imap_user = settings['imap_user']
-                pw = decrypt_password(settings['imap_pass_encrypted']) if settings['imap_pass_encrypted'] else ''
-
-                if host and imap_user and pw:
-                    # Grobe Folder-Mapping-Logik wie im Sync
-                    if folder_db == 'sent':
-                        folder_imap = 'Sent'
-                    elif folder_db == 'archive':
-                        folder_imap = 'Archive'
-                    else:
-                        folder_imap = 'INBOX'
-
-                    M = imaplib.IMAP4_SSL(host, port)
-                    M.login(imap_user, pw)
-                    try:
-                        try:
-                            sel_typ, _ = M.select(f'"{folder_imap}"')
-                        except imaplib.IMAP4.error:
-                            sel_typ, _ = M.select(folder_imap)
-                        if sel_typ == 'OK':
-                            # Nach Message-ID suchen (UID SEARCH HEADER)
-                            search_crit = f'(HEADER Message-ID "{message_id}")'
-                            typ, data = M.uid('search', None, search_crit)
-                            if typ == 'OK' and data and data[0]:
-                                for u in data[0].split():
-                                    if seen:
-                                        M.uid('store', u, '+FLAGS.SILENT', '(\\Seen)')
-                                    else:
-                                        M.uid('store', u, '-FLAGS.SILENT', '(\\Seen)')
-                                imap_updated = True
-                    finally:
-                        try:
-                            M.close()
-                        except Exception:
-                            pass
-                        M.logout()
+            if settings and settings.get('imap_host') and settings.get('imap_user') and settings.get('imap_pass_encrypted'):
+                # Grobe Folder-Mapping-Logik wie im Sync
+                if folder_db == 'sent':
+                    folder_imap = 'Sent'
+                elif folder_db == 'archive':
+                    folder_imap = 'Archive'
+                else:
+                    folder_imap = 'INBOX'
+
+                with imap_pool.session(imap_pool.account_key(account_id), settings, folder=folder_imap) as M:
+                    # Nach Message-ID suchen (UID SEARCH HEADER)
+                    search_crit = f'(HEADER Message-ID "{message_id}")'
+                    typ, data = M.uid('search', None, search_crit)
+                    if typ == 'OK' and data and data[0]:
+                        for u in data[0].split():
+                            if seen:
+                                M.uid('store', u, '+FLAGS.SILENT', '(\\Seen)')
+                            else:
+                                M.uid('store', u, '-FLAGS.SILENT', '(\\Seen)')
+                        imap_updated = True
     except Exception as e:
         # IMAP-Update ist nur Best-Effort; Fehler hier nicht als hartes API-Error behandeln
         app.logger.warning(f"[Emails Seen] IMAP update failed: {e}")
@@ -7082,10 +6921,21 @@ def api_emails_move(current_user):
     try:
         conn = get_settings_db_connection()
         cursor = conn.cursor()
+        folder_stats.ensure_schema(cursor)
+        # Zeile sperren, damit die Ordner-Zähler zum tatsächlichen Move passen
+        cursor.execute(
+            "SELECT account_id, folder, is_read FROM emails WHERE id=%s AND user_email=%s FOR UPDATE",
+            (email_id, user_email),
+        )
+        moved = cursor.fetchone()
         cursor.execute(
             "UPDATE emails SET folder=%s WHERE id=%s AND user_email=%s",
             (target_folder, email_id, user_email),
         )
+        if moved and (moved[1] or '') != target_folder:
+            unread = 0 if moved[2] else 1
+            folder_stats.bump(cursor, moved[0], moved[1], total=-1, unread=-unread)
+            folder_stats.bump(cursor, moved[0], target_folder, total=1, unread=unread)
         conn.commit()
         cursor.close()
         conn.close()
@@ -7093,19 +6943,21 @@ def api_emails_move(current_user):
         app.logger.error(f"[Emails Move] DB error: {e}")
         return jsonify({'error': 'DB-Fehler beim Verschieben der E-Mail'}), 500
 
-    return jsonify({'__ok': True})
+    # Lokalen Suchindex nachziehen (Best Effort)
+    try:
+        if moved and moved[0]:
+            email_search.move_email(moved[0], int(email_id), target_folder)
+    except Exception as e:
+        app.logger.warning(f"[Emails Move] Suchindex nicht aktualisiert: {e}")
 
+    # Semantischen Index nachziehen: Papierkorb/Spam raus, zurück wieder rein (Best Effort)
+    try:
+        if moved and moved[0]:
+            email_indexer.email_moved(user_email, moved[0], int(email_id), moved[1] or '', target_folder)
+    except Exception as e:
+        app.logger.warning(f"[Emails Move] Semantischer Index nicht aktualisiert: {e}")
 
-def get_settings_db_connection():
-    """Connect to SETTINGS_DB (user_email_settings table) or fall back to main DB."""
-    host = os.environ.get('SETTINGS_DB_HOST') or os.environ.get('DB_HOST')
-    port = int(os.environ.get('SETTINGS_DB_PORT') or os.environ.get('DB_PORT', '3306'))
-    user = os.environ.get('SETTINGS_DB_USER') or os.environ.get('DB_USER')
-    pw = os.environ.get('SETTINGS_DB_PASSWORD') or os.environ.get('DB_PASSWORD')
-    db = os.environ.get('SETTINGS_DB_NAME') or os.environ.get('DB_NAME')
-    if not (host and user and pw and db):
-        raise RuntimeError("SETTINGS_DB (or DB) configuration incomplete")
-    return mysql.connector.connect(host=host, port=port, user=user, password=pw, database=db)
+    return jsonify({'__ok': True})
 
 
 @app.route('/api/email-accounts/list', methods=['GET'])
@@ -7314,6 +7166,8 @@ def api_email_account_delete(current_user, account_id: int):
         conn.close()
         if affected == 0:
             return jsonify({'error': 'Account nicht gefunden'}), 404
+        # Offene IMAP-Sessions des Accounts nicht bis zum Idle-Timeout halten
+        imap_pool.discard(imap_pool.account_key(account_id))
         return jsonify({'ok': True}), 200
     except Exception as e:
         app.logger.error(f"[Email-Account-Delete] error: {e}")
@@ -7481,7 +7335,7 @@ def api_user_email_settings_post():
 
 
 def get_users_db_connection():
-    """Connect to users DB (same as SETTINGS_DB or main DB)."""
+    """Connect to users DB (same as SETTINGS_DB or main DB, shares its pool)."""
     return get_settings_db_connection()
 
 
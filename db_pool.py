@@ -0,0 +1,260 @@
+"""
+Gemeinsamer MySQL-Connection-Pool für alle get_*_db_connection-Helfer.
+
+Pro Datenbank (main, settings, blue, ...) wird genau ein Pool je Prozess
+gehalten. Die Helfer liefern ein Proxy-Objekt zurück, das sich wie eine normale
+mysql.connector-Verbindung verhält; ``conn.close()`` gibt die Verbindung an den
+Pool zurück, statt sie abzubauen. Bestehender Code (cursor/commit/close) muss
+daher nicht angepasst werden.
+
+Zusätzlich gibt es eine Context-Manager-API::
+
+    with db_pool.connection('settings', **config) as conn:
+        cur = conn.cursor(dictionary=True)
+        ...
+
+Konfiguration über Env (global oder pro Pool mit Suffix, z.B. DB_POOL_SIZE_BLUE):
+- DB_POOL_ENABLED        (Default true)  – false = immer direkte Verbindungen
+- DB_POOL_SIZE           (Default 5)     – max. Anzahl gehaltener Idle-Verbindungen
+- DB_POOL_MAX_OVERFLOW   (Default 10)    – zusätzliche Verbindungen unter Last
+- DB_POOL_TIMEOUT        (Default 10)    – Sekunden Wartezeit, wenn der Pool erschöpft ist
+- DB_POOL_RECYCLE        (Default 1800)  – Verbindungen älter als N Sekunden neu aufbauen
+- DB_POOL_PING_INTERVAL  (Default 5)     – Health-Check (ping) beim Auschecken, wenn länger idle
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+
+def _env_value(name: str, key: str, default: str) -> str:
+    """Liest DB_POOL_<KEY>_<NAME>, sonst DB_POOL_<KEY>, sonst Default."""
+    specific = os.environ.get(f"DB_POOL_{key}_{name.upper()}")
+    if specific not in (None, ""):
+        return specific
+    generic = os.environ.get(f"DB_POOL_{key}")
+    if generic not in (None, ""):
+        return generic
+    return default
+
+
+def _env_int(name: str, key: str, default: int) -> int:
+    try:
+        return int(_env_value(name, key, str(default)))
+    except Exception:
+        return default
+
+
+def _env_float(name: str, key: str, default: float) -> float:
+    try:
+        return float(_env_value(name, key, str(default)))
+    except Exception:
+        return default
+
+
+def pooling_enabled(name: str = "") -> bool:
+    return _env_value(name, "ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+class ConnectionPool:
+    """Einfacher, threadsicherer Pool für mysql.connector-Verbindungen."""
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.config = dict(config)
+        self.size = max(0, _env_int(name, "SIZE", 5))
+        self.max_overflow = max(0, _env_int(name, "MAX_OVERFLOW", 10))
+        self.timeout = max(0.0, _env_float(name, "TIMEOUT", 10.0))
+        self.recycle = _env_float(name, "RECYCLE", 1800.0)
+        self.ping_interval = _env_float(name, "PING_INTERVAL", 5.0)
+        self._idle: List[Dict[str, Any]] = []  # LIFO: zuletzt genutzte Verbindung zuerst
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "waits": 0, "timeouts": 0}
+
+    # --- intern -------------------------------------------------------------
+    def _connect(self):
+        cnx = mysql.connector.connect(**self.config)
+        with self._cond:
+            self.stats["created"] += 1
+        return {"cnx": cnx, "created": time.time(), "last_used": time.time()}
+
+    def _discard(self, entry: Dict[str, Any]) -> None:
+        with self._cond:
+            self.stats["discarded"] += 1
+        try:
+            entry["cnx"].close()
+        except Exception:
+            pass
+
+    def _healthy(self, entry: Dict[str, Any]) -> bool:
+        now = time.time()
+        if self.recycle > 0 and now - entry["created"] > self.recycle:
+            return False
+        if now - entry["last_used"] < self.ping_interval:
+            return True
+        try:
+            entry["cnx"].ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    # --- API ----------------------------------------------------------------
+    def acquire(self) -> Dict[str, Any]:
+        deadline = time.time() + self.timeout
+        while True:
+            entry = None
+            with self._cond:
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use += 1
+                elif self._in_use < self.size + self.max_overflow:
+                    self._in_use += 1
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        logger.warning(f"[DB-Pool] {self.name}: Timeout nach {self.timeout}s, Pool erschöpft")
+                        raise RuntimeError(
+                            f"DB-Pool '{self.name}' erschöpft ({self._in_use} Verbindungen in Benutzung)"
+                        )
+                    self.stats["waits"] += 1
+                    self._cond.wait(remaining)
+                    continue
+            if entry is not None:
+                if self._healthy(entry):
+                    with self._cond:
+                        self.stats["reused"] += 1
+                    return entry
+                self._discard(entry)
+            # Neue Verbindung aufbauen (Slot ist bereits reserviert)
+            try:
+                return self._connect()
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+    def release(self, entry: Dict[str, Any]) -> None:
+        cnx = entry["cnx"]
+        keep = True
+        try:
+            # Offene Transaktion/ungelesene Ergebnisse verwerfen, damit der
+            # nächste Nutzer eine saubere Session bekommt.
+            cnx.rollback()
+        except Exception:
+            keep = False
+        with self._cond:
+            self._in_use -= 1
+            if keep and len(self._idle) < self.size:
+                entry["last_used"] = time.time()
+                self._idle.append(entry)
+                entry = None
+            self._cond.notify()
+        if entry is not None:
+            self._discard(entry)
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "name": self.name,
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                **self.stats,
+            }
+
+
+class PooledConnection:
+    """Proxy um eine gepoolte Verbindung; close() gibt sie an den Pool zurück."""
+
+    def __init__(self, pool: ConnectionPool, entry: Dict[str, Any]):
+        self._pool = pool
+        self._entry = entry
+        self._cnx = entry["cnx"]
+
+    def close(self) -> None:
+        # Idempotent: mehrfaches close() (z.B. in try und except) ist erlaubt
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool.release(entry)
+
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        if self._entry is None:
+            raise mysql.connector.errors.OperationalError("Verbindung wurde bereits an den Pool zurückgegeben")
+        return getattr(self._cnx, item)
+
+    def is_connected(self) -> bool:
+        if self._entry is None:
+            return False
+        return self._cnx.is_connected()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        # Vergessene close()-Aufrufe sollen den Pool nicht leerlaufen lassen
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_POOLS: Dict[tuple, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+_POOLS_PID = os.getpid()
+
+
+def _get_pool(name: str, config: Dict[str, Any]) -> ConnectionPool:
+    global _POOLS_PID
+    key = (name, config.get("host"), config.get("port"), config.get("user"), config.get("database"))
+    with _POOLS_LOCK:
+        # Nach einem fork (gunicorn) keine Sockets des Elternprozesses weiterverwenden
+        if os.getpid() != _POOLS_PID:
+            _POOLS.clear()
+            _POOLS_PID = os.getpid()
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(name, config)
+            _POOLS[key] = pool
+        return pool
+
+
+def get_pooled_connection(name: str, **config):
+    """Liefert eine Verbindung aus dem Pool ``name`` (oder direkt, wenn Pooling aus ist)."""
+    if not pooling_enabled(name):
+        return mysql.connector.connect(**config)
+    pool = _get_pool(name, config)
+    return PooledConnection(pool, pool.acquire())
+
+
+@contextmanager
+def connection(name: str, **config):
+    conn = get_pooled_connection(name, **config)
+    try:
+        yield conn
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return [p.status() for p in pools]
@@ -1,5 +1,5 @@
 import os
-import mysql.connector
+from db_pool import get_pooled_connection
 
 def get_db_connection():
     host = os.environ.get("DB_HOST")
@@ -7,10 +7,27 @@ def get_db_connection():
     password = os.environ.get("DB_PASSWORD")
     database = os.environ.get("DB_NAME")
     port = int(os.environ.get("DB_PORT", 3306))
-    return mysql.connector.connect(
+    return get_pooled_connection(
+        "main",
         host=host,
         user=user,
         password=password,
         database=database,
         port=port
     )
+
+
+def get_settings_db_connection():
+    """Connect to SETTINGS_DB (user_email_settings table) or fall back to main DB.
+
+    Verbindungen kommen aus dem gemeinsamen Pool 'settings' (siehe db_pool);
+    conn.close() gibt sie an den Pool zurück.
+    """
+    host = os.environ.get('SETTINGS_DB_HOST') or os.environ.get('DB_HOST')
+    port = int(os.environ.get('SETTINGS_DB_PORT') or os.environ.get('DB_PORT', '3306'))
+    user = os.environ.get('SETTINGS_DB_USER') or os.environ.get('DB_USER')
+    pw = os.environ.get('SETTINGS_DB_PASSWORD') or os.environ.get('DB_PASSWORD')
+    db = os.environ.get('SETTINGS_DB_NAME') or os.environ.get('DB_NAME')
+    if not (host and user and pw and db):
+        raise RuntimeError("SETTINGS_DB (or DB) configuration incomplete")
+    return get_pooled_connection('settings', host=host, port=port, user=user, password=pw, database=db)
@@ -1,5 +1,5 @@
 import os
-import mysql.connector
+from db_pool import get_pooled_connection
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,8 +8,10 @@ def get_blue_db_connection():
     """
     Stellt eine Verbindung zur neckattack BLUE-Datenbank her.
     Die Zugangsdaten werden aus den Umgebungsvariablen gelesen.
+    Die Verbindung stammt aus dem gemeinsamen Pool 'blue' (siehe db_pool).
     """
-    return mysql.connector.connect(
+    return get_pooled_connection(
+        'blue',
         host=os.environ.get('BLUE_DB_HOST'),
         user=os.environ.get('BLUE_DB_USER'),
         password=os.environ.get('BLUE_DB_PASSWORD'),
@@ -0,0 +1,579 @@
+"""
+Attachment-Metadaten und lokaler Blob-Cache für E-Mail-Anhänge.
+
+Statt für jede Anhangsliste die komplette Nachricht per ``BODY.PEEK[]`` zu laden
+und alle Parts zu dekodieren, werden Dateiname, Content-Type, Größe und die
+IMAP-Section (z.B. ``2`` oder ``1.3``) in ``email_attachments`` gespeichert:
+
+- beim Sync direkt aus der ohnehin geladenen Nachricht (gleiche Nummerierung
+  wie BODYSTRUCTURE),
+- für ältere Mails einmalig lazy über ``UID FETCH <uid> (BODYSTRUCTURE)``.
+
+Ein Download holt dann nur noch ``BODY.PEEK[<section>]`` – in Teilstücken
+(``<offset.length>``), die direkt dekodiert an den Client gestreamt werden, damit
+der Speicherbedarf unabhängig von der Anhangsgröße bleibt. Dekodierte Anhänge
+landen content-adressiert (SHA-256) in einem Verzeichnis auf der Platte; wird
+das Größenlimit überschritten, fliegen die am längsten nicht gelesenen Dateien
+zuerst raus (LRU über mtime).
+
+Konfiguration über Env:
+- EMAIL_ATTACHMENT_CACHE_DIR     (Default <tmp>/slotbooking_attachments)
+- EMAIL_ATTACHMENT_CACHE_MAX_MB  (Default 512, 0 = Cache aus)
+- EMAIL_ATTACHMENT_FETCH_CHUNK_KB (Default 1024) – Teil-FETCH-Größe beim Streamen
+"""
+import os
+import re
+import base64
+import logging
+import binascii
+import tempfile
+import threading
+import hashlib
+from email.header import decode_header
+from urllib.parse import unquote_to_bytes
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+CACHE_DIR = os.environ.get('EMAIL_ATTACHMENT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'slotbooking_attachments')
+CACHE_MAX_BYTES = max(0, _env_int('EMAIL_ATTACHMENT_CACHE_MAX_MB', 512)) * 1024 * 1024
+# Größe der Teil-FETCHes beim Streamen vom IMAP-Server (kodierte Bytes)
+FETCH_CHUNK_BYTES = max(64, _env_int('EMAIL_ATTACHMENT_FETCH_CHUNK_KB', 1024)) * 1024
+
+ATTACHMENTS_DDL = """
+CREATE TABLE IF NOT EXISTS email_attachments (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    email_id INT NOT NULL,
+    idx INT NOT NULL,
+    section VARCHAR(64) NOT NULL,
+    filename VARCHAR(512) NOT NULL,
+    content_type VARCHAR(255) NOT NULL,
+    encoding VARCHAR(32) NULL,
+    size_bytes BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    size_exact TINYINT(1) NOT NULL DEFAULT 0,
+    content_id VARCHAR(255) NULL,
+    sha256 CHAR(64) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_email_attachments (email_id, idx),
+    KEY idx_email_attachments_sha (sha256)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_SCHEMA_READY = False
+_SCHEMA_LOCK = threading.Lock()
+
+
+def ensure_attachments_schema(cursor) -> None:
+    """Legt email_attachments und emails.attachments_indexed an (einmal pro Prozess, Best Effort)."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if _SCHEMA_READY:
+            return
+        try:
+            cursor.execute(ATTACHMENTS_DDL)
+        except Exception as e:
+            logger.warning(f"[Attachments] DDL email_attachments fehlgeschlagen (ignoriert): {e}")
+        try:
+            cursor.execute("ALTER TABLE emails ADD COLUMN IF NOT EXISTS attachments_indexed TINYINT(1) NOT NULL DEFAULT 0")
+        except Exception as e:
+            logger.warning(f"[Attachments] ALTER emails.attachments_indexed fehlgeschlagen (ignoriert): {e}")
+        _SCHEMA_READY = True
+
+
+# --- BODYSTRUCTURE parsen -----------------------------------------------------
+
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}\r?\n|([^\s()"{]+))', re.DOTALL)
+
+
+def _flatten_fetch_data(data) -> bytes:
+    """Fügt die von imaplib zerlegte FETCH-Antwort (Literale als Tupel) wieder zusammen."""
+    out = b''
+    for item in data or []:
+        if isinstance(item, tuple):
+            out += item[0] + b'\r\n' + (item[1] or b'')
+        elif isinstance(item, (bytes, bytearray)):
+            out += bytes(item)
+    return out
+
+
+def parse_sexp(raw: bytes, pos: int = 0):
+    """Parst eine IMAP-Klammerliste ab ``pos``; liefert (Liste, Endposition).
+
+    Strings werden als ``str`` geliefert, NIL als None, Zahlen bleiben Strings.
+    """
+    stack: List[list] = [[]]
+    while pos < len(raw):
+        m = _TOKEN_RE.match(raw, pos)
+        if not m:
+            break
+        pos = m.end()
+        if m.group(1):
+            stack.append([])
+        elif m.group(2):
+            done = stack.pop()
+            stack[-1].append(done)
+            if len(stack) == 1:
+                return done, pos
+        elif m.group(3) is not None:
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', m.group(3)).decode('utf-8', errors='replace'))
+        elif m.group(4) is not None:
+            n = int(m.group(4))
+            stack[-1].append(raw[pos:pos + n].decode('utf-8', errors='replace'))
+            pos += n
+        else:
+            atom = m.group(5).decode('ascii', errors='replace')
+            stack[-1].append(None if atom.upper() == 'NIL' else atom)
+    raise ValueError('Unvollständige IMAP-Liste')
+
+
+def _decode_words(value: Optional[str]) -> str:
+    if not value:
+        return ''
+    out = []
+    for content, charset in decode_header(value):
+        if isinstance(content, bytes):
+            out.append(content.decode(charset or 'utf-8', errors='replace'))
+        else:
+            out.append(content)
+    return ''.join(out).strip()
+
+
+def _param_dict(params) -> Dict[str, str]:
+    if not isinstance(params, list):
+        return {}
+    return {str(params[i]).lower(): params[i + 1] or '' for i in range(0, len(params) - 1, 2)}
+
+
+def _param_value(params: Dict[str, str], name: str) -> Optional[str]:
+    """Parameterwert inkl. RFC 2231 (``name*=utf-8''...`` und ``name*0*=``-Fortsetzungen)."""
+    if name in params:
+        return _decode_words(params[name])
+    parts = []
+    for key, value in params.items():
+        m = re.fullmatch(re.escape(name) + r'\*(?:(\d+)(\*)?)?', key)
+        if m:
+            encoded = m.group(1) is None or bool(m.group(2))
+            parts.append((int(m.group(1) or 0), encoded, value))
+    if not parts:
+        return None
+    charset = 'utf-8'
+    buf = b''
+    for n, encoded, value in sorted(parts):
+        if encoded:
+            if n == 0 and value.count("'") >= 2:
+                charset, _lang, value = value.split("'", 2)
+            buf += unquote_to_bytes(value)
+        else:
+            buf += value.encode('utf-8')
+    try:
+        return buf.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        return buf.decode('utf-8', errors='replace')
+
+
+def _estimate_decoded_size(size: int, encoding: str) -> int:
+    # BODYSTRUCTURE liefert die Größe der kodierten Daten
+    if encoding == 'base64':
+        return size * 57 // 78  # 76 Zeichen + CRLF pro 57 Bytes
+    return size
+
+
+def attachments_from_bodystructure(node, section: str = '') -> List[Dict[str, Any]]:
+    """Liefert alle Parts mit Dateinamen (Reihenfolge = idx) aus einer geparsten BODYSTRUCTURE."""
+    if not isinstance(node, list) or not node:
+        return []
+    if isinstance(node[0], list):
+        # Kind-Parts stehen vorne, danach Subtype und Erweiterungen (die auch Listen sein können)
+        children = []
+        for c in node:
+            if not isinstance(c, list):
+                break
+            children.append(c)
+        out: List[Dict[str, Any]] = []
+        for i, child in enumerate(children, 1):
+            out.extend(attachments_from_bodystructure(child, f"{section}.{i}" if section else str(i)))
+        return out
+
+    maintype = (node[0] or '').lower()
+    subtype = (node[1] or '').lower()
+    body_params = _param_dict(node[2] if len(node) > 2 else None)
+    encoding = ((node[5] if len(node) > 5 else None) or '7bit').lower()
+    try:
+        size = int(node[6]) if len(node) > 6 and node[6] else 0
+    except ValueError:
+        size = 0
+    # Erweiterungsfelder: text/* hat zusätzlich "lines", message/rfc822 zusätzlich envelope, body, lines
+    ext = 7
+    if maintype == 'text':
+        ext = 8
+    elif maintype == 'message' and subtype == 'rfc822':
+        ext = 10
+    disposition = node[ext + 1] if len(node) > ext + 1 else None
+    disp_params = _param_dict(disposition[1]) if isinstance(disposition, list) and len(disposition) > 1 else {}
+
+    filename = _param_value(disp_params, 'filename') or _param_value(body_params, 'name')
+    if not filename:
+        return []
+    content_id = (node[3] or '').strip().strip('<>') if len(node) > 3 else ''
+    return [{
+        'section': section or '1',
+        'filename': filename,
+        'content_type': f"{maintype}/{subtype}" if maintype and subtype else 'application/octet-stream',
+        'encoding': encoding,
+        'size': _estimate_decoded_size(size, encoding),
+        'size_exact': False,
+        'content_id': content_id or None,
+    }]
+
+
+def parse_bodystructure_response(data) -> List[Dict[str, Any]]:
+    """Wertet die Antwort von ``UID FETCH <uid> (BODYSTRUCTURE)`` aus."""
+    raw = _flatten_fetch_data(data)
+    pos = raw.upper().find(b'BODYSTRUCTURE')
+    if pos < 0:
+        return []
+    tree, _ = parse_sexp(raw, pos + len(b'BODYSTRUCTURE'))
+    attachments = attachments_from_bodystructure(tree)
+    for i, att in enumerate(attachments):
+        att['idx'] = i
+    return attachments
+
+
+def attachments_from_message(msg) -> List[Dict[str, Any]]:
+    """Gleiche Metadaten wie aus BODYSTRUCTURE, aber aus einer bereits geparsten Nachricht (Sync)."""
+    out: List[Dict[str, Any]] = []
+
+    def _walk(part, section: str) -> None:
+        if part.get_content_maintype() == 'multipart' and part.is_multipart():
+            for i, child in enumerate(part.get_payload(), 1):
+                _walk(child, f"{section}.{i}" if section else str(i))
+            return
+        filename = part.get_filename()
+        if not filename:
+            return
+        try:
+            payload = part.get_payload(decode=True)
+            if payload is None and part.is_multipart():
+                payload = part.get_payload(0).as_bytes()  # message/rfc822
+            size = len(payload or b'')
+        except Exception:
+            size = 0
+        out.append({
+            'idx': len(out),
+            'section': section or '1',
+            'filename': _decode_words(filename),
+            'content_type': part.get_content_type() or 'application/octet-stream',
+            'encoding': (part.get('Content-Transfer-Encoding') or '7bit').strip().lower(),
+            'size': size,
+            'size_exact': True,
+            'content_id': (part.get('Content-ID') or '').strip().strip('<>') or None,
+        })
+
+    _walk(msg, '')
+    return out
+
+
+def decode_section(data: bytes, encoding: Optional[str]) -> bytes:
+    """Dekodiert eine per ``BODY.PEEK[<section>]`` geladene Section."""
+    enc = (encoding or '').lower()
+    if enc == 'base64':
+        return base64.b64decode(data)
+    if enc == 'quoted-printable':
+        return binascii.a2b_qp(data)
+    return data
+
+
+class StreamDecoder:
+    """Dekodiert base64/quoted-printable stückweise; Reste an Chunk-Grenzen werden gepuffert."""
+
+    def __init__(self, encoding: Optional[str]):
+        self.encoding = (encoding or '').lower()
+        self._buf = b''
+
+    def feed(self, data: bytes) -> bytes:
+        if self.encoding == 'base64':
+            self._buf += data.translate(None, b' \t\r\n')
+            cut = len(self._buf) - len(self._buf) % 4
+            out, self._buf = self._buf[:cut], self._buf[cut:]
+            return base64.b64decode(out) if out else b''
+        if self.encoding == 'quoted-printable':
+            # Nur vollständige Zeilen dekodieren (Soft-Line-Breaks "=\r\n" und "=XX" nie zerteilen)
+            self._buf += data
+            cut = self._buf.rfind(b'\n') + 1
+            out, self._buf = self._buf[:cut], self._buf[cut:]
+            return binascii.a2b_qp(out) if out else b''
+        return data
+
+    def flush(self) -> bytes:
+        rest, self._buf = self._buf, b''
+        return decode_section(rest, self.encoding) if rest else b''
+
+
+def fetch_section_range(M, uid, section: str, offset: int, length: int) -> Optional[bytes]:
+    """Lädt ``length`` Bytes einer Section ab ``offset`` (``BODY.PEEK[n]<o.l>``, ohne \\Seen).
+
+    None, wenn die UID nicht (mehr) existiert.
+    """
+    typ, data = M.uid('fetch', str(uid), f'(BODY.PEEK[{section}]<{offset}.{length}>)')
+    if typ != 'OK':
+        return None
+    for item in data or []:
+        if isinstance(item, tuple) and len(item) > 1:
+            return item[1] or b''
+    for item in data or []:
+        # Leere Section bzw. Offset hinter dem Ende: ``BODY[2]<0> ""`` statt Literal
+        if isinstance(item, (bytes, bytearray)) and b'BODY[' in item.upper():
+            return b''
+    return None
+
+
+def iter_section(fetch_range, encoding: Optional[str], first: bytes, chunk_size: int = FETCH_CHUNK_BYTES):
+    """Liefert die dekodierte Section chunkweise; ``first`` ist das bereits geladene erste Stück.
+
+    ``fetch_range(offset, length)`` holt die weiteren Stücke (z.B. fetch_section_range
+    unter einer kurzen Pool-Ausleihe, damit zwischen den Stücken keine Session blockiert ist).
+    """
+    decoder = StreamDecoder(encoding)
+    data, offset = first, 0
+    while True:
+        out = decoder.feed(data)
+        if out:
+            yield out
+        offset += len(data)
+        if len(data) < chunk_size:
+            break
+        data = fetch_range(offset, chunk_size)
+        if not data:
+            break
+    tail = decoder.flush()
+    if tail:
+        yield tail
+
+
+def fetch_bodystructure(M, uid) -> Optional[List[Dict[str, Any]]]:
+    typ, data = M.uid('fetch', str(uid), '(BODYSTRUCTURE)')
+    if typ != 'OK' or not data or data == [None]:
+        return None
+    return parse_bodystructure_response(data)
+
+
+# --- DB -------------------------------------------------------------------------
+
+def store_attachments(cursor, by_email: Dict[int, List[Dict[str, Any]]], replace: bool = False) -> None:
+    """Speichert die Metadaten mehrerer Mails gebündelt und markiert sie als indexiert."""
+    if not by_email:
+        return
+    ids = list(by_email)
+    placeholders = ", ".join(["%s"] * len(ids))
+    if replace:
+        cursor.execute(f"DELETE FROM email_attachments WHERE email_id IN ({placeholders})", ids)
+    rows = [
+        (email_id, a['idx'], a['section'], (a['filename'] or '')[:512], (a['content_type'] or '')[:255],
+         (a.get('encoding') or '')[:32], int(a.get('size') or 0), 1 if a.get('size_exact') else 0,
+         (a.get('content_id') or '')[:255] or None)
+        for email_id, attachments in by_email.items() for a in attachments
+    ]
+    if rows:
+        cursor.executemany(
+            "INSERT INTO email_attachments (email_id, idx, section, filename, content_type, encoding, size_bytes, size_exact, content_id) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+    cursor.execute(f"UPDATE emails SET attachments_indexed=1 WHERE id IN ({placeholders})", ids)
+
+
+def load_attachments(cursor, email_id: int) -> List[Dict[str, Any]]:
+    cursor.execute(
+        "SELECT idx, section, filename, content_type, encoding, size_bytes, size_exact, sha256 "
+        "FROM email_attachments WHERE email_id=%s ORDER BY idx ASC",
+        (email_id,),
+    )
+    cols = cursor.column_names
+    rows = [r if isinstance(r, dict) else dict(zip(cols, r)) for r in cursor.fetchall()]
+    return [{
+        'idx': r['idx'],
+        'section': r['section'],
+        'filename': r['filename'],
+        'content_type': r['content_type'] or 'application/octet-stream',
+        'encoding': r['encoding'],
+        'size': int(r['size_bytes'] or 0),
+        'size_exact': bool(r['size_exact']),
+        'sha256': r['sha256'],
+    } for r in rows]
+
+
+def remember_blob(cursor, email_id: int, idx: int, sha256: str, size: int) -> None:
+    cursor.execute(
+        "UPDATE email_attachments SET sha256=%s, size_bytes=%s, size_exact=1 WHERE email_id=%s AND idx=%s",
+        (sha256, size, email_id, idx),
+    )
+
+
+def public_view(att: Dict[str, Any]) -> Dict[str, Any]:
+    """Form, die /api/emails/<id>/attachments an das Frontend liefert."""
+    return {'idx': att['idx'], 'filename': att['filename'], 'content_type': att['content_type'], 'size': att['size']}
+
+
+# --- Blob-Cache -------------------------------------------------------------------
+
+class BlobStore:
+    """Content-adressierter Datei-Cache (``<root>/<sha[:2]>/<sha>``) mit LRU-Verdrängung nach Größe."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def get(self, sha256: Optional[str]) -> Optional[str]:
+        """Pfad zur Datei (und mtime als 'zuletzt benutzt' setzen) oder None."""
+        if not self.enabled or not sha256:
+            return None
+        p = self.path(sha256)
+        try:
+            os.utime(p)
+            return p
+        except OSError:
+            return None
+
+    def writer(self) -> 'BlobWriter':
+        return BlobWriter(self)
+
+    def put(self, data: bytes) -> str:
+        w = self.writer()
+        try:
+            w.write(data)
+            return w.commit()
+        finally:
+            w.abort()
+
+    def _added(self, size: int) -> None:
+        with self._lock:
+            if self._total is not None:
+                self._total += size
+        self._evict()
+
+    def _scan(self) -> List[tuple]:
+        entries = []
+        for dirpath, _dirs, files in os.walk(self.root):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                p = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+        return entries
+
+    def _evict(self) -> None:
+        with self._lock:
+            if self._total is not None and self._total <= self.max_bytes:
+                return
+            entries = self._scan()
+            total = sum(e[1] for e in entries)
+            if total > self.max_bytes:
+                # Auf 90 % des Limits runter, damit nicht jeder Put erneut scannt
+                target = int(self.max_bytes * 0.9)
+                for _mtime, size, p in sorted(entries):
+                    if total <= target:
+                        break
+                    try:
+                        os.unlink(p)
+                        total -= size
+                    except OSError:
+                        pass
+                logger.info(f"[Attachments] Blob-Cache verkleinert auf {total // 1024} KB")
+            self._total = total
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'dir': self.root, 'max_bytes': self.max_bytes, 'total_bytes': self._total}
+
+
+class BlobWriter:
+    """Schreibt einen Blob stückweise in eine Temp-Datei und legt ihn bei commit() unter seinem Hash ab.
+
+    Überschreitet der Inhalt das Cache-Limit, wird nur noch der Hash berechnet.
+    """
+
+    def __init__(self, store: BlobStore):
+        self.store = store
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._skip = not store.enabled
+        self._file = None
+        self._tmp: Optional[str] = None
+
+    def write(self, data: bytes) -> None:
+        self._hash.update(data)
+        self.size += len(data)
+        if self._skip:
+            return
+        if self.size > self.store.max_bytes:
+            self._skip = True
+            self.abort()
+            return
+        if self._file is None:
+            os.makedirs(self.store.root, exist_ok=True)
+            fd, self._tmp = tempfile.mkstemp(dir=self.store.root, prefix='.tmp-')
+            self._file = os.fdopen(fd, 'wb')
+        self._file.write(data)
+
+    def commit(self) -> str:
+        sha = self._hash.hexdigest()
+        if self._skip:
+            return sha
+        p = self.store.path(sha)
+        if os.path.exists(p):
+            os.utime(p)
+            self.abort()
+            return sha
+        if self._file is None:
+            # Leerer Anhang
+            self.write(b'')
+            if self._file is None:
+                return sha
+        self._file.close()
+        self._file = None
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        os.replace(self._tmp, p)
+        self._tmp = None
+        self.store._added(self.size)
+        return sha
+
+    def abort(self) -> None:
+        """Temp-Datei verwerfen (nach commit() ein No-op)."""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+        if self._tmp:
+            try:
+                os.unlink(self._tmp)
+            except OSError:
+                pass
+            self._tmp = None
+
+
+blob_store = BlobStore(CACHE_DIR, CACHE_MAX_BYTES)
@@ -0,0 +1,299 @@
+"""
+Lokaler Volltextindex (SQLite FTS5) als Such-Backend ohne Schemaänderung an MySQL.
+
+Aktiv mit ``EMAIL_SEARCH_BACKEND=sqlite`` (siehe email_search.get_backend). Pro
+Account liegt eine Datei ``<EMAIL_SEARCH_FTS_DIR>/account_<id>.sqlite`` mit einer
+FTS5-Tabelle (rowid = emails.id). Treffer werden anschließend über die IDs aus
+MySQL geladen (email_search.hydrate).
+
+- Befüllt wird inkrementell vom Sync (SyncWriter -> email_search.index_emails)
+  sowie einmalig per ``python email_fts.py rebuild [--account ID]``.
+- Erst nach einem vollständigen Rebuild gilt der Index eines Accounts als
+  komplett; bis dahin sucht das MySQL-Backend.
+- Deutsche Umlaute werden gefaltet (ä -> ae, ß -> ss), sowohl beim Indexieren
+  als auch in der Suche: "Müller" findet "Mueller" und umgekehrt. Übrige
+  Akzente entfernt der Tokenizer (``remove_diacritics``).
+- Query-Syntax wie email_search.parse_query, inkl. ``from:``, ``to:``,
+  ``subject:`` und Präfixsuche.
+
+Konfiguration über Env:
+- EMAIL_SEARCH_FTS_DIR         (Default ./instance/email_fts)
+- EMAIL_SEARCH_FTS_BODY_CHARS  indexierte Zeichen aus body_text (Default 20000)
+"""
+import os
+import re
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import email_search
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+def fts_dir() -> str:
+    # Zur Laufzeit lesen, damit auch der CLI-Aufruf (.env erst in __main__ geladen) das Verzeichnis kennt
+    return os.environ.get('EMAIL_SEARCH_FTS_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'email_fts'
+    )
+
+
+BODY_CHARS = max(0, _env_int('EMAIL_SEARCH_FTS_BODY_CHARS', 20000))
+REBUILD_BATCH = 1000
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+    subject, from_name, from_addr, to_addrs, body,
+    folder UNINDEXED, received_at UNINDEXED,
+    tokenize = "unicode61 remove_diacritics 2"
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Spalten pro Feldfilter (FTS5-Column-Filter)
+FIELD_COLUMNS = {'from': '{from_name from_addr}', 'to': 'to_addrs', 'subject': 'subject'}
+# bm25-Gewichte in Spaltenreihenfolge: Betreff zählt doppelt
+BM25 = "bm25(emails_fts, 2.0, 1.0, 1.0, 1.0, 1.0)"
+
+_UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+
+def fold(text: Optional[str]) -> str:
+    """Kleinschreibung + deutsche Umlaut-Faltung (gleich für Index und Query)."""
+    return (text or '').lower().translate(_UMLAUTS)
+
+
+def _quote(text: str) -> Optional[str]:
+    folded = fold(text)
+    if not re.search(r'\w', folded):
+        return None
+    return '"' + folded.replace('"', '""') + '"'
+
+
+def to_match(parsed: email_search.ParsedQuery) -> Optional[str]:
+    """Übersetzt die geparste Query in einen FTS5-MATCH-Ausdruck (None = nichts Suchbares)."""
+    parts: List[str] = []
+    for word in parsed.terms + parsed.phrases:
+        q = _quote(word)
+        if q:
+            parts.append(q)
+    for word in parsed.prefixes:
+        q = _quote(word)
+        if q:
+            parts.append(q + '*')
+    for field, value, phrase in parsed.fields:
+        q = _quote(value)
+        if q:
+            parts.append(f"{FIELD_COLUMNS[field]} : {q}{'' if phrase else '*'}")
+    if not parts:
+        return None
+    expr = ' AND '.join(parts)
+    for word in parsed.excluded:
+        q = _quote(word)
+        if q:
+            expr += f" NOT {q}"
+    return expr
+
+
+def index_path(account_id: int) -> str:
+    return os.path.join(fts_dir(), f"account_{int(account_id)}.sqlite")
+
+
+def _connect(account_id: int, create: bool = False) -> Optional[sqlite3.Connection]:
+    path = index_path(account_id)
+    if not create and not os.path.exists(path):
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, timeout=10)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def _meta(db: sqlite3.Connection, key: str) -> Optional[str]:
+    row = db.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(db: sqlite3.Connection, key: str, value: str) -> None:
+    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _write_rows(db: sqlite3.Connection, rows: List[tuple]) -> None:
+    """rows: (id, subject, from_name, from_addr, to_addrs, body, folder, received_at)."""
+    if not rows:
+        return
+    db.executemany("DELETE FROM emails_fts WHERE rowid=?", [(r[0],) for r in rows])
+    db.executemany(
+        "INSERT INTO emails_fts (rowid, subject, from_name, from_addr, to_addrs, body, folder, received_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(r[0], fold(r[1]), fold(r[2]), fold(r[3]), fold(r[4]), fold((r[5] or '')[:BODY_CHARS]),
+          r[6], r[7].isoformat() if hasattr(r[7], 'isoformat') else (r[7] or ''))
+         for r in rows],
+    )
+
+
+def _folder_values(folder: str) -> Optional[List[str]]:
+    if folder == 'all':
+        return None
+    if folder == 'sent':
+        return ['sent', 'inbox.sent', 'sent items']
+    return [folder]
+
+
+class SqliteFtsSearch:
+    """Such-Backend über die FTS5-Dateien; ohne vollständigen Index sucht ``fallback``."""
+
+    name = 'sqlite'
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self._warned = set()
+        self._lock = threading.Lock()
+
+    def _fallback(self, account_id: int, reason: str, *args, **kwargs):
+        with self._lock:
+            if account_id not in self._warned:
+                self._warned.add(account_id)
+                logger.warning(f"[Search] FTS-Index account={account_id} {reason}; nutze MySQL "
+                               f"(python email_fts.py rebuild --account {account_id})")
+        return self.fallback.search(*args, **kwargs)
+
+    def search(self, conn, user_email: str, account_id: int, folder: str, q: str,
+               limit: int = email_search.MAX_LIMIT, offset: int = 0) -> email_search.SearchResult:
+        args = (conn, user_email, account_id, folder, q)
+        parsed = email_search.parse_query(q)
+        if parsed.is_empty():
+            return email_search.SearchResult([], 0, False, self.name)
+        expr = to_match(parsed)
+        if expr is None:
+            return email_search.SearchResult([], 0, False, self.name)
+
+        db = _connect(account_id)
+        if db is None:
+            return self._fallback(account_id, 'fehlt', *args, limit=limit, offset=offset)
+        try:
+            if _meta(db, 'complete') != '1':
+                return self._fallback(account_id, 'unvollständig', *args, limit=limit, offset=offset)
+            where = "emails_fts MATCH ?"
+            params: List[Any] = [expr]
+            folders = _folder_values(folder)
+            if folders:
+                where += f" AND folder IN ({', '.join('?' * len(folders))})"
+                params.extend(folders)
+            try:
+                ids = [r[0] for r in db.execute(
+                    f"SELECT rowid FROM emails_fts WHERE {where} ORDER BY {BM25}, received_at DESC LIMIT ? OFFSET ?",
+                    params + [limit, offset],
+                )]
+                total = db.execute(
+                    f"SELECT COUNT(*) FROM (SELECT rowid FROM emails_fts WHERE {where} LIMIT {email_search.COUNT_CAP + 1})",
+                    params,
+                ).fetchone()[0]
+            except sqlite3.OperationalError as e:
+                logger.warning(f"[Search] FTS-Query {expr!r} fehlgeschlagen: {e}")
+                return self.fallback.search(*args, limit=limit, offset=offset)
+            return email_search.SearchResult(ids, min(total, email_search.COUNT_CAP), total > email_search.COUNT_CAP, self.name)
+        finally:
+            db.close()
+
+    def index_emails(self, user_email: str, account_id: int, folder_db: str, rows: List[Tuple[int, Dict[str, Any]]]) -> None:
+        db = _connect(account_id, create=True)
+        try:
+            with db:
+                _write_rows(db, [
+                    (email_id, p.get('subject'), p.get('from_name'), p.get('from_email'), p.get('to_addrs'),
+                     p.get('body_text'), folder_db, p.get('received_at'))
+                    for email_id, p in rows
+                ])
+        finally:
+            db.close()
+
+    def move_email(self, account_id: int, email_id: int, folder: str) -> None:
+        db = _connect(account_id)
+        if db is None:
+            return
+        try:
+            with db:
+                db.execute("UPDATE emails_fts SET folder=? WHERE rowid=?", (folder, email_id))
+        finally:
+            db.close()
+
+
+def rebuild_account(mysql_conn, account_id: int) -> int:
+    """Baut den Index eines Accounts aus MySQL neu auf (batchweise, parallel zum Sync möglich).
+
+    Während des Aufbaus gilt der Index als unvollständig (Suche über MySQL);
+    gleichzeitig vom Sync geschriebene Zeilen bleiben erhalten.
+    """
+    db = _connect(account_id, create=True)
+    cursor = mysql_conn.cursor()
+    count = 0
+    try:
+        with db:
+            _set_meta(db, 'complete', '0')
+            db.execute("DELETE FROM emails_fts")
+        last_id = 0
+        while True:
+            cursor.execute(
+                "SELECT id, subject, from_name, from_addr, to_addrs, LEFT(body_text, %s), folder, received_at "
+                "FROM emails WHERE account_id=%s AND id > %s ORDER BY id ASC LIMIT %s",
+                (BODY_CHARS, account_id, last_id, REBUILD_BATCH),
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            with db:
+                _write_rows(db, rows)
+            count += len(rows)
+            last_id = rows[-1][0]
+        with db:
+            _set_meta(db, 'complete', '1')
+        db.execute("INSERT INTO emails_fts(emails_fts) VALUES ('optimize')")
+        db.commit()
+    finally:
+        cursor.close()
+        db.close()
+    return count
+
+
+def main() -> None:
+    import argparse
+    from db_utils import get_settings_db_connection
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Lokalen E-Mail-Suchindex (SQLite FTS5) verwalten")
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild = sub.add_parser('rebuild', help='Index aus MySQL neu aufbauen')
+    rebuild.add_argument('--account', type=int, help='nur diesen email_accounts.id (Default: alle aktiven)')
+    args = parser.parse_args()
+
+    conn = get_settings_db_connection()
+    try:
+        if args.account:
+            account_ids = [args.account]
+        else:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM email_accounts WHERE is_active=1 ORDER BY id ASC")
+            account_ids = [r[0] for r in cursor.fetchall()]
+            cursor.close()
+        for account_id in account_ids:
+            n = rebuild_account(conn, account_id)
+            logger.info(f"[FTS] account={account_id}: {n} Mails indexiert -> {index_path(account_id)}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+    main()
@@ -0,0 +1,520 @@
+"""
+Semantischer Index über alle synchronisierten E-Mails (Qdrant).
+
+Bisher wurden Mails nur on demand im Request eingebettet
+(``/api/debug/qdrant-contact/<id>``, ein paar Mails pro Aufruf). Jetzt gibt es
+eine Stufe hinter dem Sync::
+
+    sync_worker.run_job -> email_indexer.schedule(user_email, account_id)
+                        -> Index-Thread: index_account() -> qdrant_store.upsert_texts()
+
+- Pro Mail: HTML entfernt (falls kein Plaintext), in überlappende Chunks
+  geteilt (EMAIL_INDEX_CHUNK_CHARS/_OVERLAP), jeder Chunk mit Betreff als
+  Kontext. Punkt-IDs sind deterministisch (user_email, "email", id, "chunk", n).
+- Payload für Filter: user_email, account_id, contact_id, email_id,
+  received_at (ISO) und received_ts (Unix-Zeit, für Bereichsfilter). Qdrant
+  bekommt dafür Payload-Indizes (siehe PAYLOAD_INDEXES).
+- Eingebettet wird gebatcht über embedding_cache mit Priorität BACKGROUND,
+  interaktive Aufrufe haben also Vorrang.
+- Fortsetzbar: ``email_index_state.last_email_id`` ist die höchste indexierte
+  ``emails.id`` pro Account und wird erst nach erfolgreichem Upsert eines
+  Batches erhöht. Nach Absturz/Neustart geht es dort weiter; die
+  Wartungsschleife des Sync-Workers plant Accounts mit offenen Mails erneut ein
+  und baut so auch die bestehende Historie nach und nach auf.
+- Ein Account wird pro Durchlauf höchstens EMAIL_INDEX_MAX_PER_RUN Mails weit
+  indexiert und danach hinten angestellt, damit große Postfächer andere nicht
+  blockieren. Ein MySQL-Named-Lock verhindert, dass zwei Prozesse denselben
+  Account gleichzeitig indexieren.
+
+- Mails in Papierkorb/Spam (SKIP_FOLDERS) werden nicht indexiert; ein Move
+  dorthin löscht ihre Punkte (``email_moved``), ein Move zurück indexiert neu.
+  Wird eine Mail erneut indexiert und hat weniger Chunks als zuvor, werden die
+  überzähligen Punkte gelöscht.
+
+Suchen: ``search(user_email, "Rechnung Oktober", contact_id=42)``.
+Nach einem Wechsel des Embedding-Modells: ``python email_indexer.py --reset``
+(setzt die Marken zurück; unveränderte Chunks überspringt upsert_texts).
+
+Konfiguration über Env:
+- EMAIL_INDEX_ENABLED          true (Default, wirksam nur mit QDRANT_URL) | false
+- EMAIL_INDEX_BATCH            Mails pro Batch/Upsert (Default 100)
+- EMAIL_INDEX_MAX_PER_RUN      Mails pro Account und Durchlauf (Default 2000)
+- EMAIL_INDEX_CHUNK_CHARS      Zeichen pro Chunk (Default 1500)
+- EMAIL_INDEX_CHUNK_OVERLAP    Überlappung in Zeichen (Default 200)
+- EMAIL_INDEX_MAX_CHUNKS       Chunks pro Mail, Rest wird ignoriert (Default 20)
+"""
+import os
+import re
+import sys
+import html
+import queue
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+if __name__ == '__main__':
+    # Eigenständiger Aufruf: .env laden, bevor die Env-Defaults gelesen werden
+    from dotenv import load_dotenv
+    load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+BATCH_SIZE = max(1, _env_int('EMAIL_INDEX_BATCH', 100))
+MAX_PER_RUN = max(1, _env_int('EMAIL_INDEX_MAX_PER_RUN', 2000))
+CHUNK_CHARS = max(200, _env_int('EMAIL_INDEX_CHUNK_CHARS', 1500))
+CHUNK_OVERLAP = min(CHUNK_CHARS // 2, max(0, _env_int('EMAIL_INDEX_CHUNK_OVERLAP', 200)))
+MAX_CHUNKS = max(1, _env_int('EMAIL_INDEX_MAX_CHUNKS', 20))
+
+# Payload-Felder, nach denen gefiltert wird -> Qdrant-Indextyp
+PAYLOAD_INDEXES = {'user_email': 'keyword', 'source': 'keyword', 'account_id': 'integer', 'contact_id': 'integer', 'email_id': 'integer',
+                   'received_ts': 'integer'}
+
+# Mails in diesen Ordnern werden nicht indexiert; ein Move dorthin entfernt ihre Punkte
+SKIP_FOLDERS = ('trash', 'spam')
+
+
+def _folder_clause(column: str = 'folder') -> str:
+    return f"COALESCE({column}, '') NOT IN ({', '.join(['%s'] * len(SKIP_FOLDERS))})"
+
+
+STATE_DDL = """
+CREATE TABLE IF NOT EXISTS email_index_state (
+    account_id INT NOT NULL PRIMARY KEY,
+    user_email VARCHAR(255) NOT NULL,
+    last_email_id BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    indexed_emails INT NOT NULL DEFAULT 0,
+    indexed_chunks INT NOT NULL DEFAULT 0,
+    last_error TEXT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_SCHEMA_READY = False
+_SCHEMA_LOCK = threading.Lock()
+
+
+def enabled() -> bool:
+    if (os.environ.get('EMAIL_INDEX_ENABLED') or 'true').strip().lower() != 'true':
+        return False
+    return bool(os.environ.get('QDRANT_URL'))
+
+
+def ensure_schema(cursor) -> None:
+    """Legt email_index_state an (einmal pro Prozess, Best Effort)."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if _SCHEMA_READY:
+            return
+        try:
+            cursor.execute(STATE_DDL)
+        except Exception as e:
+            logger.warning(f"[EmailIndex] DDL email_index_state fehlgeschlagen (ignoriert): {e}")
+        _SCHEMA_READY = True
+
+
+# --- Text und Chunks ---------------------------------------------------------
+
+def html_to_text(s: Optional[str]) -> str:
+    if not s:
+        return ''
+    s = re.sub(r'<\s*(script|style)[^>]*>.*?<\s*/\s*\1\s*>', '', s, flags=re.IGNORECASE | re.DOTALL)
+    # Zeilenumbrüche für Blockelemente
+    s = re.sub(r'<\s*br\s*/?>', '\n', s, flags=re.IGNORECASE)
+    s = re.sub(r'</\s*(p|div|li|tr|h[1-6])\s*>', '\n', s, flags=re.IGNORECASE)
+    # Tags entfernen, Entities auflösen
+    s = html.unescape(re.sub(r'<[^>]+>', '', s))
+    s = re.sub(r'[ \t\r\f\v]+', ' ', s)
+    s = re.sub(r'\n\s*\n\s*\n+', '\n\n', s)
+    return s.strip()
+
+
+def email_text(row: Dict[str, Any]) -> str:
+    """Inhalt einer Mail: Plaintext, sonst HTML ohne Tags."""
+    return (row.get('body_text') or '').strip() or html_to_text(row.get('body_html'))
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP, max_chunks: int = MAX_CHUNKS) -> List[str]:
+    """Teilt ``text`` in überlappende Chunks; geschnitten wird möglichst an Absatz-/Wortgrenzen."""
+    text = (text or '').strip()
+    chunks: List[str] = []
+    start = 0
+    while start < len(text) and len(chunks) < max_chunks:
+        end = min(len(text), start + size)
+        if end < len(text):
+            # Nicht mitten im Wort schneiden, aber höchstens die hintere Hälfte opfern
+            cut = max(text.rfind('\n', start + size // 2, end), text.rfind(' ', start + size // 2, end))
+            if cut > start:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(start + 1, end - overlap)
+    return chunks
+
+
+def _payload(row: Dict[str, Any], account_id: int, idx: int) -> Dict[str, Any]:
+    received = row.get('received_at')
+    return {
+        'source': 'email',
+        'user_email': row['user_email'],
+        'account_id': account_id,
+        'contact_id': row.get('contact_id'),
+        'email_id': row['id'],
+        'chunk': idx,
+        'subject': row.get('subject') or '',
+        'from_addr': row.get('from_addr') or '',
+        'received_at': received.isoformat() if isinstance(received, datetime) else received,
+        'received_ts': int(received.timestamp()) if isinstance(received, datetime) else None,
+    }
+
+
+def build_points(rows: List[Dict[str, Any]], account_id: int) -> Tuple[List[str], List[Tuple[Any, ...]], List[Dict[str, Any]]]:
+    """(Texte, ID-Teile, Payloads) für alle Chunks der Mails."""
+    texts: List[str] = []
+    ids: List[Tuple[Any, ...]] = []
+    meta: List[Dict[str, Any]] = []
+    for row in rows:
+        subject = (row.get('subject') or '').strip()
+        chunks = chunk_text(email_text(row)) or ([''] if subject else [])
+        for idx, chunk in enumerate(chunks):
+            texts.append(f"Betreff: {subject}\n\n{chunk}".strip())
+            ids.append((row['user_email'], 'email', row['id'], 'chunk', idx))
+            meta.append(_payload(row, account_id, idx))
+    return texts, ids, meta
+
+
+# --- High-Water-Mark ---------------------------------------------------------
+
+def load_mark(cursor, account_id: int) -> int:
+    cursor.execute("SELECT last_email_id FROM email_index_state WHERE account_id=%s", (account_id,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return int((row['last_email_id'] if isinstance(row, dict) else row[0]) or 0)
+
+
+def save_mark(cursor, user_email: str, account_id: int, last_email_id: int, emails: int, chunks: int) -> None:
+    # GREATEST: ein langsamerer paralleler Lauf setzt die Marke nie zurück
+    cursor.execute(
+        "INSERT INTO email_index_state (account_id, user_email, last_email_id, indexed_emails, indexed_chunks, last_error) "
+        "VALUES (%s, %s, %s, %s, %s, NULL) ON DUPLICATE KEY UPDATE "
+        "last_email_id=GREATEST(last_email_id, VALUES(last_email_id)), "
+        "indexed_emails=indexed_emails+VALUES(indexed_emails), indexed_chunks=indexed_chunks+VALUES(indexed_chunks), "
+        "last_error=NULL",
+        (account_id, user_email, last_email_id, emails, chunks),
+    )
+
+
+def _save_error(cursor, user_email: str, account_id: int, error: str) -> None:
+    cursor.execute(
+        "INSERT INTO email_index_state (account_id, user_email, last_error) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE last_error=VALUES(last_error)",
+        (account_id, user_email, error[:2000]),
+    )
+
+
+def fetch_batch(cursor, account_id: int, after_id: int, limit: int = BATCH_SIZE) -> List[Dict[str, Any]]:
+    cursor.execute(
+        "SELECT id, user_email, contact_id, from_addr, subject, body_text, body_html, received_at "
+        f"FROM emails WHERE account_id=%s AND id>%s AND {_folder_clause()} ORDER BY id ASC LIMIT %s",
+        (account_id, after_id, *SKIP_FOLDERS, limit),
+    )
+    return cursor.fetchall()
+
+
+# --- Indexieren --------------------------------------------------------------
+
+def _upsert(texts: List[str], ids: List[Tuple[Any, ...]], meta: List[Dict[str, Any]]) -> int:
+    # Lazy: Sync-Worker ohne Qdrant-Setup sollen dieses Modul trotzdem importieren können
+    import llm_gateway
+    import qdrant_store
+    written = qdrant_store.upsert_texts(texts, ids=[qdrant_store.point_id(*parts) for parts in ids],
+                                        metadata=meta, priority=llm_gateway.BACKGROUND)
+    # Erst nach dem Upsert: die Collection (Vektorgröße) legt upsert_texts an; danach gemerkt
+    try:
+        qdrant_store.ensure_payload_indexes(PAYLOAD_INDEXES)
+    except Exception as e:
+        logger.warning(f"[EmailIndex] Payload-Indizes nicht angelegt: {e}")
+    return written
+
+
+def _delete(filters: Dict[str, Any], any_of: Optional[List[Dict[str, Any]]] = None) -> None:
+    import qdrant_store
+    qdrant_store.delete_points(filters, any_of=any_of)
+
+
+def write_points(rows: List[Dict[str, Any]], account_id: int) -> Tuple[int, int]:
+    """Upsert der Chunks und Löschen überzähliger Chunks (Mail neu indexiert, jetzt kürzer); (Chunks, geschrieben)."""
+    if not rows:
+        return 0, 0
+    texts, ids, meta = build_points(rows, account_id)
+    written = _upsert(texts, ids, meta) if texts else 0
+    counts = {row['id']: 0 for row in rows}
+    for m in meta:
+        counts[m['email_id']] += 1
+    _delete({'user_email': rows[0]['user_email']},
+            any_of=[{'email_id': email_id, 'chunk': {'gte': n}} for email_id, n in counts.items()])
+    return len(texts), written
+
+
+def index_batches(conn, cursor, user_email: str, account_id: int, max_emails: int = MAX_PER_RUN) -> Dict[str, Any]:
+    """Indexiert Mails oberhalb der Marke batchweise; nach jedem Batch wird die Marke committet.
+
+    ``more`` im Ergebnis: Limit erreicht, es liegen noch weitere Mails an.
+    """
+    mark = load_mark(cursor, account_id)
+    stats = {'emails': 0, 'chunks': 0, 'written': 0, 'last_email_id': mark, 'more': False}
+    while stats['emails'] < max_emails:
+        rows = fetch_batch(cursor, account_id, mark, min(BATCH_SIZE, max_emails - stats['emails']))
+        if not rows:
+            return stats
+        chunks, written = write_points(rows, account_id)
+        stats['written'] += written
+        mark = max(int(r['id']) for r in rows)
+        save_mark(cursor, user_email, account_id, mark, len(rows), chunks)
+        conn.commit()
+        stats['emails'] += len(rows)
+        stats['chunks'] += chunks
+        stats['last_email_id'] = mark
+    stats['more'] = bool(fetch_batch(cursor, account_id, mark, 1))
+    return stats
+
+
+def index_account(user_email: str, account_id: int, max_emails: int = MAX_PER_RUN) -> Optional[Dict[str, Any]]:
+    """Indexiert neue Mails eines Accounts; None, wenn ein anderer Prozess ihn gerade indexiert."""
+    from db_utils import get_settings_db_connection
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    lock_name = f"email_index:{account_id}"
+    got_lock = False
+    try:
+        ensure_schema(cursor)
+        cursor.execute("SELECT GET_LOCK(%s, 0) AS got", (lock_name,))
+        got_lock = bool((cursor.fetchone() or {}).get('got'))
+        if not got_lock:
+            return None
+        try:
+            stats = index_batches(conn, cursor, user_email, account_id, max_emails)
+        except Exception as e:
+            # Marke bleibt beim letzten erfolgreichen Batch; nächster Lauf setzt dort fort
+            try:
+                _save_error(cursor, user_email, account_id, str(e))
+                conn.commit()
+            except Exception:
+                pass
+            raise
+        if stats['emails']:
+            logger.info(f"[EmailIndex] account={account_id}: {stats['emails']} Mails, {stats['chunks']} Chunks "
+                        f"({stats['written']} geschrieben), bis id={stats['last_email_id']}")
+        return stats
+    finally:
+        if got_lock:
+            try:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                cursor.fetchall()
+            except Exception:
+                pass
+        cursor.close()
+        conn.close()
+
+
+def pending_accounts() -> List[Dict[str, Any]]:
+    """Aktive Accounts mit Mails oberhalb ihrer Marke (inkl. noch nie indexierter Accounts)."""
+    from db_utils import get_settings_db_connection
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        ensure_schema(cursor)
+        cursor.execute(
+            "SELECT a.id, a.user_email FROM email_accounts a "
+            "LEFT JOIN email_index_state s ON s.account_id=a.id "
+            "WHERE a.is_active=1 AND EXISTS ("
+            "SELECT 1 FROM emails e WHERE e.account_id=a.id AND e.id > COALESCE(s.last_email_id, 0) "
+            f"AND {_folder_clause('e.folder')})",
+            SKIP_FOLDERS,
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def reset(account_id: Optional[int] = None) -> int:
+    """Setzt die Marke(n) zurück, z.B. nach einem Wechsel des Embedding-Modells."""
+    from db_utils import get_settings_db_connection
+    conn = get_settings_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_schema(cursor)
+        if account_id is None:
+            cursor.execute("UPDATE email_index_state SET last_email_id=0")
+        else:
+            cursor.execute("UPDATE email_index_state SET last_email_id=0 WHERE account_id=%s", (account_id,))
+        count = cursor.rowcount
+        conn.commit()
+        return count
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def email_moved(user_email: str, account_id: int, email_id: int, old_folder: str, folder: str) -> None:
+    """Nach einem Move: in Papierkorb/Spam die Punkte der Mail löschen, von dort zurück neu indexieren.
+
+    Liegt die Mail oberhalb der Marke, übernimmt das der nächste Indexlauf.
+    """
+    if not enabled() or not account_id or (old_folder in SKIP_FOLDERS) == (folder in SKIP_FOLDERS):
+        return
+    if folder in SKIP_FOLDERS:
+        _delete({'user_email': user_email, 'email_id': int(email_id)})
+        return
+    from db_utils import get_settings_db_connection
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        ensure_schema(cursor)
+        if int(email_id) > load_mark(cursor, account_id):
+            return
+        cursor.execute(
+            "SELECT id, user_email, contact_id, from_addr, subject, body_text, body_html, received_at "
+            "FROM emails WHERE id=%s AND user_email=%s",
+            (email_id, user_email),
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    write_points(rows, account_id)
+
+
+# --- Hintergrund-Thread ------------------------------------------------------
+
+class IndexQueue:
+    """Ein Thread pro Prozess, der Accounts nacheinander indexiert; jeder Account steht höchstens einmal an."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue: Optional[queue.Queue] = None
+        self._pending: Set[int] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.stats = {'scheduled': 0, 'runs': 0, 'emails': 0, 'chunks': 0, 'written': 0, 'failed': 0, 'skipped_locked': 0}
+
+    def put(self, user_email: str, account_id: int) -> bool:
+        with self._lock:
+            # Nach einem fork (gunicorn) weder Queue noch Thread des Elternprozesses übernehmen
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue, self._pending = queue.Queue(), set()
+                self._thread = threading.Thread(target=self._run, name="email-index", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            if account_id in self._pending:
+                return False
+            self._pending.add(account_id)
+            self.stats['scheduled'] += 1
+        self._queue.put((user_email, account_id))
+        return True
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            user_email, account_id = q.get()
+            with self._lock:
+                self._pending.discard(account_id)
+            try:
+                result = index_account(user_email, account_id)
+            except Exception as e:
+                logger.error(f"[EmailIndex] account={account_id} fehlgeschlagen: {e}")
+                with self._lock:
+                    self.stats['failed'] += 1
+                continue
+            with self._lock:
+                if result is None:
+                    self.stats['skipped_locked'] += 1
+                    continue
+                self.stats['runs'] += 1
+                for key in ('emails', 'chunks', 'written'):
+                    self.stats[key] += result[key]
+            if result['more']:
+                # Großes Postfach: hinten anstellen, damit andere Accounts dazwischen drankommen
+                self.put(user_email, account_id)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'pending': len(self._pending), **self.stats}
+
+
+_QUEUE = IndexQueue()
+
+
+def schedule(user_email: str, account_id: int) -> bool:
+    """Stellt den Account zum Indexieren an (nach einem Sync); False, wenn deaktiviert oder schon wartend."""
+    if not enabled() or not account_id:
+        return False
+    return _QUEUE.put(user_email, int(account_id))
+
+
+def schedule_pending() -> int:
+    """Wartung: Accounts mit noch nicht indexierten Mails einplanen (Nachholen nach Neustart, Historie)."""
+    if not enabled():
+        return 0
+    return sum(int(schedule(acc['user_email'], acc['id'])) for acc in pending_accounts())
+
+
+def status() -> Dict[str, Any]:
+    return {'enabled': enabled(), 'batch_size': BATCH_SIZE, **_QUEUE.status()}
+
+
+# --- Suche -------------------------------------------------------------------
+
+def search(user_email: str, query: str, limit: int = 10, account_id: Optional[int] = None,
+           contact_id: Optional[int] = None, since: Optional[datetime] = None,
+           source: Optional[str] = 'email') -> List[Dict[str, Any]]:
+    """Semantische Suche über die indexierten Mails des Users (immer auf user_email gefiltert).
+
+    ``source`` grenzt auf die Punkte des Indexers ein; andere Quellen in derselben
+    Collection (z.B. ältere Snippets pro Request) liefern sonst dieselbe Mail doppelt.
+    """
+    import qdrant_store
+    if not user_email:
+        raise ValueError("search ohne user_email")
+    filters: Dict[str, Any] = {'user_email': user_email, 'source': source, 'account_id': account_id, 'contact_id': contact_id}
+    if since is not None:
+        filters['received_ts'] = {'gte': int(since.timestamp())}
+    return qdrant_store.similarity_search(query, limit=limit, filters=filters)
+
+
+def main() -> None:
+    """``python email_indexer.py [--account <id>] [--reset]``: Index aufbauen bzw. nachholen (blockierend)."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    account_id = int(sys.argv[sys.argv.index('--account') + 1]) if '--account' in sys.argv else None
+    if '--reset' in sys.argv:
+        print(f"{reset(account_id)} Marke(n) zurückgesetzt")
+    accounts = [a for a in pending_accounts() if account_id is None or a['id'] == account_id]
+    for acc in accounts:
+        while True:
+            result = index_account(acc['user_email'], acc['id'])
+            if result is None:
+                print(f"account={acc['id']}: wird gerade von einem anderen Prozess indexiert")
+                break
+            print(f"account={acc['id']}: {result['emails']} Mails, {result['chunks']} Chunks, bis id={result['last_email_id']}")
+            if not result['more']:
+                break
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""
+Suche über synchronisierte E-Mails.
+
+Statt fünf ``LIKE '%q%'``-Bedingungen (Full Table Scan pro Tastendruck) nutzt
+die Suche einen FULLTEXT-Index über ``subject, from_name, from_addr, to_addrs,
+body_text`` (Migration: scripts/add_emails_fulltext.sql) im BOOLEAN MODE.
+
+Query-Syntax (parse_query):
+- ``wort``          muss vorkommen; das letzte Wort zählt als Präfix (Suche beim Tippen)
+- ``wort*``         Präfixsuche
+- ``"genaue phrase"`` Phrase; Begriffe mit Sonderzeichen (z.B. E-Mail-Adressen) ebenso
+- ``-wort`` / ``-"phrase"`` schließt aus
+- ``from:``/``von:``, ``to:``/``an:``, ``subject:``/``betreff:`` schränken auf Felder ein
+
+Sortiert wird nach Relevanz (Treffer im Betreff zählen doppelt), bei gleichem
+Score nach Datum. Die Trefferzahl wird nur bis EMAIL_SEARCH_COUNT_CAP gezählt
+(``total_capped``), damit die Latenz nicht mit der Postfachgröße wächst.
+
+Wörter unterhalb der minimalen Token-Länge von InnoDB (EMAIL_SEARCH_MIN_TOKEN,
+Default 3 = innodb_ft_min_token_size) kann der Index nicht finden; sie werden
+als LIKE auf Absender/Empfänger/Betreff der FULLTEXT-Treffer angewendet. Fehlt
+der Index (Migration noch nicht gelaufen), fällt die Suche auf LIKE zurück.
+
+Alternativ (ohne Schemaänderung an MySQL) kann mit ``EMAIL_SEARCH_BACKEND=sqlite``
+ein lokaler SQLite-FTS5-Index pro Account genutzt werden (siehe email_fts).
+"""
+import os
+import re
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+MIN_TOKEN = max(1, _env_int('EMAIL_SEARCH_MIN_TOKEN', 3))
+COUNT_CAP = max(1, _env_int('EMAIL_SEARCH_COUNT_CAP', 1000))
+MAX_LIMIT = 500
+
+FULLTEXT_COLUMNS = "e.subject, e.from_name, e.from_addr, e.to_addrs, e.body_text"
+# MySQL-Fehler 1191: kein FULLTEXT-Index passend zur Spaltenliste
+ER_FT_MATCHING_KEY_NOT_FOUND = 1191
+
+_TOKEN_RE = re.compile(r'(-?)(?:([A-Za-z]+):(?=\S))?(?:"([^"]*)"?|(\S+))')
+# Feldfilter (auch deutsch) -> logischer Feldname
+FIELD_ALIASES = {'from': 'from', 'von': 'from', 'to': 'to', 'an': 'to', 'subject': 'subject', 'betreff': 'subject'}
+# Spalten pro Feld für LIKE-Filter in MySQL
+FIELD_COLUMNS = {'from': ('e.from_addr', 'e.from_name'), 'to': ('e.to_addrs',), 'subject': ('e.subject',)}
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+
+class ParsedQuery:
+    def __init__(self):
+        self.terms: List[str] = []       # Pflichtwörter
+        self.prefixes: List[str] = []    # Pflicht-Präfixe (wort*)
+        self.phrases: List[str] = []     # Pflicht-Phrasen
+        self.excluded: List[str] = []    # ausgeschlossene Wörter/Phrasen
+        self.fields: List[Tuple[str, str, bool]] = []  # (feld, wert, phrase?)
+
+    def is_empty(self) -> bool:
+        return not (self.terms or self.prefixes or self.phrases or self.fields)
+
+    def positive_words(self) -> List[str]:
+        return self.terms + self.prefixes + self.phrases
+
+
+def parse_query(q: str) -> ParsedQuery:
+    """Zerlegt die Eingabe in Wörter, Präfixe, Phrasen und Ausschlüsse."""
+    parsed = ParsedQuery()
+    matches = list(_TOKEN_RE.finditer(q or ''))
+    for i, m in enumerate(matches):
+        field = FIELD_ALIASES.get((m.group(2) or '').lower())
+        if m.group(3) is not None:
+            phrase = ' '.join(m.group(3).split())
+            if not phrase and not m.group(2):
+                continue
+            if m.group(2) and not field:
+                # Unbekanntes "xyz:" gehört zum Suchtext
+                phrase = f"{m.group(2)}:{phrase}"
+            if m.group(1):
+                parsed.excluded.append(phrase)
+            elif field:
+                if phrase:
+                    parsed.fields.append((field, phrase, True))
+            else:
+                parsed.phrases.append(phrase)
+            continue
+        raw = m.group(4)
+        if m.group(2) and not field:
+            raw = f"{m.group(2)}:{raw}"
+        negative = bool(m.group(1))
+        prefix = raw.endswith('*')
+        word = raw.strip('*+~<>()-')
+        if not word:
+            continue
+        if negative:
+            parsed.excluded.append(word)
+        elif field:
+            parsed.fields.append((field, word, bool(re.search(r'[^\w]', word))))
+        elif re.search(r'[^\w]', word):
+            # E-Mail-Adressen, Domains, "A-B" ... -> als Phrase (tokenisiert wie der Index)
+            parsed.phrases.append(word)
+        elif prefix or i == len(matches) - 1:
+            parsed.prefixes.append(word)
+        else:
+            parsed.terms.append(word)
+    return parsed
+
+
+def _quote_phrase(text: str) -> str:
+    return '"' + _BOOLEAN_OPERATORS.sub(' ', text).strip() + '"'
+
+
+def to_boolean_mode(parsed: ParsedQuery, min_token: int = MIN_TOKEN) -> Tuple[Optional[str], List[str]]:
+    """Baut den AGAINST(... IN BOOLEAN MODE)-Ausdruck.
+
+    Liefert (ausdruck oder None, zu kurze Wörter für den LIKE-Nachfilter).
+    """
+    parts: List[str] = []
+    short: List[str] = []
+    for word in parsed.terms:
+        if len(word) < min_token:
+            short.append(word)
+        else:
+            parts.append(f"+{word}")
+    for word in parsed.prefixes:
+        if len(word) < min_token:
+            short.append(word)
+        else:
+            parts.append(f"+{word}*")
+    for phrase in parsed.phrases:
+        tokens = [t for t in _BOOLEAN_OPERATORS.sub(' ', re.sub(r'[^\w]', ' ', phrase)).split()]
+        if any(len(t) >= min_token for t in tokens):
+            parts.append('+' + _quote_phrase(phrase))
+        else:
+            short.append(phrase)
+    if not parts:
+        return None, short
+    for word in parsed.excluded:
+        parts.append('-' + (_quote_phrase(word) if re.search(r'[^\w]', word) else word))
+    return ' '.join(parts), short
+
+
+def folder_filter(folder: str) -> Tuple[List[str], List[Any]]:
+    """Folder-Filter wie in api_emails_list ('all', 'sent'-Gruppe, sonst exakt)."""
+    if folder == 'all':
+        return [], []
+    if folder == 'sent':
+        return ["e.folder IN (%s, %s, %s)"], ['sent', 'inbox.sent', 'sent items']
+    return ["e.folder = %s"], [folder]
+
+
+def _like(word: str) -> str:
+    return '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _field_filters(parsed: ParsedQuery) -> Tuple[List[str], List[Any]]:
+    where: List[str] = []
+    params: List[Any] = []
+    for field, value, _phrase in parsed.fields:
+        cols = FIELD_COLUMNS[field]
+        where.append("(" + " OR ".join(f"{c} LIKE %s" for c in cols) + ")")
+        params.extend([_like(value)] * len(cols))
+    return where, params
+
+
+class SearchResult:
+    def __init__(self, ids: List[int], total: int, capped: bool, engine: str):
+        self.ids = ids
+        self.total = total
+        self.capped = capped
+        self.engine = engine
+
+
+class MySQLFulltextSearch:
+    """Such-Backend auf Basis des FULLTEXT-Index der emails-Tabelle."""
+
+    name = 'mysql'
+
+    def __init__(self):
+        self.fulltext_available = True
+
+    def _capped_count(self, cursor, where_sql: str, params: List[Any]) -> Tuple[int, bool]:
+        cursor.execute(
+            f"SELECT COUNT(*) AS total FROM (SELECT e.id FROM emails e WHERE {where_sql} LIMIT {COUNT_CAP + 1}) t",
+            params,
+        )
+        row = cursor.fetchone()
+        total = int(row['total'] if isinstance(row, dict) else row[0])
+        return min(total, COUNT_CAP), total > COUNT_CAP
+
+    def _like_search(self, cursor, where: List[str], params: List[Any], parsed: ParsedQuery,
+                     limit: int, offset: int) -> SearchResult:
+        """Fallback ohne Index (bzw. nur sehr kurze Wörter): LIKE über alle Suchspalten, Datum absteigend."""
+        where, params = list(where), list(params)
+        for word in parsed.positive_words():
+            where.append("(e.from_addr LIKE %s OR e.from_name LIKE %s OR e.to_addrs LIKE %s OR e.subject LIKE %s OR e.body_text LIKE %s)")
+            params.extend([_like(word)] * 5)
+        for word in parsed.excluded:
+            where.append("NOT (e.subject LIKE %s OR e.body_text LIKE %s)")
+            params.extend([_like(word)] * 2)
+        where_sql = " AND ".join(where)
+        cursor.execute(
+            f"SELECT e.id FROM emails e WHERE {where_sql} ORDER BY e.received_at DESC LIMIT %s OFFSET %s",
+            params + [limit, offset],
+        )
+        ids = [r['id'] if isinstance(r, dict) else r[0] for r in cursor.fetchall()]
+        total, capped = self._capped_count(cursor, where_sql, params)
+        return SearchResult(ids, total, capped, 'like')
+
+    def search(self, conn, user_email: str, account_id: int, folder: str, q: str,
+               limit: int = MAX_LIMIT, offset: int = 0) -> SearchResult:
+        parsed = parse_query(q)
+        if parsed.is_empty():
+            return SearchResult([], 0, False, self.name)
+        f_where, f_params = folder_filter(folder)
+        fld_where, fld_params = _field_filters(parsed)
+        where = ["e.user_email = %s", "e.account_id = %s"] + f_where + fld_where
+        params: List[Any] = [user_email, account_id] + f_params + fld_params
+
+        cursor = conn.cursor(dictionary=True)
+        try:
+            expr, short = to_boolean_mode(parsed)
+            if expr is None or not self.fulltext_available:
+                return self._like_search(cursor, where, params, parsed, limit, offset)
+
+            ft_where = where + [f"MATCH({FULLTEXT_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)"]
+            ft_params = params + [expr]
+            for word in short:
+                ft_where.append("(e.from_addr LIKE %s OR e.from_name LIKE %s OR e.to_addrs LIKE %s OR e.subject LIKE %s)")
+                ft_params.extend([_like(word)] * 4)
+            where_sql = " AND ".join(ft_where)
+            try:
+                cursor.execute(
+                    f"""
+                    SELECT e.id,
+                           MATCH({FULLTEXT_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)
+                           + 2 * MATCH(e.subject) AGAINST (%s IN BOOLEAN MODE) AS score
+                    FROM emails e
+                    WHERE {where_sql}
+                    ORDER BY score DESC, e.received_at DESC
+                    LIMIT %s OFFSET %s
+                    """,
+                    [expr, expr] + ft_params + [limit, offset],
+                )
+            except Exception as e:
+                if getattr(e, 'errno', None) != ER_FT_MATCHING_KEY_NOT_FOUND:
+                    raise
+                logger.warning("[Search] FULLTEXT-Index fehlt (scripts/add_emails_fulltext.sql), nutze LIKE-Fallback")
+                self.fulltext_available = False
+                return self._like_search(cursor, where, params, parsed, limit, offset)
+            ids = [r['id'] for r in cursor.fetchall()]
+            total, capped = self._capped_count(cursor, where_sql, ft_params)
+            return SearchResult(ids, total, capped, self.name)
+        finally:
+            cursor.close()
+
+
+def hydrate(cursor, ids: List[int], user_email: str, preview_chars: int = 200) -> List[Dict[str, Any]]:
+    """Lädt die Listenfelder für die Treffer-IDs (nur eigene Mails) in der Reihenfolge des Rankings.
+
+    Statt des ganzen Bodys nur die Vorschau (``emails.preview``, für Altbestand die ersten ``preview_chars`` Zeichen).
+    """
+    if not ids:
+        return []
+    cursor.execute(
+        f"""
+        SELECT e.id, e.message_id, e.from_addr, e.from_name, e.to_addrs, e.subject,
+               COALESCE(e.preview, LEFT(e.body_text, %s)) AS preview, e.received_at, e.folder, e.is_read, e.is_replied, e.starred,
+               e.has_attachments, e.urgency_level, e.importance_level,
+               c.name as contact_name, c.contact_email, c.email_count as contact_email_count
+        FROM emails e
+        LEFT JOIN contacts c ON e.contact_id = c.id
+        WHERE e.user_email = %s AND e.id IN ({', '.join(['%s'] * len(ids))})
+        """,
+        [preview_chars, user_email] + list(ids),
+    )
+    by_id = {row['id']: row for row in cursor.fetchall()}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+BACKEND_NAME = (os.environ.get('EMAIL_SEARCH_BACKEND') or 'mysql').strip().lower()
+
+_MYSQL_BACKEND = MySQLFulltextSearch()
+_BACKEND = None
+
+
+def mysql_backend() -> MySQLFulltextSearch:
+    return _MYSQL_BACKEND
+
+
+def get_backend():
+    """Aktives Such-Backend laut EMAIL_SEARCH_BACKEND (mysql | sqlite)."""
+    global _BACKEND
+    if _BACKEND is None:
+        if BACKEND_NAME == 'sqlite':
+            import email_fts
+            _BACKEND = email_fts.SqliteFtsSearch(fallback=_MYSQL_BACKEND)
+        else:
+            _BACKEND = _MYSQL_BACKEND
+    return _BACKEND
+
+
+def indexes_on_sync() -> bool:
+    """True, wenn das aktive Backend neue Mails vom Sync übergeben bekommen muss."""
+    return hasattr(get_backend(), 'index_emails')
+
+
+def index_emails(user_email: str, account_id: int, folder_db: str, rows: List[Tuple[int, Dict[str, Any]]]) -> None:
+    """Vom Sync aufgerufen: neue Mails (email_id, geparste Felder) ins Such-Backend übernehmen.
+
+    Für MySQL ein No-op (der FULLTEXT-Index pflegt sich selbst).
+    """
+    if rows and indexes_on_sync():
+        get_backend().index_emails(user_email, account_id, folder_db, rows)
+
+
+def move_email(account_id: int, email_id: int, folder: str) -> None:
+    """Ordnerwechsel einer Mail im Such-Backend nachziehen (nur lokaler FTS-Index)."""
+    backend = get_backend()
+    if hasattr(backend, 'move_email'):
+        backend.move_email(account_id, email_id, folder)
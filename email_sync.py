@@ -0,0 +1,1209 @@
+"""
+Hilfsfunktionen für den inkrementellen IMAP-Sync.
+
+Pro (account_id, IMAP-Ordner) merken wir uns UIDVALIDITY und die höchste bereits
+synchronisierte UID in der Tabelle ``email_sync_state``. Solange UIDVALIDITY
+unverändert ist, müssen nur die UIDs ``last_uid+1:*`` geholt werden; erst wenn
+der Server UIDVALIDITY ändert (Ordner neu angelegt/umnummeriert), fällt der
+Sync auf einen vollständigen Abgleich zurück.
+
+Mit ``limit`` werden nie UIDs übersprungen: neue UIDs oberhalb von last_uid
+werden aufsteigend geholt (der Rest folgt beim nächsten Lauf). Ältere Mails
+unterhalb von ``backfill_uid`` (Low-Water-Mark, z.B. nach einem ersten Sync
+mit limit, der nur die neuesten N lädt) werden mit dem restlichen Budget
+absteigend nachgeladen; ``backfill_uid=0`` heißt: Historie vollständig.
+
+Nachrichten, die sich wiederholt nicht parsen oder (einzeln) nicht speichern
+lassen, zählt ``email_sync_failures``; nach MAX_UID_ATTEMPTS Versuchen werden sie
+übersprungen, statt die High-Water-Mark dauerhaft festzuhalten.
+
+Gelesen/Beantwortet-Status wird separat über ``sync_flags`` abgeglichen:
+mit CONDSTORE (``CHANGEDSINCE <highestmodseq>``) nur für geänderte Nachrichten,
+sonst über ein einziges ``UID FETCH 1:* (FLAGS)``, das im Speicher mit der DB
+verglichen wird.
+
+Neue Nachrichten werden chunkweise per ``UID FETCH <uid-set>`` geladen (Anzahl
+und Byte-Budget pro Chunk konfigurierbar), statt einen Round Trip pro Mail.
+"""
+import os
+import re
+import email
+import base64
+import imaplib
+import logging
+import threading
+from datetime import datetime
+from email.header import decode_header
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import email_attachments
+import email_search
+import folder_stats
+
+logger = logging.getLogger(__name__)
+
+SYNC_STATE_DDL = """
+CREATE TABLE IF NOT EXISTS email_sync_state (
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL,
+    uidvalidity BIGINT UNSIGNED NOT NULL,
+    last_uid BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    uidnext BIGINT UNSIGNED NULL,
+    highestmodseq BIGINT UNSIGNED NULL,
+    backfill_uid BIGINT UNSIGNED NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, folder)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+SYNC_FAILURES_DDL = """
+CREATE TABLE IF NOT EXISTS email_sync_failures (
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL,
+    uidvalidity BIGINT UNSIGNED NOT NULL,
+    uid BIGINT UNSIGNED NOT NULL,
+    attempts INT NOT NULL DEFAULT 1,
+    last_error TEXT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, folder, uidvalidity, uid)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+# Nach so vielen fehlgeschlagenen Parse-Versuchen wird eine UID übersprungen
+MAX_UID_ATTEMPTS = 3
+
+_SCHEMA_READY = False
+_SCHEMA_LOCK = threading.Lock()
+
+# Länge der in emails.preview gespeicherten Vorschau (Listenansicht liest keine Bodies)
+PREVIEW_CHARS = 200
+
+
+def make_preview(body_text: Optional[str]) -> str:
+    return (body_text or '')[:PREVIEW_CHARS]
+
+
+def ensure_sync_schema(cursor) -> None:
+    """Legt email_sync_state und emails.imap_uid an (einmal pro Prozess, Best Effort)."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if _SCHEMA_READY:
+            return
+        try:
+            cursor.execute(SYNC_STATE_DDL)
+        except Exception as e:
+            logger.warning(f"[Sync] DDL email_sync_state fehlgeschlagen (ignoriert): {e}")
+        try:
+            cursor.execute("ALTER TABLE emails ADD COLUMN IF NOT EXISTS imap_uid BIGINT UNSIGNED NULL")
+        except Exception as e:
+            logger.warning(f"[Sync] ALTER emails.imap_uid fehlgeschlagen (ignoriert): {e}")
+        try:
+            cursor.execute("ALTER TABLE email_sync_state ADD COLUMN IF NOT EXISTS highestmodseq BIGINT UNSIGNED NULL")
+        except Exception as e:
+            logger.warning(f"[Sync] ALTER email_sync_state.highestmodseq fehlgeschlagen (ignoriert): {e}")
+        try:
+            cursor.execute("ALTER TABLE email_sync_state ADD COLUMN IF NOT EXISTS backfill_uid BIGINT UNSIGNED NULL")
+        except Exception as e:
+            logger.warning(f"[Sync] ALTER email_sync_state.backfill_uid fehlgeschlagen (ignoriert): {e}")
+        try:
+            cursor.execute(SYNC_FAILURES_DDL)
+        except Exception as e:
+            logger.warning(f"[Sync] DDL email_sync_failures fehlgeschlagen (ignoriert): {e}")
+        try:
+            cursor.execute(f"ALTER TABLE emails ADD COLUMN IF NOT EXISTS preview VARCHAR({PREVIEW_CHARS}) NULL")
+        except Exception as e:
+            logger.warning(f"[Sync] ALTER emails.preview fehlgeschlagen (ignoriert): {e}")
+        email_attachments.ensure_attachments_schema(cursor)
+        folder_stats.ensure_schema(cursor)
+        _SCHEMA_READY = True
+
+
+def _response_int(M, code: str) -> Optional[int]:
+    """Liest einen numerischen Response-Code (z.B. UIDVALIDITY) aus dem letzten SELECT."""
+    try:
+        _typ, dat = M.response(code)
+    except Exception:
+        return None
+    for val in reversed(dat or []):
+        if val is None:
+            continue
+        try:
+            return int(val.decode() if isinstance(val, (bytes, bytearray)) else val)
+        except Exception:
+            continue
+    return None
+
+
+def mailbox_status(M, folder_imap: str, select_data=None) -> Dict[str, Optional[int]]:
+    """UIDVALIDITY, UIDNEXT und Anzahl Nachrichten des gerade selektierten Ordners.
+
+    Die Werte kommen normalerweise kostenlos aus den Response-Codes des SELECT.
+    Fehlen sie (ältere Server), wird einmal STATUS abgefragt.
+    """
+    info: Dict[str, Optional[int]] = {
+        'uidvalidity': _response_int(M, 'UIDVALIDITY'),
+        'uidnext': _response_int(M, 'UIDNEXT'),
+        'highestmodseq': _response_int(M, 'HIGHESTMODSEQ'),
+        'exists': None,
+    }
+    try:
+        if select_data and select_data[0] is not None:
+            info['exists'] = int(select_data[0])
+        else:
+            # SELECT lief z.B. im IMAP-Pool: EXISTS steht dann noch in den untagged Responses
+            info['exists'] = _response_int(M, 'EXISTS')
+    except Exception:
+        info['exists'] = None
+    if info['uidvalidity'] is None or info['exists'] is None:
+        try:
+            typ, dat = M.status(f'"{folder_imap}"', '(UIDVALIDITY UIDNEXT MESSAGES)')
+            if typ == 'OK' and dat and dat[0]:
+                line = dat[0].decode(errors='ignore') if isinstance(dat[0], (bytes, bytearray)) else str(dat[0])
+                for key, field in (('UIDVALIDITY', 'uidvalidity'), ('UIDNEXT', 'uidnext'), ('MESSAGES', 'exists')):
+                    m = re.search(rf'{key} (\d+)', line)
+                    if m and info[field] is None:
+                        info[field] = int(m.group(1))
+        except Exception as e:
+            logger.warning(f"[Sync] IMAP STATUS für {folder_imap!r} fehlgeschlagen: {e}")
+    return info
+
+
+def get_sync_state(cursor, account_id: int, folder_imap: str) -> Optional[Dict[str, Any]]:
+    cursor.execute(
+        "SELECT uidvalidity, last_uid, uidnext, highestmodseq, backfill_uid FROM email_sync_state WHERE account_id=%s AND folder=%s",
+        (account_id, folder_imap),
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if not isinstance(row, dict):
+        row = dict(zip(('uidvalidity', 'last_uid', 'uidnext', 'highestmodseq', 'backfill_uid'), row))
+    return {
+        'uidvalidity': int(row['uidvalidity']),
+        'last_uid': int(row['last_uid'] or 0),
+        'uidnext': row.get('uidnext'),
+        'highestmodseq': int(row['highestmodseq']) if row.get('highestmodseq') else None,
+        # None = Zustand von vor der Low-Water-Mark (siehe sync_folder)
+        'backfill_uid': int(row['backfill_uid']) if row.get('backfill_uid') is not None else None,
+    }
+
+
+def save_sync_state(cursor, account_id: int, folder_imap: str, uidvalidity: int, last_uid: int, uidnext: Optional[int] = None,
+                    backfill_uid: Optional[int] = None) -> None:
+    """Schreibt die Marken; ``backfill_uid=None`` lässt die gespeicherte Low-Water-Mark unverändert."""
+    cursor.execute(
+        "INSERT INTO email_sync_state (account_id, folder, uidvalidity, last_uid, uidnext, backfill_uid) "
+        "VALUES (%s, %s, %s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE uidvalidity=VALUES(uidvalidity), last_uid=VALUES(last_uid), uidnext=VALUES(uidnext), "
+        "backfill_uid=COALESCE(VALUES(backfill_uid), backfill_uid)",
+        (account_id, folder_imap, uidvalidity, last_uid, uidnext, backfill_uid),
+    )
+
+
+def load_uid_failures(cursor, account_id: int, folder_imap: str, uidvalidity: int) -> Dict[int, int]:
+    """UID -> bisherige Fehlversuche (nur für die aktuelle UIDVALIDITY)."""
+    cursor.execute(
+        "SELECT uid, attempts FROM email_sync_failures WHERE account_id=%s AND folder=%s AND uidvalidity=%s",
+        (account_id, folder_imap, uidvalidity),
+    )
+    out = {}
+    for row in cursor.fetchall():
+        uid, attempts = (row['uid'], row['attempts']) if isinstance(row, dict) else row
+        out[int(uid)] = int(attempts)
+    return out
+
+
+def record_uid_failures(cursor, account_id: int, folder_imap: str, uidvalidity: int, errors: Dict[int, str]) -> None:
+    if not errors:
+        return
+    cursor.executemany(
+        "INSERT INTO email_sync_failures (account_id, folder, uidvalidity, uid, attempts, last_error) "
+        "VALUES (%s, %s, %s, %s, 1, %s) ON DUPLICATE KEY UPDATE attempts=attempts+1, last_error=VALUES(last_error)",
+        [(account_id, folder_imap, uidvalidity, uid, err[:2000]) for uid, err in errors.items()],
+    )
+
+
+def _parse_uid_list(data) -> List[int]:
+    if not data or data[0] is None:
+        return []
+    raw = data[0].decode() if isinstance(data[0], (bytes, bytearray)) else str(data[0])
+    out = []
+    for tok in raw.split():
+        try:
+            out.append(int(tok))
+        except ValueError:
+            continue
+    return sorted(set(out))
+
+
+def plan_uid_fetch(M, state: Optional[Dict[str, Any]], status: Dict[str, Optional[int]], limit: Optional[int] = None) -> Dict[str, Any]:
+    """Bestimmt die zu holenden UIDs und die Marken nach einem fehlerfreien Lauf.
+
+    - Kein State oder geänderte UIDVALIDITY: ``UID SEARCH ALL`` (Voll-Abgleich);
+      mit limit die neuesten N, der Rest darunter wird später nachgeladen.
+    - Gleiche UIDVALIDITY: ``UID last_uid+1:*`` (entfällt, wenn UIDNEXT nicht
+      größer als last_uid+1 ist); mit limit die ältesten N, damit keine Lücke
+      entsteht.
+    - Verbleibendes Budget: Backfill der neuesten UIDs unterhalb von backfill_uid.
+
+    Liefert ``{'new': [...], 'backfill': [...], 'full_resync': bool, 'backfill_uid': int}``
+    (UIDs aufsteigend; backfill_uid = neue Low-Water-Mark, 0 = Historie vollständig).
+    """
+    limit = int(limit) if limit else None
+    uidvalidity = status.get('uidvalidity')
+    full_resync = not state or uidvalidity is None or int(state['uidvalidity']) != int(uidvalidity)
+    if full_resync:
+        typ, data = M.uid('search', None, 'ALL')
+        if typ != 'OK':
+            raise RuntimeError('IMAP UID SEARCH ALL failed')
+        uids = _parse_uid_list(data)
+        new = uids[-limit:] if limit else uids
+        backfill_uid = new[0] if len(new) < len(uids) else 0
+        return {'new': new, 'backfill': [], 'full_resync': True, 'backfill_uid': backfill_uid}
+
+    last_uid = int(state.get('last_uid') or 0)
+    new: List[int] = []
+    uidnext = status.get('uidnext')
+    if uidnext is None or int(uidnext) > last_uid + 1:
+        typ, data = M.uid('search', None, f'UID {last_uid + 1}:*')
+        if typ != 'OK':
+            raise RuntimeError('IMAP UID SEARCH failed')
+        # "n:*" liefert laut RFC 3501 immer mindestens die höchste UID, auch wenn sie < n ist
+        new = [u for u in _parse_uid_list(data) if u > last_uid]
+        if limit:
+            new = new[:limit]
+
+    backfill: List[int] = []
+    backfill_uid = int(state.get('backfill_uid') or 0)
+    budget = (limit - len(new)) if limit else None
+    if backfill_uid > 1 and (budget is None or budget > 0):
+        typ, data = M.uid('search', None, f'UID 1:{backfill_uid - 1}')
+        if typ != 'OK':
+            raise RuntimeError('IMAP UID SEARCH (Backfill) failed')
+        older = [u for u in _parse_uid_list(data) if u < backfill_uid]
+        backfill = older[-budget:] if budget else older
+        backfill_uid = backfill[0] if len(backfill) < len(older) else 0
+    return {'new': new, 'backfill': backfill, 'full_resync': False, 'backfill_uid': backfill_uid}
+
+
+_FLAG_RE = re.compile(r'FLAGS \(([^)]*)\)')
+_UID_RE = re.compile(r'UID (\d+)')
+_MODSEQ_RE = re.compile(r'MODSEQ \((\d+)\)')
+
+
+def parse_flag_fetch(data) -> List[Tuple[int, str, Optional[int]]]:
+    """Parst FETCH-Antworten zu [(uid, flags, modseq)]."""
+    out = []
+    for item in data or []:
+        if item is None:
+            continue
+        raw = item[0] if isinstance(item, tuple) else item
+        line = raw.decode(errors='ignore') if isinstance(raw, (bytes, bytearray)) else str(raw)
+        m_uid = _UID_RE.search(line)
+        m_flags = _FLAG_RE.search(line)
+        if not m_uid or not m_flags:
+            continue
+        m_mod = _MODSEQ_RE.search(line)
+        out.append((int(m_uid.group(1)), m_flags.group(1), int(m_mod.group(1)) if m_mod else None))
+    return out
+
+
+def _flags_to_state(flags: str) -> Tuple[int, int]:
+    return (1 if '\\Seen' in flags else 0, 1 if '\\Answered' in flags else 0)
+
+
+def apply_flag_changes(cursor, user_email: str, account_id: int, folder_db: str, changes: Dict[int, Tuple[int, int]], batch_size: int = 500) -> int:
+    """Schreibt geänderte Flags gebündelt: ein UPDATE pro (is_read, is_replied)-Kombination.
+
+    is_replied wird wie im Sync nie zurückgesetzt (GREATEST), damit ein lokal
+    gesetztes "beantwortet" nicht durch ein fehlendes \\Answered verloren geht.
+    """
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for uid, state in changes.items():
+        groups.setdefault(state, []).append(uid)
+    updated = 0
+    for (is_read, is_replied), uids in groups.items():
+        for i in range(0, len(uids), batch_size):
+            part = uids[i:i + batch_size]
+            placeholders = ", ".join(["%s"] * len(part))
+            cursor.execute(
+                "UPDATE emails SET is_read=%s, is_replied=GREATEST(is_replied, %s) "
+                f"WHERE user_email=%s AND account_id=%s AND folder=%s AND imap_uid IN ({placeholders})",
+                (is_read, is_replied, user_email, account_id, folder_db, *part),
+            )
+            updated += max(0, cursor.rowcount or 0)
+    return updated
+
+
+def server_supports_condstore(M) -> bool:
+    caps = {str(c).upper() for c in (getattr(M, 'capabilities', None) or ())}
+    return 'CONDSTORE' in caps or 'QRESYNC' in caps
+
+
+def sync_flags(M, cursor, user_email: str, account_id: int, folder_imap: str, folder_db: str,
+               status: Dict[str, Optional[int]], state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Gleicht is_read/is_replied für bereits synchronisierte Mails mit dem Server ab.
+
+    - CONDSTORE + gespeicherte HIGHESTMODSEQ: nur ``CHANGEDSINCE``-Änderungen;
+      ist HIGHESTMODSEQ des Servers unverändert, entfällt der FETCH komplett.
+    - Sonst: ein ``UID FETCH 1:* (FLAGS)``, Diff gegen die DB im Speicher.
+    Erwartet einen selektierten Ordner und einen bereits gespeicherten Sync-State.
+    """
+    result: Dict[str, Any] = {'mode': 'unchanged', 'checked': 0, 'updated': 0}
+    if not status.get('exists'):
+        return result
+    condstore = server_supports_condstore(M)
+    known_modseq = (state or {}).get('highestmodseq')
+    server_modseq = status.get('highestmodseq')
+    if condstore and known_modseq and server_modseq and int(server_modseq) <= int(known_modseq):
+        return result
+
+    if condstore and known_modseq:
+        typ, data = M.uid('fetch', '1:*', f'(FLAGS) (CHANGEDSINCE {int(known_modseq)})')
+        if typ != 'OK':
+            raise RuntimeError(f'IMAP UID FETCH CHANGEDSINCE failed: {typ}')
+        items = parse_flag_fetch(data)
+        changes = {uid: _flags_to_state(flags) for uid, flags, _mod in items}
+        result['mode'] = 'condstore'
+    else:
+        typ, data = M.uid('fetch', '1:*', '(FLAGS MODSEQ)' if condstore else '(FLAGS)')
+        if typ != 'OK':
+            raise RuntimeError(f'IMAP UID FETCH FLAGS failed: {typ}')
+        items = parse_flag_fetch(data)
+        cursor.execute(
+            "SELECT imap_uid, is_read, is_replied FROM emails "
+            "WHERE user_email=%s AND account_id=%s AND folder=%s AND imap_uid IS NOT NULL",
+            (user_email, account_id, folder_db),
+        )
+        known = {}
+        for row in cursor.fetchall():
+            if isinstance(row, dict):
+                row = (row['imap_uid'], row['is_read'], row['is_replied'])
+            known[int(row[0])] = (int(row[1] or 0), int(row[2] or 0))
+        changes = {}
+        for uid, flags, _mod in items:
+            current = known.get(uid)
+            if current is None:
+                continue
+            is_read, is_replied = _flags_to_state(flags)
+            if current[0] != is_read or (is_replied and not current[1]):
+                changes[uid] = (is_read, is_replied)
+        result['mode'] = 'full'
+
+    result['checked'] = len(items)
+    result['updated'] = apply_flag_changes(cursor, user_email, account_id, folder_db, changes) if changes else 0
+
+    if condstore:
+        modseqs = [mod for _uid, _flags, mod in items if mod]
+        new_modseq = max([int(known_modseq or 0), int(server_modseq or 0)] + modseqs)
+        if new_modseq:
+            cursor.execute(
+                "UPDATE email_sync_state SET highestmodseq=%s WHERE account_id=%s AND folder=%s",
+                (new_modseq, account_id, folder_imap),
+            )
+    return result
+
+
+# --- Batch-FETCH --------------------------------------------------------------
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except Exception:
+        return default
+
+
+# Nachrichten pro UID FETCH und Byte-Budget pro Chunk (begrenzt den Speicher je Chunk)
+FETCH_CHUNK_SIZE = _env_int('EMAIL_SYNC_FETCH_CHUNK', 50)
+FETCH_CHUNK_BYTES = _env_int('EMAIL_SYNC_FETCH_CHUNK_BYTES', 20 * 1024 * 1024)
+
+
+def compress_uid_set(uids: List[int]) -> str:
+    """[1, 2, 3, 7, 9, 10] -> '1:3,7,9:10' (kompakter UID-Set für FETCH)."""
+    parts = []
+    start = prev = None
+    for u in sorted(set(uids)):
+        if start is None:
+            start = prev = u
+        elif u == prev + 1:
+            prev = u
+        else:
+            parts.append(f"{start}:{prev}" if start != prev else str(start))
+            start = prev = u
+    if start is not None:
+        parts.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(parts)
+
+
+_SIZE_RE = re.compile(r'RFC822\.SIZE (\d+)')
+
+
+def fetch_sizes(M, uids: List[int]) -> Dict[int, int]:
+    """Holt RFC822.SIZE für alle UIDs in einem einzigen Round Trip."""
+    if not uids:
+        return {}
+    typ, data = M.uid('fetch', compress_uid_set(uids), '(RFC822.SIZE)')
+    if typ != 'OK':
+        return {}
+    sizes = {}
+    for item in data or []:
+        raw = item[0] if isinstance(item, tuple) else item
+        if raw is None:
+            continue
+        line = raw.decode(errors='ignore') if isinstance(raw, (bytes, bytearray)) else str(raw)
+        m_uid = _UID_RE.search(line)
+        m_size = _SIZE_RE.search(line)
+        if m_uid and m_size:
+            sizes[int(m_uid.group(1))] = int(m_size.group(1))
+    return sizes
+
+
+def plan_fetch_chunks(uids: List[int], sizes: Optional[Dict[int, int]] = None,
+                      max_count: Optional[int] = None, max_bytes: Optional[int] = None) -> List[List[int]]:
+    """Teilt UIDs (aufsteigend) in Chunks nach Anzahl und Byte-Budget.
+
+    Eine einzelne Nachricht größer als max_bytes bildet einen eigenen Chunk.
+    """
+    max_count = max(1, int(max_count or FETCH_CHUNK_SIZE))
+    max_bytes = max(1, int(max_bytes or FETCH_CHUNK_BYTES))
+    sizes = sizes or {}
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    current_bytes = 0
+    for uid in sorted(uids):
+        size = sizes.get(uid, 0)
+        if current and (len(current) >= max_count or current_bytes + size > max_bytes):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(uid)
+        current_bytes += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def iter_fetch_messages(M, uids: List[int]):
+    """Ein ``UID FETCH`` für den ganzen Chunk; liefert (uid, meta, raw_bytes) nacheinander.
+
+    BODY.PEEK[] setzt kein \\Seen. Bereits gelieferte Nachrichten werden aus der
+    Antwortliste entfernt, damit pro Chunk nicht alles doppelt im Speicher liegt.
+    """
+    typ, data = M.uid('fetch', compress_uid_set(uids), '(UID FLAGS BODY.PEEK[])')
+    if typ != 'OK':
+        raise RuntimeError(f'IMAP UID FETCH failed: {typ}')
+    data = data or []
+    for i in range(len(data)):
+        item = data[i]
+        if not isinstance(item, tuple):
+            continue
+        meta = item[0].decode(errors='ignore') if isinstance(item[0], (bytes, bytearray)) else str(item[0])
+        # Manche Server schicken FLAGS erst nach dem Literal: (..., b' FLAGS (\\Seen))')
+        if i + 1 < len(data) and isinstance(data[i + 1], (bytes, bytearray)):
+            meta += ' ' + data[i + 1].decode(errors='ignore')
+        m_uid = _UID_RE.search(meta)
+        raw_email = item[1]
+        data[i] = None
+        if not m_uid or raw_email is None:
+            continue
+        yield int(m_uid.group(1)), meta, raw_email
+
+
+# --- Nachricht parsen ---------------------------------------------------------
+
+def _decode_header_value(value) -> str:
+    if not value:
+        return ''
+    parts = decode_header(value)
+    decoded = []
+    for content, encoding in parts:
+        if isinstance(content, bytes):
+            decoded.append(content.decode(encoding or 'utf-8', errors='ignore'))
+        else:
+            decoded.append(str(content))
+    return ' '.join(decoded)
+
+
+def parse_message(raw_email: bytes, uid: int, meta_raw: str = '') -> Dict[str, Any]:
+    """Zerlegt eine Rohnachricht in die Felder der emails-Tabelle."""
+    # Gelesen-Status und Beantwortet-Status aus FLAGS extrahieren.
+    # is_read spiegelt den aktuellen IMAP-Status (\\Seen) wider,
+    # damit alle Clients (Outlook, Handy, unsere App) konsistent sind.
+    is_read = 1 if ('\\Seen' in meta_raw) else 0
+    is_replied = 1 if ('\\Answered' in meta_raw) else 0
+    msg = email.message_from_bytes(raw_email)
+
+    message_id = msg.get('Message-ID', '').strip()
+    if not message_id:
+        message_id = f"no-id-{uid}"
+
+    # Thread/Reply-Header auslesen
+    in_reply_to = (msg.get('In-Reply-To') or '').strip()
+    # References kann mehrfach vorkommen; alle kombinieren
+    try:
+        refs_list = msg.get_all('References', []) or []
+    except Exception:
+        refs_list = []
+    references_raw = ' '.join(refs_list).strip() if refs_list else ''
+
+    # Einfache thread_id bestimmen:
+    # 1) erste Message-ID aus References
+    # 2) sonst In-Reply-To
+    # 3) sonst eigene Message-ID
+    thread_id = ''
+    try:
+        candidate = ''
+        if references_raw:
+            ids = re.findall(r'<([^>]+)>', references_raw)
+            if ids:
+                candidate = ids[0]
+        if not candidate and in_reply_to:
+            m = re.search(r'<([^>]+)>', in_reply_to)
+            candidate = m.group(1) if m else in_reply_to
+        if not candidate and message_id:
+            m = re.search(r'<([^>]+)>', message_id)
+            candidate = m.group(1) if m else message_id
+        thread_id = candidate[:255] if candidate else ''
+    except Exception:
+        thread_id = ''
+
+    from_addr = _decode_header_value(msg.get('From', ''))
+    to_addrs = msg.get('To', '')
+    subject = _decode_header_value(msg.get('Subject', ''))
+    date_str = msg.get('Date', '')
+
+    # Extract email address and name from "Name <email@example.com>"
+    from_email = from_addr
+    from_name = ''
+    email_match = re.search(r'<(.+?)>', from_addr)
+    if email_match:
+        from_email = email_match.group(1)
+        from_name = from_addr.split('<')[0].strip().strip('"')
+
+    try:
+        received_at = parsedate_to_datetime(date_str)
+    except Exception:
+        received_at = datetime.now()
+
+    body_text = ''
+    body_html = ''
+    has_attachments = False
+    # Mapping von Content-ID -> data:-URL für kleine Inline-Bilder
+    inline_images = {}
+
+    if msg.is_multipart():
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            disp = (part.get("Content-Disposition") or "").lower()
+            cid = (part.get("Content-ID") or "").strip().strip("<>")
+
+            if ctype == 'text/plain' and not body_text:
+                try:
+                    payload = part.get_payload(decode=True)
+                    body_text = payload.decode(part.get_content_charset() or 'utf-8', errors='ignore')
+                except Exception:
+                    pass
+            elif ctype == 'text/html' and not body_html:
+                try:
+                    payload = part.get_payload(decode=True)
+                    body_html = payload.decode(part.get_content_charset() or 'utf-8', errors='ignore')
+                except Exception:
+                    pass
+            # Kleine Inline-Bilder (cid) als data:-URL vorbereiten
+            elif ctype.startswith('image/') and cid and ('attachment' not in disp):
+                try:
+                    payload = part.get_payload(decode=True) or b''
+                    # Größen-Limit ~70 KB, damit die Base64-URL sicher in body_html[:100000] passt
+                    # (Base64 ca. 4/3 der Bytes -> ~93 KB Text)
+                    if len(payload) <= 70_000:
+                        b64 = base64.b64encode(payload).decode('ascii')
+                        # Nur ausgewählte Typen explizit zulassen
+                        if ctype in ('image/png', 'image/jpeg', 'image/jpg', 'image/gif'):
+                            inline_images[cid] = f"data:{ctype};base64,{b64}"
+                except Exception:
+                    # Inline-Bild ist optional – Fehler hier sollen den Import nicht blockieren
+                    pass
+            elif part.get_filename():
+                has_attachments = True
+    else:
+        try:
+            payload = msg.get_payload(decode=True)
+            if msg.get_content_type() == 'text/html':
+                body_html = payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore')
+            else:
+                body_text = payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore')
+        except Exception:
+            pass
+
+    # Anhang-Metadaten (Section-Nummern wie BODYSTRUCTURE) für email_attachments
+    try:
+        attachments = email_attachments.attachments_from_message(msg)
+    except Exception as e:
+        logger.warning(f"[Sync] Attachment-Metadaten für UID {uid} nicht ermittelbar: {e}")
+        attachments = None
+    if attachments:
+        has_attachments = True
+
+    # Falls HTML vorhanden ist und wir Inline-Bilder haben, ersetze cid:-Verweise durch data:-URLs
+    if body_html and inline_images:
+        try:
+            body_html = re.sub(r'src=("|\')(cid:[^"\']+)("|\')',
+                               lambda m: f"src=\"{inline_images.get(m.group(2).split(':',1)[1].strip('<>'), m.group(2))}\"",
+                               body_html)
+        except Exception:
+            # Wenn Ersetzung fehlschlägt, lieber Original-HTML behalten
+            pass
+
+    return {
+        'uid': uid,
+        'message_id': message_id,
+        'in_reply_to': in_reply_to,
+        'references_raw': references_raw,
+        'thread_id': thread_id,
+        'from_email': from_email,
+        'from_name': from_name,
+        'to_addrs': to_addrs,
+        'subject': subject,
+        'received_at': received_at,
+        'body_text': body_text,
+        'body_html': body_html,
+        'preview': make_preview(body_text),
+        'has_attachments': has_attachments,
+        'attachments': attachments,
+        'is_read': is_read,
+        'is_replied': is_replied,
+    }
+
+
+# --- Gebündeltes Schreiben ----------------------------------------------------
+
+_CONTACTS_UNIQUE: Optional[bool] = None
+
+
+def _naive(dt):
+    """Für Vergleiche: tz-aware und naive Datumswerte (Fallback datetime.now()) mischen sich."""
+    if dt is not None and getattr(dt, 'tzinfo', None) is not None:
+        return dt.replace(tzinfo=None)
+    return dt
+
+
+def contacts_have_unique_email(cursor) -> bool:
+    """Prüft einmal pro Prozess, ob contacts einen UNIQUE-Key auf (user_email, contact_email) hat."""
+    global _CONTACTS_UNIQUE
+    if _CONTACTS_UNIQUE is not None:
+        return _CONTACTS_UNIQUE
+    try:
+        cursor.execute("SHOW INDEX FROM contacts WHERE Non_unique = 0")
+        cols = cursor.column_names
+        keys: Dict[str, set] = {}
+        for row in cursor.fetchall():
+            rec = dict(zip(cols, row)) if not isinstance(row, dict) else row
+            keys.setdefault(rec['Key_name'], set()).add(str(rec['Column_name']).lower())
+        _CONTACTS_UNIQUE = any(k == {'user_email', 'contact_email'} for k in keys.values())
+    except Exception as e:
+        logger.warning(f"[Sync] SHOW INDEX contacts fehlgeschlagen: {e}")
+        _CONTACTS_UNIQUE = False
+    return _CONTACTS_UNIQUE
+
+
+class SyncWriter:
+    """Sammelt geparste Nachrichten eines Chunks und schreibt sie gebündelt.
+
+    Pro flush(): ein SELECT für bereits vorhandene Mails, Kontakte des ganzen
+    Chunks per ``INSERT ... ON DUPLICATE KEY UPDATE``, Mails per ``executemany``
+    und ein Commit. Schlägt ein Chunk fehl, wird er zurückgerollt und Mail für
+    Mail erneut geschrieben; was dann noch scheitert (z.B. "Data too long"),
+    steht in ``write_errors`` (UID -> Fehler), der Rest des Chunks ist gespeichert.
+    """
+
+    def __init__(self, conn, user_email: str, account_id: int, folder_db: str):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.user_email = user_email
+        self.account_id = account_id
+        self.folder_db = folder_db
+        self.pending: List[Dict[str, Any]] = []
+        self.write_errors: Dict[int, str] = {}
+
+    def add(self, parsed: Dict[str, Any]) -> None:
+        self.pending.append(parsed)
+
+    @property
+    def pending_uids(self) -> List[int]:
+        return [p['uid'] for p in self.pending]
+
+    def close(self) -> None:
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+
+    def _in_clause(self, values) -> str:
+        return ", ".join(["%s"] * len(values))
+
+    def _existing_emails(self, message_ids: List[str]) -> Dict[str, int]:
+        if not message_ids:
+            return {}
+        self.cursor.execute(
+            "SELECT id, message_id FROM emails WHERE user_email=%s AND account_id=%s AND folder=%s "
+            f"AND message_id IN ({self._in_clause(message_ids)})",
+            (self.user_email, self.account_id, self.folder_db, *message_ids),
+        )
+        return {row[1]: row[0] for row in self.cursor.fetchall()}
+
+    def _contact_ids(self, emails: List[str]) -> Dict[str, int]:
+        if not emails:
+            return {}
+        self.cursor.execute(
+            f"SELECT id, contact_email FROM contacts WHERE user_email=%s AND contact_email IN ({self._in_clause(emails)})",
+            (self.user_email, *emails),
+        )
+        out: Dict[str, int] = {}
+        for cid, addr in self.cursor.fetchall():
+            out.setdefault((addr or '').lower(), cid)
+        return out
+
+    def _upsert_contacts(self, rows: List[Dict[str, Any]]) -> Tuple[Dict[str, int], int]:
+        """Legt Kontakte des Chunks an bzw. zählt email_count hoch; liefert (lower(email) -> id, neu)."""
+        agg: Dict[str, Dict[str, Any]] = {}
+        for p in rows:
+            key = (p['from_email'] or '').lower()
+            a = agg.get(key)
+            received = _naive(p['received_at'])
+            if a is None:
+                agg[key] = {'email': p['from_email'], 'name': p['from_name'], 'count': 1, 'first': received, 'last': received}
+                continue
+            a['count'] += 1
+            a['first'] = min(a['first'], received)
+            if received >= a['last']:
+                a['last'] = received
+                a['name'] = p['from_name'] or a['name']
+
+        emails = [a['email'] for a in agg.values()]
+        existing = self._contact_ids(emails)
+
+        def _values(a):
+            name = a['name']
+            return (self.user_email, a['email'], name or a['email'], name.split()[0] if name else '',
+                    a['count'], a['first'], a['last'])
+
+        if contacts_have_unique_email(self.cursor):
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(agg))
+            params: List[Any] = []
+            for a in agg.values():
+                params.extend(_values(a))
+            self.cursor.execute(
+                "INSERT INTO contacts (user_email, contact_email, name, first_name, email_count, first_contact_at, last_contact_at) "
+                f"VALUES {placeholders} "
+                "ON DUPLICATE KEY UPDATE email_count=email_count+VALUES(email_count), "
+                "last_contact_at=GREATEST(COALESCE(last_contact_at, VALUES(last_contact_at)), VALUES(last_contact_at)), "
+                # Gepflegten Namen behalten; nur leere Namen aus der Mail füllen
+                "name=COALESCE(NULLIF(name, ''), VALUES(name))",
+                params,
+            )
+        else:
+            # Ohne UNIQUE-Key (Migration noch nicht gelaufen): bestehende per executemany
+            # aktualisieren, neue in einem Multi-Row-INSERT anlegen.
+            updates = [(a['count'], a['last'], a['last'], a['name'] or a['email'], existing[k])
+                       for k, a in agg.items() if k in existing]
+            if updates:
+                self.cursor.executemany(
+                    "UPDATE contacts SET email_count=email_count+%s, "
+                    "last_contact_at=GREATEST(COALESCE(last_contact_at, %s), %s), name=COALESCE(NULLIF(name, ''), %s) WHERE id=%s",
+                    updates,
+                )
+            inserts = [_values(a) for k, a in agg.items() if k not in existing]
+            if inserts:
+                self.cursor.executemany(
+                    "INSERT INTO contacts (user_email, contact_email, name, first_name, email_count, first_contact_at, last_contact_at) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                    inserts,
+                )
+
+        new_keys = [k for k in agg if k not in existing]
+        ids = dict(existing)
+        if new_keys:
+            ids.update(self._contact_ids([agg[k]['email'] for k in new_keys]))
+        return ids, len(new_keys)
+
+    def flush(self) -> Dict[str, int]:
+        """Schreibt alle gesammelten Nachrichten und committet (auch weitere Änderungen der Verbindung).
+
+        Scheitert der Chunk, wird jede Mail einzeln geschrieben; nur ein Verbindungsabbruch
+        wird weitergereicht (dann ist der ganze Chunk erneut zu versuchen).
+        """
+        batch, self.pending = self.pending, []
+        try:
+            return self._write(batch)
+        except Exception as e:
+            if not batch or not self._connected():
+                raise
+            logger.warning(f"[Sync] Chunk mit {len(batch)} Mails nicht gespeichert ({e}), schreibe einzeln")
+        stats = {'inserted': 0, 'updated': 0, 'new_contacts': 0}
+        for p in batch:
+            try:
+                one = self._write([p])
+            except Exception as e:
+                if not self._connected():
+                    raise
+                logger.error(f"[Sync] UID {p['uid']} nicht gespeichert: {e}")
+                self.write_errors[p['uid']] = str(e)
+                continue
+            for key in stats:
+                stats[key] += one[key]
+        return stats
+
+    def take_write_errors(self) -> Dict[int, str]:
+        errors, self.write_errors = self.write_errors, {}
+        return errors
+
+    def _connected(self) -> bool:
+        is_connected = getattr(self.conn, 'is_connected', None)
+        try:
+            return bool(is_connected()) if is_connected else True
+        except Exception:
+            return False
+
+    def _write(self, batch: List[Dict[str, Any]]) -> Dict[str, int]:
+        stats = {'inserted': 0, 'updated': 0, 'new_contacts': 0}
+        new_rows: List[Dict[str, Any]] = []
+        new_ids: Dict[str, int] = {}
+        try:
+            if batch:
+                existing = self._existing_emails(sorted({p['message_id'] for p in batch}))
+                updates = []
+                new_rows = []
+                seen = set()
+                for p in batch:
+                    mid = p['message_id']
+                    if mid in existing:
+                        # Wichtig: Ein lokal gesetztes is_replied=1 (z.B. nach Versand einer Antwort)
+                        # darf durch fehlendes IMAP-Flag (\\Answered) nicht wieder auf 0 fallen.
+                        updates.append((p['is_read'], p['is_replied'], p['uid'], existing[mid]))
+                    elif mid not in seen:
+                        seen.add(mid)
+                        new_rows.append(p)
+                if updates:
+                    self.cursor.executemany(
+                        "UPDATE emails SET is_read=%s, is_replied=GREATEST(is_replied, %s), imap_uid=%s WHERE id=%s",
+                        updates,
+                    )
+                    stats['updated'] = len(updates)
+                if new_rows:
+                    contact_ids, stats['new_contacts'] = self._upsert_contacts(new_rows)
+                    self.cursor.executemany(
+                        "INSERT INTO emails (message_id, in_reply_to, references_raw, thread_id, user_email, account_id, contact_id, from_addr, from_name, "
+                        "to_addrs, subject, body_text, body_html, preview, received_at, folder, has_attachments, is_read, is_replied, imap_uid) "
+                        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                        [self._email_values(p, contact_ids.get((p['from_email'] or '').lower())) for p in new_rows],
+                    )
+                    stats['inserted'] = len(new_rows)
+                    self._bump_folder_stats(new_rows)
+                    # IDs der neuen Zeilen nur holen, wenn Anhänge oder der Suchindex sie brauchen
+                    # (leere Listen: die UI fragt Anhänge nur bei has_attachments ab)
+                    if email_search.indexes_on_sync() or any(p.get('attachments') for p in new_rows):
+                        new_ids = self._existing_emails(sorted({p['message_id'] for p in new_rows}))
+                    self._store_attachments(new_rows, new_ids)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        if new_ids:
+            self._index_for_search(new_rows, new_ids)
+        return stats
+
+    def _bump_folder_stats(self, rows: List[Dict[str, Any]]) -> None:
+        """Ordner-Zähler im Commit des Chunks mitführen (Best Effort; sync_folder zählt am Ende nach)."""
+        try:
+            folder_stats.bump(self.cursor, self.account_id, self.folder_db,
+                              total=len(rows), unread=sum(1 for p in rows if not p['is_read']))
+        except Exception as e:
+            logger.warning(f"[Sync] folder_stats nicht aktualisiert: {e}")
+
+    def _store_attachments(self, rows: List[Dict[str, Any]], ids: Dict[str, int]) -> None:
+        """Anhang-Metadaten der neuen Mails ablegen (Best Effort, ohne den Chunk zu gefährden)."""
+        rows = [p for p in rows if p.get('attachments') and p['message_id'] in ids]
+        if not rows:
+            return
+        try:
+            email_attachments.store_attachments(self.cursor, {ids[p['message_id']]: p['attachments'] for p in rows})
+        except Exception as e:
+            logger.warning(f"[Sync] Attachment-Metadaten nicht gespeichert (werden beim Abruf nachgeholt): {e}")
+
+    def _index_for_search(self, rows: List[Dict[str, Any]], ids: Dict[str, int]) -> None:
+        """Neue Mails nach dem Commit ans Such-Backend geben (nur relevant für den lokalen FTS-Index)."""
+        try:
+            email_search.index_emails(
+                self.user_email, self.account_id, self.folder_db,
+                [(ids[p['message_id']], p) for p in rows if p['message_id'] in ids],
+            )
+        except Exception as e:
+            logger.warning(f"[Sync] Suchindex nicht aktualisiert (python email_fts.py rebuild): {e}")
+
+    def _email_values(self, p: Dict[str, Any], contact_id: Optional[int]) -> tuple:
+        body_text = p['body_text']
+        body_html = p['body_html']
+        return (
+            p['message_id'], p['in_reply_to'], p['references_raw'], p['thread_id'], self.user_email, self.account_id, contact_id,
+            p['from_email'], p['from_name'], p['to_addrs'], p['subject'],
+            body_text[:50000] if body_text else '', body_html[:100000] if body_html else '',
+            p.get('preview', make_preview(body_text)), p['received_at'], self.folder_db, p['has_attachments'], p['is_read'], p['is_replied'], p['uid'],
+        )
+
+
+# --- Sync-Lauf (von API und Hintergrund-Worker gemeinsam genutzt) ------------
+
+def resolve_sync_folder(raw_folder) -> Tuple[str, str]:
+    """Normalisiert den Ordner vom Client zu (IMAP-Name, logischer DB-Key)."""
+    if not isinstance(raw_folder, str):
+        return 'INBOX', 'inbox'
+    f = raw_folder.strip() or 'INBOX'
+    # Kaputte Präfixe wie '." INBOX.Sent' säubern
+    if f.startswith('."') or f.startswith('"'):
+        f = f.lstrip('.').lstrip('"').strip()
+    fu = f.upper()
+    # Gesendet-Varianten
+    if 'SENT' in fu:
+        return f or 'INBOX.Sent', 'sent'
+    # Archiv-Varianten
+    if 'ARCHIVE' in fu or 'ARCHIV' in fu:
+        return f or 'Archive', 'archive'
+    # Inbox-Varianten (auch wenn zusätzlich INBOX.* drinsteht)
+    if 'INBOX' in fu:
+        return 'INBOX', 'inbox'
+    # Fallback: letzten Pfadteil als Key verwenden
+    lower = f.lower()
+    last_part = lower.split('/')[-1].split('.')[-1]
+    return f or 'INBOX', last_part or lower or 'inbox'
+
+
+def connect_account(settings: Dict[str, Any]):
+    """Baut eine eingeloggte IMAP-Verbindung für eine email_accounts-Zeile auf."""
+    from encryption_utils import decrypt_password
+    host = settings['imap_host']
+    port = int(settings.get('imap_port') or 993)
+    pw = decrypt_password(settings['imap_pass_encrypted']) if settings.get('imap_pass_encrypted') else ''
+    M = imaplib.IMAP4_SSL(host, port, timeout=15)
+    M.login(settings['imap_user'], pw)
+    return M
+
+
+def select_folder(M, folder_imap: str):
+    """SELECT mit Quotes (Leerzeichen im Namen), sonst ungequotet; liefert die SELECT-Daten."""
+    try:
+        typ, data = M.select(f'"{folder_imap}"')
+    except imaplib.IMAP4.error as e:
+        logger.warning(f"[Sync] IMAP SELECT with quotes failed for folder={folder_imap!r}: {e}")
+        typ, data = M.select(folder_imap)
+    if typ != 'OK':
+        raise imaplib.IMAP4.error(f"IMAP SELECT status {typ} for folder {folder_imap!r}")
+    return data
+
+
+def _lowest_known_uid(cursor, account_id: int, folder_db: str, last_uid: int) -> int:
+    cursor.execute(
+        "SELECT MIN(imap_uid) FROM emails WHERE account_id=%s AND folder=%s AND imap_uid IS NOT NULL",
+        (account_id, folder_db),
+    )
+    row = cursor.fetchone()
+    lowest = (row[0] if not isinstance(row, dict) else next(iter(row.values()))) if row else None
+    return int(lowest) if lowest else last_uid + 1
+
+
+def sync_folder(M, conn_db, user_email: str, account_id: int, folder_imap: str, folder_db: str,
+                mbox_status: Dict[str, Optional[int]], limit: Optional[int] = None,
+                chunk_size: Optional[int] = None, progress_cb=None) -> Dict[str, Any]:
+    """Lädt neue Nachrichten eines bereits selektierten Ordners in die DB.
+
+    ``progress_cb(done, total, synced)`` wird nach jedem Chunk aufgerufen.
+    Liefert dieselben Kennzahlen, die /api/emails/sync bisher zurückgegeben hat.
+    """
+    cursor_db = conn_db.cursor()
+    try:
+        ensure_sync_schema(cursor_db)
+
+        # Nur UIDs oberhalb der gespeicherten High-Water-Mark holen; Voll-Abgleich
+        # nur, wenn es noch keinen State gibt oder UIDVALIDITY sich geändert hat.
+        sync_state = get_sync_state(cursor_db, account_id, folder_imap)
+        if sync_state and sync_state.get('backfill_uid') is None:
+            # State von vor der Low-Water-Mark: ältere Mails können (limit) fehlen ->
+            # ab der niedrigsten bekannten UID nachladen (Duplikate fängt der Writer ab)
+            sync_state['backfill_uid'] = _lowest_known_uid(cursor_db, account_id, folder_db, sync_state['last_uid'])
+        plan = plan_uid_fetch(M, sync_state, mbox_status, limit)
+        full_resync = plan['full_resync']
+        track_state = mbox_status.get('uidvalidity') is not None
+        uid_failures = load_uid_failures(cursor_db, account_id, folder_imap, mbox_status['uidvalidity']) if track_state else {}
+        # Wiederholt nicht parsebare Nachrichten nicht mehr holen; sie blockieren keine Marke
+        given_up = {uid for uid, attempts in uid_failures.items() if attempts >= MAX_UID_ATTEMPTS}
+        new_uids = set(plan['new'])
+        uids_to_fetch = [u for u in plan['new'] + plan['backfill'] if u not in given_up]
+        if full_resync and sync_state:
+            logger.info(f"[Sync] UIDVALIDITY changed for account={account_id} folder={folder_imap!r} -> full resync")
+            # Gespeicherte UIDs gehören zur alten UIDVALIDITY und sind ungültig
+            cursor_db.execute(
+                "UPDATE emails SET imap_uid=NULL WHERE user_email=%s AND account_id=%s AND folder=%s",
+                (user_email, account_id, folder_db)
+            )
+            conn_db.commit()
+
+        synced_count = 0
+        updated_count = 0
+        new_contacts_count = 0
+        failed_uids: List[int] = []
+        parse_errors: Dict[int, str] = {}
+
+        # Chunkweise laden: ein UID FETCH pro Chunk statt pro Nachricht. Die
+        # Chunk-Grenzen richten sich nach Anzahl und RFC822.SIZE (Byte-Budget).
+        try:
+            msg_sizes = fetch_sizes(M, uids_to_fetch)
+        except Exception as e:
+            logger.warning(f"[Sync] RFC822.SIZE fetch failed, chunking by count only: {e}")
+            msg_sizes = {}
+        fetch_chunks = plan_fetch_chunks(uids_to_fetch, msg_sizes, max_count=chunk_size or FETCH_CHUNK_SIZE)
+        if progress_cb:
+            progress_cb(0, len(uids_to_fetch), 0)
+
+        # Persistenz chunkweise: Kontakte/Mails gebündelt schreiben und pro Chunk
+        # committen, damit ein später Fehler nicht den ganzen Lauf verwirft.
+        writer = SyncWriter(conn_db, user_email, account_id, folder_db)
+        prev_high = 0 if full_resync else int(sync_state.get('last_uid') or 0)
+        high_water = prev_high
+        # Beim Voll-Abgleich wird aufsteigend ab der neuen Low-Water-Mark geholt -> gleich mitschreiben
+        chunk_backfill_uid = plan['backfill_uid'] if full_resync else None
+        done = 0
+
+        for chunk_no, chunk in enumerate(fetch_chunks, 1):
+            chunk_seen = set()
+            try:
+                for uid, meta_raw, raw_email in iter_fetch_messages(M, chunk):
+                    chunk_seen.add(uid)
+                    try:
+                        writer.add(parse_message(raw_email, uid, meta_raw))
+                    except Exception as e:
+                        logger.error(f"[Sync] Error processing email {uid}: {e}")
+                        failed_uids.append(uid)
+                        parse_errors[uid] = str(e)
+                    raw_email = None
+            except Exception as e:
+                # Ganzer Chunk fehlgeschlagen: alle noch nicht verarbeiteten UIDs erneut versuchen
+                logger.error(f"[Sync] Error fetching chunk {chunk_no}/{len(fetch_chunks)} ({len(chunk)} UIDs): {e}")
+                failed_uids.extend(u for u in chunk if u not in chunk_seen)
+
+            # High-Water-Mark im selben Commit wie die Mails des Chunks fortschreiben
+            # (Chunks sind aufsteigend: ohne bisherige Fehler sind alle neuen UIDs bis hier geholt)
+            chunk_new = [u for u in chunk if u in new_uids]
+            if track_state and chunk_new and not failed_uids:
+                high_water = max(high_water, max(chunk_new))
+                save_sync_state(cursor_db, account_id, folder_imap, mbox_status['uidvalidity'], high_water,
+                                mbox_status.get('uidnext'), chunk_backfill_uid)
+            pending_uids = writer.pending_uids
+            try:
+                chunk_stats = writer.flush()
+                synced_count += chunk_stats['inserted']
+                updated_count += chunk_stats['updated']
+                new_contacts_count += chunk_stats['new_contacts']
+            except Exception as e:
+                logger.error(f"[Sync] Error writing chunk {chunk_no}/{len(fetch_chunks)}: {e}")
+                failed_uids.extend(pending_uids)
+            # Einzeln nicht speicherbare Mails zählen wie Parse-Fehler (nach MAX_UID_ATTEMPTS übersprungen)
+            write_errors = writer.take_write_errors()
+            failed_uids.extend(write_errors)
+            parse_errors.update(write_errors)
+            done += len(chunk)
+            logger.info(
+                f"[Sync] account={account_id} folder={folder_imap!r} chunk {chunk_no}/{len(fetch_chunks)} "
+                f"fetched={len(chunk_seen)}/{len(chunk)} synced_total={synced_count}"
+            )
+            if progress_cb:
+                progress_cb(done, len(uids_to_fetch), synced_count)
+        writer.close()
+
+        # Marken abschließend setzen: nie über nicht geholte UIDs hinweg. Bei Fehlern
+        # endet die High-Water-Mark vor der ersten fehlgeschlagenen neuen UID, die
+        # Low-Water-Mark über der höchsten fehlgeschlagenen Backfill-UID.
+        skipped: List[int] = []
+        backfill_uid = 0
+        if track_state:
+            record_uid_failures(cursor_db, account_id, folder_imap, mbox_status['uidvalidity'], parse_errors)
+            recovered = [u for u in uids_to_fetch if u in uid_failures and u not in failed_uids]
+            if recovered:
+                cursor_db.execute(
+                    "DELETE FROM email_sync_failures WHERE account_id=%s AND folder=%s AND uidvalidity=%s AND uid IN ("
+                    + ",".join(["%s"] * len(recovered)) + ")",
+                    (account_id, folder_imap, mbox_status['uidvalidity'], *recovered),
+                )
+            for uid in parse_errors:
+                if uid_failures.get(uid, 0) + 1 >= MAX_UID_ATTEMPTS:
+                    logger.warning(f"[Sync] account={account_id} folder={folder_imap!r}: UID {uid} nach "
+                                   f"{MAX_UID_ATTEMPTS} Versuchen übersprungen ({parse_errors[uid]})")
+                    skipped.append(uid)
+            blocking = set(failed_uids) - set(skipped)
+            failed_new = [u for u in blocking if u in new_uids]
+            if failed_new:
+                high_water = max(prev_high, min(failed_new) - 1)
+            elif plan['new']:
+                high_water = max(prev_high, max(plan['new']))
+            backfill_uid = plan['backfill_uid']
+            failed_old = [u for u in blocking if u not in new_uids]
+            if failed_old:
+                backfill_uid = max(failed_old) + 1
+            save_sync_state(cursor_db, account_id, folder_imap, mbox_status['uidvalidity'], high_water,
+                            mbox_status.get('uidnext'), backfill_uid)
+            if full_resync:
+                cursor_db.execute(
+                    "DELETE FROM email_sync_failures WHERE account_id=%s AND folder=%s AND uidvalidity<>%s",
+                    (account_id, folder_imap, mbox_status['uidvalidity']),
+                )
+        conn_db.commit()
+
+        # Gelesen/Beantwortet der bereits vorhandenen Mails abgleichen (Best Effort)
+        flag_result = None
+        if track_state:
+            try:
+                flag_state = None if full_resync else sync_state
+                flag_result = sync_flags(M, cursor_db, user_email, account_id, folder_imap, folder_db, mbox_status, flag_state)
+                # Gelesen-Status hat sich geändert -> Ordner-Zähler in derselben Transaktion neu zählen
+                if flag_result['updated'] or updated_count:
+                    folder_stats.refresh_folder(cursor_db, account_id, folder_db)
+                conn_db.commit()
+            except Exception as e:
+                conn_db.rollback()
+                logger.warning(f"[Sync] Flag sync failed for account={account_id} folder={folder_imap!r}: {e}")
+
+        # Gesamtanzahl der bereits in der DB vorhandenen Mails (Account bzw. aktueller Ordner)
+        try:
+            stats = folder_stats.load(cursor_db, account_id)
+            conn_db.commit()
+            total_in_db = folder_stats.counts_for(stats, 'all')[0]
+            total_in_db_folder = stats.get(folder_db, {}).get('total', 0)
+        except Exception as e:
+            conn_db.rollback()
+            logger.warning(f"[Sync] folder_stats nicht lesbar, zähle direkt: {e}")
+            cursor_db.execute(
+                "SELECT COUNT(*) FROM emails WHERE user_email=%s AND account_id=%s",
+                (user_email, account_id)
+            )
+            total_in_db = cursor_db.fetchone()[0]
+            cursor_db.execute(
+                "SELECT COUNT(*) FROM emails WHERE user_email=%s AND account_id=%s AND folder=%s",
+                (user_email, account_id, folder_db)
+            )
+            total_in_db_folder = cursor_db.fetchone()[0]
+    finally:
+        cursor_db.close()
+
+    return {
+        'synced': synced_count,
+        'total_on_server': mbox_status.get('exists') or 0,
+        'total_in_db': total_in_db,
+        'total_in_db_folder': total_in_db_folder,
+        'new_contacts': new_contacts_count,
+        'already_synced': total_in_db - synced_count,
+        'chunks': len(fetch_chunks),
+        'failed': len(failed_uids),
+        'skipped': len(skipped) + len(given_up & set(plan['new'] + plan['backfill'])),
+        'backfill_pending': bool(track_state and backfill_uid),
+        'flags': flag_result,
+    }
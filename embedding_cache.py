@@ -0,0 +1,154 @@
+"""
+Embedding-Schicht mit persistentem Cache, Batching und paralleler Ausführung.
+
+Ersetzt den direkten ``embeddings.create``-Aufruf in qdrant_store::
+
+    vectors = embedding_cache.embed(texts, model="text-embedding-3-small")
+
+- Cache: Schlüssel (Modell, SHA-256 des Texts), per Default im SQLite-Store von
+  ttl_cache (überlebt Neustarts, geteilt zwischen Workern). Vektoren werden als
+  float32-Bytes gespeichert (1536 Dimensionen = 6 KB) statt als gepickelte
+  Float-Listen. Unveränderte Texte kosten beim erneuten Indexieren keinen
+  API-Aufruf; Treffer/Misses stehen unter /api/debug/caches (``embeddings``).
+- Gleiche Texte innerhalb eines Aufrufs werden nur einmal eingebettet.
+- Fehlende Texte werden in Batches aufgeteilt: höchstens EMBED_BATCH_SIZE
+  Texte und ca. EMBED_BATCH_TOKENS geschätzte Tokens pro Request (API-Limits:
+  2048 Eingaben, 300k Tokens). Einzeltexte über EMBED_MAX_CHARS werden gekürzt
+  (API-Limit 8191 Tokens pro Eingabe).
+- Mehrere Batches laufen parallel im Pool ``llm_executor.EMBED``; jeder Batch
+  geht über ``llm_gateway.embed`` (Rate-Limit, Priorität, Retry bei 429/503).
+
+Konfiguration über Env:
+- EMBED_CACHE_BACKEND   sqlite (Default) | memory
+- EMBED_CACHE_MAXSIZE   max. gespeicherte Vektoren (Default 20000, ca. 120 MB bei 1536 Dimensionen)
+- EMBED_CACHE_TTL       Sekunden (Default 2592000 = 30 Tage)
+- EMBED_BATCH_SIZE      Texte pro Request (Default 256, max. 2048)
+- EMBED_BATCH_TOKENS    geschätzte Tokens pro Request (Default 100000)
+- EMBED_MAX_CHARS       Zeichen pro Text (Default 20000)
+- EMBED_BATCH_TIMEOUT   Sekunden, die auf einen parallelen Batch gewartet wird (Default 120)
+"""
+import os
+import hashlib
+import threading
+from array import array
+from typing import Any, Dict, List, Sequence, Tuple
+
+import llm_executor
+import llm_gateway
+import ttl_cache
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+CACHE_MAXSIZE = max(1, _env_int('EMBED_CACHE_MAXSIZE', 20000))
+CACHE_TTL = max(1, _env_int('EMBED_CACHE_TTL', 30 * 24 * 3600))
+CACHE_BACKEND = os.environ.get('EMBED_CACHE_BACKEND') or 'sqlite'
+BATCH_SIZE = min(2048, max(1, _env_int('EMBED_BATCH_SIZE', 256)))
+BATCH_TOKENS = max(1000, _env_int('EMBED_BATCH_TOKENS', 100000))
+MAX_CHARS = max(100, _env_int('EMBED_MAX_CHARS', 20000))
+BATCH_TIMEOUT = max(1, _env_int('EMBED_BATCH_TIMEOUT', 120))
+
+_CACHE = ttl_cache.cache('embeddings', maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL, shared=True, backend=CACHE_BACKEND)
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "texts": 0, "cached": 0, "deduplicated": 0, "embedded": 0, "api_calls": 0}
+
+
+def _count(**deltas: int) -> None:
+    with _stats_lock:
+        for k, v in deltas.items():
+            _stats[k] += v
+
+
+def cache_key(model: str, text: str) -> Tuple[str, str]:
+    return model, hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _encode(vector: Sequence[float]) -> bytes:
+    return array('f', vector).tobytes()
+
+
+def _decode(blob: bytes) -> List[float]:
+    vec = array('f')
+    vec.frombytes(blob)
+    return vec.tolist()
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def make_batches(texts: Sequence[str], max_items: int = BATCH_SIZE, max_tokens: int = BATCH_TOKENS) -> List[List[str]]:
+    """Teilt Texte in Batches, die beide Grenzen einhalten (Reihenfolge bleibt erhalten)."""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    tokens = 0
+    for text in texts:
+        cost = _estimate_tokens(text)
+        if current and (len(current) >= max_items or tokens + cost > max_tokens):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(text)
+        tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _embed_batch(batch: List[str], model: str, priority: int) -> List[List[float]]:
+    vectors = llm_gateway.embed(batch, model=model, priority=priority)
+    _count(api_calls=1, embedded=len(batch))
+    return vectors
+
+
+def _dispatch(batches: List[List[str]], model: str, priority: int) -> List[List[List[float]]]:
+    """Führt die Batches aus; ab zwei Batches parallel im EMBED-Pool (bei Überlast inline)."""
+    if len(batches) == 1:
+        return [_embed_batch(batches[0], model, priority)]
+    futures: List[Any] = []
+    for batch in batches:
+        try:
+            futures.append(llm_executor.EMBED.submit(_embed_batch, batch, model, priority))
+        except llm_executor.Overloaded:
+            futures.append(batch)
+    results = []
+    for fut, batch in zip(futures, batches):
+        if fut is batch:
+            results.append(_embed_batch(batch, model, priority))
+        else:
+            results.append(fut.result(timeout=BATCH_TIMEOUT))
+    return results
+
+
+def embed(texts: Sequence[str], *, model: str, priority: int = llm_gateway.BACKGROUND) -> List[List[float]]:
+    """Vektoren zu ``texts`` (gleiche Reihenfolge) – aus dem Cache oder per gebatchtem API-Aufruf."""
+    prepared = [(t or ' ')[:MAX_CHARS] for t in texts]
+    keys: Dict[str, Tuple[str, str]] = {t: cache_key(model, t) for t in prepared}
+    found: Dict[str, List[float]] = {}
+    for text, key in keys.items():
+        blob = _CACHE.get(key)
+        if blob is not None:
+            found[text] = _decode(blob)
+    missing = [t for t in keys if t not in found]
+    _count(requests=1, texts=len(prepared), cached=len(found), deduplicated=len(prepared) - len(keys))
+
+    if missing:
+        batches = make_batches(missing)
+        for batch, vectors in zip(batches, _dispatch(batches, model, priority)):
+            for text, vector in zip(batch, vectors):
+                blob = _encode(vector)
+                _CACHE.set(keys[text], blob)
+                # Wie aus dem Cache: float32-genau, damit Treffer und Neuberechnung identisch sind
+                found[text] = _decode(blob)
+    return [found[t] for t in prepared]
+
+
+def status() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    return {"batch_size": BATCH_SIZE, "batch_tokens": BATCH_TOKENS, **stats, "cache": _CACHE.status()}
@@ -1,22 +1,68 @@
+"""
+FAQ-Antworten und Relevanzprüfung auf Basis von docs/knowledge.md (LangChain + FAISS).
+
+Der Vektorindex wird nicht mehr bei jedem Import neu eingebettet, sondern
+persistent unter FAQ_INDEX_DIR abgelegt:
+
+    FAQ_INDEX_DIR/<hash>/index.faiss   FAISS-Index (IndexFlatL2, wie FAISS.from_texts)
+    FAQ_INDEX_DIR/<hash>/meta.json     Modell, Splitter-Parameter und Chunk-Texte
+    FAQ_INDEX_DIR/LATEST               zuletzt gebauter <hash>
+
+- ``<hash>`` = SHA-256 über Inhalt von knowledge.md, Embedding-Modell und
+  Splitter-Parameter. Passt der Hash, wird der Index nur geladen (per mmap,
+  falls die faiss-Version das für den Index-Typ kann) – kein Embedding-Aufruf.
+- Hat sich knowledge.md geändert, werden nur neue/geänderte Chunks eingebettet;
+  Vektoren unveränderter Chunks kommen aus dem vorherigen Index (LATEST).
+- Gebaut wird lazy beim ersten faq_is_relevant/faq_answer oder offline:
+  ``python faq_langchain.py --build-index`` (z.B. im Deploy). Parallele Worker
+  bauen dank Dateisperre nur einmal.
+- Embeddings und die Antwort laufen über embedding_cache bzw. llm_gateway
+  (Cache, Rate-Limit, Priorität, Retry) statt über die OpenAI-Klassen von
+  LangChain; LangChain liefert nur Splitter, Prompt und FAISS-Wrapper.
+
+Konfiguration über Env:
+- FAQ_INDEX_DIR          (Default ./instance/faq_index)
+- FAQ_EMBEDDING_MODEL    (Default text-embedding-ada-002, wie bisher OpenAIEmbeddings)
+- FAQ_MODEL              Chat-Modell für faq_answer (Default AGENT_MODEL bzw. gpt-3.5-turbo)
+- FAQ_TOP_K              Chunks als Kontext für faq_answer (Default 4, wie RetrievalQA)
+"""
 import os
-from langchain.llms import OpenAI
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
 from langchain.prompts import PromptTemplate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
+from langchain.embeddings.base import Embeddings
 from langchain.vectorstores import FAISS
-from langchain.chains import RetrievalQA
+from langchain.docstore.document import Document
+from langchain.docstore.in_memory import InMemoryDocstore
+
+import embedding_cache
+import llm_gateway
 
-# Lade knowledge.md
-with open("docs/knowledge.md", "r", encoding="utf-8") as f:
-    faq_content = f.read()
+logger = logging.getLogger(__name__)
 
-# Splitte FAQ in sinnvolle Chunks
-splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-faq_chunks = splitter.split_text(faq_content)
+KNOWLEDGE_PATH = "docs/knowledge.md"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+EMBEDDING_MODEL = os.environ.get("FAQ_EMBEDDING_MODEL") or "text-embedding-ada-002"
+FAQ_MODEL = os.environ.get("FAQ_MODEL") or os.environ.get("AGENT_MODEL") or "gpt-3.5-turbo"
+try:
+    FAQ_TOP_K = max(1, int(os.environ.get("FAQ_TOP_K", "4")))
+except Exception:
+    FAQ_TOP_K = 4
+
+
+def index_dir() -> str:
+    return os.environ.get("FAQ_INDEX_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "instance", "faq_index"
+    )
 
-# Embeddings erzeugen
-embeddings = OpenAIEmbeddings()
-vectorstore = FAISS.from_texts(faq_chunks, embeddings)
 
 # Prompt für individuelle, gemischte Antwort
 prompt = PromptTemplate(
@@ -28,26 +74,196 @@ prompt = PromptTemplate(
     )
 )
 
-llm = OpenAI(temperature=0.2, openai_api_key=os.environ.get("OPENAI_API_KEY"))
+_lock = threading.Lock()
+_vectorstore = None
+
+
+def _chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _content_hash(content: str) -> str:
+    key = json.dumps({"model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP})
+    return hashlib.sha256((key + "\n" + content).encode("utf-8")).hexdigest()
+
+
+def _split(content: str):
+    # Splitte FAQ in sinnvolle Chunks
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return splitter.split_text(content)
+
+
+class GatewayEmbeddings(Embeddings):
+    """LangChain-Embeddings über embedding_cache: Index-Aufbau im Hintergrund, Suchanfragen interaktiv."""
+
+    def embed_documents(self, texts):
+        return embedding_cache.embed(texts, model=EMBEDDING_MODEL, priority=llm_gateway.BACKGROUND)
+
+    def embed_query(self, text):
+        return embedding_cache.embed([text], model=EMBEDDING_MODEL, priority=llm_gateway.INTERACTIVE)[0]
+
+
+def _embeddings():
+    return GatewayEmbeddings()
+
+
+class _FileLock:
+    """Exklusive Sperre über mehrere Prozesse (fcntl); ohne fcntl nur pro Prozess."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fh = open(self.path, "a")
+        try:
+            import fcntl
+            fcntl.flock(self._fh, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        return self
+
+    def __exit__(self, *exc):
+        self._fh.close()  # gibt auch die flock-Sperre frei
+
+
+def _read_index(path: str):
+    import faiss
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+    except Exception:
+        # mmap wird nicht von jeder faiss-Version/jedem Index-Typ unterstützt
+        return faiss.read_index(path)
+
+
+def _load(version_dir: str):
+    """(index, chunks) aus einem Versionsverzeichnis oder None."""
+    try:
+        with open(os.path.join(version_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = _read_index(os.path.join(version_dir, "index.faiss"))
+        if meta.get("model") != EMBEDDING_MODEL or index.ntotal != len(meta.get("chunks") or []):
+            return None
+        return index, meta["chunks"]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"[FAQ-Index] {version_dir} nicht lesbar: {e}")
+        return None
+
+
+def _previous_vectors(base: str):
+    """Chunk-Hash -> Vektor aus dem zuletzt gebauten Index (für inkrementelles Neubauen)."""
+    try:
+        with open(os.path.join(base, "LATEST"), "r", encoding="utf-8") as f:
+            latest = f.read().strip()
+    except FileNotFoundError:
+        return {}
+    loaded = _load(os.path.join(base, latest)) if latest else None
+    if not loaded:
+        return {}
+    index, chunks = loaded
+    vectors = index.reconstruct_n(0, index.ntotal)
+    return {_chunk_hash(text): vectors[i] for i, text in enumerate(chunks)}
+
+
+def build_index(force: bool = False):
+    """Lädt den Index zum aktuellen knowledge.md oder baut ihn (nur geänderte Chunks werden eingebettet).
+
+    Liefert (index, chunks, version).
+    """
+    import faiss
+    import numpy as np
+
+    with open(KNOWLEDGE_PATH, "r", encoding="utf-8") as f:
+        content = f.read()
+    version = _content_hash(content)
+    base = index_dir()
+    version_dir = os.path.join(base, version)
+
+    if not force:
+        loaded = _load(version_dir)
+        if loaded:
+            return loaded[0], loaded[1], version
+
+    with _FileLock(os.path.join(base, ".lock")):
+        # Ein anderer Worker kann inzwischen gebaut haben
+        loaded = None if force else _load(version_dir)
+        if loaded:
+            return loaded[0], loaded[1], version
+
+        chunks = _split(content)
+        previous = {} if force else _previous_vectors(base)
+        missing = [t for t in dict.fromkeys(chunks) if _chunk_hash(t) not in previous]
+        if missing:
+            for text, vec in zip(missing, _embeddings().embed_documents(missing)):
+                previous[_chunk_hash(text)] = np.asarray(vec, dtype="float32")
+        logger.info(f"[FAQ-Index] {len(chunks)} Chunks, {len(missing)} neu eingebettet ({version[:12]})")
+
+        vectors = np.vstack([previous[_chunk_hash(t)] for t in chunks]).astype("float32") if chunks else None
+        index = faiss.IndexFlatL2(vectors.shape[1] if vectors is not None else 1)
+        if vectors is not None:
+            index.add(vectors)
+
+        # Atomar schreiben: erst temporäres Verzeichnis, dann umbenennen
+        os.makedirs(base, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".build-", dir=base)
+        try:
+            faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                           "chunks": chunks}, f, ensure_ascii=False)
+            if os.path.isdir(version_dir):
+                shutil.rmtree(version_dir)
+            os.replace(tmp_dir, version_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        with open(os.path.join(base, "LATEST.tmp"), "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(os.path.join(base, "LATEST.tmp"), os.path.join(base, "LATEST"))
+
+        # Alte Versionen aufräumen
+        for name in os.listdir(base):
+            path = os.path.join(base, name)
+            if name != version and os.path.isdir(path) and not name.startswith("."):
+                shutil.rmtree(path, ignore_errors=True)
+
+        return _read_index(os.path.join(version_dir, "index.faiss")), chunks, version
+
+
+def get_vectorstore():
+    """FAISS-Vectorstore (LangChain), beim ersten Aufruf geladen bzw. gebaut."""
+    global _vectorstore
+    if _vectorstore is None:
+        with _lock:
+            if _vectorstore is None:
+                index, chunks, _version = build_index()
+                ids = [str(i) for i in range(len(chunks))]
+                docstore = InMemoryDocstore({ids[i]: Document(page_content=t) for i, t in enumerate(chunks)})
+                _vectorstore = FAISS(_embeddings(), index, docstore, dict(enumerate(ids)))
+    return _vectorstore
 
-qa = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=vectorstore.as_retriever(),
-    return_source_documents=True,
-    chain_type_kwargs={"prompt": prompt}
-)
 
 def faq_answer(question):
-    result = qa({"query": question})
-    return result["result"].strip()
+    # Wie RetrievalQA ("stuff"): die besten Chunks als Kontext in den Prompt
+    docs = get_vectorstore().similarity_search(question, k=FAQ_TOP_K)
+    context = "\n\n".join(doc.page_content for doc in docs)
+    response = llm_gateway.chat(
+        [{"role": "user", "content": prompt.format(context=context, question=question)}],
+        model=FAQ_MODEL,
+        temperature=0.2,
+        priority=llm_gateway.INTERACTIVE,
+    )
+    return (response.choices[0].message.content or "").strip()
 
 # Relevanzprüfung: Nutzt FAISS similarity_search_with_score.
 # Hinweis: Bei FAISS in LangChain ist ein KLEINERER Score in der Regel besser (Distanz).
 # Der Default-Threshold 0.6 ist konservativ; je kleiner desto strenger.
 def faq_is_relevant(question: str, threshold: float = 0.6):
     try:
-        docs = vectorstore.similarity_search_with_score(question, k=1)
+        docs = get_vectorstore().similarity_search_with_score(question, k=1)
         if not docs:
             return False, None, None
         doc, score = docs[0]
@@ -57,5 +273,10 @@ def faq_is_relevant(question: str, threshold: float = 0.6):
         return False, None, None
 
 if __name__ == "__main__":
-    frage = input("Deine Frage: ")
-    print(faq_answer(frage))
+    if "--build-index" in sys.argv:
+        logging.basicConfig(level=logging.INFO)
+        _index, _chunks, _version = build_index(force="--force" in sys.argv)
+        print(f"FAQ-Index {_version[:12]}: {len(_chunks)} Chunks in {index_dir()}")
+    else:
+        frage = input("Deine Frage: ")
+        print(faq_answer(frage))
@@ -0,0 +1,135 @@
+"""
+Materialisierte Ordner-Zähler (Gesamt/ungelesen) pro Account.
+
+Die Tabelle ``folder_stats`` wird in derselben Transaktion fortgeschrieben wie
+die Änderung an ``emails``:
+
+- Sync (email_sync.SyncWriter): neue Mails per ``bump``; nach dem Flag-Abgleich
+  eines Ordners einmal ``refresh_folder`` (korrigiert auch Drift).
+- /api/emails/seen, /api/emails/move, Ablage gesendeter Mails: ``bump``.
+
+Gelesen wird ausschließlich über ``load`` (ein Primärschlüssel-Range-Scan pro
+Account). Fehlen für einen Account noch alle Zeilen (z.B. direkt nach der
+Migration), baut ``load`` sie einmalig per GROUP BY auf.
+"""
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FOLDER_STATS_DDL = """
+CREATE TABLE IF NOT EXISTS folder_stats (
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL,
+    total INT UNSIGNED NOT NULL DEFAULT 0,
+    unread INT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, folder)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+# Ordner-Gruppen wie email_search.folder_filter (historische Varianten von 'sent')
+FOLDER_GROUPS = {'sent': ('sent', 'inbox.sent', 'sent items')}
+
+_SCHEMA_READY = False
+_SCHEMA_LOCK = threading.Lock()
+
+
+def ensure_schema(cursor) -> None:
+    """Legt folder_stats an (einmal pro Prozess, Best Effort)."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if _SCHEMA_READY:
+            return
+        try:
+            cursor.execute(FOLDER_STATS_DDL)
+        except Exception as e:
+            logger.warning(f"[FolderStats] DDL folder_stats fehlgeschlagen (ignoriert): {e}")
+        _SCHEMA_READY = True
+
+
+def _key(folder: Optional[str]) -> str:
+    return folder or ''
+
+
+def refresh_folder(cursor, account_id: int, folder: str) -> None:
+    """Zählt einen Ordner neu aus emails (COUNT über idx_emails_account_folder_*)."""
+    cursor.execute(
+        "INSERT INTO folder_stats (account_id, folder, total, unread) "
+        "SELECT %s, %s, COUNT(*), COALESCE(SUM(is_read = 0), 0) FROM emails "
+        "WHERE account_id=%s AND folder=%s "
+        "ON DUPLICATE KEY UPDATE total=VALUES(total), unread=VALUES(unread)",
+        (account_id, _key(folder), account_id, _key(folder)),
+    )
+
+
+def refresh_account(cursor, account_id: int) -> None:
+    """Baut alle Zähler eines Accounts neu auf (GROUP BY über emails)."""
+    cursor.execute("DELETE FROM folder_stats WHERE account_id=%s", (account_id,))
+    cursor.execute(
+        "INSERT INTO folder_stats (account_id, folder, total, unread) "
+        "SELECT account_id, COALESCE(folder, ''), COUNT(*), COALESCE(SUM(is_read = 0), 0) FROM emails "
+        "WHERE account_id=%s GROUP BY account_id, COALESCE(folder, '')",
+        (account_id,),
+    )
+
+
+def bump(cursor, account_id: Optional[int], folder: Optional[str], total: int = 0, unread: int = 0) -> None:
+    """Verschiebt die Zähler eines Ordners um ein Delta (in der Transaktion des Aufrufers).
+
+    Existiert die Zeile noch nicht, wird der Ordner stattdessen neu gezählt,
+    damit ein Delta nie als absoluter Wert stehen bleibt.
+    """
+    if not account_id or (not total and not unread):
+        return
+    cursor.execute(
+        "UPDATE folder_stats SET total=GREATEST(CAST(total AS SIGNED) + %s, 0), "
+        "unread=GREATEST(CAST(unread AS SIGNED) + %s, 0) WHERE account_id=%s AND folder=%s",
+        (total, unread, account_id, _key(folder)),
+    )
+    if not cursor.rowcount:
+        refresh_folder(cursor, account_id, folder)
+
+
+def load(cursor, account_id: int) -> Dict[str, Dict[str, int]]:
+    """Liefert ``{folder: {'total': n, 'unread': m}}`` für einen Account."""
+    cursor.execute("SELECT folder, total, unread FROM folder_stats WHERE account_id=%s", (account_id,))
+    rows = cursor.fetchall()
+    if not rows:
+        refresh_account(cursor, account_id)
+        cursor.execute("SELECT folder, total, unread FROM folder_stats WHERE account_id=%s", (account_id,))
+        rows = cursor.fetchall()
+    out: Dict[str, Dict[str, int]] = {}
+    for row in rows:
+        if isinstance(row, dict):
+            row = (row['folder'], row['total'], row['unread'])
+        out[row[0]] = {'total': int(row[1] or 0), 'unread': int(row[2] or 0)}
+    return out
+
+
+def members(folder: str) -> Iterable[str]:
+    return FOLDER_GROUPS.get(folder, (folder,))
+
+
+def counts_for(stats: Dict[str, Dict[str, int]], folder: str) -> Tuple[int, int]:
+    """(total, unread) eines logischen Ordners; 'all' summiert den ganzen Account."""
+    keys = stats.keys() if folder == 'all' else members(folder)
+    total = sum(stats.get(k, {}).get('total', 0) for k in keys)
+    unread = sum(stats.get(k, {}).get('unread', 0) for k in keys)
+    return total, unread
+
+
+def summarize(stats: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    """Antwortform für /api/emails/folder-stats: Ordner-Gruppen zusammengefasst."""
+    folders: Dict[str, Dict[str, int]] = {}
+    grouped = {k: g for g, ks in FOLDER_GROUPS.items() for k in ks}
+    for key, counts in stats.items():
+        name = grouped.get(key, key)
+        agg = folders.setdefault(name, {'total': 0, 'unread': 0})
+        agg['total'] += counts['total']
+        agg['unread'] += counts['unread']
+    total, unread = counts_for(stats, 'all')
+    return {'folders': folders, 'all': {'total': total, 'unread': unread}}
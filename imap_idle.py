@@ -0,0 +1,325 @@
+"""
+IMAP IDLE (RFC 2177): Push-Benachrichtigung bei neuen Mails.
+
+Pro aktivem Eintrag in ``email_accounts`` hält ein IdleListener eine
+eingeloggte Verbindung auf INBOX offen und wartet per ``IDLE`` auf
+``EXISTS``/``EXPUNGE``/``FETCH``. Bei einer Änderung wird ein inkrementeller
+Sync-Job (nur neue UIDs + Flags, siehe sync_worker) eingereiht; dessen Abschluss
+landet als Benachrichtigung in ``email_events`` und erreicht das Frontend über
+``/api/emails/events``.
+
+Damit bei mehreren Prozessen (gunicorn-Worker, separater Worker-Prozess) nicht
+jeder Prozess eigene Listener öffnet, sichert der IdleManager jeden Account
+über einen MySQL-Named-Lock (``GET_LOCK('email_idle:<id>')``) auf einer
+eigenen Verbindung ab. Stirbt der Prozess, gibt MySQL die Locks frei und ein
+anderer Prozess übernimmt beim nächsten Durchlauf.
+
+Server ohne IDLE-Capability werden per ``NOOP`` im Intervall abgefragt.
+
+Konfiguration über Env:
+- EMAIL_IDLE_ENABLED         (Default true)
+- EMAIL_IDLE_RENEW_SECONDS   IDLE spätestens nach N Sekunden erneuern (Default 600, RFC: < 29 min)
+- EMAIL_IDLE_POLL_SECONDS    NOOP-Intervall ohne IDLE-Support (Default 60)
+- EMAIL_IDLE_MAX_ACCOUNTS    max. Listener pro Prozess (Default 50)
+"""
+import os
+import re
+import ssl
+import time
+import select
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import email_sync
+import sync_worker
+from db_utils import get_settings_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+IDLE_ENABLED = (os.environ.get('EMAIL_IDLE_ENABLED') or 'true').strip().lower() not in ('0', 'false', 'no', 'off')
+RENEW_SECONDS = min(max(60, _env_int('EMAIL_IDLE_RENEW_SECONDS', 600)), 28 * 60)
+POLL_SECONDS = max(10, _env_int('EMAIL_IDLE_POLL_SECONDS', 60))
+MAX_ACCOUNTS = max(1, _env_int('EMAIL_IDLE_MAX_ACCOUNTS', 50))
+IDLE_FOLDER = 'INBOX'
+
+_UNTAGGED_RE = re.compile(rb'^\* (\d+) (EXISTS|EXPUNGE|FETCH)\b', re.IGNORECASE)
+
+
+def parse_idle_line(line: bytes) -> Optional[str]:
+    """Liefert EXISTS/EXPUNGE/FETCH für relevante untagged Responses, sonst None."""
+    m = _UNTAGGED_RE.match(line or b'')
+    return m.group(2).decode().upper() if m else None
+
+
+def _data_pending(M) -> bool:
+    """True, wenn imaplib bereits gepufferte Daten hat oder der Socket lesbar ist (ohne zu blockieren)."""
+    sock = M.sock
+    old_timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return bool(M.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(old_timeout)
+
+
+def idle_wait(M, timeout: float, stop: threading.Event) -> List[str]:
+    """Ein IDLE-Zyklus: wartet bis zu ``timeout`` Sekunden auf Änderungen.
+
+    imaplib kennt (vor Python 3.14) kein IDLE, daher wird das Kommando direkt
+    über die Verbindung geschickt. Gewartet wird per select() auf dem Socket,
+    damit ``stop`` regelmäßig geprüft werden kann, ohne den Lese-Puffer von
+    imaplib durch Socket-Timeouts zu beschädigen. Zeilen, die schon zusammen mit
+    der ``+ idling``-Antwort gepuffert wurden, sieht select() nicht – daher
+    vorher ``_data_pending``.
+    """
+    tag = M._new_tag()
+    M.send(tag + b' IDLE\r\n')
+    events: List[str] = []
+    while True:
+        line = M.readline()
+        if not line:
+            raise EOFError('IMAP-Verbindung während IDLE geschlossen')
+        if line.startswith(b'+'):
+            break
+        if line.startswith(tag):
+            raise RuntimeError(f"IDLE abgelehnt: {line.strip()!r}")
+        kind = parse_idle_line(line)
+        if kind:
+            events.append(kind)
+
+    deadline = time.time() + timeout
+    try:
+        while not events and not stop.is_set():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            if not _data_pending(M):
+                readable, _, _ = select.select([M.sock], [], [], min(remaining, 15))
+                if not readable:
+                    continue
+            line = M.readline()
+            if not line:
+                raise EOFError('IMAP-Verbindung während IDLE geschlossen')
+            kind = parse_idle_line(line)
+            if kind:
+                events.append(kind)
+    finally:
+        # IDLE beenden und bis zur getaggten Antwort lesen (dabei weitere Events einsammeln)
+        M.send(b'DONE\r\n')
+        while True:
+            line = M.readline()
+            if not line:
+                raise EOFError('IMAP-Verbindung nach DONE geschlossen')
+            if line.startswith(tag):
+                break
+            kind = parse_idle_line(line)
+            if kind:
+                events.append(kind)
+    return events
+
+
+def noop_wait(M, timeout: float, stop: threading.Event) -> List[str]:
+    """Fallback ohne IDLE: nach ``timeout`` Sekunden ein NOOP und untagged Responses auswerten."""
+    stop.wait(timeout)
+    if stop.is_set():
+        return []
+    M.noop()
+    events = []
+    for kind in ('EXISTS', 'EXPUNGE', 'FETCH'):
+        _, data = M.response(kind)
+        if data and data != [None]:
+            events.append(kind)
+    return events
+
+
+class IdleListener(threading.Thread):
+    """Hält eine IMAP-Verbindung für einen Account offen und reiht bei Änderungen Sync-Jobs ein."""
+
+    def __init__(self, account: Dict[str, Any]):
+        super().__init__(name=f"email-idle-{account['id']}", daemon=True)
+        self.account = account
+        self.stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def _trigger_sync(self, events: List[str]) -> None:
+        try:
+            job, created = sync_worker.enqueue_job(
+                self.account['user_email'], self.account['id'], IDLE_FOLDER, source='idle'
+            )
+            logger.info(
+                f"[IDLE] account={self.account['id']} {','.join(sorted(set(events)))} -> "
+                f"Sync-Job {job['id']} ({'neu' if created else 'bereits offen'})"
+            )
+        except Exception as e:
+            logger.error(f"[IDLE] account={self.account['id']} Sync-Job nicht eingereiht: {e}")
+
+    def run(self) -> None:
+        backoff = 5
+        while not self.stop_event.is_set():
+            M = None
+            try:
+                M = email_sync.connect_account(self.account)
+                email_sync.select_folder(M, IDLE_FOLDER)
+                supports_idle = 'IDLE' in getattr(M, 'capabilities', ())
+                logger.info(f"[IDLE] account={self.account['id']} verbunden ({'IDLE' if supports_idle else 'NOOP-Polling'})")
+                # Änderungen während der Verbindungspause einmal nachholen
+                self._trigger_sync(['RECONNECT'])
+                backoff = 5
+                while not self.stop_event.is_set():
+                    if supports_idle:
+                        events = idle_wait(M, RENEW_SECONDS, self.stop_event)
+                    else:
+                        events = noop_wait(M, POLL_SECONDS, self.stop_event)
+                    if events:
+                        self._trigger_sync(events)
+            except Exception as e:
+                logger.warning(f"[IDLE] account={self.account['id']} Verbindung verloren: {e}; neuer Versuch in {backoff}s")
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, 300)
+            finally:
+                if M is not None:
+                    try:
+                        M.logout()
+                    except Exception:
+                        pass
+
+
+def _account_fingerprint(account: Dict[str, Any]) -> tuple:
+    return (account.get('imap_host'), account.get('imap_port'), account.get('imap_user'), account.get('imap_pass_encrypted'))
+
+
+class IdleManager:
+    """Startet/stoppt IdleListener passend zu den aktiven Accounts (Abgleich jede Minute)."""
+
+    LOCK_PREFIX = 'email_idle:'
+
+    def __init__(self, interval: int = 60):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._listeners: Dict[int, IdleListener] = {}
+        self._lock_conn = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="email-idle-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._stop_all()
+
+    # --- Named Locks (eine Verbindung pro Prozess hält alle Locks) ---------
+    def _lock_connection(self):
+        if self._lock_conn is not None:
+            try:
+                cur = self._lock_conn.cursor()
+                cur.execute("SELECT 1")
+                cur.fetchall()
+                cur.close()
+                return self._lock_conn
+            except Exception:
+                # Verbindung weg -> Locks sind serverseitig frei, Listener dürfen nicht weiterlaufen
+                logger.warning("[IDLE] Lock-Verbindung verloren, stoppe alle Listener")
+                self._stop_all()
+                self._release_lock_conn()
+        self._lock_conn = get_settings_db_connection()
+        return self._lock_conn
+
+    def _release_lock_conn(self) -> None:
+        conn, self._lock_conn = self._lock_conn, None
+        if conn is None:
+            return
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT RELEASE_ALL_LOCKS()")
+            cur.fetchall()
+            cur.close()
+        except Exception:
+            pass
+        conn.close()
+
+    def _try_lock(self, account_id: int) -> bool:
+        cur = self._lock_connection().cursor()
+        try:
+            cur.execute("SELECT GET_LOCK(%s, 0)", (f"{self.LOCK_PREFIX}{account_id}",))
+            row = cur.fetchone()
+            return bool(row and row[0] == 1)
+        finally:
+            cur.close()
+
+    def _unlock(self, account_id: int) -> None:
+        if self._lock_conn is None:
+            return
+        try:
+            cur = self._lock_conn.cursor()
+            cur.execute("SELECT RELEASE_LOCK(%s)", (f"{self.LOCK_PREFIX}{account_id}",))
+            cur.fetchall()
+            cur.close()
+        except Exception:
+            pass
+
+    # --- Abgleich ------------------------------------------------------------
+    def _active_accounts(self) -> List[Dict[str, Any]]:
+        conn = get_settings_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(
+                "SELECT id, user_email, imap_host, imap_port, imap_user, imap_pass_encrypted, imap_security "
+                "FROM email_accounts WHERE is_active=1 AND imap_host IS NOT NULL AND imap_host <> '' ORDER BY id ASC"
+            )
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _stop_listener(self, account_id: int) -> None:
+        listener = self._listeners.pop(account_id, None)
+        if listener is not None:
+            listener.stop()
+        self._unlock(account_id)
+
+    def _stop_all(self) -> None:
+        for account_id in list(self._listeners):
+            self._stop_listener(account_id)
+
+    def reconcile(self) -> None:
+        self._lock_connection()
+        accounts = {a['id']: a for a in self._active_accounts()}
+        for account_id, listener in list(self._listeners.items()):
+            account = accounts.get(account_id)
+            if (account is None or not listener.is_alive()
+                    or _account_fingerprint(account) != _account_fingerprint(listener.account)):
+                self._stop_listener(account_id)
+        for account_id, account in accounts.items():
+            if account_id in self._listeners:
+                continue
+            if len(self._listeners) >= MAX_ACCOUNTS:
+                break
+            if not self._try_lock(account_id):
+                continue  # läuft bereits in einem anderen Prozess
+            listener = IdleListener(account)
+            self._listeners[account_id] = listener
+            listener.start()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"[IDLE] Abgleich der Accounts fehlgeschlagen: {e}")
+            self._stop.wait(self.interval)
+        self._stop_all()
+        self._release_lock_conn()
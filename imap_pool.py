@@ -0,0 +1,304 @@
+"""
+Pool eingeloggter IMAP-Sessions, damit nicht jeder Request IMAP4_SSL + LOGIN +
+SELECT + LOGOUT bezahlen muss (typisch 300–800 ms vor der ersten Nutzdaten-Zeile).
+
+Sessions werden pro Schlüssel gehalten (``account_key(account_id)`` für
+email_accounts, ``user_key(user_email)`` für die alten user_email_settings) und
+exklusiv ausgeliehen::
+
+    with imap_pool.session(imap_pool.account_key(account_id), settings, folder='INBOX') as M:
+        typ, data = M.uid('search', None, 'ALL')
+
+- Der zuletzt selektierte Ordner wird gemerkt; ein erneutes SELECT entfällt,
+  wenn die nächste Nutzung denselben Ordner braucht (``reselect=True`` erzwingt
+  es). ``M.select()``/``M.close()``/``M.logout()`` daher im ``with``-Block nicht
+  selbst aufrufen.
+- Vor der Ausgabe einer länger ungenutzten Session prüft ein NOOP die
+  Verbindung; ist sie weg, wird transparent neu verbunden.
+- Verbindungsfehler (abort/Socket) im ``with``-Block verwerfen die Session.
+- Ein Hintergrund-Thread hält Idle-Sessions per NOOP am Leben und baut
+  Sessions ab, die länger als IMAP_POOL_IDLE_TIMEOUT unbenutzt sind.
+- Ändern sich die Zugangsdaten eines Accounts, werden alte Sessions verworfen.
+
+Konfiguration über Env:
+- IMAP_POOL_ENABLED          (Default true) – false = pro Nutzung neu verbinden
+- IMAP_POOL_MAX_PER_ACCOUNT  (Default 2)    – gleichzeitige Sessions pro Schlüssel
+- IMAP_POOL_TIMEOUT          (Default 15)   – Sekunden warten, wenn alle Sessions belegt sind
+- IMAP_POOL_IDLE_TIMEOUT     (Default 300)  – ungenutzte Sessions danach schließen
+- IMAP_POOL_KEEPALIVE        (Default 60)   – NOOP, wenn eine Session so lange ungenutzt war
+"""
+import os
+import ssl
+import time
+import imaplib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import email_sync
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+POOL_ENABLED = (os.environ.get('IMAP_POOL_ENABLED') or 'true').strip().lower() not in ('0', 'false', 'no', 'off')
+MAX_PER_KEY = max(1, _env_int('IMAP_POOL_MAX_PER_ACCOUNT', 2))
+WAIT_TIMEOUT = max(1, _env_int('IMAP_POOL_TIMEOUT', 15))
+IDLE_TIMEOUT = max(30, _env_int('IMAP_POOL_IDLE_TIMEOUT', 300))
+KEEPALIVE = max(10, _env_int('IMAP_POOL_KEEPALIVE', 60))
+
+# Fehler, nach denen der Zustand der Verbindung unklar ist -> Session verwerfen
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError, EOFError, ssl.SSLError)
+
+
+def account_key(account_id) -> str:
+    return f"account:{account_id}"
+
+
+def user_key(user_email: str) -> str:
+    return f"user:{(user_email or '').lower()}"
+
+
+def _fingerprint(settings: Dict[str, Any]) -> tuple:
+    return (settings.get('imap_host'), int(settings.get('imap_port') or 993),
+            settings.get('imap_user'), settings.get('imap_pass_encrypted'))
+
+
+def _logout_quietly(M) -> None:
+    if M is None:
+        return
+    try:
+        M.logout()
+    except Exception:
+        pass
+
+
+class _Session:
+    def __init__(self, key: str, fingerprint: tuple):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.M = None
+        self.selected: Optional[str] = None
+        self.in_use = True
+        self.created = time.time()
+        self.last_used = self.created
+
+
+class ImapPool:
+    def __init__(self):
+        self._sessions: Dict[str, List[_Session]] = {}
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._janitor: Optional[threading.Thread] = None
+        self.stats = {"created": 0, "reused": 0, "reconnects": 0, "discarded": 0, "evicted": 0, "waits": 0, "timeouts": 0}
+
+    # --- intern -------------------------------------------------------------
+    def _check_fork(self) -> None:
+        # Nach einem fork (gunicorn) keine Sockets des Elternprozesses verwenden
+        if os.getpid() != self._pid:
+            self._sessions = {}
+            self._pid = os.getpid()
+            self._janitor = None
+
+    def _ensure_janitor(self) -> None:
+        if self._janitor is None or not self._janitor.is_alive():
+            self._janitor = threading.Thread(target=self._janitor_loop, name="imap-pool-janitor", daemon=True)
+            self._janitor.start()
+
+    def _checkout(self, key: str, fingerprint: tuple, folder: Optional[str]) -> _Session:
+        deadline = time.time() + WAIT_TIMEOUT
+        stale: List[_Session] = []
+        try:
+            with self._cond:
+                self._check_fork()
+                self._ensure_janitor()
+                while True:
+                    sessions = self._sessions.setdefault(key, [])
+                    for s in [s for s in sessions if not s.in_use and s.fingerprint != fingerprint]:
+                        sessions.remove(s)
+                        stale.append(s)
+                    idle = [s for s in sessions if not s.in_use]
+                    if idle:
+                        # Bevorzugt eine Session, die den Ordner schon selektiert hat
+                        idle.sort(key=lambda s: (s.selected != folder, -s.last_used))
+                        s = idle[0]
+                        s.in_use = True
+                        self.stats["reused"] += 1
+                        return s
+                    if len(sessions) < MAX_PER_KEY:
+                        s = _Session(key, fingerprint)
+                        sessions.append(s)
+                        return s
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise RuntimeError(f"IMAP-Pool '{key}' erschöpft ({len(sessions)} Sessions in Benutzung)")
+                    self.stats["waits"] += 1
+                    self._cond.wait(remaining)
+        finally:
+            for s in stale:
+                _logout_quietly(s.M)
+
+    def _remove(self, s: _Session, counter: str = "discarded") -> None:
+        with self._cond:
+            sessions = self._sessions.get(s.key) or []
+            if s in sessions:
+                sessions.remove(s)
+                self.stats[counter] += 1
+            self._cond.notify()
+        _logout_quietly(s.M)
+        s.M = None
+
+    def _connect(self, s: _Session, settings: Dict[str, Any]) -> None:
+        _logout_quietly(s.M)
+        s.M = None
+        s.selected = None
+        s.M = email_sync.connect_account(settings)
+        with self._cond:
+            self.stats["created"] += 1
+
+    def _prepare(self, s: _Session, settings: Dict[str, Any], folder: Optional[str], reselect: bool = False) -> None:
+        """Verbindung sicherstellen (NOOP bzw. Reconnect) und Ordner selektieren."""
+        if s.M is None:
+            self._connect(s, settings)
+        elif time.time() - s.last_used > KEEPALIVE:
+            try:
+                s.M.noop()
+            except CONNECTION_ERRORS as e:
+                logger.info(f"[IMAP-Pool] {s.key}: Verbindung tot ({e}), verbinde neu")
+                with self._cond:
+                    self.stats["reconnects"] += 1
+                self._connect(s, settings)
+        if folder and (reselect or s.selected != folder):
+            s.selected = None
+            try:
+                email_sync.select_folder(s.M, folder)
+            except CONNECTION_ERRORS:
+                # Server hat die Verbindung zwischenzeitlich geschlossen -> einmal neu verbinden
+                with self._cond:
+                    self.stats["reconnects"] += 1
+                self._connect(s, settings)
+                email_sync.select_folder(s.M, folder)
+            s.selected = folder
+
+    def _release(self, s: _Session) -> None:
+        try:
+            # Aufgelaufene untagged Responses (EXISTS, FETCH, ...) nicht ewig mitschleppen
+            s.M.untagged_responses.clear()
+        except Exception:
+            pass
+        with self._cond:
+            s.in_use = False
+            s.last_used = time.time()
+            self._cond.notify()
+
+    def _janitor_loop(self) -> None:
+        while True:
+            time.sleep(min(30, KEEPALIVE))
+            now = time.time()
+            expired: List[_Session] = []
+            keepalive: List[_Session] = []
+            with self._cond:
+                for sessions in self._sessions.values():
+                    for s in list(sessions):
+                        if s.in_use:
+                            continue
+                        if now - s.last_used > IDLE_TIMEOUT:
+                            sessions.remove(s)
+                            self.stats["evicted"] += 1
+                            expired.append(s)
+                        elif now - s.last_used > KEEPALIVE:
+                            s.in_use = True
+                            keepalive.append(s)
+            for s in expired:
+                _logout_quietly(s.M)
+            for s in keepalive:
+                try:
+                    s.M.noop()
+                    self._release(s)
+                except Exception:
+                    self._remove(s)
+
+    # --- API ----------------------------------------------------------------
+    @contextmanager
+    def session(self, key: str, settings: Dict[str, Any], folder: Optional[str] = None, reselect: bool = False):
+        if not POOL_ENABLED:
+            M = email_sync.connect_account(settings)
+            try:
+                if folder:
+                    email_sync.select_folder(M, folder)
+                yield M
+            finally:
+                _logout_quietly(M)
+            return
+
+        s = self._checkout(key, _fingerprint(settings), folder)
+        try:
+            self._prepare(s, settings, folder, reselect)
+        except CONNECTION_ERRORS:
+            self._remove(s)
+            raise
+        except BaseException:
+            # z.B. SELECT auf unbekannten Ordner: Verbindung ist weiter brauchbar
+            if s.M is None:
+                self._remove(s)
+            else:
+                self._release(s)
+            raise
+        try:
+            yield s.M
+        except CONNECTION_ERRORS:
+            self._remove(s)
+            raise
+        except BaseException:
+            self._release(s)
+            raise
+        else:
+            self._release(s)
+
+    def discard(self, key: str) -> None:
+        """Alle freien Sessions eines Schlüssels schließen (z.B. nach Änderung der Zugangsdaten)."""
+        with self._cond:
+            self._check_fork()
+            sessions = self._sessions.get(key) or []
+            idle = [s for s in sessions if not s.in_use]
+            for s in idle:
+                sessions.remove(s)
+                self.stats["discarded"] += 1
+        for s in idle:
+            _logout_quietly(s.M)
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "enabled": POOL_ENABLED,
+                "sessions": {k: {"total": len(v), "in_use": sum(1 for s in v if s.in_use)} for k, v in self._sessions.items() if v},
+                **self.stats,
+            }
+
+
+_POOL = ImapPool()
+
+
+def session(key: str, settings: Dict[str, Any], folder: Optional[str] = None, reselect: bool = False):
+    """Leiht eine eingeloggte (und ggf. auf ``folder`` selektierte) IMAP-Verbindung aus.
+
+    ``reselect=True`` erzwingt ein frisches SELECT, z.B. wenn UIDVALIDITY/EXISTS
+    aus den SELECT-Responses gebraucht werden (siehe email_sync.mailbox_status).
+    """
+    return _POOL.session(key, settings, folder, reselect)
+
+
+def discard(key: str) -> None:
+    _POOL.discard(key)
+
+
+def pool_status() -> Dict[str, Any]:
+    return _POOL.status()
@@ -0,0 +1,142 @@
+"""
+Geteilte, begrenzte Thread-Pools für LLM- und FAQ-Aufrufe mit echter Deadline.
+
+Vorher erzeugte jeder Aufruf einen eigenen ``ThreadPoolExecutor`` in einem
+``with``-Block; dessen Exit wartet auf den Worker, sodass ein "Timeout" den
+Request trotzdem die volle LLM-Dauer blockierte. Hier gilt::
+
+    answer = llm_executor.LLM.run(agent_respond, text, timeout=8)
+
+- ``run`` wartet höchstens ``timeout`` Sekunden (inkl. Wartezeit in der Queue)
+  und kehrt dann mit ``DeadlineExceeded`` zurück, ohne auf den Worker zu warten.
+- Noch nicht gestartete Aufgaben werden bei Ablauf abgebrochen (``cancelled``);
+  bereits laufende laufen im Hintergrund zu Ende, ihr Ergebnis wird verworfen
+  (``abandoned``). Startet ein Worker eine Aufgabe erst nach ihrer Deadline,
+  entfällt sie (``expired``).
+- Ist die Queue voll, wird sofort mit ``Overloaded`` abgelehnt statt zu stauen.
+- ``status()`` liefert Queue-Tiefe, laufende Aufgaben und Zähler
+  (/api/debug/executors).
+
+Getrennte Pools, weil agent_respond (LLM-Pool) selbst FAQ-Aufgaben
+startet – im selben Pool könnten sich die Aufgaben gegenseitig aussperren.
+Der EMBED-Pool verteilt die Batches eines großen Embedding-Aufrufs
+(embedding_cache).
+
+Konfiguration über Env:
+- LLM_EXECUTOR_WORKERS / LLM_EXECUTOR_QUEUE  (Default 8 / 32)
+- FAQ_EXECUTOR_WORKERS / FAQ_EXECUTOR_QUEUE  (Default 4 / 16)
+- EMBED_EXECUTOR_WORKERS / EMBED_EXECUTOR_QUEUE  (Default 4 / 32, parallele Embedding-Batches)
+"""
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Any, Callable, Dict, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+class DeadlineExceeded(FuturesTimeout):
+    """Kein Ergebnis innerhalb der Deadline."""
+
+
+class Overloaded(DeadlineExceeded):
+    """Queue voll – Aufgabe wurde gar nicht erst eingeplant."""
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pid = os.getpid()
+        self.queued = 0
+        self.running = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "timeouts": 0, "cancelled": 0,
+                      "abandoned": 0, "expired": 0, "rejected": 0, "max_queued": 0}
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # Nach einem fork (gunicorn) keine Threads des Elternprozesses annehmen
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-exec")
+            self._pid = os.getpid()
+            self.queued = self.running = 0
+        return self._pool
+
+    def _wrap(self, fn: Callable, args, kwargs, deadline: Optional[float]):
+        def _task():
+            with self._lock:
+                self.queued -= 1
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.stats["expired"] += 1
+                    return None
+                self.running += 1
+            try:
+                result = fn(*args, **kwargs)
+                with self._lock:
+                    self.stats["completed"] += 1
+                return result
+            except BaseException:
+                with self._lock:
+                    self.stats["failed"] += 1
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+        return _task
+
+    def submit(self, fn: Callable, *args, deadline: Optional[float] = None, **kwargs) -> Future:
+        """Plant ``fn`` ein; ``deadline`` (time.monotonic()) verwirft verspätet gestartete Aufgaben."""
+        with self._lock:
+            pool = self._get_pool()
+            if self.queued + self.running >= self.max_workers + self.max_queue:
+                self.stats["rejected"] += 1
+                raise Overloaded(f"Executor '{self.name}' ausgelastet ({self.queued} wartend, {self.running} laufend)")
+            self.queued += 1
+            self.stats["submitted"] += 1
+            self.stats["max_queued"] = max(self.stats["max_queued"], self.queued)
+        try:
+            return pool.submit(self._wrap(fn, args, kwargs, deadline))
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+
+    def run(self, fn: Callable, *args, timeout: float, **kwargs) -> Any:
+        """Führt ``fn`` im Pool aus und wartet höchstens ``timeout`` Sekunden (kein Join bei Ablauf)."""
+        deadline = time.monotonic() + timeout
+        fut = self.submit(fn, *args, deadline=deadline, **kwargs)
+        try:
+            return fut.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FuturesTimeout:
+            cancelled = fut.cancel()
+            with self._lock:
+                self.stats["timeouts"] += 1
+                if cancelled:
+                    # _task startet nie -> Queue-Zähler hier zurücknehmen
+                    self.queued -= 1
+                    self.stats["cancelled"] += 1
+                else:
+                    self.stats["abandoned"] += 1
+            raise DeadlineExceeded(f"Executor '{self.name}': keine Antwort nach {timeout}s")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"max_workers": self.max_workers, "max_queue": self.max_queue,
+                    "queued": self.queued, "running": self.running, **self.stats}
+
+
+LLM = BoundedExecutor('llm', _env_int('LLM_EXECUTOR_WORKERS', 8), _env_int('LLM_EXECUTOR_QUEUE', 32))
+FAQ = BoundedExecutor('faq', _env_int('FAQ_EXECUTOR_WORKERS', 4), _env_int('FAQ_EXECUTOR_QUEUE', 16))
+EMBED = BoundedExecutor('embed', _env_int('EMBED_EXECUTOR_WORKERS', 4), _env_int('EMBED_EXECUTOR_QUEUE', 32))
+
+
+def all_status() -> Dict[str, Dict[str, Any]]:
+    return {ex.name: ex.status() for ex in (LLM, FAQ, EMBED)}
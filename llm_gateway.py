@@ -0,0 +1,408 @@
+"""
+Zentrale Stelle für alle Chat-Completions an OpenAI (pro Prozess).
+
+Alle Aufrufer gehen über ``chat()`` statt ``client.chat.completions.create``::
+
+    resp = llm_gateway.chat(messages, model="gpt-4.1-mini", max_tokens=220,
+                            priority=llm_gateway.INTERACTIVE, temperature=0.3)
+
+- Token-Buckets pro Modell: Requests/Minute und (geschätzte) Tokens/Minute.
+  Die Schätzung ist Prompt-Zeichen/4 + max_tokens.
+- Begrenzte Anzahl gleichzeitiger Aufrufe (LLM_MAX_CONCURRENCY).
+- Prioritäten: INTERACTIVE (Antwort-Entwurf, Reply-Prep) vor BACKGROUND
+  (Profil-/Themen-Generierung). Innerhalb einer Klasse gilt FIFO. Ein Aufruf
+  startet erst, wenn kein wichtigerer Aufruf und kein älterer desselben
+  Modells wartet, ein Slot frei ist und der Bucket genug Kapazität hat.
+- Wartende sind begrenzt (LLM_MAX_WAITING); wer länger als ``queue_timeout``
+  wartet, bekommt ``LLMBusy``.
+- HTTP 429/503 werden mit exponentiellem Backoff und Full Jitter wiederholt
+  (``Retry-After`` wird respektiert). Ein 429 leert zusätzlich den Bucket des
+  Modells, damit parallele Aufrufer ebenfalls bremsen.
+
+- Antwort-Cache: identische Anfragen (Hash über Modell, Messages, temperature,
+  max_tokens und übrige Parameter) liefern die gespeicherte Antwort, ohne
+  Bucket oder Provider zu belasten. Per Default persistent in der
+  SQLite-Datei von ttl_cache (überlebt Neustarts, geteilt zwischen Workern),
+  begrenzt per TTL und Größe; gleichzeitige identische Anfragen rechnen nur
+  einmal. Aufrufer, die bewusst eine neue Antwort wollen (Neu generieren,
+  force=1, Health-Check), übergeben ``cache=False``. Trefferquote unter
+  /api/debug/caches (``llm_response``) und /api/debug/executors.
+- ``embed()`` schickt Embedding-Batches durch dieselben Buckets und Retries
+  (Cache/Batching dafür in embedding_cache.py).
+- ``chat_stream()`` liefert die Antwort stückweise (für SSE); der Slot bleibt
+  bis zum Ende des Streams belegt, wiederholt wird nur vor dem ersten Stück.
+  Das Ergebnis landet im selben Antwort-Cache wie bei ``chat()``.
+
+Die Limits gelten pro Prozess: bei N gunicorn-Workern das Provider-Limit
+durch N teilen.
+
+Konfiguration über Env:
+- LLM_RATE_LIMITS      pro Modell ``modell=rpm:tpm``, kommagetrennt
+                       (z.B. ``gpt-4.1-mini=500:200000,gpt-3.5-turbo=3500:90000``)
+- LLM_DEFAULT_RPM / LLM_DEFAULT_TPM   für alle übrigen Modelle (Default 500 / 200000)
+- LLM_MAX_CONCURRENCY  gleichzeitige Aufrufe (Default 8)
+- LLM_MAX_WAITING      max. wartende Aufrufe (Default 64)
+- LLM_QUEUE_TIMEOUT    Sekunden Wartezeit bis LLMBusy (Default 30)
+- LLM_MAX_RETRIES      Wiederholungen bei 429/503 (Default 3)
+- LLM_CACHE_TTL        Sekunden, die eine Antwort wiederverwendet wird (Default 604800 = 7 Tage, 0 = aus)
+- LLM_CACHE_MAXSIZE    max. gespeicherte Antworten (Default 5000)
+- LLM_CACHE_BACKEND    sqlite (Default) | memory
+"""
+import os
+import time
+import json
+import random
+import hashlib
+import logging
+import threading
+import itertools
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import ttl_cache
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+RETRY_STATUS = (429, 503)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+def _parse_rate_limits(raw: str) -> Dict[str, Tuple[int, int]]:
+    out: Dict[str, Tuple[int, int]] = {}
+    for part in (raw or '').split(','):
+        if '=' not in part:
+            continue
+        model, _, limits = part.partition('=')
+        rpm, _, tpm = limits.partition(':')
+        try:
+            out[model.strip()] = (int(rpm), int(tpm or DEFAULT_TPM))
+        except ValueError:
+            logger.warning(f"[LLM] LLM_RATE_LIMITS-Eintrag ignoriert: {part!r}")
+    return out
+
+
+DEFAULT_RPM = max(1, _env_int('LLM_DEFAULT_RPM', 500))
+DEFAULT_TPM = max(1, _env_int('LLM_DEFAULT_TPM', 200000))
+RATE_LIMITS = _parse_rate_limits(os.environ.get('LLM_RATE_LIMITS', ''))
+MAX_CONCURRENCY = max(1, _env_int('LLM_MAX_CONCURRENCY', 8))
+MAX_WAITING = max(1, _env_int('LLM_MAX_WAITING', 64))
+QUEUE_TIMEOUT = max(1, _env_int('LLM_QUEUE_TIMEOUT', 30))
+MAX_RETRIES = max(0, _env_int('LLM_MAX_RETRIES', 3))
+CACHE_TTL = max(0, _env_int('LLM_CACHE_TTL', 7 * 24 * 3600))
+CACHE_MAXSIZE = max(1, _env_int('LLM_CACHE_MAXSIZE', 5000))
+CACHE_BACKEND = os.environ.get('LLM_CACHE_BACKEND') or 'sqlite'
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 20.0
+
+
+class LLMBusy(RuntimeError):
+    """Kein Slot/Budget innerhalb der Wartezeit bzw. Warteschlange voll."""
+
+
+class TokenBucket:
+    """Klassischer Token-Bucket: ``capacity`` pro Minute, kontinuierlich aufgefüllt."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Sekunden, bis ``cost`` verfügbar ist (0 = sofort). Kosten über der Kapazität werden gedeckelt."""
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        self.tokens -= min(cost, self.capacity)
+
+    def drain(self) -> None:
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Model:
+    def __init__(self, name: str):
+        rpm, tpm = RATE_LIMITS.get(name, (DEFAULT_RPM, DEFAULT_TPM))
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+
+class Scheduler:
+    """Priorisierte Zulassung zu LLM-Aufrufen (Buckets + Concurrency-Limit)."""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_waiting: int = MAX_WAITING):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: List[Tuple[int, int, str]] = []  # (priority, seq, model), sortiert
+        self._models: Dict[str, _Model] = {}
+        self.in_flight = 0
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "rejected": 0, "queue_timeouts": 0,
+                      "failed": 0, "wait_seconds": 0.0}
+
+    def _model(self, name: str) -> _Model:
+        m = self._models.get(name)
+        if m is None:
+            m = self._models[name] = _Model(name)
+        return m
+
+    def _ready_in(self, ticket: Tuple[int, int, str], cost: int, now: float) -> Optional[float]:
+        """None = ein anderer Aufruf ist zuerst dran; sonst Sekunden bis zum Start."""
+        if self.in_flight >= self.max_concurrency:
+            return None
+        for other in self._waiting:
+            if other == ticket:
+                break
+            # Älterer Aufruf desselben Modells oder irgendein wichtigerer Aufruf geht vor
+            if other[2] == ticket[2] or other[0] < ticket[0]:
+                return None
+        m = self._model(ticket[2])
+        return max(m.requests.wait_time(1, now), m.tokens.wait_time(cost, now))
+
+    def acquire(self, model: str, cost: int, priority: int, timeout: float) -> None:
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            if len(self._waiting) >= self.max_waiting:
+                self.stats["rejected"] += 1
+                raise LLMBusy(f"LLM-Warteschlange voll ({len(self._waiting)} wartend)")
+            ticket = (priority, next(self._seq), model)
+            self._waiting.append(ticket)
+            self._waiting.sort()
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._ready_in(ticket, cost, now)
+                    if wait == 0.0:
+                        m = self._model(model)
+                        m.requests.take(1)
+                        m.tokens.take(cost)
+                        self.in_flight += 1
+                        self.stats["wait_seconds"] += now - start
+                        return
+                    if now >= deadline:
+                        self.stats["queue_timeouts"] += 1
+                        raise LLMBusy(f"LLM {model}: kein Slot nach {timeout:.0f}s "
+                                      f"({self.in_flight} laufend, {len(self._waiting)} wartend)")
+                    self._cond.wait(min(deadline - now, wait if wait is not None else deadline - now))
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def rate_limited(self, model: str) -> None:
+        with self._cond:
+            self.stats["rate_limited"] += 1
+            self._model(model).requests.drain()
+
+    def count(self, counter: str) -> None:
+        with self._cond:
+            self.stats[counter] += 1
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            models = {}
+            for name, m in self._models.items():
+                m.requests.wait_time(0, now)
+                m.tokens.wait_time(0, now)
+                models[name] = {"rpm": int(m.requests.capacity), "tpm": int(m.tokens.capacity),
+                                "requests_available": round(m.requests.tokens, 1),
+                                "tokens_available": int(m.tokens.tokens)}
+            waiting = {name: sum(1 for t in self._waiting if t[0] == prio) for prio, name in PRIORITY_NAMES.items()}
+            return {"in_flight": self.in_flight, "max_concurrency": self.max_concurrency,
+                    "waiting": waiting, "models": models, **self.stats}
+
+
+_SCHEDULER = Scheduler()
+_RESPONSE_CACHE = ttl_cache.cache('llm_response', maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL,
+                                  shared=True, backend=CACHE_BACKEND)
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _client():
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                from openai import OpenAI
+                _CLIENT = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    return _CLIENT
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> int:
+    chars = sum(len(str(m.get('content') or '')) for m in messages)
+    return chars // 4 + int(max_tokens or 256)
+
+
+def _retry_status(e: Exception) -> Optional[int]:
+    status = getattr(e, 'status_code', None)
+    return status if status in RETRY_STATUS else None
+
+
+def _retry_delay(e: Exception, attempt: int) -> float:
+    try:
+        retry_after = float(e.response.headers.get('retry-after'))
+        if retry_after > 0:
+            return min(retry_after, BACKOFF_CAP) + random.uniform(0, BACKOFF_BASE)
+    except Exception:
+        pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+# Beeinflussen nur die Übertragung, nicht die Antwort
+_TRANSPORT_PARAMS = ('stream', 'timeout')
+
+
+def cache_key(params: Dict[str, Any]) -> str:
+    """Inhaltsadresse einer Anfrage: SHA-256 über alle Parameter (sortiert)."""
+    content = {k: v for k, v in params.items() if k not in _TRANSPORT_PARAMS}
+    raw = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _call(params: Dict[str, Any], cost: int, priority: int, timeout: float, hold: bool = False,
+          create: Optional[Callable[..., Any]] = None) -> Any:
+    """Ein Aufruf inkl. Retry (Default: Chat-Completion, sonst ``create``).
+    ``hold=True``: Slot bleibt belegt, der Aufrufer gibt ihn frei (Streaming)."""
+    model = params['model']
+    attempt = 0
+    while True:
+        _SCHEDULER.acquire(model, cost, priority, timeout)
+        release = True
+        try:
+            _SCHEDULER.count("calls")
+            result = (create or _client().chat.completions.create)(**params)
+            release = not hold
+            return result
+        except Exception as e:
+            status = _retry_status(e)
+            if status is None or attempt >= MAX_RETRIES:
+                _SCHEDULER.count("failed")
+                raise
+            if status == 429:
+                _SCHEDULER.rate_limited(model)
+            delay = _retry_delay(e, attempt)
+            logger.warning(f"[LLM] {model}: HTTP {status}, Versuch {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s")
+        finally:
+            if release:
+                _SCHEDULER.release()
+        _SCHEDULER.count("retries")
+        attempt += 1
+        time.sleep(delay)
+
+
+def _params(messages: List[Dict[str, Any]], model: str, max_tokens: Optional[int], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    params = dict(kwargs, model=model, messages=messages)
+    if max_tokens is not None:
+        params['max_tokens'] = max_tokens
+    return params
+
+
+def _text_response(text: str, finish_reason: Optional[str]) -> Any:
+    """Minimale Antwort im SDK-Format (``choices[0].message.content``) für gestreamte Ergebnisse."""
+    return SimpleNamespace(choices=[SimpleNamespace(
+        index=0, finish_reason=finish_reason, message=SimpleNamespace(role='assistant', content=text),
+    )])
+
+
+def chat(messages: List[Dict[str, Any]], *, model: str, max_tokens: Optional[int] = None,
+         priority: int = INTERACTIVE, queue_timeout: Optional[float] = None,
+         cache: bool = True, cache_ttl: Optional[float] = None, **kwargs) -> Any:
+    """``chat.completions.create`` mit Antwort-Cache, Rate-Limit, Priorität und Retry; Rückgabe wie das SDK.
+
+    ``cache=False`` erzwingt einen neuen Aufruf (das Ergebnis wird dann auch nicht
+    gespeichert); ``cache_ttl`` verkürzt das zulässige Alter eines Treffers.
+    """
+    cost = estimate_tokens(messages, max_tokens)
+    timeout = QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+    params = _params(messages, model, max_tokens, kwargs)
+    if not cache or not CACHE_TTL or params.get('stream'):
+        return _call(params, cost, priority, timeout)
+    return _RESPONSE_CACHE.get_or_compute(cache_key(params), lambda: _call(params, cost, priority, timeout),
+                                          ttl=cache_ttl)
+
+
+def chat_stream(messages: List[Dict[str, Any]], *, model: str, max_tokens: Optional[int] = None,
+                priority: int = INTERACTIVE, queue_timeout: Optional[float] = None,
+                cache: bool = True, cache_ttl: Optional[float] = None, **kwargs) -> Iterator[str]:
+    """Wie ``chat``, liefert aber Text-Stücke, sobald sie vom Provider kommen.
+
+    Ein Cache-Treffer kommt als ein einziges Stück. Nur vollständig gelesene
+    Streams werden gespeichert; bricht der Aufrufer ab, gibt ``finally`` den
+    Slot frei und es wird nichts gecacht.
+    """
+    cost = estimate_tokens(messages, max_tokens)
+    timeout = QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+    params = _params(messages, model, max_tokens, kwargs)
+    use_cache = cache and CACHE_TTL
+    key = cache_key(params) if use_cache else None
+    if use_cache:
+        cached = _RESPONSE_CACHE.get(key, ttl=cache_ttl)
+        if cached is not None:
+            text = cached.choices[0].message.content if cached.choices else ''
+            if text:
+                yield text
+            return
+    params['stream'] = True
+    stream = _call(params, cost, priority, timeout, hold=True)
+    parts: List[str] = []
+    finish_reason = None
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish_reason = getattr(choice, 'finish_reason', None) or finish_reason
+            delta = getattr(choice.delta, 'content', None)
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception:
+        _SCHEDULER.count("failed")
+        raise
+    finally:
+        _SCHEDULER.release()
+        close = getattr(stream, 'close', None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+    if use_cache and parts:
+        _RESPONSE_CACHE.set(key, _text_response(''.join(parts), finish_reason))
+
+
+def embed(texts: Sequence[str], *, model: str, priority: int = BACKGROUND,
+          queue_timeout: Optional[float] = None) -> List[List[float]]:
+    """``embeddings.create`` für einen Batch mit Rate-Limit, Priorität und Retry (ohne Cache)."""
+    cost = sum(len(t) for t in texts) // 4 + 1
+    timeout = QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+    res = _call({'model': model, 'input': list(texts)}, cost, priority, timeout,
+                create=_client().embeddings.create)
+    return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+
+
+def status() -> Dict[str, Any]:
+    return {**_SCHEDULER.status(), "response_cache": _RESPONSE_CACHE.status()}
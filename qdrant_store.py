@@ -1,9 +1,14 @@
 import os
+import uuid
+import hashlib
+import threading
 from typing import List, Optional, Sequence, Dict, Any
 
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qmodels
-from openai import OpenAI
+
+import embedding_cache
+import llm_gateway
 
 # Konfiguration über Env
 QDRANT_URL = os.environ.get("QDRANT_URL")
@@ -15,68 +20,225 @@ QDRANT_COLLECTION = (
     or "knowledge"
 )
 EMBED_MODEL = os.environ.get("AGENT_EMBED_MODEL", "text-embedding-3-small")
+# Optional gRPC statt REST (QDRANT_PREFER_GRPC=true, Port QDRANT_GRPC_PORT, Default 6334)
+QDRANT_PREFER_GRPC = os.environ.get("QDRANT_PREFER_GRPC", "false").lower() == "true"
+try:
+    QDRANT_GRPC_PORT = int(os.environ.get("QDRANT_GRPC_PORT", "6334"))
+except Exception:
+    QDRANT_GRPC_PORT = 6334
+
+# Namensraum für deterministische Punkt-IDs (UUIDv5); nie ändern, sonst entstehen Duplikate
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "neckattack/slotbooking/qdrant")
 
-_openai = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# Ein Client pro Prozess (Connection-Reuse); nach einem fork (gunicorn) neu anlegen
+_client: Optional[QdrantClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+# Collection -> Vektorgröße, sobald ihre Existenz bestätigt ist
+_collections: Dict[str, int] = {}
+# (Collection, Feld) mit angelegtem Payload-Index
+_payload_indexes: set = set()
 
 
 def get_client() -> QdrantClient:
+    global _client, _client_pid
     if not QDRANT_URL:
         raise RuntimeError("QDRANT_URL fehlt (Env)")
-    headers = {"api-key": QDRANT_API_KEY} if QDRANT_API_KEY else None
-    return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=10.0, prefer_grpc=False)
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=10.0,
+                                       prefer_grpc=QDRANT_PREFER_GRPC, grpc_port=QDRANT_GRPC_PORT)
+                _client_pid = os.getpid()
+                _collections.clear()
+                _payload_indexes.clear()
+    return _client
+
+
+def forget_collection(name: str = QDRANT_COLLECTION) -> None:
+    """Verwirft das gemerkte Existenz-Ergebnis (z.B. nachdem ein Aufruf mit "Not found" scheiterte)."""
+    _collections.pop(name, None)
+    _payload_indexes.difference_update({key for key in _payload_indexes if key[0] == name})
 
 
-def _embed(texts: Sequence[str]) -> List[List[float]]:
-    # OpenAI Embeddings
-    res = _openai.embeddings.create(model=EMBED_MODEL, input=list(texts))
-    return [d.embedding for d in res.data]
+def _embed(texts: Sequence[str], priority: int = llm_gateway.INTERACTIVE) -> List[List[float]]:
+    # OpenAI Embeddings über Cache + Batching (embedding_cache)
+    return embedding_cache.embed(texts, model=EMBED_MODEL, priority=priority)
+
+
+def _vector_size(info: Any) -> Optional[int]:
+    try:
+        vectors = info.config.params.vectors
+        return int(vectors.size if hasattr(vectors, "size") else next(iter(vectors.values())).size)
+    except Exception:
+        return None
 
 
 def ensure_collection(vector_size: int, distance: str = "Cosine") -> None:
-    """Erstellt die Collection falls nicht vorhanden."""
+    """Erstellt die Collection falls nicht vorhanden (Ergebnis wird pro Prozess gemerkt)."""
+    known = _collections.get(QDRANT_COLLECTION)
+    if known is not None:
+        if known != vector_size:
+            raise RuntimeError(f"Qdrant-Collection {QDRANT_COLLECTION} hat Vektorgröße {known}, nicht {vector_size}")
+        return
     client = get_client()
     try:
         exists = client.collection_exists(QDRANT_COLLECTION)
     except Exception:
         exists = False
-    if not exists:
-        # Distance-String robust auf Enum-Werte mappen (COSINE, DOT, EUCLID)
-        dist_key = (distance or "cosine").strip().upper()
-        if dist_key not in {"COSINE", "DOT", "EUCLID"}:
-            dist_key = "COSINE"
-        dist = getattr(qmodels.Distance, dist_key)
-        client.recreate_collection(
+    if exists:
+        try:
+            known = _vector_size(client.get_collection(QDRANT_COLLECTION))
+        except Exception:
+            known = None
+        _collections[QDRANT_COLLECTION] = known or vector_size
+        if known and known != vector_size:
+            raise RuntimeError(f"Qdrant-Collection {QDRANT_COLLECTION} hat Vektorgröße {known}, nicht {vector_size}")
+        return
+    # Distance-String robust auf Enum-Werte mappen (COSINE, DOT, EUCLID)
+    dist_key = (distance or "cosine").strip().upper()
+    if dist_key not in {"COSINE", "DOT", "EUCLID"}:
+        dist_key = "COSINE"
+    dist = getattr(qmodels.Distance, dist_key)
+    try:
+        # create statt recreate: ein paralleler Worker darf die Collection nicht wieder löschen
+        client.create_collection(
             collection_name=QDRANT_COLLECTION,
             vectors_config=qmodels.VectorParams(size=vector_size, distance=dist),
         )
+    except Exception:
+        # Inzwischen von einem anderen Worker angelegt?
+        if not client.collection_exists(QDRANT_COLLECTION):
+            raise
+    _collections[QDRANT_COLLECTION] = vector_size
 
 
-def upsert_texts(texts: Sequence[str], ids: Optional[Sequence[str]] = None, metadata: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+def ensure_payload_indexes(fields: Dict[str, str]) -> None:
+    """Legt Payload-Indizes für Filterfelder an, z.B. {"user_email": "keyword", "received_ts": "integer"}."""
+    client = get_client()
+    for field, schema in fields.items():
+        if (QDRANT_COLLECTION, field) in _payload_indexes:
+            continue
+        # Existiert der Index bereits, ist create_payload_index ein No-op
+        client.create_payload_index(
+            collection_name=QDRANT_COLLECTION,
+            field_name=field,
+            field_schema=getattr(qmodels.PayloadSchemaType, schema.upper()),
+        )
+        _payload_indexes.add((QDRANT_COLLECTION, field))
+
+
+def _filter(filters: Optional[Dict[str, Any]]) -> Optional[qmodels.Filter]:
+    """Payload-Filter: Wert = exakter Treffer, dict = Bereich (gte/lte/gt/lt); None-Werte werden ignoriert."""
+    must = []
+    for key, value in (filters or {}).items():
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            must.append(qmodels.FieldCondition(key=key, range=qmodels.Range(**value)))
+        else:
+            must.append(qmodels.FieldCondition(key=key, match=qmodels.MatchValue(value=value)))
+    return qmodels.Filter(must=must) if must else None
+
+
+def point_id(*parts: Any) -> str:
+    """Stabile Punkt-ID aus fachlichen Schlüsselteilen, z.B. point_id(user_email, "email", email_id, "snippet")."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, "/".join(str(p) for p in parts)))
+
+
+def content_hash(text: str) -> str:
+    """Hash über Modell und Text; ändert sich eins davon, wird neu eingebettet."""
+    return hashlib.sha256(f"{EMBED_MODEL}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _normalize_id(raw_pid: Any, text: str) -> Any:
+    # Qdrant akzeptiert nur unsigned Integer oder UUIDs
+    if raw_pid is None:
+        # Ohne fachliche ID: inhaltsadressiert (gleicher Text -> gleicher Punkt)
+        return point_id("text", content_hash(text))
+    if isinstance(raw_pid, int) or (isinstance(raw_pid, str) and raw_pid.isdigit()):
+        return int(raw_pid)
+    try:
+        return str(uuid.UUID(str(raw_pid)))
+    except ValueError:
+        return point_id(raw_pid)
+
+
+def _stored_hashes(client: QdrantClient, pids: Sequence[Any]) -> Dict[str, str]:
+    """content_hash der bereits gespeicherten Punkte (leer, wenn die Collection noch fehlt)."""
+    try:
+        found = client.retrieve(collection_name=QDRANT_COLLECTION, ids=list(pids),
+                                with_payload=["content_hash"], with_vectors=False)
+    except Exception:
+        return {}
+    return {str(pt.id): (pt.payload or {}).get("content_hash") for pt in found}
+
+
+def upsert_texts(texts: Sequence[str], ids: Optional[Sequence[Any]] = None, metadata: Optional[Sequence[Dict[str, Any]]] = None,
+                 priority: int = llm_gateway.INTERACTIVE) -> int:
+    """Idempotenter Upsert: deterministische IDs, unveränderte Punkte werden übersprungen.
+
+    - ``ids``: fachliche IDs (int, UUID oder beliebiger String -> UUIDv5, siehe point_id);
+      ohne ID wird die ID aus dem Inhalt abgeleitet.
+    - Punkte, deren gespeicherter content_hash zum Text passt, werden weder
+      eingebettet noch neu geschrieben.
+
+    Liefert die Anzahl tatsächlich geschriebener Punkte.
+    """
     if not texts:
         return 0
-    vecs = _embed(texts)
+    pids = [_normalize_id(ids[i] if ids and i < len(ids) else None, t) for i, t in enumerate(texts)]
+    hashes = [content_hash(t) for t in texts]
+    client = get_client()
+    stored = _stored_hashes(client, pids)
+    # Pro ID nur den letzten Eintrag schreiben (doppelte IDs im selben Aufruf)
+    pending: Dict[Any, int] = {}
+    for i, pid in enumerate(pids):
+        if stored.get(str(pid)) != hashes[i]:
+            pending[pid] = i
+    if not pending:
+        return 0
+    order = list(pending.values())
+    vecs = _embed([texts[i] for i in order], priority=priority)
     ensure_collection(vector_size=len(vecs[0]))
     points: List[qmodels.PointStruct] = []
-    for i, v in enumerate(vecs):
-        # Wenn keine externe ID angegeben ist, nutze eine einfache Integer-ID
-        raw_pid = ids[i] if ids and i < len(ids) else None
-        try:
-            pid = int(raw_pid) if raw_pid is not None else i
-        except Exception:
-            pid = i
-        payload = (metadata[i] if metadata and i < len(metadata) else {}) or {}
+    for i, v in zip(order, vecs):
+        payload = dict((metadata[i] if metadata and i < len(metadata) else {}) or {})
         payload.setdefault("text", texts[i])
-        points.append(qmodels.PointStruct(id=pid, vector=v, payload=payload))
-    client = get_client()
-    client.upsert(collection_name=QDRANT_COLLECTION, points=points)
+        payload["content_hash"] = hashes[i]
+        points.append(qmodels.PointStruct(id=pids[i], vector=v, payload=payload))
+    try:
+        client.upsert(collection_name=QDRANT_COLLECTION, points=points)
+    except Exception:
+        # Collection evtl. extern gelöscht -> beim nächsten Mal neu prüfen
+        forget_collection()
+        raise
     return len(points)
 
 
-def similarity_search(query: str, limit: int = 5) -> List[Dict[str, Any]]:
-    vec = _embed([query])[0]
+def delete_points(filters: Optional[Dict[str, Any]] = None, any_of: Optional[Sequence[Dict[str, Any]]] = None) -> None:
+    """Löscht Punkte per Payload-Filter: ``filters`` muss passen (siehe _filter), dazu mindestens ein Filter aus ``any_of``.
+
+    Ohne jeden Filter wird abgebrochen (würde die ganze Collection leeren).
+    """
+    must = _filter(filters)
+    should = [f for f in (_filter(x) for x in (any_of or [])) if f is not None]
+    if any_of is not None and not should:
+        return
+    if must is None and not should:
+        raise ValueError("delete_points ohne Filter")
     client = get_client()
-    ensure_collection(vector_size=len(vec))
-    res = client.search(collection_name=QDRANT_COLLECTION, query_vector=vec, limit=limit)
+    if QDRANT_COLLECTION not in _collections and not client.collection_exists(QDRANT_COLLECTION):
+        return
+    selector = qmodels.Filter(must=must.must if must else None, should=should or None)
+    try:
+        client.delete(collection_name=QDRANT_COLLECTION, points_selector=qmodels.FilterSelector(filter=selector))
+    except Exception:
+        forget_collection()
+        raise
+
+
+def _hits(res: Sequence[Any]) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
     for pt in res:
         out.append({
@@ -88,8 +250,40 @@ def similarity_search(query: str, limit: int = 5) -> List[Dict[str, Any]]:
     return out
 
 
+def similarity_search(query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    return similarity_search_batch([query], limit=limit, filters=filters)[0]
+
+
+def similarity_search_batch(queries: Sequence[str], limit: int = 5,
+                            filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+    """Mehrere Suchen in einem Durchgang: ein Embedding-Aufruf und ein Qdrant-Request (search_batch).
+
+    ``filters`` schränkt alle Anfragen auf Payload-Werte ein (siehe _filter).
+    Liefert pro Anfrage die Trefferliste in der Reihenfolge von ``queries``.
+    """
+    if not queries:
+        return []
+    vecs = _embed(queries)
+    client = get_client()
+    ensure_collection(vector_size=len(vecs[0]))
+    query_filter = _filter(filters)
+    try:
+        if len(vecs) == 1:
+            results = [client.search(collection_name=QDRANT_COLLECTION, query_vector=vecs[0], limit=limit,
+                                     query_filter=query_filter)]
+        else:
+            results = client.search_batch(
+                collection_name=QDRANT_COLLECTION,
+                requests=[qmodels.SearchRequest(vector=v, limit=limit, with_payload=True, filter=query_filter) for v in vecs],
+            )
+    except Exception:
+        forget_collection()
+        raise
+    return [_hits(res) for res in results]
+
+
 def index_knowledge_md(path: str = "docs/knowledge.md", chunk_size: int = 800, overlap: int = 120) -> int:
-    """Teilt knowledge.md in überlappende Chunks und speichert sie in Qdrant."""
+    """Teilt knowledge.md in überlappende Chunks und speichert geänderte Chunks in Qdrant."""
     if not os.path.exists(path):
         return 0
     with open(path, "r", encoding="utf-8") as f:
@@ -101,4 +295,5 @@ def index_knowledge_md(path: str = "docs/knowledge.md", chunk_size: int = 800, o
         chunks.append(chunk)
         i += max(1, chunk_size - overlap)
     meta = [{"source": path, "idx": idx} for idx in range(len(chunks))]
-    return upsert_texts(chunks, metadata=meta)
+    ids = [point_id("knowledge", path, idx) for idx in range(len(chunks))]
+    return upsert_texts(chunks, ids=ids, metadata=meta)
@@ -0,0 +1,14 @@
+-- UNIQUE-Key für Kontakte pro Nutzer, damit der Sync Kontakte gebündelt per
+-- INSERT ... ON DUPLICATE KEY UPDATE anlegen/hochzählen kann.
+-- Ohne diesen Key nutzt der Sync einen langsameren Fallback (SELECT + executemany).
+-- Run this on your production database
+
+-- 1) Vorher prüfen, ob Dubletten existieren (müssen vor Schritt 2 zusammengeführt werden):
+SELECT user_email, contact_email, COUNT(*) AS cnt
+FROM contacts
+GROUP BY user_email, contact_email
+HAVING cnt > 1;
+
+-- 2) UNIQUE-Key anlegen
+ALTER TABLE contacts
+ADD UNIQUE KEY uniq_contacts_user_contact_email (user_email, contact_email);
@@ -0,0 +1,21 @@
+-- Attachment-Metadaten (aus BODYSTRUCTURE bzw. beim Sync) für schnelle Anhangslisten/-downloads
+-- Run this on your production database (wird beim Sync auch automatisch versucht)
+
+CREATE TABLE IF NOT EXISTS email_attachments (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    email_id INT NOT NULL,
+    idx INT NOT NULL,
+    section VARCHAR(64) NOT NULL COMMENT 'IMAP-Section, z.B. 2 oder 1.3',
+    filename VARCHAR(512) NOT NULL,
+    content_type VARCHAR(255) NOT NULL,
+    encoding VARCHAR(32) NULL COMMENT 'Content-Transfer-Encoding',
+    size_bytes BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    size_exact TINYINT(1) NOT NULL DEFAULT 0 COMMENT '0 = aus BODYSTRUCTURE geschätzt',
+    content_id VARCHAR(255) NULL,
+    sha256 CHAR(64) NULL COMMENT 'Schlüssel im lokalen Blob-Cache',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_email_attachments (email_id, idx),
+    KEY idx_email_attachments_sha (sha256)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS attachments_indexed TINYINT(1) NOT NULL DEFAULT 0;
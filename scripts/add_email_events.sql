@@ -0,0 +1,14 @@
+-- Leichte Benachrichtigungen für das Frontend (/api/emails/events), z.B. nach IDLE-Sync
+-- Run this on your production database (wird vom Worker auch automatisch versucht)
+
+CREATE TABLE IF NOT EXISTS email_events (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_email VARCHAR(255) NOT NULL,
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL,
+    kind VARCHAR(32) NOT NULL COMMENT 'z.B. sync',
+    payload TEXT NULL COMMENT 'JSON, z.B. {"synced": 3, "flags_updated": 1}',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_email_events_user (user_email, id),
+    KEY idx_email_events_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,15 @@
+-- Semantischer Mail-Index (email_indexer.py): höchste indexierte emails.id pro Account
+-- Run this on your production database (wird vom Indexer auch automatisch versucht)
+
+CREATE TABLE IF NOT EXISTS email_index_state (
+    account_id INT NOT NULL PRIMARY KEY,
+    user_email VARCHAR(255) NOT NULL,
+    last_email_id BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'High-Water-Mark: höchste bereits eingebettete emails.id',
+    indexed_emails INT NOT NULL DEFAULT 0,
+    indexed_chunks INT NOT NULL DEFAULT 0,
+    last_error TEXT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Batches "account_id=? AND id>? ORDER BY id" ohne Sortierung über die ganze Tabelle
+CREATE INDEX IF NOT EXISTS idx_emails_account_id ON emails(account_id, id);
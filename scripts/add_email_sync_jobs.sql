@@ -0,0 +1,27 @@
+-- Hintergrund-Sync: Job-Queue für /api/emails/sync (siehe sync_worker.py)
+-- Run this on your production database (wird vom Worker auch automatisch versucht)
+
+CREATE TABLE IF NOT EXISTS email_sync_jobs (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_email VARCHAR(255) NOT NULL,
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL COMMENT 'IMAP-Ordnername, z.B. INBOX oder INBOX.Sent',
+    sync_limit INT NULL COMMENT 'max. neue Mails pro Lauf (NULL = alle)',
+    chunk_size INT NULL,
+    source VARCHAR(20) NOT NULL DEFAULT 'api' COMMENT 'api | schedule',
+    status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+    progress_done INT NOT NULL DEFAULT 0 COMMENT 'bereits verarbeitete UIDs',
+    progress_total INT NULL COMMENT 'UIDs in diesem Lauf',
+    synced INT NOT NULL DEFAULT 0 COMMENT 'neu gespeicherte Mails',
+    result TEXT NULL COMMENT 'JSON-Ergebnis (wie früher von /api/emails/sync)',
+    error TEXT NULL,
+    worker VARCHAR(128) NULL COMMENT 'host:pid:thread des ausführenden Workers',
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    heartbeat_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    KEY idx_email_sync_jobs_status (status, id),
+    KEY idx_email_sync_jobs_user (user_email, id),
+    KEY idx_email_sync_jobs_account_folder (account_id, folder, status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
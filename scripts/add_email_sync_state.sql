@@ -0,0 +1,40 @@
+-- Inkrementeller IMAP-Sync: UIDVALIDITY + höchste synchronisierte UID pro Account/Ordner
+-- Run this on your production database (wird vom Sync auch automatisch versucht)
+
+CREATE TABLE IF NOT EXISTS email_sync_state (
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL COMMENT 'IMAP-Ordnername, z.B. INBOX oder INBOX.Sent',
+    uidvalidity BIGINT UNSIGNED NOT NULL,
+    last_uid BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Höchste bereits synchronisierte UID',
+    uidnext BIGINT UNSIGNED NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, folder)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- IMAP-UID je gespeicherter Mail (gültig für die aktuelle UIDVALIDITY des Ordners)
+ALTER TABLE emails
+ADD COLUMN IF NOT EXISTS imap_uid BIGINT UNSIGNED NULL COMMENT 'IMAP UID im Ordner (NULL nach UIDVALIDITY-Wechsel)';
+
+-- Dedupe-Lookup im Sync (message_id + folder) und UID-basierte Zuordnung
+CREATE INDEX IF NOT EXISTS idx_emails_account_folder_msgid ON emails(account_id, folder, message_id(191));
+CREATE INDEX IF NOT EXISTS idx_emails_account_folder_uid ON emails(account_id, folder, imap_uid);
+
+-- CONDSTORE-Flag-Sync: zuletzt gesehene HIGHESTMODSEQ pro Ordner
+ALTER TABLE email_sync_state
+ADD COLUMN IF NOT EXISTS highestmodseq BIGINT UNSIGNED NULL COMMENT 'Letzte bekannte HIGHESTMODSEQ (CONDSTORE)';
+
+-- Low-Water-Mark: UIDs unterhalb werden noch nachgeladen (0 = Historie vollständig)
+ALTER TABLE email_sync_state
+ADD COLUMN IF NOT EXISTS backfill_uid BIGINT UNSIGNED NULL COMMENT 'Niedrigste synchronisierte UID, solange ältere fehlen; 0 = vollständig';
+
+-- Fehlversuche pro UID: nach MAX_UID_ATTEMPTS wird eine nicht parsebare Nachricht übersprungen
+CREATE TABLE IF NOT EXISTS email_sync_failures (
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL,
+    uidvalidity BIGINT UNSIGNED NOT NULL,
+    uid BIGINT UNSIGNED NOT NULL,
+    attempts INT NOT NULL DEFAULT 1,
+    last_error TEXT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, folder, uidvalidity, uid)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
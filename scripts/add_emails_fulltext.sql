@@ -0,0 +1,11 @@
+-- FULLTEXT-Indizes für /api/emails/search (email_search.py)
+-- Run this on your production database. Bei großen emails-Tabellen außerhalb der
+-- Hauptlast ausführen (InnoDB baut den Index online, braucht aber Zeit/Platz).
+-- Spaltenreihenfolge muss zu email_search.FULLTEXT_COLUMNS passen.
+
+ALTER TABLE emails
+    ADD FULLTEXT INDEX ft_emails_search (subject, from_name, from_addr, to_addrs, body_text);
+
+-- Treffer im Betreff werden beim Ranking höher gewichtet
+ALTER TABLE emails
+    ADD FULLTEXT INDEX ft_emails_subject (subject);
@@ -0,0 +1,10 @@
+-- Listenansicht ohne Bodies + Keyset-Pagination für /api/emails/list
+-- Run this on your production database (preview wird beim Sync auch automatisch angelegt)
+
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS preview VARCHAR(200) NULL;
+
+-- Vorschau für bereits synchronisierte Mails nachtragen (bei sehr großen Tabellen ggf. in Etappen)
+UPDATE emails SET preview = LEFT(body_text, 200) WHERE preview IS NULL;
+
+-- Keyset-Index: WHERE user_email, account_id, folder ORDER BY received_at DESC, id DESC
+ALTER TABLE emails ADD INDEX IF NOT EXISTS idx_emails_list_keyset (user_email, account_id, folder, received_at, id);
@@ -0,0 +1,19 @@
+-- Materialisierte Ordner-Zähler (Gesamt/ungelesen) für Listen-Totals und Ordner-Badges
+-- Run this on your production database (die Tabelle wird bei Bedarf auch automatisch angelegt)
+
+CREATE TABLE IF NOT EXISTS folder_stats (
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL,
+    total INT UNSIGNED NOT NULL DEFAULT 0,
+    unread INT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, folder)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Startwerte aus emails (ohne diesen Schritt zählt die App pro Account beim ersten Zugriff)
+INSERT INTO folder_stats (account_id, folder, total, unread)
+SELECT account_id, COALESCE(folder, ''), COUNT(*), COALESCE(SUM(is_read = 0), 0)
+FROM emails
+WHERE account_id IS NOT NULL
+GROUP BY account_id, COALESCE(folder, '')
+ON DUPLICATE KEY UPDATE total = VALUES(total), unread = VALUES(unread);
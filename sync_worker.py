@@ -0,0 +1,618 @@
+"""
+Hintergrund-Sync für E-Mails: Job-Queue in MySQL plus Worker.
+
+``/api/emails/sync`` legt nur noch einen Job in ``email_sync_jobs`` an; die
+eigentliche Arbeit (IMAP-Fetch, Parsen, Schreiben – siehe email_sync.sync_folder)
+erledigt ein Worker. Fortschritt (progress_done/progress_total/synced) wird pro
+Chunk in den Job geschrieben und ist über ``/api/emails/sync/jobs/<id>`` abrufbar.
+
+Pro (account_id, Ordner) gibt es höchstens einen wartenden und einen laufenden
+Job; ein weiterer Sync-Aufruf liefert den wartenden Job zurück. Läuft gerade ein
+Job, wird ein Folge-Job eingereiht (damit währenddessen eingetroffene Mails nicht
+verloren gehen), der erst nach dessen Ende startet. Jobs werden per
+``UPDATE ... WHERE status='queued'`` geclaimt, daher können mehrere Prozesse
+(gunicorn-Worker, separater Worker-Prozess) dieselbe Queue abarbeiten.
+
+Konfiguration über Env:
+- EMAIL_SYNC_WORKER            thread (Default) | process | off
+    thread:  jeder Web-Prozess startet beim ersten Job einen kleinen Thread-Pool
+    process: Web-Prozesse legen nur Jobs an, ausgeführt von ``python sync_worker.py``
+    off:     Job wird direkt im Request ausgeführt (altes Verhalten)
+- EMAIL_SYNC_WORKERS           Anzahl Worker-Threads (Default 2)
+- EMAIL_SYNC_POLL_SECONDS      Poll-Intervall der Queue (Default 2)
+- EMAIL_SYNC_STALE_SECONDS     running-Jobs ohne Heartbeat werden neu eingereiht (Default 600)
+- EMAIL_SYNC_SCHEDULE_MINUTES  >0: INBOX aller aktiven Accounts periodisch syncen (Default 0 = aus)
+
+Abgeschlossene Syncs mit Änderungen landen als leichte Benachrichtigung in
+``email_events``; das Frontend liest sie über ``/api/emails/events`` (SSE).
+Neue Mails stößt neben API und Scheduler vor allem der IDLE-Listener an
+(siehe imap_idle.py), der im selben Prozess wie der Worker läuft.
+
+Nach einem Sync mit neuen Mails wird der Account zum semantischen Indexieren
+angestellt (email_indexer, eigener Thread); die Wartungsschleife holt offene
+Accounts nach, z.B. nach einem Neustart.
+"""
+import os
+import json
+import socket
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+if __name__ == '__main__':
+    # Eigenständiger Worker: .env laden, bevor Module ihre Env-Defaults lesen
+    from dotenv import load_dotenv
+    load_dotenv()
+
+import email_indexer
+import email_sync
+from db_utils import get_settings_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+WORKER_THREADS = max(1, _env_int('EMAIL_SYNC_WORKERS', 2))
+POLL_SECONDS = max(1, _env_int('EMAIL_SYNC_POLL_SECONDS', 2))
+STALE_SECONDS = max(60, _env_int('EMAIL_SYNC_STALE_SECONDS', 600))
+SCHEDULE_MINUTES = max(0, _env_int('EMAIL_SYNC_SCHEDULE_MINUTES', 0))
+MAX_ATTEMPTS = 3
+
+JOBS_DDL = """
+CREATE TABLE IF NOT EXISTS email_sync_jobs (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_email VARCHAR(255) NOT NULL,
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL,
+    sync_limit INT NULL,
+    chunk_size INT NULL,
+    source VARCHAR(20) NOT NULL DEFAULT 'api',
+    status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+    progress_done INT NOT NULL DEFAULT 0,
+    progress_total INT NULL,
+    synced INT NOT NULL DEFAULT 0,
+    result TEXT NULL,
+    error TEXT NULL,
+    worker VARCHAR(128) NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    heartbeat_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    KEY idx_email_sync_jobs_status (status, id),
+    KEY idx_email_sync_jobs_user (user_email, id),
+    KEY idx_email_sync_jobs_account_folder (account_id, folder, status)
+)
+"""
+
+EVENTS_DDL = """
+CREATE TABLE IF NOT EXISTS email_events (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_email VARCHAR(255) NOT NULL,
+    account_id INT NOT NULL,
+    folder VARCHAR(255) NOT NULL,
+    kind VARCHAR(32) NOT NULL,
+    payload TEXT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_email_events_user (user_email, id),
+    KEY idx_email_events_created (created_at)
+)
+"""
+EVENTS_RETENTION_HOURS = 24
+
+_SCHEMA_READY = False
+_SCHEMA_LOCK = threading.Lock()
+
+
+def ensure_jobs_schema(cursor) -> None:
+    """Legt email_sync_jobs und email_events an (einmal pro Prozess, Best Effort)."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if _SCHEMA_READY:
+            return
+        try:
+            cursor.execute(JOBS_DDL)
+        except Exception as e:
+            logger.warning(f"[SyncJobs] DDL email_sync_jobs fehlgeschlagen (ignoriert): {e}")
+        try:
+            cursor.execute(EVENTS_DDL)
+        except Exception as e:
+            logger.warning(f"[SyncJobs] DDL email_events fehlgeschlagen (ignoriert): {e}")
+        _SCHEMA_READY = True
+
+
+def worker_mode() -> str:
+    mode = (os.environ.get('EMAIL_SYNC_WORKER') or 'thread').strip().lower()
+    return mode if mode in ('thread', 'process', 'off') else 'thread'
+
+
+# --- Job-Zugriff -------------------------------------------------------------
+
+_JOB_COLUMNS = (
+    "id, user_email, account_id, folder, sync_limit, chunk_size, source, status, progress_done, "
+    "progress_total, synced, result, error, attempts, created_at, started_at, heartbeat_at, finished_at"
+)
+
+
+def _fmt_dt(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def job_to_dict(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Job-Zeile in die JSON-Form der API umwandeln."""
+    total = row.get('progress_total')
+    done = row.get('progress_done') or 0
+    result = None
+    if row.get('result'):
+        try:
+            result = json.loads(row['result'])
+        except Exception:
+            result = None
+    return {
+        'id': row['id'],
+        'account_id': row['account_id'],
+        'folder': row['folder'],
+        'source': row.get('source'),
+        'status': row['status'],
+        'progress': {
+            'done': done,
+            'total': total,
+            'percent': (round(done * 100 / total) if total else (100 if row['status'] == 'done' else 0)),
+        },
+        'synced': row.get('synced') or 0,
+        'result': result,
+        'error': row.get('error'),
+        'attempts': row.get('attempts') or 0,
+        'created_at': _fmt_dt(row.get('created_at')),
+        'started_at': _fmt_dt(row.get('started_at')),
+        'finished_at': _fmt_dt(row.get('finished_at')),
+    }
+
+
+def enqueue_job(user_email: str, account_id: int, folder_imap: str, limit: Optional[int] = None,
+                chunk_size: Optional[int] = None, source: str = 'api') -> Tuple[Dict[str, Any], bool]:
+    """Legt einen Sync-Job an; wartet für Account/Ordner schon ein Job, wird dieser geliefert.
+
+    Rückgabe: (Job-Zeile, neu angelegt?)
+    """
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    lock_name = f"email_sync_enqueue:{account_id}"
+    got_lock = False
+    try:
+        ensure_jobs_schema(cursor)
+        # Named Lock statt UNIQUE-Key: "höchstens ein wartender Job" gilt nur für status='queued'
+        cursor.execute("SELECT GET_LOCK(%s, 5) AS got", (lock_name,))
+        got_lock = bool((cursor.fetchone() or {}).get('got'))
+        cursor.execute(
+            f"SELECT {_JOB_COLUMNS} FROM email_sync_jobs "
+            "WHERE user_email=%s AND account_id=%s AND folder=%s AND status='queued' ORDER BY id DESC LIMIT 1",
+            (user_email, account_id, folder_imap),
+        )
+        existing = cursor.fetchone()
+        if existing:
+            return existing, False
+        cursor.execute(
+            "INSERT INTO email_sync_jobs (user_email, account_id, folder, sync_limit, chunk_size, source) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (user_email, account_id, folder_imap, limit, chunk_size, source),
+        )
+        job_id = cursor.lastrowid
+        conn.commit()
+        cursor.execute(f"SELECT {_JOB_COLUMNS} FROM email_sync_jobs WHERE id=%s", (job_id,))
+        job = cursor.fetchone()
+    finally:
+        if got_lock:
+            try:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                cursor.fetchall()
+            except Exception:
+                pass
+        cursor.close()
+        conn.close()
+    _WAKE.set()
+    return job, True
+
+
+def get_job(job_id: int, user_email: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        ensure_jobs_schema(cursor)
+        if user_email is None:
+            cursor.execute(f"SELECT {_JOB_COLUMNS} FROM email_sync_jobs WHERE id=%s", (job_id,))
+        else:
+            cursor.execute(f"SELECT {_JOB_COLUMNS} FROM email_sync_jobs WHERE id=%s AND user_email=%s", (job_id, user_email))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def list_jobs(user_email: str, account_id: Optional[int] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        ensure_jobs_schema(cursor)
+        sql = f"SELECT {_JOB_COLUMNS} FROM email_sync_jobs WHERE user_email=%s"
+        params: List[Any] = [user_email]
+        if account_id:
+            sql += " AND account_id=%s"
+            params.append(account_id)
+        sql += " ORDER BY id DESC LIMIT %s"
+        params.append(max(1, min(int(limit), 100)))
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _update_job(job_id: int, assignments: str, params: tuple = ()) -> None:
+    conn = get_settings_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"UPDATE email_sync_jobs SET {assignments} WHERE id=%s", (*params, job_id))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def claim_job(worker_id: str, job_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Nimmt den ältesten (bzw. den angegebenen) queued-Job atomar in Arbeit."""
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        ensure_jobs_schema(cursor)
+        if job_id is not None:
+            candidates = [job_id]
+        else:
+            # Jobs, deren Ordner gerade von einem anderen Job synchronisiert wird, warten lassen
+            cursor.execute(
+                "SELECT q.id FROM email_sync_jobs q WHERE q.status='queued' AND NOT EXISTS ("
+                "SELECT 1 FROM email_sync_jobs r WHERE r.status='running' AND r.account_id=q.account_id AND r.folder=q.folder"
+                ") ORDER BY q.id ASC LIMIT 10"
+            )
+            candidates = [r['id'] for r in cursor.fetchall()]
+        for cid in candidates:
+            cursor.execute(
+                "UPDATE email_sync_jobs SET status='running', worker=%s, attempts=attempts+1, "
+                "started_at=NOW(), heartbeat_at=NOW(), error=NULL WHERE id=%s AND status='queued'",
+                (worker_id, cid),
+            )
+            if cursor.rowcount == 1:
+                conn.commit()
+                cursor.execute(f"SELECT {_JOB_COLUMNS} FROM email_sync_jobs WHERE id=%s", (cid,))
+                return cursor.fetchone()
+        conn.commit()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def requeue_stale_jobs() -> int:
+    """running-Jobs ohne Heartbeat (abgestürzter Worker) erneut einreihen bzw. aufgeben."""
+    conn = get_settings_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_jobs_schema(cursor)
+        cursor.execute(
+            "UPDATE email_sync_jobs SET status=IF(attempts >= %s, 'failed', 'queued'), "
+            "error=IF(attempts >= %s, 'Worker-Timeout', error), "
+            "finished_at=IF(attempts >= %s, NOW(), finished_at) "
+            "WHERE status='running' AND heartbeat_at < NOW() - INTERVAL %s SECOND",
+            (MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS, STALE_SECONDS),
+        )
+        count = cursor.rowcount
+        conn.commit()
+        if count:
+            logger.warning(f"[SyncJobs] {count} hängende Job(s) zurückgesetzt")
+        return count
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def schedule_due_accounts() -> int:
+    """Periodischer Sync: INBOX aller aktiven Accounts, deren letzter Job älter als das Intervall ist."""
+    if SCHEDULE_MINUTES <= 0:
+        return 0
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        ensure_jobs_schema(cursor)
+        cursor.execute(
+            "SELECT a.id, a.user_email FROM email_accounts a "
+            "WHERE a.is_active=1 AND a.imap_host IS NOT NULL AND a.imap_host <> '' "
+            "AND NOT EXISTS (SELECT 1 FROM email_sync_jobs j WHERE j.account_id=a.id AND j.folder='INBOX' "
+            "AND j.created_at > NOW() - INTERVAL %s MINUTE)",
+            (SCHEDULE_MINUTES,),
+        )
+        due = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    created = 0
+    for acc in due:
+        try:
+            _, is_new = enqueue_job(acc['user_email'], acc['id'], 'INBOX', source='schedule')
+            created += int(is_new)
+        except Exception as e:
+            logger.warning(f"[SyncJobs] Planung für account={acc['id']} fehlgeschlagen: {e}")
+    return created
+
+
+# --- Benachrichtigungen ------------------------------------------------------
+
+def record_event(user_email: str, account_id: int, folder: str, kind: str, payload: Optional[Dict[str, Any]] = None) -> None:
+    conn = get_settings_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_jobs_schema(cursor)
+        cursor.execute(
+            "INSERT INTO email_events (user_email, account_id, folder, kind, payload) VALUES (%s, %s, %s, %s, %s)",
+            (user_email, account_id, folder, kind, json.dumps(payload or {}, default=str)),
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def latest_event_id(user_email: str) -> int:
+    conn = get_settings_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_jobs_schema(cursor)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM email_events WHERE user_email=%s", (user_email,))
+        return int(cursor.fetchone()[0] or 0)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def fetch_events(user_email: str, since_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+    """Benachrichtigungen des Users mit id > since_id (älteste zuerst)."""
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT id, account_id, folder, kind, payload, created_at FROM email_events "
+            "WHERE user_email=%s AND id>%s ORDER BY id ASC LIMIT %s",
+            (user_email, since_id, limit),
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    events = []
+    for r in rows:
+        try:
+            payload = json.loads(r['payload']) if r.get('payload') else {}
+        except Exception:
+            payload = {}
+        events.append({
+            'id': r['id'], 'account_id': r['account_id'], 'folder': r['folder'], 'kind': r['kind'],
+            'created_at': _fmt_dt(r.get('created_at')), **payload,
+        })
+    return events
+
+
+def purge_old_events() -> None:
+    conn = get_settings_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_jobs_schema(cursor)
+        cursor.execute("DELETE FROM email_events WHERE created_at < NOW() - INTERVAL %s HOUR", (EVENTS_RETENTION_HOURS,))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# --- Ausführung --------------------------------------------------------------
+
+def _load_account(user_email: str, account_id: int) -> Optional[Dict[str, Any]]:
+    conn = get_settings_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT id, imap_host, imap_port, imap_user, imap_pass_encrypted, imap_security "
+            "FROM email_accounts WHERE user_email=%s AND id=%s AND is_active=1",
+            (user_email, account_id),
+        )
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def run_job(job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Führt einen geclaimten Job aus und schreibt Ergebnis bzw. Fehler in die Job-Zeile."""
+    job_id = job['id']
+
+    def _progress(done: int, total: int, synced: int) -> None:
+        try:
+            _update_job(job_id, "progress_done=%s, progress_total=%s, synced=%s, heartbeat_at=NOW()", (done, total, synced))
+        except Exception as e:
+            logger.warning(f"[SyncJobs] Fortschritt für Job {job_id} nicht gespeichert: {e}")
+
+    M = None
+    conn_db = None
+    try:
+        settings = _load_account(job['user_email'], job['account_id'])
+        if not settings or not settings.get('imap_host'):
+            raise RuntimeError('IMAP settings not configured')
+        folder_imap, folder_db = email_sync.resolve_sync_folder(job['folder'])
+        M = email_sync.connect_account(settings)
+        sel_data = email_sync.select_folder(M, folder_imap)
+        mbox_status = email_sync.mailbox_status(M, folder_imap, sel_data)
+        conn_db = get_settings_db_connection()
+        result = email_sync.sync_folder(
+            M, conn_db, job['user_email'], job['account_id'], folder_imap, folder_db, mbox_status,
+            limit=job.get('sync_limit'), chunk_size=job.get('chunk_size'), progress_cb=_progress,
+        )
+        _update_job(
+            job_id,
+            "status='done', synced=%s, result=%s, finished_at=NOW(), heartbeat_at=NOW()",
+            (result['synced'], json.dumps(result, default=str)),
+        )
+        logger.info(f"[SyncJobs] Job {job_id} fertig: account={job['account_id']} folder={folder_imap!r} synced={result['synced']}")
+        flags_updated = (result.get('flags') or {}).get('updated') or 0
+        if result['synced'] or flags_updated:
+            try:
+                record_event(job['user_email'], job['account_id'], folder_imap, 'sync', {
+                    'job_id': job_id, 'folder_db': folder_db, 'synced': result['synced'], 'flags_updated': flags_updated,
+                })
+            except Exception as e:
+                logger.warning(f"[SyncJobs] Benachrichtigung für Job {job_id} nicht gespeichert: {e}")
+        if result['synced']:
+            # Embeddings im eigenen Thread: der Sync-Worker wartet nicht auf die Embedding-API
+            email_indexer.schedule(job['user_email'], job['account_id'])
+        return result
+    except Exception as e:
+        logger.error(f"[SyncJobs] Job {job_id} fehlgeschlagen: {e}")
+        try:
+            _update_job(job_id, "status='failed', error=%s, finished_at=NOW()", (str(e)[:2000],))
+        except Exception as e2:
+            logger.error(f"[SyncJobs] Status für Job {job_id} nicht gespeichert: {e2}")
+        return None
+    finally:
+        if conn_db is not None:
+            conn_db.close()
+        if M is not None:
+            try:
+                M.close()
+            except Exception:
+                pass
+            try:
+                M.logout()
+            except Exception:
+                pass
+
+
+def run_inline(job_id: int) -> Optional[Dict[str, Any]]:
+    """EMAIL_SYNC_WORKER=off: Job direkt im aktuellen Request ausführen."""
+    job = claim_job(_worker_id('inline'), job_id=job_id)
+    if job is not None:
+        run_job(job)
+    return get_job(job_id)
+
+
+# --- Worker ------------------------------------------------------------------
+
+_WAKE = threading.Event()
+
+
+def _worker_id(suffix: str) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{suffix}"[:128]
+
+
+class SyncWorker:
+    """Thread-Pool, der die Job-Queue abarbeitet; ein Thread kümmert sich um Wartung/Planung.
+
+    Zusätzlich wird der IDLE-Listener (imap_idle) gestartet, damit neue Mails
+    ohne Polling als Job eingereiht werden.
+    """
+
+    def __init__(self, threads: int = WORKER_THREADS):
+        self.threads = threads
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.threads):
+            t = threading.Thread(target=self._work_loop, args=(i,), name=f"email-sync-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._maintenance_loop, name="email-sync-maint", daemon=True)
+        t.start()
+        self._threads.append(t)
+        import imap_idle
+        self._idle = imap_idle.IdleManager() if imap_idle.IDLE_ENABLED else None
+        if self._idle is not None:
+            self._idle.start()
+        logger.info(f"[SyncJobs] Worker gestartet ({self.threads} Threads, pid={os.getpid()})")
+
+    def stop(self) -> None:
+        self._stop.set()
+        _WAKE.set()
+        if getattr(self, '_idle', None) is not None:
+            self._idle.stop()
+
+    def join(self) -> None:
+        for t in self._threads:
+            t.join()
+
+    def _work_loop(self, idx: int) -> None:
+        worker_id = _worker_id(f"t{idx}")
+        while not self._stop.is_set():
+            try:
+                job = claim_job(worker_id)
+            except Exception as e:
+                logger.error(f"[SyncJobs] Queue nicht lesbar: {e}")
+                job = None
+            if job is None:
+                _WAKE.wait(POLL_SECONDS)
+                _WAKE.clear()
+                continue
+            run_job(job)
+
+    def _maintenance_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                requeue_stale_jobs()
+                purge_old_events()
+                if schedule_due_accounts():
+                    _WAKE.set()
+            except Exception as e:
+                logger.error(f"[SyncJobs] Wartung fehlgeschlagen: {e}")
+            try:
+                email_indexer.schedule_pending()
+            except Exception as e:
+                logger.error(f"[EmailIndex] Nachholen fehlgeschlagen: {e}")
+            self._stop.wait(60)
+
+
+_WORKER: Optional[SyncWorker] = None
+_WORKER_PID: Optional[int] = None
+_WORKER_LOCK = threading.Lock()
+
+
+def ensure_started() -> None:
+    """Startet im Modus 'thread' einmal pro Prozess den Worker (auch nach fork)."""
+    global _WORKER, _WORKER_PID
+    if worker_mode() != 'thread':
+        return
+    with _WORKER_LOCK:
+        if _WORKER is not None and _WORKER_PID == os.getpid():
+            return
+        _WORKER = SyncWorker()
+        _WORKER_PID = os.getpid()
+        _WORKER.start()
+
+
+def main() -> None:
+    """Eigenständiger Worker-Prozess: ``python sync_worker.py``."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    worker = SyncWorker()
+    worker.start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,3 +9,15 @@ def test_get_db_connection():
         conn.close()
     except Exception as e:
         pytest.fail(f"get_db_connection() schlägt fehl: {e}")
+
+def test_get_db_connection_reuses_pooled_connection():
+    """Nach close() wird dieselbe Verbindung aus dem Pool wiederverwendet."""
+    conn = get_db_connection()
+    first_id = conn.connection_id
+    conn.close()
+    conn = get_db_connection()
+    try:
+        assert conn.is_connected()
+        assert conn.connection_id == first_id
+    finally:
+        conn.close()
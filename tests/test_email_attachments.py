@@ -0,0 +1,94 @@
+import os
+import email
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import email_attachments
+
+
+def _sample_message():
+    msg = MIMEMultipart('mixed')
+    alt = MIMEMultipart('alternative')
+    alt.attach(MIMEText('Hallo', 'plain'))
+    alt.attach(MIMEText('<p>Hallo</p>', 'html'))
+    msg.attach(alt)
+    pdf = MIMEApplication(b'%PDF-1.4 ' + b'x' * 500, 'pdf')
+    pdf.add_header('Content-Disposition', 'attachment', filename=('utf-8', '', 'Rechnung März.pdf'))
+    msg.attach(pdf)
+    return email.message_from_bytes(msg.as_bytes())
+
+
+def test_bodystructure_matches_sync_metadata():
+    # Antwort wie von imaplib geliefert (RFC-2231-Dateiname, Erweiterungsdaten des Multiparts als Liste)
+    data = [
+        b'1 (UID 42 BODYSTRUCTURE ((("TEXT" "PLAIN" ("CHARSET" "us-ascii") NIL NIL "7BIT" 5 1 NIL NIL NIL NIL)'
+        b'("TEXT" "HTML" ("CHARSET" "us-ascii") NIL NIL "7BIT" 12 1 NIL NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "a") NIL NIL NIL)'
+        b'("APPLICATION" "PDF" NIL NIL NIL "BASE64" 702 NIL ("ATTACHMENT" ("FILENAME*" "utf-8\'\'Rechnung%20M%C3%A4rz.pdf")) NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "b") NIL NIL NIL))'
+    ]
+    from_imap = email_attachments.parse_bodystructure_response(data)
+    from_sync = email_attachments.attachments_from_message(_sample_message())
+
+    assert [(a['idx'], a['section'], a['filename'], a['content_type']) for a in from_imap] == [
+        (0, '2', 'Rechnung März.pdf', 'application/pdf')
+    ]
+    assert [(a['idx'], a['section'], a['filename'], a['content_type']) for a in from_sync] == [
+        (a['idx'], a['section'], a['filename'], a['content_type']) for a in from_imap
+    ]
+    assert from_sync[0]['size'] == 509 and from_sync[0]['size_exact']
+    assert abs(from_imap[0]['size'] - 509) < 10
+
+
+def test_bodystructure_with_literal_filename():
+    data = [(b'1 (UID 7 BODYSTRUCTURE ("IMAGE" "PNG" ("NAME" {9}', b'Foto .png'), b' NIL NIL "BASE64" 100 NIL NIL NIL NIL))']
+    atts = email_attachments.parse_bodystructure_response(data)
+    assert atts[0]['section'] == '1'
+    assert atts[0]['filename'] == 'Foto .png'
+
+
+def test_blob_store_evicts_least_recently_used(tmp_path):
+    store = email_attachments.BlobStore(str(tmp_path), max_bytes=250)
+    first = store.put(b'a' * 100)
+    second = store.put(b'b' * 100)
+    # first zuletzt benutzt -> second ist der älteste Eintrag
+    os.utime(store.path(second), (1, 1))
+    assert store.get(first)
+    store.put(b'c' * 100)
+
+    assert store.get(first)
+    assert store.get(second) is None
+    assert email_attachments.decode_section(b'SGFs\r\nbG8=\r\n', 'base64') == b'Hallo'
+
+
+class FakeSectionIMAP:
+    """Beantwortet ``UID FETCH <uid> (BODY.PEEK[<section>]<o.l>)`` aus einem festen Inhalt."""
+
+    def __init__(self, body):
+        self.body = body
+        self.fetches = []
+
+    def uid(self, command, uid, items):
+        offset, length = (int(x) for x in items.split('<', 1)[1].rstrip('>)').split('.'))
+        self.fetches.append((offset, length))
+        part = self.body[offset:offset + length]
+        return 'OK', [(f'1 (UID {uid} BODY[2]<{offset}> {{{len(part)}}}'.encode(), part), b')']
+
+
+def test_iter_section_streams_partial_fetches():
+    import base64
+    import binascii
+
+    payload = bytes(range(256)) * 40
+    for encoding, encoded in (
+        ('base64', base64.encodebytes(payload)),
+        ('quoted-printable', binascii.b2a_qp(payload)),
+    ):
+        M = FakeSectionIMAP(encoded)
+        first = email_attachments.fetch_section_range(M, 5, '2', 0, 1000)
+        fetch = lambda offset, length: email_attachments.fetch_section_range(M, 5, '2', offset, length)  # noqa: E731
+        chunks = list(email_attachments.iter_section(fetch, encoding, first, chunk_size=1000))
+
+        assert b''.join(chunks) == payload
+        assert len(M.fetches) == len(encoded) // 1000 + 1
+        assert max(len(c) for c in chunks) <= 1000
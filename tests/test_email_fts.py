@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import email_fts
+import email_search
+
+
+class FallbackBackend:
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, *args, **kwargs):
+        self.calls += 1
+        return email_search.SearchResult([], 0, False, 'mysql')
+
+
+class FakeMySQLCursor:
+    """Liefert die emails-Zeilen für rebuild_account seitenweise (Keyset über id)."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    def execute(self, sql, params):
+        _body_chars, _account_id, last_id, limit = params
+        self.result = [r for r in self.rows if r[0] > last_id][:limit]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeMySQL:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return FakeMySQLCursor(self.rows)
+
+
+ROWS = [
+    (1, 'Rechnung März', 'Max Müller', 'max@firma.de', 'info@neckattack.net', 'Anbei die Rechnung.', 'inbox', datetime(2024, 3, 1)),
+    (2, 'Termin', 'Erika Mueller', 'erika@beispiel.de', 'info@neckattack.net', 'Rechnung folgt separat', 'inbox', datetime(2024, 3, 2)),
+    (3, 'Angebot Straße', 'Hans', 'hans@firma.de', 'info@neckattack.net', 'Kein Bezug', 'sent', datetime(2024, 3, 3)),
+]
+
+
+def test_fts_search_with_umlaut_folding_fields_and_ranking(tmp_path, monkeypatch):
+    monkeypatch.setenv('EMAIL_SEARCH_FTS_DIR', str(tmp_path))
+    fallback = FallbackBackend()
+    backend = email_fts.SqliteFtsSearch(fallback=fallback)
+
+    # Ohne Rebuild: MySQL-Fallback
+    backend.search(None, 'u@x.de', 5, 'all', 'rechnung')
+    assert fallback.calls == 1
+
+    assert email_fts.rebuild_account(FakeMySQL(ROWS), 5) == 3
+
+    def ids(q, folder='all'):
+        return backend.search(None, 'u@x.de', 5, folder, q).ids
+
+    # Betreff-Treffer vor Body-Treffer
+    assert ids('rechnung') == [1, 2]
+    # Umlaut-Faltung in beide Richtungen
+    assert sorted(ids('mueller')) == [1, 2]
+    assert sorted(ids('müller')) == [1, 2]
+    assert ids('strasse') == [3]
+    # Feldfilter, Präfix, Ausschluss, Ordner
+    assert ids('from:erika') == [2]
+    assert ids('subject:rech') == [1]
+    assert ids('rechnung -termin') == [1]
+    assert ids('firma', folder='sent') == [3]
+    assert fallback.calls == 1
+
+
+def test_sync_rows_are_indexed_incrementally(tmp_path, monkeypatch):
+    monkeypatch.setenv('EMAIL_SEARCH_FTS_DIR', str(tmp_path))
+    backend = email_fts.SqliteFtsSearch(fallback=FallbackBackend())
+    email_fts.rebuild_account(FakeMySQL([]), 9)
+
+    backend.index_emails('u@x.de', 9, 'inbox', [(42, {
+        'subject': 'Neue Buchung', 'from_name': 'Jörg', 'from_email': 'joerg@x.de',
+        'to_addrs': 'info@neckattack.net', 'body_text': 'Hallo', 'received_at': datetime(2024, 1, 1),
+    })])
+    assert backend.search(None, 'u@x.de', 9, 'inbox', 'buchung').ids == [42]
+
+    backend.move_email(9, 42, 'archive')
+    assert backend.search(None, 'u@x.de', 9, 'inbox', 'buchung').ids == []
+    assert backend.search(None, 'u@x.de', 9, 'archive', 'from:jörg').ids == [42]
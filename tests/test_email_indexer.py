@@ -0,0 +1,119 @@
+import sys
+import types
+from datetime import datetime
+
+import pytest
+
+import email_indexer
+
+
+class FakeDB:
+    """Mini-MySQL für emails/email_index_state: Verbindung und Cursor in einem."""
+
+    def __init__(self, emails):
+        self.emails = emails
+        self.mark = 0
+        self.commits = 0
+        self._result = []
+
+    def execute(self, sql, params=None):
+        if sql.startswith('SELECT last_email_id'):
+            self._result = [{'last_email_id': self.mark}]
+        elif sql.startswith('SELECT id, user_email'):
+            account_id, after_id, *skip, limit = params
+            self._result = [e for e in self.emails if e['account_id'] == account_id and e['id'] > after_id
+                            and e.get('folder', 'inbox') not in skip][:limit]
+        elif sql.startswith('INSERT INTO email_index_state'):
+            self.mark = max(self.mark, params[2])
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+    def commit(self):
+        self.commits += 1
+
+
+def _mail(email_id, **kw):
+    row = {'id': email_id, 'account_id': 3, 'user_email': 'u@x', 'contact_id': 42, 'from_addr': 'k@y',
+           'subject': f'Mail {email_id}', 'body_text': '', 'body_html': '', 'received_at': datetime(2024, 5, 1, 9, 30)}
+    row.update(kw)
+    return row
+
+
+def test_chunks_strip_html_and_overlap():
+    html = '<html><style>p{color:red}</style><p>Hallo&nbsp;Anna,</p><div>Termin am <b>Montag</b>?</div></html>'
+    assert email_indexer.email_text({'body_html': html}) == 'Hallo\xa0Anna,\nTermin am Montag?'
+
+    text = ' '.join(f'wort{i}' for i in range(200))
+    chunks = email_indexer.chunk_text(text, size=300, overlap=50)
+    assert all(len(c) <= 300 for c in chunks)
+    assert chunks[0].split()[-1] in chunks[1]                # Überlappung
+    assert chunks[-1].endswith('wort199')
+    assert not any(c.startswith('ort') for c in chunks)      # Schnitt an Wortgrenzen
+    assert len(email_indexer.chunk_text(text, size=300, overlap=50, max_chunks=2)) == 2
+
+
+def test_index_resumes_from_high_water_mark(monkeypatch):
+    db = FakeDB([_mail(i, body_text=f'Inhalt {i}') for i in range(1, 6)] + [_mail(9, account_id=4)])
+    upserts, deletes = [], []
+
+    def fake_upsert(texts, ids, meta):
+        upserts.append((texts, ids, meta))
+        if len(upserts) == 2:
+            raise RuntimeError('Qdrant weg')
+        return len(texts)
+
+    monkeypatch.setattr(email_indexer, 'BATCH_SIZE', 2)
+    monkeypatch.setattr(email_indexer, '_upsert', fake_upsert)
+    monkeypatch.setattr(email_indexer, '_delete', lambda filters, any_of=None: deletes.append((filters, any_of)))
+    with pytest.raises(RuntimeError):
+        email_indexer.index_batches(db, db, 'u@x', 3)
+    # Erster Batch gespeichert, zweiter fehlgeschlagen -> Marke bleibt bei 2
+    assert db.mark == 2 and db.commits == 1
+    texts, ids, meta = upserts[0]
+    assert texts[0] == 'Betreff: Mail 1\n\nInhalt 1'
+    assert ids[1] == ('u@x', 'email', 2, 'chunk', 0)
+    assert meta[0]['contact_id'] == 42 and meta[0]['account_id'] == 3
+    assert meta[0]['received_at'] == '2024-05-01T09:30:00' and isinstance(meta[0]['received_ts'], int)
+
+    stats = email_indexer.index_batches(db, db, 'u@x', 3, max_emails=2)
+    assert (stats['emails'], stats['last_email_id'], stats['more']) == (2, 4, True)
+    stats = email_indexer.index_batches(db, db, 'u@x', 3)
+    assert (stats['emails'], stats['last_email_id'], stats['more']) == (1, 5, False)
+    assert [m['email_id'] for _, _, meta in upserts[2:] for m in meta] == [3, 4, 5]
+
+
+def test_reindex_deletes_surplus_chunks_and_skips_trash(monkeypatch):
+    long_text = ' '.join(f'wort{i}' for i in range(600))
+    db = FakeDB([_mail(1, body_text=long_text), _mail(2, body_text='kurz'), _mail(3, folder='trash', body_text='weg')])
+    upserts, deletes = [], []
+    monkeypatch.setattr(email_indexer, '_upsert', lambda texts, ids, meta: upserts.append(ids) or len(texts))
+    monkeypatch.setattr(email_indexer, '_delete', lambda filters, any_of=None: deletes.append((filters, any_of)))
+
+    stats = email_indexer.index_batches(db, db, 'u@x', 3)
+    assert stats['emails'] == 2 and {parts[2] for parts in upserts[0]} == {1, 2}
+    chunks = sum(1 for parts in upserts[0] if parts[2] == 1)
+    assert chunks > 1
+    # Alles ab der neuen Chunk-Anzahl wird gelöscht (war die Mail früher länger, verschwinden die alten Chunks)
+    assert deletes == [({'user_email': 'u@x'}, [{'email_id': 1, 'chunk': {'gte': chunks}},
+                                                {'email_id': 2, 'chunk': {'gte': 1}}])]
+
+    monkeypatch.setattr(email_indexer, 'enabled', lambda: True)
+    email_indexer.email_moved('u@x', 3, 2, 'inbox', 'archive')      # kein Papierkorb beteiligt
+    email_indexer.email_moved('u@x', 3, 2, 'inbox', 'trash')
+    assert deletes[1:] == [({'user_email': 'u@x', 'email_id': 2}, None)]
+
+
+def test_search_is_scoped_to_user_and_indexer_points(monkeypatch):
+    calls = []
+    fake_store = types.SimpleNamespace(similarity_search=lambda query, limit, filters: calls.append(filters) or [])
+    monkeypatch.setitem(sys.modules, 'qdrant_store', fake_store)
+
+    email_indexer.search('u@x', 'Rechnung', contact_id=42)
+    email_indexer.search('u@x', 'Rechnung', contact_id=42, source='email_snippet')
+    assert [(f['user_email'], f['source'], f['contact_id']) for f in calls] == [('u@x', 'email', 42), ('u@x', 'email_snippet', 42)]
+    with pytest.raises(ValueError):
+        email_indexer.search('', 'Rechnung')
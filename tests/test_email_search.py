@@ -0,0 +1,62 @@
+import email_search
+
+
+def test_parse_query_builds_boolean_mode_expression():
+    parsed = email_search.parse_query('rechnung "neckattack gmbh" max@firma.de -spam mär')
+    expr, short = email_search.to_boolean_mode(parsed, min_token=3)
+
+    assert expr == '+rechnung +mär* +"neckattack gmbh" +"max firma.de" -spam'
+    assert short == []
+
+
+def test_short_words_are_filtered_separately():
+    parsed = email_search.parse_query('ab rechnung')
+    expr, short = email_search.to_boolean_mode(parsed, min_token=3)
+    assert expr == '+rechnung*'
+    assert short == ['ab']
+
+    expr, short = email_search.to_boolean_mode(email_search.parse_query('ab'), min_token=3)
+    assert expr is None and short == ['ab']
+
+
+class FakeCursor:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.queries = []
+
+    def execute(self, sql, params=None):
+        self.queries.append((sql, params))
+        result = self.responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        self.result = result
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0]
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, dictionary=False):
+        return self._cursor
+
+
+def test_missing_fulltext_index_falls_back_to_like():
+    missing = Exception('Can\'t find FULLTEXT index matching the column list')
+    missing.errno = email_search.ER_FT_MATCHING_KEY_NOT_FOUND
+    cursor = FakeCursor([missing, [{'id': 7}], [{'total': 1}]])
+    backend = email_search.MySQLFulltextSearch()
+
+    result = backend.search(FakeConn(cursor), 'u@x.de', 1, 'inbox', 'rechnung')
+
+    assert result.ids == [7] and result.total == 1 and result.engine == 'like'
+    assert 'LIKE' in cursor.queries[1][0] and 'MATCH' not in cursor.queries[1][0]
+    assert backend.fulltext_available is False
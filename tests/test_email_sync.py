@@ -0,0 +1,287 @@
+import email_sync
+
+
+class FakeIMAP:
+    """Minimaler IMAP-Stub: beantwortet UID SEARCH/FETCH mit festen Daten."""
+
+    def __init__(self, uids, flags=None, capabilities=()):
+        self.uids = uids
+        self.flags = flags or {}
+        self.capabilities = capabilities
+        self.commands = []
+
+    def uid(self, command, *args):
+        self.commands.append((command,) + args)
+        if command == 'search':
+            crit = args[-1]
+            if crit == 'ALL':
+                found = self.uids
+            else:
+                start, end = crit.split()[1].split(':')
+                if end == '*':
+                    # RFC 3501: "n:*" enthält immer die höchste UID
+                    found = [u for u in self.uids if u >= int(start)] or self.uids[-1:]
+                else:
+                    found = [u for u in self.uids if int(start) <= u <= int(end)]
+            return 'OK', [' '.join(str(u) for u in found).encode()]
+        if command == 'fetch':
+            lines = []
+            for i, u in enumerate(self.uids, 1):
+                lines.append(f'{i} (UID {u} FLAGS ({self.flags.get(u, "")}) MODSEQ ({100 + u}))'.encode())
+            return 'OK', lines
+        raise AssertionError(command)
+
+
+class FakeCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.executed = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        self.rowcount = 1
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_plan_uid_fetch_incremental_only_new_uids():
+    M = FakeIMAP([3, 7, 9])
+    state = {'uidvalidity': 42, 'last_uid': 7}
+    plan = email_sync.plan_uid_fetch(M, state, {'uidvalidity': 42, 'uidnext': 10})
+    assert plan == {'new': [9], 'backfill': [], 'full_resync': False, 'backfill_uid': 0}
+    assert M.commands == [('search', None, 'UID 8:*')]
+
+
+def test_plan_uid_fetch_skips_search_when_uidnext_unchanged():
+    M = FakeIMAP([3, 7, 9])
+    plan = email_sync.plan_uid_fetch(M, {'uidvalidity': 42, 'last_uid': 9}, {'uidvalidity': 42, 'uidnext': 10})
+    assert plan['new'] == [] and plan['backfill'] == [] and plan['full_resync'] is False
+    assert M.commands == []
+
+
+def test_plan_uid_fetch_full_resync_on_uidvalidity_change():
+    M = FakeIMAP([3, 7, 9, 11])
+    plan = email_sync.plan_uid_fetch(M, {'uidvalidity': 1, 'last_uid': 9}, {'uidvalidity': 2}, limit=2)
+    assert plan['full_resync'] is True
+    assert plan['new'] == [9, 11]
+    assert plan['backfill_uid'] == 9   # 3 und 7 werden später nachgeladen
+
+
+def test_plan_uid_fetch_with_limit_never_skips_uids():
+    M = FakeIMAP([2, 4, 6, 8, 10, 12, 14])
+    status = {'uidvalidity': 42, 'uidnext': 15}
+    # Mehr neue Mails als limit: die ältesten zuerst, der Rest beim nächsten Lauf
+    plan = email_sync.plan_uid_fetch(M, {'uidvalidity': 42, 'last_uid': 6, 'backfill_uid': 4}, status, limit=2)
+    assert plan['new'] == [8, 10] and plan['backfill'] == []
+    assert plan['backfill_uid'] == 4
+
+    # Restbudget geht in den Backfill unterhalb der Low-Water-Mark (neueste zuerst)
+    M.commands.clear()
+    plan = email_sync.plan_uid_fetch(M, {'uidvalidity': 42, 'last_uid': 12, 'backfill_uid': 8}, status, limit=3)
+    assert plan['new'] == [14] and plan['backfill'] == [4, 6]
+    assert plan['backfill_uid'] == 4
+    assert M.commands[-1] == ('search', None, 'UID 1:7')
+
+    plan = email_sync.plan_uid_fetch(M, {'uidvalidity': 42, 'last_uid': 14, 'backfill_uid': 4}, status, limit=3)
+    assert plan['new'] == [] and plan['backfill'] == [2] and plan['backfill_uid'] == 0
+
+
+def test_sync_flags_full_diff_updates_only_changed_rows():
+    M = FakeIMAP([5, 6], flags={5: '\\Seen', 6: ''})
+    cursor = FakeCursor(rows=[(5, 0, 0), (6, 0, 0)])
+    res = email_sync.sync_flags(M, cursor, 'u@x', 1, 'INBOX', 'inbox', {'exists': 2}, None)
+    assert res['mode'] == 'full'
+    assert res['checked'] == 2
+    updates = [e for e in cursor.executed if e[0].startswith('UPDATE emails')]
+    assert len(updates) == 1
+    assert updates[0][1][-1] == 5
+
+
+def test_compress_uid_set():
+    assert email_sync.compress_uid_set([9, 1, 2, 3, 7, 10]) == '1:3,7,9:10'
+
+
+def test_plan_fetch_chunks_respects_count_and_bytes():
+    sizes = {1: 10, 2: 10, 3: 100, 4: 10}
+    assert email_sync.plan_fetch_chunks([1, 2, 3, 4], sizes, max_count=2, max_bytes=1000) == [[1, 2], [3, 4]]
+    assert email_sync.plan_fetch_chunks([1, 2, 3, 4], sizes, max_count=10, max_bytes=50) == [[1, 2], [3], [4]]
+
+
+def test_iter_fetch_messages_reads_flags_after_literal():
+    raw = b'Message-ID: <a@b>\r\nSubject: Hi\r\n\r\nBody'
+
+    class M:
+        def uid(self, command, uid_set, items):
+            assert uid_set == '4:5'
+            return 'OK', [
+                (b'1 (UID 4 BODY[] {40}', raw), b' FLAGS (\\Seen))',
+                (b'2 (UID 5 FLAGS () BODY[] {40}', raw), b')',
+            ]
+
+    out = list(email_sync.iter_fetch_messages(M(), [4, 5]))
+    assert [u for u, _meta, _raw in out] == [4, 5]
+    first = email_sync.parse_message(out[0][2], out[0][0], out[0][1])
+    assert first['is_read'] == 1 and first['message_id'] == '<a@b>' and first['subject'] == 'Hi'
+    assert email_sync.parse_message(out[1][2], 5, out[1][1])['is_read'] == 0
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class WriterCursor(FakeCursor):
+    """Liefert für SELECT-Abfragen vorgegebene Ergebnisse in Reihenfolge."""
+
+    def __init__(self, results):
+        super().__init__()
+        self.results = list(results)
+        self.many = []
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def executemany(self, sql, rows):
+        self.many.append((sql, list(rows)))
+
+
+def _parsed(uid, message_id, from_email):
+    from datetime import datetime
+    return {
+        'uid': uid, 'message_id': message_id, 'in_reply_to': '', 'references_raw': '', 'thread_id': '',
+        'from_email': from_email, 'from_name': 'Max Muster', 'to_addrs': '', 'subject': 's',
+        'received_at': datetime(2025, 1, uid), 'body_text': 'x', 'body_html': '',
+        'has_attachments': False, 'is_read': 0, 'is_replied': 0,
+    }
+
+
+def test_sync_writer_flushes_chunk_in_bulk(monkeypatch):
+    monkeypatch.setattr(email_sync, '_CONTACTS_UNIQUE', True)
+    cursor = WriterCursor([
+        [(11, '<old@x>')],             # vorhandene Mails
+        [],                            # vorhandene Kontakte
+        [(7, 'max@x')],                # IDs nach dem Upsert
+    ])
+    conn = FakeConn(cursor)
+    writer = email_sync.SyncWriter(conn, 'u@x', 1, 'inbox')
+    for p in (_parsed(1, '<old@x>', 'max@x'), _parsed(2, '<new1@x>', 'max@x'), _parsed(3, '<new2@x>', 'MAX@x')):
+        writer.add(p)
+    stats = writer.flush()
+    assert stats == {'inserted': 2, 'updated': 1, 'new_contacts': 1}
+    assert conn.commits == 1
+    upsert = [sql for sql, _ in cursor.executed if sql.startswith('INSERT INTO contacts')]
+    assert len(upsert) == 1 and 'ON DUPLICATE KEY UPDATE' in upsert[0]
+    assert "name=COALESCE(NULLIF(name, ''), VALUES(name))" in upsert[0]   # vorhandenen Namen nicht überschreiben
+    inserted = [rows for sql, rows in cursor.many if sql.startswith('INSERT INTO emails')][0]
+    assert [r[6] for r in inserted] == [7, 7]
+
+
+def test_sync_writer_retries_failed_chunk_row_by_row(monkeypatch):
+    monkeypatch.setattr(email_sync, '_CONTACTS_UNIQUE', True)
+
+    class Cursor(WriterCursor):
+        def fetchall(self):
+            return [(7, 'max@x')] if 'FROM contacts' in self.executed[-1][0] else []
+
+        def executemany(self, sql, rows):
+            rows = list(rows)
+            if sql.startswith('INSERT INTO emails') and any(r[10] == 'kaputt' for r in rows):
+                raise ValueError("Incorrect string value")
+            super().executemany(sql, rows)
+
+    conn = FakeConn(Cursor([]))
+    writer = email_sync.SyncWriter(conn, 'u@x', 1, 'inbox')
+    bad = dict(_parsed(2, '<bad@x>', 'max@x'), subject='kaputt')
+    for p in (_parsed(1, '<a@x>', 'max@x'), bad, _parsed(3, '<b@x>', 'max@x')):
+        writer.add(p)
+    stats = writer.flush()
+    # Eine fehlerhafte Zeile verwirft nicht den ganzen Chunk
+    assert stats['inserted'] == 2 and conn.commits == 2 and conn.rollbacks == 2
+    assert list(writer.take_write_errors()) == [2] and writer.take_write_errors() == {}
+
+
+def test_resolve_sync_folder_normalizes_client_names():
+    assert email_sync.resolve_sync_folder('INBOX') == ('INBOX', 'inbox')
+    assert email_sync.resolve_sync_folder('." INBOX.Sent') == ('INBOX.Sent', 'sent')
+    assert email_sync.resolve_sync_folder('Archiv') == ('Archiv', 'archive')
+    assert email_sync.resolve_sync_folder('INBOX/Projekte') == ('INBOX', 'inbox')
+    assert email_sync.resolve_sync_folder('Kunden/Rechnungen') == ('Kunden/Rechnungen', 'rechnungen')
+    # bereits normalisierte Namen (so wie sie im Job gespeichert werden) bleiben stabil
+    assert email_sync.resolve_sync_folder('INBOX.Sent') == ('INBOX.Sent', 'sent')
+
+
+def test_sync_folder_skips_poison_uid_after_max_attempts(monkeypatch):
+    state = {'uidvalidity': 42, 'last_uid': 3, 'uidnext': None, 'highestmodseq': None, 'backfill_uid': 0}
+    failures = {}
+
+    class Writer:
+        def __init__(self, *args):
+            self.pending = []
+        pending_uids = property(lambda self: [p['uid'] for p in self.pending])
+        def add(self, parsed):
+            self.pending.append(parsed)
+        def flush(self):
+            n, self.pending = len(self.pending), []
+            return {'inserted': n, 'updated': 0, 'new_contacts': 0}
+        def take_write_errors(self):
+            return {}
+        def close(self):
+            pass
+
+    def parse(raw, uid, meta):
+        if uid == 5:
+            raise ValueError('kaputt')
+        return {'uid': uid}
+
+    def save(cursor, account_id, folder, uidvalidity, last_uid, uidnext=None, backfill_uid=None):
+        state.update(last_uid=last_uid, backfill_uid=state['backfill_uid'] if backfill_uid is None else backfill_uid)
+
+    def record(cursor, account_id, folder, uidvalidity, errors):
+        for uid in errors:
+            failures[uid] = failures.get(uid, 0) + 1
+
+    class Cursor(FakeCursor):
+        def close(self):
+            pass
+
+    class Conn:
+        def cursor(self):
+            return Cursor()
+        commit = rollback = lambda self: None
+
+    monkeypatch.setattr(email_sync, 'ensure_sync_schema', lambda cursor: None)
+    monkeypatch.setattr(email_sync, 'get_sync_state', lambda *a: dict(state))
+    monkeypatch.setattr(email_sync, 'save_sync_state', save)
+    monkeypatch.setattr(email_sync, 'load_uid_failures', lambda *a: dict(failures))
+    monkeypatch.setattr(email_sync, 'record_uid_failures', record)
+    monkeypatch.setattr(email_sync, 'SyncWriter', Writer)
+    monkeypatch.setattr(email_sync, 'fetch_sizes', lambda M, uids: {})
+    monkeypatch.setattr(email_sync, 'iter_fetch_messages', lambda M, uids: ((u, '', b'') for u in uids))
+    monkeypatch.setattr(email_sync, 'parse_message', parse)
+    monkeypatch.setattr(email_sync, 'sync_flags', lambda *a: {'updated': 0})
+    monkeypatch.setattr(email_sync.folder_stats, 'load', lambda cursor, account_id: {})
+
+    M = FakeIMAP([1, 2, 3, 4, 5, 6, 7])
+    status = {'uidvalidity': 42, 'uidnext': 8}
+    for attempt in range(1, email_sync.MAX_UID_ATTEMPTS):
+        email_sync.sync_folder(M, Conn(), 'u@x', 1, 'INBOX', 'inbox', status)
+        assert state['last_uid'] == 4 and failures == {5: attempt}   # 5 wird erneut versucht
+
+    result = email_sync.sync_folder(M, Conn(), 'u@x', 1, 'INBOX', 'inbox', status)
+    assert state['last_uid'] == 7 and result['skipped'] == 1
+    # Danach wird die UID gar nicht mehr geholt
+    result = email_sync.sync_folder(M, Conn(), 'u@x', 1, 'INBOX', 'inbox', {'uidvalidity': 42, 'uidnext': 9})
+    assert result['failed'] == 0 and state['last_uid'] == 7
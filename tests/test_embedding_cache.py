@@ -0,0 +1,30 @@
+import embedding_cache
+import ttl_cache
+
+
+def test_batches_respect_item_and_token_limits():
+    texts = ['a' * 40, 'b' * 40, 'c' * 400, 'd' * 4]
+    assert embedding_cache.make_batches(texts, max_items=2, max_tokens=1000) == [texts[:2], texts[2:]]
+    # c allein sprengt das Token-Budget des ersten Batches -> eigener Batch
+    assert embedding_cache.make_batches(texts, max_items=10, max_tokens=100) == [texts[:2], [texts[2]], [texts[3]]]
+
+
+def test_unchanged_texts_cost_no_api_calls(monkeypatch):
+    calls = []
+
+    def fake_embed(batch, *, model, priority):
+        calls.append(list(batch))
+        return [[float(len(t)), 0.1] for t in batch]
+
+    monkeypatch.setattr(embedding_cache.llm_gateway, 'embed', fake_embed)
+    monkeypatch.setattr(embedding_cache, '_CACHE', ttl_cache.TTLCache('test_embeddings', maxsize=100, ttl=60))
+
+    first = embedding_cache.embed(['Hallo', 'Welt', 'Hallo'], model='m')
+    assert calls == [['Hallo', 'Welt']]                      # Duplikat nur einmal eingebettet
+    assert first[0] == first[2] and first[1][0] == 4.0
+    assert abs(first[0][1] - 0.1) < 1e-6                      # float32-Speicherung
+
+    assert embedding_cache.embed(['Welt', 'Hallo'], model='m') == [first[1], first[0]]
+    assert len(calls) == 1                                    # komplett aus dem Cache
+    embedding_cache.embed(['Welt'], model='anderes-modell')
+    assert len(calls) == 2                                    # Modell ist Teil des Schlüssels
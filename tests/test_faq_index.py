@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+pytest.importorskip('langchain')
+pytest.importorskip('faiss')
+np = pytest.importorskip('numpy')
+
+import faq_langchain  # noqa: E402
+
+
+class FakeEmbeddings:
+    """Deterministische Vektoren aus dem Text; merkt sich, was eingebettet wurde."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+
+@pytest.fixture
+def faq(tmp_path, monkeypatch):
+    knowledge = tmp_path / 'knowledge.md'
+    fake = FakeEmbeddings()
+    monkeypatch.setenv('FAQ_INDEX_DIR', str(tmp_path / 'index'))
+    monkeypatch.setattr(faq_langchain, 'KNOWLEDGE_PATH', str(knowledge))
+    monkeypatch.setattr(faq_langchain, '_split', lambda content: content.split('\n\n'))
+    monkeypatch.setattr(faq_langchain, '_embeddings', lambda: fake)
+    return knowledge, fake
+
+
+def _versions(base):
+    return sorted(n for n in os.listdir(base) if os.path.isdir(os.path.join(base, n)) and not n.startswith('.'))
+
+
+def test_build_index_reuses_and_replaces_versions(faq):
+    knowledge, fake = faq
+    base = faq_langchain.index_dir()
+    knowledge.write_text('Öffnungszeiten: 9-18 Uhr\n\nStornierung bis 24h vorher\n\nZahlung per Rechnung', encoding='utf-8')
+
+    index, chunks, version = faq_langchain.build_index()
+    assert index.ntotal == 3 and len(fake.embedded) == 3
+    assert _versions(base) == [version]
+
+    # Hash-Treffer: nur laden, nichts einbetten
+    _index, _chunks, again = faq_langchain.build_index()
+    assert again == version and _chunks == chunks and len(fake.embedded) == 3
+
+    # Ein Chunk geändert: nur dieser wird eingebettet, die übrigen Vektoren kommen aus der alten Version
+    old = index.reconstruct_n(0, index.ntotal)
+    knowledge.write_text('Öffnungszeiten: 9-18 Uhr\n\nStornierung bis 48h vorher\n\nZahlung per Rechnung', encoding='utf-8')
+    index, chunks, new_version = faq_langchain.build_index()
+    assert new_version != version
+    assert fake.embedded[3:] == ['Stornierung bis 48h vorher']
+    vectors = index.reconstruct_n(0, index.ntotal)
+    assert np.allclose(vectors[0], old[0]) and np.allclose(vectors[2], old[2])
+
+    # Alte Version ist aufgeräumt, LATEST zeigt auf die neue
+    assert _versions(base) == [new_version]
+    with open(os.path.join(base, 'LATEST'), encoding='utf-8') as f:
+        assert f.read() == new_version
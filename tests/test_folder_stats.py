@@ -0,0 +1,47 @@
+import folder_stats
+
+
+class FakeCursor:
+    """Merkt sich Statements; rowcount für UPDATEs vorgegeben."""
+
+    def __init__(self, update_rowcount=1, rows=()):
+        self.update_rowcount = update_rowcount
+        self.rows = list(rows)
+        self.executed = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        self.rowcount = self.update_rowcount if sql.startswith('UPDATE') else 1
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_bump_applies_delta_and_recounts_missing_rows():
+    cursor = FakeCursor(update_rowcount=1)
+    folder_stats.bump(cursor, 3, 'inbox', total=2, unread=1)
+    assert len(cursor.executed) == 1
+    assert cursor.executed[0][1] == (2, 1, 3, 'inbox')
+
+    # Noch keine Zeile für den Ordner -> neu zählen statt Delta als absoluten Wert zu speichern
+    cursor = FakeCursor(update_rowcount=0)
+    folder_stats.bump(cursor, 3, 'projekte', total=1)
+    assert cursor.executed[1][0].startswith('INSERT INTO folder_stats') and 'COUNT(*)' in cursor.executed[1][0]
+
+    cursor = FakeCursor()
+    folder_stats.bump(cursor, 3, 'inbox')
+    folder_stats.bump(cursor, None, 'inbox', total=1)
+    assert cursor.executed == []
+
+
+def test_summarize_groups_sent_variants():
+    stats = folder_stats.load(FakeCursor(rows=[
+        {'folder': 'inbox', 'total': 120, 'unread': 3},
+        {'folder': 'sent', 'total': 10, 'unread': 0},
+        {'folder': 'inbox.sent', 'total': 5, 'unread': 1},
+    ]), 3)
+    assert folder_stats.counts_for(stats, 'sent') == (15, 1)
+    summary = folder_stats.summarize(stats)
+    assert summary['folders'] == {'inbox': {'total': 120, 'unread': 3}, 'sent': {'total': 15, 'unread': 1}}
+    assert summary['all'] == {'total': 135, 'unread': 4}
@@ -0,0 +1,49 @@
+import socket
+import threading
+
+import imap_idle
+
+
+class FakeIdleIMAP:
+    """IMAP-Stub für IDLE: Server-Zeilen kommen über ein socketpair, damit select() funktioniert."""
+
+    def __init__(self, lines):
+        self.sock, self._server = socket.socketpair()
+        self.file = self.sock.makefile('rb')
+        self.sent = []
+        self._lines = list(lines)
+
+    def _new_tag(self):
+        return b'A001'
+
+    def send(self, data):
+        self.sent.append(data)
+        if data == b'A001 IDLE\r\n':
+            self._server.sendall(b'+ idling\r\n')
+            for line in self._lines:
+                self._server.sendall(line)
+        elif data == b'DONE\r\n':
+            self._server.sendall(b'A001 OK IDLE terminated\r\n')
+
+    def readline(self):
+        return self.file.readline()
+
+
+def test_parse_idle_line():
+    assert imap_idle.parse_idle_line(b'* 12 EXISTS\r\n') == 'EXISTS'
+    assert imap_idle.parse_idle_line(b'* 3 expunge\r\n') == 'EXPUNGE'
+    assert imap_idle.parse_idle_line(b'* 4 FETCH (FLAGS (\\Seen))\r\n') == 'FETCH'
+    assert imap_idle.parse_idle_line(b'* OK Still here\r\n') is None
+
+
+def test_idle_wait_returns_on_exists_and_terminates_idle():
+    M = FakeIdleIMAP([b'* OK Still here\r\n', b'* 13 EXISTS\r\n'])
+    events = imap_idle.idle_wait(M, timeout=5, stop=threading.Event())
+    assert events == ['EXISTS']
+    assert M.sent == [b'A001 IDLE\r\n', b'DONE\r\n']
+
+
+def test_idle_wait_times_out_without_events():
+    M = FakeIdleIMAP([])
+    assert imap_idle.idle_wait(M, timeout=0.2, stop=threading.Event()) == []
+    assert M.sent[-1] == b'DONE\r\n'
@@ -0,0 +1,90 @@
+import imaplib
+
+import pytest
+
+import email_sync
+import imap_pool
+
+
+class FakeSessionIMAP:
+    """Zählt SELECT/NOOP/LOGOUT; ``dead`` simuliert eine vom Server geschlossene Verbindung."""
+
+    def __init__(self):
+        self.selects = []
+        self.noops = 0
+        self.logged_out = False
+        self.dead = False
+        self.untagged_responses = {}
+
+    def select(self, mailbox):
+        if self.dead:
+            raise imaplib.IMAP4.abort('socket error: EOF')
+        self.selects.append(mailbox)
+        return 'OK', [b'3']
+
+    def noop(self):
+        if self.dead:
+            raise imaplib.IMAP4.abort('socket error: EOF')
+        self.noops += 1
+        return 'OK', [b'']
+
+    def logout(self):
+        self.logged_out = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    connections = []
+
+    def _connect(settings):
+        M = FakeSessionIMAP()
+        connections.append(M)
+        return M
+
+    monkeypatch.setattr(email_sync, 'connect_account', _connect)
+    monkeypatch.setattr(imap_pool, 'POOL_ENABLED', True)
+    p = imap_pool.ImapPool()
+    p._ensure_janitor = lambda: None
+    return p, connections
+
+
+SETTINGS = {'imap_host': 'imap.x', 'imap_port': 993, 'imap_user': 'u', 'imap_pass_encrypted': 'enc'}
+
+
+def test_session_is_reused_and_select_cached(pool):
+    p, connections = pool
+    with p.session('account:1', SETTINGS, folder='INBOX') as M1:
+        pass
+    with p.session('account:1', SETTINGS, folder='INBOX') as M2:
+        pass
+    assert M1 is M2 and len(connections) == 1
+    assert M1.selects == ['"INBOX"']
+    with p.session('account:1', SETTINGS, folder='INBOX', reselect=True):
+        pass
+    assert M1.selects == ['"INBOX"', '"INBOX"']
+
+
+def test_connection_error_discards_and_reconnects(pool, monkeypatch):
+    p, connections = pool
+    with pytest.raises(imaplib.IMAP4.abort):
+        with p.session('account:1', SETTINGS, folder='INBOX'):
+            raise imaplib.IMAP4.abort('boom')
+    assert connections[0].logged_out
+    with p.session('account:1', SETTINGS, folder='INBOX') as M:
+        assert M is connections[1]
+
+    # Tote Idle-Session: NOOP schlägt fehl -> transparent neu verbinden
+    monkeypatch.setattr(imap_pool, 'KEEPALIVE', 0)
+    connections[1].dead = True
+    with p.session('account:1', SETTINGS, folder='INBOX') as M:
+        assert M is connections[2]
+        assert M.selects == ['"INBOX"']
+
+
+def test_changed_credentials_drop_old_sessions(pool):
+    p, connections = pool
+    with p.session('account:1', SETTINGS):
+        pass
+    with p.session('account:1', dict(SETTINGS, imap_pass_encrypted='new')) as M:
+        assert M is connections[1]
+    assert connections[0].logged_out
@@ -0,0 +1,37 @@
+import threading
+import time
+
+import pytest
+
+import llm_executor
+
+
+def test_timeout_returns_without_waiting_for_worker():
+    ex = llm_executor.BoundedExecutor('test_deadline', max_workers=1, max_queue=4)
+    release = threading.Event()
+
+    t0 = time.monotonic()
+    with pytest.raises(llm_executor.DeadlineExceeded):
+        ex.run(release.wait, 5, timeout=0.1)
+    assert time.monotonic() - t0 < 1.0          # kein Join auf den noch laufenden Worker
+    assert ex.status()['abandoned'] == 1
+
+    # Zweite Aufgabe wartet hinter der ersten in der Queue und wird bei Ablauf abgebrochen
+    with pytest.raises(llm_executor.DeadlineExceeded):
+        ex.run(lambda: 'nie', timeout=0.1)
+    status = ex.status()
+    assert status['cancelled'] == 1 and status['queued'] == 0 and status['running'] == 1
+
+    release.set()
+    assert ex.run(lambda: 'ok', timeout=2) == 'ok'
+
+
+def test_full_queue_is_rejected():
+    ex = llm_executor.BoundedExecutor('test_overload', max_workers=1, max_queue=1)
+    release = threading.Event()
+    ex.submit(release.wait, 5)
+    ex.submit(release.wait, 5)
+    with pytest.raises(llm_executor.Overloaded):
+        ex.submit(lambda: None)
+    assert ex.status()['rejected'] == 1
+    release.set()
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import llm_gateway
+import ttl_cache
+
+
+def test_interactive_calls_start_before_waiting_background_calls():
+    sched = llm_gateway.Scheduler(max_concurrency=1, max_waiting=10)
+    sched.acquire('m', 10, llm_gateway.BACKGROUND, timeout=1)   # belegt den einzigen Slot
+    order = []
+
+    def worker(prio, name):
+        sched.acquire('m', 10, prio, timeout=5)
+        order.append(name)
+        sched.release()
+
+    bg = threading.Thread(target=worker, args=(llm_gateway.BACKGROUND, 'profile'))
+    bg.start()
+    time.sleep(0.05)
+    fg = threading.Thread(target=worker, args=(llm_gateway.INTERACTIVE, 'compose'))
+    fg.start()
+    time.sleep(0.05)
+    sched.release()
+    bg.join()
+    fg.join()
+    assert order == ['compose', 'profile']
+
+
+def test_rate_limit_errors_are_retried(monkeypatch):
+    class RateLimited(Exception):
+        status_code = 429
+
+    calls = []
+
+    class Completions:
+        def create(self, **params):
+            calls.append(params)
+            if len(calls) < 3:
+                raise RateLimited('slow down')
+            return 'ok'
+
+    class Client:
+        class chat:
+            completions = Completions()
+
+    monkeypatch.setattr(llm_gateway, '_SCHEDULER', llm_gateway.Scheduler())
+    monkeypatch.setattr(llm_gateway, '_CLIENT', Client())
+    monkeypatch.setattr(llm_gateway, '_RESPONSE_CACHE', ttl_cache.TTLCache('test_llm_retry', maxsize=10, ttl=60))
+    monkeypatch.setattr(llm_gateway.time, 'sleep', lambda s: None)
+
+    assert llm_gateway.chat([{'role': 'user', 'content': 'Hallo'}], model='m', max_tokens=50, temperature=0.2) == 'ok'
+    assert len(calls) == 3 and calls[0]['temperature'] == 0.2 and calls[0]['max_tokens'] == 50
+    status = llm_gateway.status()
+    assert status['retries'] == 2 and status['rate_limited'] == 2 and status['in_flight'] == 0
+
+
+def test_identical_requests_are_answered_from_cache(monkeypatch):
+    calls = []
+
+    class Completions:
+        def create(self, **params):
+            calls.append(params)
+            return f"antwort {len(calls)}"
+
+    class Client:
+        class chat:
+            completions = Completions()
+
+    response_cache = ttl_cache.TTLCache('test_llm_cache', maxsize=10, ttl=60)
+    monkeypatch.setattr(llm_gateway, '_SCHEDULER', llm_gateway.Scheduler())
+    monkeypatch.setattr(llm_gateway, '_CLIENT', Client())
+    monkeypatch.setattr(llm_gateway, '_RESPONSE_CACHE', response_cache)
+    messages = [{'role': 'user', 'content': 'Fasse zusammen'}]
+
+    assert llm_gateway.chat(messages, model='m', max_tokens=50, temperature=0.3) == 'antwort 1'
+    assert llm_gateway.chat(list(messages), model='m', max_tokens=50, temperature=0.3) == 'antwort 1'
+    assert llm_gateway.chat(messages, model='m', max_tokens=50, temperature=0.7) == 'antwort 2'   # anderer Parameter
+    assert llm_gateway.chat(messages, model='m', max_tokens=50, temperature=0.3, cache=False) == 'antwort 3'
+    assert len(calls) == 3
+    assert response_cache.status()['hits'] == 1 and llm_gateway.status()['calls'] == 3
+
+
+def test_stream_yields_chunks_releases_slot_and_fills_cache(monkeypatch):
+    from types import SimpleNamespace as NS
+
+    calls = []
+
+    class Completions:
+        def create(self, **params):
+            calls.append(params)
+            return iter([NS(choices=[NS(delta=NS(content=t), finish_reason=None)]) for t in ('Hal', 'lo')]
+                        + [NS(choices=[NS(delta=NS(content=None), finish_reason='stop')])])
+
+    class Client:
+        class chat:
+            completions = Completions()
+
+    monkeypatch.setattr(llm_gateway, '_SCHEDULER', llm_gateway.Scheduler())
+    monkeypatch.setattr(llm_gateway, '_CLIENT', Client())
+    monkeypatch.setattr(llm_gateway, '_RESPONSE_CACHE', ttl_cache.TTLCache('test_llm_stream', maxsize=10, ttl=60))
+    messages = [{'role': 'user', 'content': 'Entwurf bitte'}]
+
+    assert list(llm_gateway.chat_stream(messages, model='m', max_tokens=50, timeout=5)) == ['Hal', 'lo']
+    assert calls[0]['stream'] is True and llm_gateway.status()['in_flight'] == 0
+    # Gleiche Anfrage (auch ohne Stream) kommt aus dem Cache
+    assert list(llm_gateway.chat_stream(messages, model='m', max_tokens=50)) == ['Hallo']
+    assert llm_gateway.chat(messages, model='m', max_tokens=50).choices[0].message.content == 'Hallo'
+    assert len(calls) == 1
@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip('qdrant_client')
+
+import qdrant_store  # noqa: E402
+
+
+class FakeClient:
+    """Minimaler Qdrant-Ersatz: speichert Punkte nach ID."""
+
+    def __init__(self):
+        self.points = {}
+        self.upserts = 0
+
+    def retrieve(self, collection_name, ids, with_payload=None, with_vectors=False):
+        return [self.points[pid] for pid in ids if pid in self.points]
+
+    def upsert(self, collection_name, points):
+        self.upserts += 1
+        for pt in points:
+            self.points[pt.id] = pt
+
+
+def test_upsert_is_idempotent_and_incremental(monkeypatch):
+    client = FakeClient()
+    embedded = []
+    monkeypatch.setattr(qdrant_store, 'get_client', lambda: client)
+    monkeypatch.setattr(qdrant_store, 'ensure_collection', lambda vector_size: None)
+    monkeypatch.setattr(qdrant_store, '_embed', lambda texts, priority=None: embedded.extend(texts) or [[0.1, 0.2]] * len(texts))
+
+    ids = [qdrant_store.point_id('u@x', 'email', n, 'snippet') for n in (1, 2)]
+    assert ids[0] == qdrant_store.point_id('u@x', 'email', 1, 'snippet') != ids[1]
+
+    assert qdrant_store.upsert_texts(['Mail 1', 'Mail 2'], ids=ids) == 2
+    assert qdrant_store.upsert_texts(['Mail 1', 'Mail 2'], ids=ids) == 0        # nichts geändert
+    assert qdrant_store.upsert_texts(['Mail 1', 'Mail 2 (neu)'], ids=ids) == 1  # nur der geänderte Punkt
+    assert embedded == ['Mail 1', 'Mail 2', 'Mail 2 (neu)']
+    assert set(client.points) == set(ids)
+
+    # Ohne IDs: inhaltsadressiert statt 0..n -> überschreibt keine fremden Punkte
+    qdrant_store.upsert_texts(['Anderer Text'])
+    assert len(client.points) == 3
+
+
+def test_collection_check_is_memoized(monkeypatch):
+    calls = []
+
+    class Client:
+        def collection_exists(self, name):
+            calls.append('exists')
+            return False
+
+        def create_collection(self, collection_name, vectors_config):
+            calls.append(('create', vectors_config.size))
+
+    monkeypatch.setattr(qdrant_store, 'get_client', lambda: Client())
+    monkeypatch.setattr(qdrant_store, '_collections', {})
+    qdrant_store.ensure_collection(vector_size=3)
+    qdrant_store.ensure_collection(vector_size=3)
+    assert calls == ['exists', ('create', 3)]
+    with pytest.raises(RuntimeError):
+        qdrant_store.ensure_collection(vector_size=4)
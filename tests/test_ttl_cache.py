@@ -0,0 +1,72 @@
+import ttl_cache
+
+
+def test_lru_eviction_and_counters():
+    cache = ttl_cache.TTLCache('test_lru', maxsize=2, ttl=60)
+    cache.set(('u@x', 1), 'a')
+    cache.set(('u@x', 2), 'b')
+    assert cache.get(('u@x', 1)) == 'a'      # 1 ist jetzt zuletzt benutzt
+    cache.set(('u@x', 3), 'c')               # verdrängt 2
+    assert cache.get(('u@x', 2)) is None
+    assert cache.get(('u@x', 3)) == 'c'
+
+    status = ttl_cache.all_stats()['test_lru']
+    assert status['size'] == 2 and status['evictions'] == 1
+    assert status['hits'] == 2 and status['misses'] == 1
+
+
+def test_ttl_expiry_and_cached_none(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, 'monotonic', lambda: now[0])
+    cache = ttl_cache.TTLCache('test_ttl', maxsize=10, ttl=30)
+    cache.set('k', None)
+    assert cache.get('k', ttl_cache.MISSING) is None
+
+    now[0] += 20
+    assert cache.get('k', ttl_cache.MISSING, ttl=10) is ttl_cache.MISSING  # kürzerer Aufrufer-TTL
+    assert len(cache) == 1                                                  # ... löscht aber nicht
+
+    now[0] += 20
+    assert cache.get('k', ttl_cache.MISSING) is ttl_cache.MISSING
+    assert len(cache) == 0 and cache.status()['expirations'] == 1
+
+
+def test_get_or_compute_runs_once_for_concurrent_misses(tmp_path):
+    import threading
+    import time
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'draft': 'Hallo'}
+
+    for cache in (ttl_cache.TTLCache('test_stampede', maxsize=10, ttl=60),
+                  ttl_cache.SqliteCache('test_stampede_sqlite', maxsize=10, ttl=60, path=str(tmp_path / 'c.sqlite'))):
+        calls.clear()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute(('u@x', 7), compute)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert results == [{'draft': 'Hallo'}] * 5
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'c.sqlite')
+    worker_a = ttl_cache.SqliteCache('test_shared', maxsize=10, ttl=60, path=path)
+    worker_b = ttl_cache.SqliteCache('test_shared', maxsize=10, ttl=60, path=path)
+    worker_a.set(('u@x', 1), (['job'], []))
+    assert worker_b.get(('u@x', 1)) == (['job'], [])
+    worker_b.delete(('u@x', 1))
+    assert worker_a.get(('u@x', 1)) is None
+
+    # Lease eines anderen Workers blockiert die Berechnung, bis sie freigegeben ist
+    assert worker_a._acquire_lease('k') is True
+    assert worker_b._acquire_lease('k') is False
+    worker_a._release_lease('k')
+    assert worker_b._acquire_lease('k') is True
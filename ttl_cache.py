@@ -0,0 +1,392 @@
+"""
+Thread-sichere Caches mit LRU-Begrenzung und TTL, wahlweise prozessübergreifend.
+
+Ersetzt die früheren dict-Caches in app.py, die nur beim Lesen nach Ablauf
+aufgeräumt wurden und in langlebigen gunicorn-Workern unbegrenzt wuchsen::
+
+    EMAIL_DETAIL_CACHE = ttl_cache.cache('email_detail', maxsize=500, ttl=10)
+    COMPOSE_CACHE = ttl_cache.cache('compose', maxsize=500, ttl=300, shared=True)
+
+    value = EMAIL_DETAIL_CACHE.get((user_email, email_id))
+    info = BLUE_USER_CACHE.get_or_compute(email, lambda: load(email))
+
+- ``maxsize``: älteste Einträge werden verdrängt (im Speicher LRU, im
+  geteilten Store nach Schreibzeitpunkt).
+- ``ttl``: Default-Lebensdauer in Sekunden; ``get(key, ttl=...)`` kann sie pro
+  Aufruf verkürzen.
+- Soll ``None`` als Wert gecacht werden, mit ``get(key, MISSING)`` abfragen.
+- ``get_or_compute``: Stampede-Schutz – gleichzeitige Misses für denselben
+  Schlüssel rechnen nur einmal (Threads per Key-Lock, Worker über eine Lease im
+  geteilten Store); die übrigen warten auf das Ergebnis, höchstens
+  CACHE_LOCK_TIMEOUT Sekunden.
+- Jeder Cache zählt hits/misses/evictions/expirations/coalesced; ``all_stats()``
+  liefert sie für alle Caches des Prozesses (/api/debug/caches).
+
+Backends (``shared=True`` nutzt den über CACHE_BACKEND gewählten Store, sonst
+immer Speicher):
+- ``memory``  (Default) – pro Prozess, wie bisher
+- ``sqlite``  – eine SQLite-Datei (WAL), die sich alle Worker eines Hosts teilen.
+  Werte werden gepickelt; die Datei gehört wie instance/ zur App.
+
+Konfiguration über Env:
+- CACHE_BACKEND       memory | sqlite
+- CACHE_SQLITE_PATH   (Default ./instance/cache.sqlite)
+- CACHE_LOCK_TIMEOUT  Sekunden, die ein Miss auf eine fremde Berechnung wartet (Default 30)
+"""
+import os
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+BACKEND = (os.environ.get('CACHE_BACKEND') or 'memory').strip().lower()
+LOCK_TIMEOUT = max(1, _env_int('CACHE_LOCK_TIMEOUT', 30))
+LOCK_POLL = 0.1
+# Geteilter Store: Ablauf/Größe nur bei jedem n-ten set() prüfen
+PRUNE_EVERY = 50
+
+_REGISTRY: Dict[str, '_BaseCache'] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def sqlite_path() -> str:
+    return os.environ.get('CACHE_SQLITE_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'cache.sqlite'
+    )
+
+
+class _KeyLocks:
+    """Ein Lock pro Schlüssel, nur solange ihn jemand hält oder darauf wartet."""
+
+    def __init__(self):
+        self._locks: Dict[Hashable, list] = {}  # key -> [lock, refs]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: Hashable):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    self._locks.pop(key, None)
+
+
+class _BaseCache:
+    """Gemeinsame Logik; Backends implementieren _lookup/_store/_remove/_clear/_size."""
+
+    backend = 'memory'
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self._stats_lock = threading.Lock()
+        self._key_locks = _KeyLocks()
+        self.stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "coalesced": 0}
+        with _REGISTRY_LOCK:
+            _REGISTRY[name] = self
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[counter] += n
+
+    def _max_age(self, ttl: Optional[float]) -> float:
+        return self.ttl if ttl is None else min(ttl, self.ttl)
+
+    # --- API ----------------------------------------------------------------
+    def get(self, key: Hashable, default: Any = None, ttl: Optional[float] = None) -> Any:
+        value = self._lookup(key, self._max_age(ttl))
+        if value is MISSING:
+            self._count("misses")
+            return default
+        self._count("hits")
+        return value
+
+    def set(self, key: Hashable, value: Any) -> Any:
+        self._store(key, value)
+        self._count("sets")
+        return value
+
+    def delete(self, key: Hashable) -> None:
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._clear()
+
+    def __len__(self) -> int:
+        return self._size()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Wert aus dem Cache oder einmalig ``compute()`` (auch bei gleichzeitigen Misses)."""
+        max_age = self._max_age(ttl)
+        value = self.get(key, MISSING, ttl)
+        if value is not MISSING:
+            return value
+        with self._key_locks.hold(key):
+            # Ein anderer Thread kann den Wert inzwischen berechnet haben
+            value = self._lookup(key, max_age)
+            if value is not MISSING:
+                self._count("coalesced")
+                return value
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            leased = self._acquire_lease(key)
+            while not leased and time.monotonic() < deadline:
+                time.sleep(LOCK_POLL)
+                value = self._lookup(key, max_age)
+                if value is not MISSING:
+                    self._count("coalesced")
+                    return value
+                leased = self._acquire_lease(key)
+            try:
+                return self.set(key, compute())
+            finally:
+                if leased:
+                    self._release_lease(key)
+
+    def status(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "backend": self.backend,
+            "size": self._size(),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else None,
+            **stats,
+        }
+
+    # --- Backend ------------------------------------------------------------
+    def _acquire_lease(self, key: Hashable) -> bool:
+        # Im Speicher genügt das Key-Lock
+        return True
+
+    def _release_lease(self, key: Hashable) -> None:
+        pass
+
+
+class TTLCache(_BaseCache):
+    """Cache im Prozessspeicher (OrderedDict, LRU)."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        super().__init__(name, maxsize, ttl)
+
+    def _lookup(self, key: Hashable, max_age: float) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if now - entry[0] > max_age:
+                # Nur bei Ablauf gegenüber dem Cache-TTL entfernen; ein kürzerer
+                # Aufrufer-TTL darf den Eintrag anderer Leser nicht löschen.
+                if now - entry[0] > self.ttl:
+                    del self._data[key]
+                    self._count("expirations")
+                return MISSING
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now, value)
+            self._data.move_to_end(key)
+            self._prune(now)
+
+    def _remove(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def _size(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def _prune(self, now: float) -> None:
+        # Abgelaufene Einträge am LRU-Ende zuerst, dann nach Größe verdrängen
+        while self._data:
+            key, (stored_at, _value) = next(iter(self._data.items()))
+            if now - stored_at > self.ttl:
+                del self._data[key]
+                self._count("expirations")
+            elif len(self._data) > self.maxsize:
+                del self._data[key]
+                self._count("evictions")
+            else:
+                break
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    name TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, stored_at REAL NOT NULL,
+    PRIMARY KEY (name, key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_stored ON cache_entries (name, stored_at);
+CREATE TABLE IF NOT EXISTS cache_leases (
+    name TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+
+class SqliteCache(_BaseCache):
+    """Geteilter Cache in einer SQLite-Datei (alle Worker eines Hosts).
+
+    Fehler des Stores werden geloggt und wie ein Miss behandelt; ein kaputter
+    Cache darf keinen Request scheitern lassen.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, name: str, maxsize: int, ttl: float, path: Optional[str] = None):
+        self.path = path or sqlite_path()
+        self._local = threading.local()
+        self._sets = 0
+        self._warned = False
+        super().__init__(name, maxsize, ttl)
+
+    def _db(self) -> sqlite3.Connection:
+        # Eine Verbindung pro Thread und Prozess (nach fork nicht weiterverwenden)
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SQLITE_SCHEMA)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _warn(self, action: str, e: Exception) -> None:
+        if not self._warned:
+            self._warned = True
+            logger.warning(f"[Cache] {self.name}: {action} im SQLite-Store fehlgeschlagen ({self.path}): {e}")
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return repr(key)
+
+    def _lookup(self, key: Hashable, max_age: float) -> Any:
+        try:
+            row = self._db().execute(
+                "SELECT value, stored_at FROM cache_entries WHERE name=? AND key=?", (self.name, self._key(key))
+            ).fetchone()
+            if row is None or time.time() - row[1] > max_age:
+                return MISSING
+            return pickle.loads(row[0])
+        except Exception as e:
+            self._warn('Lesen', e)
+            return MISSING
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        try:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO cache_entries (name, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                (self.name, self._key(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time()),
+            )
+            with self._stats_lock:
+                self._sets += 1
+                prune = self._sets % PRUNE_EVERY == 0
+            if prune:
+                self._prune(db)
+        except Exception as e:
+            self._warn('Schreiben', e)
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        cur = db.execute("DELETE FROM cache_entries WHERE name=? AND stored_at < ?", (self.name, time.time() - self.ttl))
+        self._count("expirations", max(0, cur.rowcount))
+        excess = db.execute("SELECT COUNT(*) FROM cache_entries WHERE name=?", (self.name,)).fetchone()[0] - self.maxsize
+        if excess > 0:
+            cur = db.execute(
+                "DELETE FROM cache_entries WHERE name=? AND key IN "
+                "(SELECT key FROM cache_entries WHERE name=? ORDER BY stored_at ASC LIMIT ?)",
+                (self.name, self.name, excess),
+            )
+            self._count("evictions", max(0, cur.rowcount))
+        db.execute("DELETE FROM cache_leases WHERE expires_at < ?", (time.time(),))
+
+    def _remove(self, key: Hashable) -> None:
+        try:
+            self._db().execute("DELETE FROM cache_entries WHERE name=? AND key=?", (self.name, self._key(key)))
+        except Exception as e:
+            self._warn('Löschen', e)
+
+    def _clear(self) -> None:
+        try:
+            self._db().execute("DELETE FROM cache_entries WHERE name=?", (self.name,))
+        except Exception as e:
+            self._warn('Leeren', e)
+
+    def _size(self) -> int:
+        try:
+            return self._db().execute("SELECT COUNT(*) FROM cache_entries WHERE name=?", (self.name,)).fetchone()[0]
+        except Exception as e:
+            self._warn('Zählen', e)
+            return 0
+
+    def _acquire_lease(self, key: Hashable) -> bool:
+        """Worker-übergreifende Berechnungs-Lease; verfällt nach CACHE_LOCK_TIMEOUT."""
+        now = time.time()
+        try:
+            db = self._db()
+            db.execute("DELETE FROM cache_leases WHERE name=? AND key=? AND expires_at < ?", (self.name, self._key(key), now))
+            cur = db.execute(
+                "INSERT OR IGNORE INTO cache_leases (name, key, expires_at) VALUES (?, ?, ?)",
+                (self.name, self._key(key), now + LOCK_TIMEOUT),
+            )
+            return cur.rowcount == 1
+        except Exception as e:
+            self._warn('Lease', e)
+            return True
+
+    def _release_lease(self, key: Hashable) -> None:
+        try:
+            self._db().execute("DELETE FROM cache_leases WHERE name=? AND key=?", (self.name, self._key(key)))
+        except Exception as e:
+            self._warn('Lease-Freigabe', e)
+
+
+def cache(name: str, maxsize: int, ttl: float, shared: bool = False, backend: Optional[str] = None) -> _BaseCache:
+    """Legt einen Cache an; ``shared=True`` nutzt ``backend`` bzw. das über CACHE_BACKEND gewählte Backend."""
+    backend = (backend or BACKEND).strip().lower()
+    if shared and backend == 'sqlite':
+        return SqliteCache(name, maxsize, ttl)
+    if shared and backend != 'memory':
+        logger.warning(f"[Cache] Unbekanntes Cache-Backend {backend!r}, nutze memory für {name}")
+    return TTLCache(name, maxsize, ttl)
+
+
+def all_stats() -> Dict[str, Dict[str, Any]]:
+    with _REGISTRY_LOCK:
+        caches = list(_REGISTRY.values())
+    return {c.name: c.status() for c in caches}